@@ -0,0 +1,587 @@
+"""
+Statistiques de l'administration du chat maintenues incrémentalement
+
+Les totaux (messages, conversations, dernier message), le volume quotidien et
+les utilisateurs actifs sont stockés dans les tables chat_stats,
+chat_daily_stats, chat_user_activity et chat_user_last_active. Ils sont mis à
+jour dans la transaction qui insère ou supprime les messages et conversations
+(écouteur after_flush de la session), puis comparés périodiquement aux tables
+sources pour corriger toute dérive (suppressions en masse, écritures hors ORM).
+
+Les totaux et chaque jour sont répartis sur STATS_SHARDS lignes, choisies
+d'après la connexion de l'écriture : les écritures concurrentes ne se disputent
+pas une ligne unique et une lecture des totaux somme au plus STATS_SHARDS
+lignes. Les utilisateurs actifs sur N jours sont comptés par jour de dernière
+activité (last_active_users) : la lecture somme les lignes des N derniers jours
+au lieu de parcourir l'activité de chaque utilisateur.
+"""
+import os
+import time
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import case, delete, event, exists, func, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import db, Conversation, Message, ChatStats, ChatDailyStats, ChatUserActivity, ChatUserLastActive
+from auth import admin_required
+import aws_clients
+import document_cache
+
+logger = logging.getLogger(__name__)
+
+# Intervalle entre deux recalculs complets (secondes, 0 pour désactiver)
+RECONCILE_INTERVAL = int(os.environ.get('ADMIN_STATS_RECONCILE_INTERVAL', 21600))
+
+# Nombre de jours d'historique renvoyés par défaut
+DEFAULT_DAYS = 30
+
+# Clé du verrou consultatif PostgreSQL garantissant un seul recalcul à la fois
+RECONCILE_LOCK_KEY = 720051
+
+# Verrou consultatif partagé par les écritures, pris en exclusif pour appliquer les corrections du recalcul
+WRITE_LOCK_KEY = 720054
+
+# Lignes de chat_stats, et de chat_daily_stats par jour (deux connexions n'écrivent la même que si leurs PID
+# coïncident modulo STATS_SHARDS)
+STATS_SHARDS = 16
+
+# Ligne recevant les corrections du recalcul et sa date
+RECONCILE_SHARD = 0
+
+admin_stats_bp = Blueprint('admin_stats', __name__, url_prefix='/admin')
+
+_listener_registered = False
+_reconcile_thread = None
+
+
+def init_app(app):
+    """Initialiser les statistiques d'administration pour l'application Flask"""
+    global _listener_registered, _reconcile_thread
+
+    app.register_blueprint(admin_stats_bp)
+
+    if not _listener_registered:
+        event.listen(db.session, 'after_flush', _after_flush)
+        _listener_registered = True
+
+    if RECONCILE_INTERVAL > 0 and _reconcile_thread is None:
+        _reconcile_thread = threading.Thread(
+            target=_reconcile_loop, args=(app,), name='admin-stats-reconcile', daemon=True
+        )
+        _reconcile_thread.start()
+
+
+class StatsDelta:
+    """Variations des statistiques produites par une écriture"""
+
+    def __init__(self):
+        self.messages = 0
+        self.conversations = 0
+        self.last_activity = None
+        self.daily = defaultdict(lambda: [0, 0])  # jour -> [messages, conversations]
+        self.activity = set()  # (jour, user_id)
+
+    def __bool__(self):
+        return bool(self.messages or self.conversations or self.daily or self.activity)
+
+    def add_message(self, timestamp, count=1):
+        self.messages += count
+        if timestamp is None:
+            return
+        self.daily[timestamp.date()][0] += count
+        if count > 0 and (self.last_activity is None or timestamp > self.last_activity):
+            self.last_activity = timestamp
+
+    def add_conversation(self, created_at, count=1):
+        self.conversations += count
+        if created_at is not None:
+            self.daily[created_at.date()][1] += count
+
+
+def _add_totals(connection, shard, messages, conversations, last_activity):
+    """Ajoute des variations aux totaux d'une ligne de chat_stats"""
+    stmt = pg_insert(ChatStats).values(
+        id=shard, total_messages=messages, total_conversations=conversations, last_activity=last_activity
+    )
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[ChatStats.id],
+        set_={
+            'total_messages': ChatStats.total_messages + stmt.excluded.total_messages,
+            'total_conversations': ChatStats.total_conversations + stmt.excluded.total_conversations,
+            'last_activity': func.greatest(ChatStats.last_activity, stmt.excluded.last_activity)
+        }
+    ))
+
+
+def _add_daily(connection, shard, daily):
+    """
+    Ajoute des variations aux lignes quotidiennes d'un numéro de ligne
+
+    Args:
+        connection: Connexion SQLAlchemy de la transaction d'écriture
+        shard: Numéro de ligne (entier ou expression SQL)
+        daily (dict): jour -> [messages, conversations, utilisateurs actifs, derniers jours actifs]
+    """
+    days = sorted(day for day, counts in daily.items() if any(counts))
+    if not days:
+        return
+    stmt = pg_insert(ChatDailyStats).values([{
+        'day': day,
+        'shard': shard,
+        'message_count': daily[day][0],
+        'conversation_count': daily[day][1],
+        'active_users': daily[day][2],
+        'last_active_users': daily[day][3]
+    } for day in days])
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[ChatDailyStats.day, ChatDailyStats.shard],
+        set_={
+            'message_count': ChatDailyStats.message_count + stmt.excluded.message_count,
+            'conversation_count': ChatDailyStats.conversation_count + stmt.excluded.conversation_count,
+            'active_users': ChatDailyStats.active_users + stmt.excluded.active_users,
+            'last_active_users': ChatDailyStats.last_active_users + stmt.excluded.last_active_users
+        }
+    ))
+
+
+def _set_last_active(connection, changes):
+    """Enregistre les nouveaux derniers jours d'activité (None : plus aucune activité)"""
+    updated = [{'user_id': user_id, 'last_day': day} for user_id, day in sorted(changes.items()) if day]
+    removed = [user_id for user_id, day in changes.items() if day is None]
+    if updated:
+        stmt = pg_insert(ChatUserLastActive).values(updated)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[ChatUserLastActive.user_id], set_={'last_day': stmt.excluded.last_day}
+        ))
+    if removed:
+        connection.execute(delete(ChatUserLastActive).where(ChatUserLastActive.user_id.in_(removed)))
+
+
+def _advance_last_active(connection, days_by_user, daily):
+    """
+    Avance le dernier jour d'activité des utilisateurs et reporte le déplacement sur les compteurs quotidiens
+
+    Args:
+        connection: Connexion SQLAlchemy de la transaction d'écriture
+        days_by_user (dict): user_id -> jour d'activité écrit
+        daily (dict): Variations quotidiennes à compléter (index 3 : derniers jours actifs)
+    """
+    user_ids = sorted(days_by_user)
+    created = set(connection.execute(
+        pg_insert(ChatUserLastActive)
+        .values([{'user_id': user_id, 'last_day': days_by_user[user_id]} for user_id in user_ids])
+        .on_conflict_do_nothing()
+        .returning(ChatUserLastActive.user_id)
+    ).scalars())
+    for user_id in created:
+        daily[days_by_user[user_id]][3] += 1
+
+    # Utilisateurs déjà connus : la ligne verrouillée donne l'ancien jour à décompter
+    known = [user_id for user_id in user_ids if user_id not in created]
+    if not known:
+        return
+    rows = connection.execute(
+        select(ChatUserLastActive.user_id, ChatUserLastActive.last_day)
+        .where(ChatUserLastActive.user_id.in_(known))
+        .order_by(ChatUserLastActive.user_id)
+        .with_for_update()
+    ).all()
+    changes = {}
+    for user_id, last_day in rows:
+        if days_by_user[user_id] > last_day:
+            daily[last_day][3] -= 1
+            daily[days_by_user[user_id]][3] += 1
+            changes[user_id] = days_by_user[user_id]
+    _set_last_active(connection, changes)
+
+
+def apply_delta(connection, delta):
+    """
+    Applique des variations aux tables de statistiques dans la transaction courante
+
+    Les écritures prennent le verrou WRITE_LOCK_KEY en mode partagé (elles ne
+    s'attendent pas entre elles) ; reconcile() le prend en exclusif le temps
+    d'appliquer ses corrections.
+
+    Args:
+        connection: Connexion SQLAlchemy de la transaction d'écriture
+        delta (StatsDelta): Variations à appliquer
+    """
+    if not delta:
+        return
+
+    connection.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {'key': WRITE_LOCK_KEY})
+
+    # Une ligne par connexion : stable pendant la transaction, distincte d'une connexion à l'autre
+    shard = func.pg_backend_pid() % STATS_SHARDS
+    _add_totals(connection, shard, delta.messages, delta.conversations, delta.last_activity)
+
+    daily = defaultdict(lambda: [0, 0, 0, 0])
+    for day, (messages, conversations) in delta.daily.items():
+        daily[day][0] += messages
+        daily[day][1] += conversations
+
+    if delta.activity:
+        # Premiers messages de la journée pour un utilisateur : +1 utilisateur actif
+        rows = connection.execute(
+            pg_insert(ChatUserActivity)
+            .values([{'day': day, 'user_id': user_id} for day, user_id in sorted(delta.activity)])
+            .on_conflict_do_nothing()
+            .returning(ChatUserActivity.day, ChatUserActivity.user_id)
+        ).all()
+        latest = {}
+        for day, user_id in rows:
+            daily[day][2] += 1
+            latest[user_id] = max(day, latest.get(user_id, day))
+        # Le dernier jour d'activité ne peut avancer qu'au premier message d'un jour
+        if latest:
+            _advance_last_active(connection, latest, daily)
+
+    _add_daily(connection, shard, daily)
+
+
+def _after_flush(session, flush_context):
+    """Répercute les messages et conversations insérés ou supprimés par le flush"""
+    created_messages = [obj for obj in session.new if isinstance(obj, Message)]
+    deleted_messages = [obj for obj in session.deleted if isinstance(obj, Message)]
+    created_conversations = [obj for obj in session.new if isinstance(obj, Conversation)]
+    deleted_conversations = [obj for obj in session.deleted if isinstance(obj, Conversation)]
+
+    if not (created_messages or deleted_messages or created_conversations or deleted_conversations):
+        return
+
+    delta = StatsDelta()
+    for message in created_messages:
+        delta.add_message(message.timestamp)
+    for message in deleted_messages:
+        delta.add_message(message.timestamp, -1)
+    for conversation in created_conversations:
+        delta.add_conversation(conversation.created_at)
+    for conversation in deleted_conversations:
+        delta.add_conversation(conversation.created_at, -1)
+
+    connection = session.connection()
+    if created_messages:
+        conversation_ids = {message.conversation_id for message in created_messages}
+        owners = dict(connection.execute(
+            select(Conversation.id, Conversation.user_id).where(Conversation.id.in_(conversation_ids))
+        ).all())
+        for message in created_messages:
+            user_id = owners.get(message.conversation_id)
+            if user_id is not None and message.timestamp is not None:
+                delta.activity.add((message.timestamp.date(), user_id))
+
+    apply_delta(connection, delta)
+
+
+def delete_conversation_messages(conversation_id):
+    """
+    Supprime en masse les messages d'une conversation en tenant les statistiques à jour
+
+    Les suppressions en masse ne passent pas par le flush de la session : les
+    horodatages des messages supprimés sont récupérés par DELETE ... RETURNING.
+
+    Args:
+        conversation_id (int): ID de la conversation
+
+    Returns:
+        int: Nombre de messages supprimés
+    """
+    rows = db.session.execute(
+        delete(Message).where(Message.conversation_id == conversation_id).returning(Message.timestamp),
+        execution_options={'synchronize_session': False}
+    ).all()
+
+    delta = StatsDelta()
+    for row in rows:
+        delta.add_message(row.timestamp, -1)
+    apply_delta(db.session.connection(), delta)
+    return len(rows)
+
+
+def _measure_drift(snapshot):
+    """
+    Compare, dans un même instantané, les statistiques aux tables message et conversation
+
+    Les statistiques étant écrites dans la transaction des messages, l'instantané
+    les voit dans l'état exact des tables sources : l'écart mesuré est la dérive.
+
+    Args:
+        snapshot: Connexion SQLAlchemy en REPEATABLE READ
+
+    Returns:
+        dict: Écarts des totaux, des volumes quotidiens, des jours d'activité et des derniers jours actifs
+    """
+    totals = snapshot.execute(text("""
+        SELECT (SELECT COUNT(*) FROM message) - (SELECT COALESCE(SUM(total_messages), 0) FROM chat_stats),
+               (SELECT COUNT(*) FROM conversation) - (SELECT COALESCE(SUM(total_conversations), 0) FROM chat_stats),
+               (SELECT MAX(timestamp) FROM message),
+               (SELECT MAX(last_activity) FROM chat_stats)
+    """)).one()
+
+    daily = snapshot.execute(text("""
+        SELECT day, SUM(messages), SUM(conversations)
+        FROM (
+            SELECT CAST(timestamp AS date) AS day, COUNT(*) AS messages, 0 AS conversations
+            FROM message WHERE timestamp IS NOT NULL GROUP BY 1
+            UNION ALL
+            SELECT CAST(created_at AS date), 0, COUNT(*)
+            FROM conversation WHERE created_at IS NOT NULL GROUP BY 1
+            UNION ALL
+            SELECT day, -SUM(message_count), -SUM(conversation_count)
+            FROM chat_daily_stats GROUP BY day
+        ) AS per_day
+        GROUP BY day
+        HAVING SUM(messages) <> 0 OR SUM(conversations) <> 0
+    """)).all()
+
+    snapshot.execute(text("""
+        CREATE TEMPORARY TABLE chat_activity_recount ON COMMIT DROP AS
+        SELECT DISTINCT CAST(m.timestamp AS date) AS day, c.user_id
+        FROM message m JOIN conversation c ON c.id = m.conversation_id
+        WHERE c.user_id IS NOT NULL AND m.timestamp IS NOT NULL
+    """))
+    missing = snapshot.execute(text("""
+        SELECT day, user_id FROM chat_activity_recount
+        EXCEPT SELECT day, user_id FROM chat_user_activity
+    """)).all()
+    extra = snapshot.execute(text("""
+        SELECT day, user_id FROM chat_user_activity
+        EXCEPT SELECT day, user_id FROM chat_activity_recount
+    """)).all()
+    last_active = snapshot.execute(text("""
+        SELECT COALESCE(r.user_id, l.user_id), r.last_day, l.last_day
+        FROM (SELECT user_id, MAX(day) AS last_day FROM chat_activity_recount GROUP BY user_id) AS r
+        FULL JOIN chat_user_last_active l ON l.user_id = r.user_id
+        WHERE r.last_day IS DISTINCT FROM l.last_day
+    """)).all()
+
+    return {
+        'messages': totals[0],
+        'conversations': totals[1],
+        'last_activity': totals[2],
+        'snapshot_last_activity': totals[3],
+        'daily': daily,
+        'missing_activity': [tuple(row) for row in missing],
+        'extra_activity': [tuple(row) for row in extra],
+        'last_active': last_active
+    }
+
+
+def _apply_drift(connection, drift):
+    """
+    Corrige les statistiques de la dérive mesurée, sous le verrou WRITE_LOCK_KEY exclusif
+
+    Les écritures validées depuis l'instantané sont déjà comptées : les compteurs
+    reçoivent l'écart mesuré, et les jours d'activité et derniers jours actifs
+    sont revérifiés sur l'état courant avant d'être modifiés.
+
+    Args:
+        connection: Connexion SQLAlchemy de la transaction de correction
+        drift (dict): Dérive renvoyée par _measure_drift
+    """
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': WRITE_LOCK_KEY})
+
+    # Dernier message : les valeurs déjà présentes dans l'instantané sont remplacées par le recalcul
+    if drift['snapshot_last_activity'] is not None:
+        connection.execute(update(ChatStats).where(
+            ChatStats.last_activity <= drift['snapshot_last_activity']
+        ).values(last_activity=None))
+    _add_totals(connection, RECONCILE_SHARD, drift['messages'], drift['conversations'], drift['last_activity'])
+    connection.execute(update(ChatStats).where(ChatStats.id == RECONCILE_SHARD).values(
+        reconciled_at=datetime.utcnow()
+    ))
+
+    daily = defaultdict(lambda: [0, 0, 0, 0])
+    for day, messages, conversations in drift['daily']:
+        daily[day][0] += int(messages)
+        daily[day][1] += int(conversations)
+
+    if drift['missing_activity']:
+        rows = connection.execute(
+            pg_insert(ChatUserActivity)
+            .values([{'day': day, 'user_id': user_id} for day, user_id in sorted(drift['missing_activity'])])
+            .on_conflict_do_nothing()
+            .returning(ChatUserActivity.day)
+        ).scalars()
+        for day in rows:
+            daily[day][2] += 1
+
+    if drift['extra_activity']:
+        # Un message a pu être écrit depuis l'instantané pour ce jour et cet utilisateur
+        rows = connection.execute(
+            delete(ChatUserActivity).where(
+                tuple_(ChatUserActivity.day, ChatUserActivity.user_id).in_(drift['extra_activity']),
+                ~exists().where(
+                    Conversation.user_id == ChatUserActivity.user_id,
+                    Message.conversation_id == Conversation.id,
+                    Message.timestamp >= ChatUserActivity.day,
+                    Message.timestamp < ChatUserActivity.day + 1
+                )
+            ).returning(ChatUserActivity.day)
+        ).scalars()
+        for day in rows:
+            daily[day][2] -= 1
+
+    if drift['last_active']:
+        current = dict(connection.execute(
+            select(ChatUserLastActive.user_id, ChatUserLastActive.last_day)
+            .where(ChatUserLastActive.user_id.in_([row[0] for row in drift['last_active']]))
+        ).all())
+        changes = {}
+        for user_id, recount_day, snapshot_day in drift['last_active']:
+            live_day = current.get(user_id)
+            new_day = recount_day
+            if live_day != snapshot_day:
+                # Activité depuis l'instantané : le jour ne fait qu'avancer
+                new_day = max(day for day in (recount_day, live_day) if day is not None)
+            if new_day == live_day:
+                continue
+            if live_day is not None:
+                daily[live_day][3] -= 1
+            if new_day is not None:
+                daily[new_day][3] += 1
+            changes[user_id] = new_day
+        _set_last_active(connection, changes)
+
+    _add_daily(connection, RECONCILE_SHARD, daily)
+
+
+def reconcile():
+    """
+    Recalcule les statistiques à partir des tables message et conversation et corrige leur dérive
+
+    Le recalcul complet est lu dans un instantané REPEATABLE READ, sans bloquer
+    les écritures ; seule la correction de la dérive, en général minime, est
+    appliquée sous le verrou WRITE_LOCK_KEY exclusif.
+
+    Returns:
+        bool: True si le recalcul a eu lieu (False si un autre processus s'en charge)
+    """
+    with db.engine.connect().execution_options(isolation_level='REPEATABLE READ') as snapshot:
+        if not snapshot.execute(text("SELECT pg_try_advisory_xact_lock(:key)"),
+                                {'key': RECONCILE_LOCK_KEY}).scalar():
+            return False
+
+        started = time.monotonic()
+        drift = _measure_drift(snapshot)
+        measured = time.monotonic()
+
+        _apply_drift(db.session.connection(), drift)
+        db.session.commit()
+
+    logger.info(f"Admin stats reconciled in {time.monotonic() - started:.2f}s "
+                f"(corrections applied in {time.monotonic() - measured:.2f}s)")
+    return True
+
+
+def _last_reconciled_at():
+    """Date du dernier recalcul complet (None s'il n'a jamais eu lieu)"""
+    return db.session.query(ChatStats.reconciled_at).filter(ChatStats.id == RECONCILE_SHARD).scalar()
+
+
+def _reconcile_loop(app):
+    """Recalcule les statistiques au démarrage si nécessaire, puis à intervalle régulier"""
+    delay = 0
+    while True:
+        time.sleep(delay)
+        delay = RECONCILE_INTERVAL
+        try:
+            with app.app_context():
+                reconciled_at = _last_reconciled_at()
+                if reconciled_at is None or \
+                        reconciled_at <= datetime.utcnow() - timedelta(seconds=RECONCILE_INTERVAL):
+                    reconcile()
+                else:
+                    db.session.rollback()
+        except Exception as e:
+            logger.error(f"Error reconciling admin stats: {str(e)}")
+
+
+def get_stats(days=DEFAULT_DAYS):
+    """
+    Retourne les statistiques du chat sans parcourir les tables message et conversation
+
+    Args:
+        days (int): Nombre de jours d'historique quotidien
+
+    Returns:
+        dict: Totaux, dernière activité, utilisateurs actifs et volume quotidien
+    """
+    if _last_reconciled_at() is None:
+        reconcile()
+
+    # Totaux : au plus STATS_SHARDS lignes
+    total_messages, total_conversations, last_activity, reconciled_at = db.session.query(
+        func.coalesce(func.sum(ChatStats.total_messages), 0),
+        func.coalesce(func.sum(ChatStats.total_conversations), 0),
+        func.max(ChatStats.last_activity),
+        func.max(ChatStats.reconciled_at)
+    ).one()
+
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days - 1)
+    daily = {row.day: row for row in db.session.query(
+        ChatDailyStats.day,
+        func.sum(ChatDailyStats.message_count).label('message_count'),
+        func.sum(ChatDailyStats.conversation_count).label('conversation_count'),
+        func.sum(ChatDailyStats.active_users).label('active_users')
+    ).filter(ChatDailyStats.day >= first_day).group_by(ChatDailyStats.day).all()}
+
+    # Utilisateurs dont le dernier jour d'activité tombe dans les 7 ou 30 derniers jours
+    active_users_7d, active_users_30d = db.session.query(
+        func.coalesce(func.sum(case(
+            (ChatDailyStats.day >= today - timedelta(days=6), ChatDailyStats.last_active_users), else_=0
+        )), 0),
+        func.coalesce(func.sum(ChatDailyStats.last_active_users), 0)
+    ).filter(ChatDailyStats.day >= today - timedelta(days=29)).one()
+
+    return {
+        'total_messages': int(total_messages),
+        'total_conversations': int(total_conversations),
+        'last_activity': last_activity,
+        'reconciled_at': reconciled_at,
+        'active_users_today': int(daily[today].active_users) if today in daily else 0,
+        'active_users_7d': int(active_users_7d),
+        'active_users_30d': int(active_users_30d),
+        'daily': [{
+            'day': day.isoformat(),
+            'messages': int(daily[day].message_count) if day in daily else 0,
+            'conversations': int(daily[day].conversation_count) if day in daily else 0,
+            'active_users': int(daily[day].active_users) if day in daily else 0
+        } for day in (first_day + timedelta(days=offset) for offset in range(days))]
+    }
+
+
+@admin_stats_bp.route("/stats", methods=["GET"])
+@admin_required
+def admin_stats_api():
+    """API JSON des statistiques du chat"""
+    days = min(max(request.args.get('days', DEFAULT_DAYS, type=int), 1), 366)
+    try:
+        stats = get_stats(days)
+        for key in ('last_activity', 'reconciled_at'):
+            stats[key] = stats[key].isoformat() if stats[key] else None
+        return jsonify({"success": True, "stats": stats})
+    except Exception as e:
+        logger.error(f"Error loading admin stats: {str(e)}")
+        db.session.rollback()
+        return jsonify({"success": False, "error": "Impossible de charger les statistiques"}), 500
+
+
+@admin_stats_bp.route("/aws-stats", methods=["GET"])
+@admin_required
+def aws_stats_api():
+    """API JSON des appels AWS du processus (nombre, erreurs, latence par service)"""
+    return jsonify({"success": True, "pid": os.getpid(), "services": aws_clients.get_stats()})
+
+
+@admin_stats_bp.route("/document-cache-stats", methods=["GET"])
+@admin_required
+def document_cache_stats_api():
+    """API JSON du cache des extractions de documents du processus (succès, échecs, taille, évictions)"""
+    return jsonify({"success": True, "pid": os.getpid(), "cache": document_cache.get_stats()})
@@ -0,0 +1,139 @@
+"""
+Cache des analyses IA (OpenAI) indexé par le contenu des données analysées
+
+Une analyse dépend uniquement des chiffres envoyés au modèle : la clé est le
+SHA-256 de leur forme canonique (clés triées, montants arrondis au centime),
+du type d'analyse et du modèle. Tant que les transactions de la période ne
+changent pas, les mêmes chiffres donnent la même clé et l'analyse est relue
+depuis le cache ; toute modification d'un montant ou d'une catégorie produit
+une nouvelle clé. Le stockage réutilise les backends de ocr_cache (répertoire
+local borné à ANALYSIS_CACHE_MAX_BYTES avec éviction LRU, ou Redis si
+ANALYSIS_CACHE_BACKEND=redis).
+"""
+import os
+import json
+import hashlib
+import logging
+import datetime
+import tempfile
+import threading
+from decimal import Decimal
+
+import ocr_cache
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie des analyses (secondes)
+ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', 90 * 24 * 3600))
+
+# Taille maximale du cache disque (octets)
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get('ANALYSIS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+ANALYSIS_CACHE_DIR = os.environ.get('ANALYSIS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'analysis-cache'))
+
+# Incrémenter pour invalider les analyses produites avec un ancien prompt
+CACHE_VERSION = 1
+
+_backend = ocr_cache.create_backend(
+    os.environ.get('ANALYSIS_CACHE_BACKEND', 'disk'),
+    directory=ANALYSIS_CACHE_DIR,
+    ttl=ANALYSIS_CACHE_TTL,
+    max_bytes=ANALYSIS_CACHE_MAX_BYTES,
+    prefix="analysis:result"
+)
+
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+
+def _canonical(value):
+    """Forme stable d'une valeur : montants au centime, dates ISO, clés triées par json.dumps"""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return str(Decimal(str(value)).quantize(Decimal('0.01')))
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return str(value)
+
+
+def analysis_digest(kind, data, model):
+    """
+    Retourne la clé de cache d'une analyse
+
+    Args:
+        kind (str): Type d'analyse (par exemple 'financial')
+        data (dict): Données envoyées au modèle
+        model (str): Modèle OpenAI utilisé
+
+    Returns:
+        str: SHA-256 hexadécimal
+    """
+    payload = json.dumps(
+        {'version': CACHE_VERSION, 'kind': kind, 'model': model, 'data': _canonical(data)},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get(digest):
+    """
+    Retourne l'analyse en cache
+
+    Args:
+        digest (str): Clé retournée par analysis_digest
+
+    Returns:
+        str: Analyse mise en cache, ou None
+    """
+    if _backend is None:
+        return None
+    try:
+        result = _backend.get(digest)
+    except Exception as e:
+        logger.warning(f"Analysis cache read failed: {str(e)}")
+        _count('errors')
+        return None
+    _count('hits' if result is not None else 'misses')
+    return result
+
+
+def put(digest, result):
+    """Enregistre une analyse réussie (les messages d'erreur ne doivent pas être mis en cache)"""
+    if _backend is None:
+        return
+    try:
+        _backend.set(digest, result)
+        _count('writes')
+    except Exception as e:
+        logger.warning(f"Analysis cache write failed: {str(e)}")
+        _count('errors')
+
+
+def get_stats():
+    """
+    Retourne les statistiques du cache pour le processus
+
+    Returns:
+        dict: Lectures réussies/manquées, écritures, erreurs, taux de succès et,
+            pour le backend disque, taille occupée et entrées évincées
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+    stats['backend'] = type(_backend).__name__ if _backend is not None else None
+    if isinstance(_backend, ocr_cache.DiskOCRCache):
+        stats['size_bytes'] = _backend.size
+        stats['max_bytes'] = _backend.max_bytes
+        stats['evictions'] = _backend.evictions
+    return stats
@@ -1,6 +1,6 @@
 import os
 import logging
-import boto3
+import aws_clients
 from warrant import Cognito
 from jose import jwt
 from flask import session, redirect, url_for, flash, request
@@ -17,8 +17,8 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def get_cognito_client():
-    """Create and return a boto3 Cognito client"""
-    return boto3.client('cognito-idp', region_name=AWS_REGION)
+    """Return the shared boto3 Cognito client"""
+    return aws_clients.get_client('cognito-idp', region_name=AWS_REGION)
 
 def login_user(username, password):
     """Authenticate a user with AWS Cognito and return tokens"""
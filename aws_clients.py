@@ -0,0 +1,156 @@
+"""
+Registre des clients AWS (boto3) partagés par tout le processus
+
+Les clients botocore sont thread-safe : un seul client par (service, région) est
+créé à la première utilisation puis réutilisé, ce qui évite de refaire à chaque
+appel la résolution des identifiants, la configuration des endpoints et les
+poignées de main TLS. Chaque client dispose d'un pool de connexions dimensionné
+(AWS_MAX_POOL_CONNECTIONS), de nouvelles tentatives adaptatives et de délais
+d'attente propres au service. Le nombre d'appels, d'erreurs et la latence sont
+comptés par service (get_stats).
+"""
+import os
+import time
+import logging
+import threading
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+AWS_REGION = os.environ.get('AWS_REGION', 'eu-west-3')
+
+# Connexions HTTP conservées par client (au moins le nombre de threads qui l'utilisent)
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50))
+
+# Tentatives par appel (première comprise) ; 'adaptive' limite aussi le débit côté client en cas de throttling
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', 5))
+
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', 5))
+
+# Délai de lecture par service (secondes) : l'analyse Textract d'une page peut être longue
+READ_TIMEOUTS = {
+    'textract': float(os.environ.get('AWS_TEXTRACT_READ_TIMEOUT', 60)),
+    's3': 60,
+    'cognito-idp': 10,
+    'dynamodb': 10,
+}
+DEFAULT_READ_TIMEOUT = 30
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _client_config(service_name, max_attempts):
+    """Configuration botocore d'un service"""
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUTS.get(service_name, DEFAULT_READ_TIMEOUT),
+        retries={'mode': AWS_RETRY_MODE, 'total_max_attempts': max_attempts},
+        tcp_keepalive=True
+    )
+
+
+def _record(service_name, elapsed, error):
+    with _stats_lock:
+        stats = _stats.setdefault(service_name, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['calls'] += 1
+        stats['total_seconds'] += elapsed
+        if elapsed > stats['max_seconds']:
+            stats['max_seconds'] = elapsed
+        if error:
+            stats['errors'] += 1
+
+
+def _register_metrics(client, service_name):
+    """Mesure chaque appel d'API, nouvelles tentatives comprises"""
+    events = client.meta.events
+
+    def before_call(context, **kwargs):
+        context['aws_clients_start'] = time.perf_counter()
+
+    def after_call(context, http_response=None, **kwargs):
+        start = context.pop('aws_clients_start', None)
+        if start is not None:
+            error = http_response is None or http_response.status_code >= 400
+            _record(service_name, time.perf_counter() - start, error)
+
+    def after_call_error(context, **kwargs):
+        start = context.pop('aws_clients_start', None)
+        if start is not None:
+            _record(service_name, time.perf_counter() - start, True)
+
+    events.register('before-call', before_call)
+    events.register('after-call', after_call)
+    events.register('after-call-error', after_call_error)
+
+
+def get_client(service_name, region_name=None, max_attempts=None):
+    """
+    Retourne le client partagé d'un service AWS, créé à la première utilisation
+
+    Les identifiants sont résolus par la chaîne standard de boto3 (variables
+    AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY, profil, rôle IAM).
+
+    Args:
+        service_name (str): Nom du service ('textract', 's3', 'cognito-idp', 'dynamodb'...)
+        region_name (str, optional): Région (AWS_REGION par défaut)
+        max_attempts (int, optional): Tentatives par appel (AWS_MAX_ATTEMPTS par défaut) ;
+            1 pour un appelant qui gère lui-même les nouvelles tentatives
+
+    Returns:
+        botocore.client.BaseClient: Client du service
+    """
+    key = (service_name, region_name or AWS_REGION, max_attempts or AWS_MAX_ATTEMPTS)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    global _session
+    # La création de clients à partir d'une session boto3 n'est pas thread-safe
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(service_name, region_name=key[1], config=_client_config(service_name, key[2]))
+            _register_metrics(client, service_name)
+            _clients[key] = client
+            logger.debug(f"Created shared AWS client for {service_name} ({key[1]})")
+    return client
+
+
+def get_stats():
+    """
+    Retourne les statistiques d'appels par service
+
+    Returns:
+        dict: Pour chaque service : appels, erreurs, latence moyenne et maximale (ms)
+    """
+    with _stats_lock:
+        return {
+            service_name: {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'avg_ms': round(stats['total_seconds'] * 1000 / stats['calls'], 1) if stats['calls'] else 0.0,
+                'max_ms': round(stats['max_seconds'] * 1000, 1)
+            }
+            for service_name, stats in _stats.items()
+        }
+
+
+def reset():
+    """Oublie les clients créés et les statistiques (changement d'identifiants, tests)"""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
+    with _stats_lock:
+        _stats.clear()
@@ -7,22 +7,67 @@ import logging
 import re
 from decimal import Decimal
 
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import (
+    ClientError, EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError
+)
+
+import aws_clients
+import ocr_cache
+import textract_parser
 
 logger = logging.getLogger(__name__)
 
-def get_textract_client():
+# Erreurs Textract transitoires pour lesquelles une nouvelle tentative a un sens
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'ProvisionedThroughputExceededException',
+    'LimitExceededException',
+    'InternalServerError',
+    'ServiceUnavailableException',
+    'RequestTimeout'
+}
+
+# Champs de synthèse AnalyzeExpense -> clés des informations extraites
+EXPENSE_AMOUNT_FIELDS = {'TOTAL': 'amount', 'TAX': 'tax_amount', 'SUBTOTAL': 'subtotal'}
+EXPENSE_TEXT_FIELDS = {'INVOICE_RECEIPT_DATE': 'date', 'VENDOR_NAME': 'vendor'}
+
+# Repli sur le texte brut lorsque les champs structurés sont absents
+AMOUNT_PATTERN = re.compile(r'(?:TOTAL|MONTANT)\s*:?\s*(\d+[,.]\d+)', re.IGNORECASE)
+DATE_PATTERN = re.compile(r'(?:DATE)\s*:?\s*(\d{2}[/.-]\d{2}[/.-]\d{4})', re.IGNORECASE)
+VENDOR_PATTERN = re.compile(r'(?:FOURNISSEUR|VENDEUR|MAGASIN)\s*:?\s*([A-Za-z0-9\s]{3,30})', re.IGNORECASE)
+INVOICE_PATTERN = re.compile(r'\b(?:FACTURE|INVOICE)\b', re.IGNORECASE)
+RECEIPT_PATTERN = re.compile(r'\b(?:REÇU|TICKET|RECEIPT)\b', re.IGNORECASE)
+
+def get_textract_client(max_attempts=None):
+    """
+    Retourne le client AWS Textract partagé du processus
+    
+    Args:
+        max_attempts (int, optional): Tentatives par appel gérées par botocore (AWS_MAX_ATTEMPTS par défaut)
+    """
+    return aws_clients.get_client('textract', region_name='eu-west-3', max_attempts=max_attempts)  # Utilisez la même région que votre bucket S3
+
+def is_retryable_error(error):
     """
-    Crée et retourne un client AWS Textract
+    Indique si une erreur AWS Textract est transitoire (limitation de débit, panne, réseau)
+    
+    Args:
+        error (Exception): Erreur levée par un appel Textract
+        
+    Returns:
+        bool: True si l'appel peut être réessayé
     """
-    return boto3.client('textract', 
-                       region_name='eu-west-3')  # Utilisez la même région que votre bucket S3
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES
+    return isinstance(error, (EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError))
 
 def extract_text_from_base64(base64_image):
     """
     Extrait du texte à partir d'une image encodée en base64 en utilisant AWS Textract
     
+    Un seul appel AnalyzeDocument (FORMS, TABLES) fournit à la fois les lignes de
+    texte et les paires clé-valeur. Le résultat est mis en cache par SHA-256 de l'image.
+    
     Args:
         base64_image (str): Image encodée en base64
         
@@ -30,39 +75,7 @@ def extract_text_from_base64(base64_image):
         dict: Résultats de l'extraction avec texte brut et analyse
     """
     try:
-        # Décoder l'image base64
-        image_bytes = base64.b64decode(base64_image)
-        
-        # Obtenir le client Textract
-        textract_client = get_textract_client()
-        
-        # Appeler l'API Textract pour l'analyse d'image brute
-        response = textract_client.detect_document_text(
-            Document={'Bytes': image_bytes}
-        )
-        
-        # Extraire le texte complet
-        full_text = ""
-        for item in response["Blocks"]:
-            if item["BlockType"] == "LINE":
-                full_text += item["Text"] + "\n"
-        
-        # Analyse avancée pour documents financiers (factures, reçus)
-        # Réutiliser l'image pour une analyse plus spécifique
-        analysis_response = textract_client.analyze_document(
-            Document={'Bytes': image_bytes},
-            FeatureTypes=['FORMS', 'TABLES']
-        )
-        
-        # Extraire les champs-clés potentiels
-        extracted_info = extract_financial_info(analysis_response)
-        
-        return {
-            "success": True,
-            "text": full_text.strip(),
-            "extracted_info": extracted_info
-        }
-    
+        return run_document_analysis(base64.b64decode(base64_image))
     except ClientError as e:
         logger.error(f"Erreur AWS Textract: {str(e)}")
         return {
@@ -78,6 +91,55 @@ def extract_text_from_base64(base64_image):
             "text": ""
         }
 
+def run_document_analysis(image_bytes, textract_client=None, digest=None):
+    """
+    Analyse une image avec AnalyzeDocument (FORMS, TABLES), avec cache par SHA-256
+    
+    Contrairement à extract_text_from_base64, les erreurs AWS ne sont pas interceptées
+    afin que l'appelant puisse décider de réessayer.
+    
+    Args:
+        image_bytes (bytes): Contenu de l'image
+        textract_client (optional): Client Textract à utiliser (client partagé par défaut)
+        digest (str, optional): Clé de cache ; passer le SHA-256 du fichier reçu lorsque
+            image_bytes en est une version réduite (SHA-256 de image_bytes par défaut)
+        
+    Returns:
+        dict: Résultats de l'extraction avec texte brut et analyse
+        
+    Raises:
+        ClientError, BotoCoreError: En cas d'erreur AWS Textract
+    """
+    digest = digest or ocr_cache.image_digest(image_bytes)
+    cached = ocr_cache.get('document', digest)
+    if cached is not None:
+        logger.debug(f"Textract document result served from cache ({digest[:12]})")
+        return cached
+    
+    # Obtenir le client Textract
+    textract_client = textract_client or get_textract_client()
+    
+    # La réponse d'AnalyzeDocument contient aussi les blocs LINE de DetectDocumentText
+    analysis_response = textract_client.analyze_document(
+        Document={'Bytes': image_bytes},
+        FeatureTypes=['FORMS', 'TABLES']
+    )
+    
+    # Texte, paires clé-valeur et tableaux en un seul parcours des blocs
+    parsed = textract_parser.parse_analysis(analysis_response)
+    full_text = "\n".join(parsed.lines).strip()
+    
+    # Extraire les champs-clés potentiels
+    extracted_info = financial_info_from_parsed(parsed)
+    
+    result = {
+        "success": True,
+        "text": full_text,
+        "extracted_info": extracted_info
+    }
+    ocr_cache.put('document', digest, result)
+    return result
+
 def analyze_expense_document(base64_image):
     """
     Analyse un document de dépense (facture, reçu) en utilisant AnalyzeExpense d'AWS Textract
@@ -89,101 +151,7 @@ def analyze_expense_document(base64_image):
         dict: Résultats détaillés de l'analyse avec montants, dates, vendeur...
     """
     try:
-        # Décoder l'image base64
-        image_bytes = base64.b64decode(base64_image)
-        
-        # Obtenir le client Textract
-        textract_client = get_textract_client()
-        
-        # Appeler l'API Textract pour l'analyse spécifique de dépenses
-        response = textract_client.analyze_expense(
-            Document={'Bytes': image_bytes}
-        )
-        
-        # Extraire les informations pertinentes
-        result = {}
-        
-        # Extraire le texte complet
-        full_text = ""
-        
-        # Traiter les documents
-        if 'ExpenseDocuments' in response:
-            for doc in response['ExpenseDocuments']:
-                # Identifier le type de document
-                doc_type = "receipt" if 'Receipt' in str(doc) else "invoice"
-                result['document_type'] = doc_type
-                
-                # Extraire les champs pour factures/reçus
-                if 'SummaryFields' in doc:
-                    for field in doc['SummaryFields']:
-                        if 'Type' in field and 'ValueDetection' in field:
-                            field_type = field['Type']['Text']
-                            field_value = field['ValueDetection'].get('Text', '')
-                            
-                            # Traiter les différents types de champs
-                            if field_type == 'TOTAL':
-                                result['amount'] = clean_amount(field_value)
-                            elif field_type == 'INVOICE_RECEIPT_DATE':
-                                result['date'] = field_value
-                            elif field_type == 'VENDOR_NAME':
-                                result['vendor'] = field_value
-                            elif field_type == 'TAX':
-                                result['tax_amount'] = clean_amount(field_value)
-                            elif field_type == 'SUBTOTAL':
-                                result['subtotal'] = clean_amount(field_value)
-        
-        # Essayer de collecter du texte brut à partir de la réponse
-        blocks_found = False
-        for block in response.get('Blocks', []):
-            if block.get('BlockType') == 'LINE':
-                full_text += block.get('Text', '') + "\n"
-                blocks_found = True
-        
-        # Si aucun bloc de texte n'a été trouvé dans la réponse AnalyzeExpense,
-        # essayer d'extraire le texte avec detect_document_text
-        if not blocks_found:
-            try:
-                # Appeler l'API de base pour l'extraction de texte
-                text_response = textract_client.detect_document_text(
-                    Document={'Bytes': image_bytes}
-                )
-                
-                for item in text_response.get("Blocks", []):
-                    if item.get("BlockType") == "LINE":
-                        full_text += item.get("Text", "") + "\n"
-            except Exception as e:
-                logger.warning(f"Erreur lors de l'extraction secondaire de texte: {str(e)}")
-                
-        # Si le texte est toujours vide, essayer de construire un texte à partir des champs extraits
-        if not full_text.strip() and 'vendor' in result:
-            full_text = f"Document: {result.get('document_type', 'Facture/Reçu')}\n"
-            if 'vendor' in result:
-                full_text += f"Fournisseur: {result['vendor']}\n"
-            if 'amount' in result:
-                full_text += f"Montant: {result['amount']}\n"
-            if 'date' in result:
-                full_text += f"Date: {result['date']}\n"
-        
-        result['full_text'] = full_text.strip()
-        
-        # Si le montant n'a pas été trouvé, essayer de l'extraire du texte
-        if 'amount' not in result:
-            amount_match = re.search(r'(?:TOTAL|MONTANT)\s*:?\s*(\d+[,.]\d+)', full_text, re.IGNORECASE)
-            if amount_match:
-                result['amount'] = clean_amount(amount_match.group(1))
-        
-        # Si la date n'a pas été trouvée, essayer de l'extraire du texte
-        if 'date' not in result:
-            date_match = re.search(r'(?:DATE)\s*:?\s*(\d{2}[/.-]\d{2}[/.-]\d{4})', full_text, re.IGNORECASE)
-            if date_match:
-                result['date'] = date_match.group(1)
-        
-        return {
-            "success": True,
-            "extracted_info": result,
-            "text": full_text
-        }
-    
+        return run_expense_analysis(base64.b64decode(base64_image))
     except ClientError as e:
         logger.error(f"Erreur AWS Textract AnalyzeExpense: {str(e)}")
         return {
@@ -199,6 +167,117 @@ def analyze_expense_document(base64_image):
             "text": ""
         }
 
+def run_expense_analysis(image_bytes, textract_client=None, digest=None):
+    """
+    Analyse un document de dépense avec AnalyzeExpense, avec cache par SHA-256
+    
+    Contrairement à analyze_expense_document, les erreurs AWS ne sont pas interceptées
+    afin que l'appelant puisse décider de réessayer.
+    
+    Args:
+        image_bytes (bytes): Contenu de l'image
+        textract_client (optional): Client Textract à utiliser (client partagé par défaut)
+        digest (str, optional): Clé de cache ; passer le SHA-256 du fichier reçu lorsque
+            image_bytes en est une version réduite (SHA-256 de image_bytes par défaut)
+        
+    Returns:
+        dict: Résultats détaillés de l'analyse avec montants, dates, vendeur...
+        
+    Raises:
+        ClientError, BotoCoreError: En cas d'erreur AWS Textract
+    """
+    digest = digest or ocr_cache.image_digest(image_bytes)
+    cached = ocr_cache.get('expense', digest)
+    if cached is not None:
+        logger.debug(f"Textract expense result served from cache ({digest[:12]})")
+        return cached
+    
+    # Obtenir le client Textract
+    textract_client = textract_client or get_textract_client()
+    
+    # Appeler l'API Textract pour l'analyse spécifique de dépenses
+    response = textract_client.analyze_expense(
+        Document={'Bytes': image_bytes}
+    )
+    
+    # Champs de synthèse et lignes de texte de tous les documents, en un seul parcours
+    parsed = textract_parser.parse_expense(response)
+    
+    # Si aucun bloc de texte n'a été trouvé dans la réponse AnalyzeExpense,
+    # essayer d'extraire le texte avec detect_document_text
+    fallback_lines = []
+    if not parsed.lines:
+        try:
+            # Appeler l'API de base pour l'extraction de texte
+            text_response = textract_client.detect_document_text(
+                Document={'Bytes': image_bytes}
+            )
+            fallback_lines = textract_parser.parse_analysis(text_response).lines
+        except Exception as e:
+            logger.warning(f"Erreur lors de l'extraction secondaire de texte: {str(e)}")
+    
+    analysis = expense_analysis_from_parsed(parsed, fallback_lines)
+    ocr_cache.put('expense', digest, analysis)
+    return analysis
+
+def expense_analysis_from_parsed(parsed, fallback_lines=()):
+    """
+    Construit le résultat d'analyse d'une réponse AnalyzeExpense déjà analysée
+    
+    Args:
+        parsed (textract_parser.ParsedExpense): Réponse analysée
+        fallback_lines (list): Lignes de DetectDocumentText si la réponse n'en contient pas
+        
+    Returns:
+        dict: Résultats détaillés de l'analyse avec montants, dates, vendeur...
+    """
+    # Extraire les informations pertinentes
+    result = {}
+    if parsed.documents:
+        # Identifier le type de document
+        result['document_type'] = "receipt" if parsed.is_receipt else "invoice"
+        
+        # Extraire les champs pour factures/reçus
+        for field_type, field_key in EXPENSE_AMOUNT_FIELDS.items():
+            if field_type in parsed.summary:
+                result[field_key] = clean_amount(parsed.summary[field_type])
+        for field_type, field_key in EXPENSE_TEXT_FIELDS.items():
+            if field_type in parsed.summary:
+                result[field_key] = parsed.summary[field_type]
+    
+    # AnalyzeExpense renvoie les blocs LINE dans chaque document
+    full_text = "".join(line + "\n" for line in (parsed.lines or fallback_lines))
+    
+    # Si le texte est toujours vide, essayer de construire un texte à partir des champs extraits
+    if not full_text.strip() and 'vendor' in result:
+        full_text = f"Document: {result.get('document_type', 'Facture/Reçu')}\n"
+        if 'vendor' in result:
+            full_text += f"Fournisseur: {result['vendor']}\n"
+        if 'amount' in result:
+            full_text += f"Montant: {result['amount']}\n"
+        if 'date' in result:
+            full_text += f"Date: {result['date']}\n"
+    
+    result['full_text'] = full_text.strip()
+    
+    # Si le montant n'a pas été trouvé, essayer de l'extraire du texte
+    if 'amount' not in result:
+        amount_match = AMOUNT_PATTERN.search(full_text)
+        if amount_match:
+            result['amount'] = clean_amount(amount_match.group(1))
+    
+    # Si la date n'a pas été trouvée, essayer de l'extraire du texte
+    if 'date' not in result:
+        date_match = DATE_PATTERN.search(full_text)
+        if date_match:
+            result['date'] = date_match.group(1)
+    
+    return {
+        "success": True,
+        "extracted_info": result,
+        "text": full_text
+    }
+
 def extract_financial_info(analysis_response):
     """
     Extrait les informations financières pertinentes d'une réponse Textract
@@ -206,50 +285,37 @@ def extract_financial_info(analysis_response):
     Args:
         analysis_response (dict): Réponse de l'API Textract
         
+    Returns:
+        dict: Informations financières extraites (montant, date, vendeur, etc.)
+    """
+    return financial_info_from_parsed(textract_parser.parse_analysis(analysis_response))
+
+def financial_info_from_parsed(parsed):
+    """
+    Extrait les informations financières d'une réponse Textract déjà analysée
+    
+    Les paires clé-valeur des formulaires sont prioritaires ; les lignes de tableau
+    dont la première cellule est un libellé connu (Total, TVA...) les complètent.
+    
+    Args:
+        parsed (textract_parser.ParsedDocument): Réponse analysée
+        
     Returns:
         dict: Informations financières extraites (montant, date, vendeur, etc.)
     """
     result = {}
     
     # Texte complet pour les expressions régulières
-    full_text = ""
+    full_text = "\n".join(parsed.lines)
     
-    # Extraire les données de formulaire
+    # Libellé -> dernière cellule renseignée des lignes de tableau, puis données de formulaire
     form_data = {}
-    for block in analysis_response["Blocks"]:
-        # Collecter le texte complet
-        if block["BlockType"] == "LINE":
-            full_text += block["Text"] + "\n"
-        
-        # Extraire les paires clé-valeur
-        if block["BlockType"] == "KEY_VALUE_SET":
-            if "KEY" in block.get("EntityTypes", []):
-                key = ""
-                for relationship in block.get("Relationships", []):
-                    if relationship["Type"] == "CHILD":
-                        for child_id in relationship["Ids"]:
-                            child_block = next((b for b in analysis_response["Blocks"] if b["Id"] == child_id), None)
-                            if child_block and child_block["BlockType"] == "WORD":
-                                key += child_block["Text"] + " "
-                
-                # Chercher la valeur associée
-                value = ""
-                for relationship in block.get("Relationships", []):
-                    if relationship["Type"] == "VALUE":
-                        for value_id in relationship["Ids"]:
-                            value_block = next((b for b in analysis_response["Blocks"] if b["Id"] == value_id), None)
-                            if value_block:
-                                for child_relationship in value_block.get("Relationships", []):
-                                    if child_relationship["Type"] == "CHILD":
-                                        for child_id in child_relationship["Ids"]:
-                                            child_block = next((b for b in analysis_response["Blocks"] if b["Id"] == child_id), None)
-                                            if child_block and child_block["BlockType"] == "WORD":
-                                                value += child_block["Text"] + " "
-                
-                key = key.strip().lower()
-                value = value.strip()
-                if key and value:
-                    form_data[key] = value
+    for table in parsed.tables:
+        for row in table:
+            values = [cell for cell in row[1:] if cell]
+            if row and row[0] and values:
+                form_data[row[0].strip().lower()] = values[-1]
+    form_data.update(parsed.form_data)
     
     # Essayer d'identifier des informations financières spécifiques
     # Montant / Total
@@ -278,24 +344,24 @@ def extract_financial_info(analysis_response):
     
     # Si certaines informations n'ont pas été trouvées, utiliser des expressions régulières
     if "amount" not in result:
-        amount_match = re.search(r'(?:TOTAL|MONTANT)\s*:?\s*(\d+[,.]\d+)', full_text, re.IGNORECASE)
+        amount_match = AMOUNT_PATTERN.search(full_text)
         if amount_match:
             result["amount"] = clean_amount(amount_match.group(1))
     
     if "date" not in result:
-        date_match = re.search(r'(?:DATE)\s*:?\s*(\d{2}[/.-]\d{2}[/.-]\d{4})', full_text, re.IGNORECASE)
+        date_match = DATE_PATTERN.search(full_text)
         if date_match:
             result["date"] = date_match.group(1)
     
     if "vendor" not in result:
-        vendor_match = re.search(r'(?:FOURNISSEUR|VENDEUR|MAGASIN)\s*:?\s*([A-Za-z0-9\s]{3,30})', full_text, re.IGNORECASE)
+        vendor_match = VENDOR_PATTERN.search(full_text)
         if vendor_match:
             result["vendor"] = vendor_match.group(1).strip()
     
     # Déterminer le type de document
-    if re.search(r'\b(?:FACTURE|INVOICE)\b', full_text, re.IGNORECASE):
+    if INVOICE_PATTERN.search(full_text):
         result["document_type"] = "invoice"
-    elif re.search(r'\b(?:REÇU|TICKET|RECEIPT)\b', full_text, re.IGNORECASE):
+    elif RECEIPT_PATTERN.search(full_text):
         result["document_type"] = "receipt"
     else:
         result["document_type"] = "unknown"
@@ -0,0 +1 @@
+"""Benchmarks de performance de l'application (exécutés manuellement, hors production)"""
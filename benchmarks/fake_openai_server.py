@@ -0,0 +1,307 @@
+"""
+Serveur local imitant l'API Chat Completions d'OpenAI pour les benchmarks
+
+Répond à POST /v1/chat/completions en JSON ou en streaming SSE avec un débit de
+tokens, une latence et un taux d'erreurs configurables, sans appeler OpenAI.
+Les clients OpenAI de l'application l'utilisent dès que OPENAI_BASE_URL pointe
+vers lui (le SDK lit cette variable) :
+
+    python -m benchmarks.fake_openai_server --port 8765 --tokens-per-second 50
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=sk-benchmark gunicorn ...
+"""
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Vocabulaire des réponses générées (un mot par token)
+WORDS = (
+    "analyse trésorerie budget client facture prévision marge croissance revenu dépense "
+    "stratégie marché contenu publication audience objectif résultat période catégorie"
+).split()
+
+
+class FakeOpenAIConfig:
+    """Paramètres du serveur simulé"""
+
+    def __init__(self, tokens_per_second=50.0, latency_ms=200.0, jitter_ms=50.0, completion_tokens=200,
+                 error_rate=0.0, error_status=500, disconnect_rate=0.0, seed=None):
+        """
+        Args:
+            tokens_per_second (float): Débit de génération (0 pour aucune attente entre tokens)
+            latency_ms (float): Délai avant le premier token (ou avant la réponse JSON)
+            jitter_ms (float): Variation aléatoire uniforme du délai initial (+/-)
+            completion_tokens (int): Nombre de tokens générés (borné par max_tokens)
+            error_rate (float): Probabilité de répondre par une erreur HTTP
+            error_status (int): Code HTTP des erreurs injectées (500, 429, 503...)
+            disconnect_rate (float): Probabilité de couper un flux SSE à mi-parcours
+            seed (int, optional): Graine du générateur aléatoire
+        """
+        self.tokens_per_second = tokens_per_second
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+
+    def to_dict(self):
+        return {
+            'tokens_per_second': self.tokens_per_second,
+            'latency_ms': self.latency_ms,
+            'jitter_ms': self.jitter_ms,
+            'completion_tokens': self.completion_tokens,
+            'error_rate': self.error_rate,
+            'error_status': self.error_status,
+            'disconnect_rate': self.disconnect_rate
+        }
+
+
+def _wants_json(body):
+    """Indique si la requête attend un objet JSON (response_format ou consigne du prompt)"""
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        return True
+    return any('JSON' in str(message.get('content', '')) for message in body.get('messages', []))
+
+
+def _json_content(tokens, rng):
+    """Génère un objet JSON d'environ `tokens` tokens, exploitable par les parseurs de l'application"""
+    entries = [{
+        'date': f"2025-01-{(i % 28) + 1:02d}",
+        'platform': rng.choice(['linkedin', 'facebook', 'instagram']),
+        'content_type': 'post',
+        'content_idea': ' '.join(rng.choice(WORDS) for _ in range(8)),
+        'best_time': '09:00'
+    } for i in range(max(1, tokens // 25))]
+    return json.dumps({
+        'calendar': entries,
+        'short_summary': ' '.join(rng.choice(WORDS) for _ in range(10)),
+        'key_points': [rng.choice(WORDS) for _ in range(3)],
+        'sentiment_score': 0.5,
+        'confidence': 0.9
+    }, ensure_ascii=False)
+
+
+def _split_tokens(content, count):
+    """Découpe un contenu en `count` fragments environ (un fragment = un chunk SSE)"""
+    size = max(1, len(content) // max(count, 1))
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Gestionnaire HTTP des requêtes Chat Completions simulées"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'gpt-4', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+            return
+
+        server = self.server
+        config = server.config
+        server.record('requests')
+
+        delay = max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        if config.random.random() < config.error_rate:
+            time.sleep(delay)
+            server.record('errors')
+            self._send_json(config.error_status, {
+                'error': {'message': 'Injected error', 'type': 'server_error', 'code': config.error_status}
+            })
+            return
+
+        tokens = min(config.completion_tokens, int(body.get('max_tokens') or config.completion_tokens))
+        if _wants_json(body):
+            content = _json_content(tokens, config.random)
+            chunks = _split_tokens(content, tokens)
+        else:
+            chunks = [(' ' if i else '') + config.random.choice(WORDS) for i in range(tokens)]
+            content = ''.join(chunks)
+
+        completion_id = f"chatcmpl-bench{server.record('completions')}"
+        model = body.get('model', 'gpt-4')
+        usage = {'prompt_tokens': sum(len(str(m.get('content', ''))) // 4 for m in body.get('messages', [])),
+                 'completion_tokens': len(chunks)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        time.sleep(delay)
+        if body.get('stream'):
+            self._stream(completion_id, model, chunks)
+        else:
+            if config.tokens_per_second > 0:
+                time.sleep(len(chunks) / config.tokens_per_second)
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+
+    def _stream(self, completion_id, model, chunks):
+        """Envoie la réponse en SSE, chunk par chunk, au débit configuré"""
+        config = self.server.config
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        disconnect_at = None
+        if config.random.random() < config.disconnect_rate:
+            disconnect_at = config.random.randrange(len(chunks)) if chunks else 0
+            self.server.record('disconnects')
+
+        interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0
+        created = int(time.time())
+        try:
+            self._write_event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                               'model': model, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': ''},
+                                                            'finish_reason': None}]})
+            for i, chunk in enumerate(chunks):
+                if i == disconnect_at:
+                    self.close_connection = True
+                    return
+                if interval and i:
+                    time.sleep(interval)
+                self._write_event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                                   'model': model, 'choices': [{'index': 0, 'delta': {'content': chunk},
+                                                                'finish_reason': None}]})
+            self._write_event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                               'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+            self._write_chunk(b'data: [DONE]\n\n')
+            self._write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # Le client a fermé le flux (annulation côté application)
+            self.server.record('cancelled')
+            self.close_connection = True
+
+    def _write_event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Serveur HTTP simulé, démarré dans un thread d'arrière-plan"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host='127.0.0.1', port=0, config=None):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.config = config or FakeOpenAIConfig()
+        self._counters = {'requests': 0, 'completions': 0, 'errors': 0, 'disconnects': 0, 'cancelled': 0}
+        self._counters_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, counter):
+        with self._counters_lock:
+            self._counters[counter] += 1
+            return self._counters[counter]
+
+    def stats(self):
+        with self._counters_lock:
+            return dict(self._counters)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-openai-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Fake OpenAI server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_config_arguments(parser):
+    """Ajoute les options du serveur simulé à un parseur argparse"""
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help="Débit de tokens (0 = sans attente)")
+    parser.add_argument('--latency-ms', type=float, default=200.0, help="Délai avant le premier token")
+    parser.add_argument('--jitter-ms', type=float, default=50.0, help="Variation aléatoire du délai initial")
+    parser.add_argument('--completion-tokens', type=int, default=200, help="Tokens générés par réponse")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion de réponses en erreur")
+    parser.add_argument('--error-status', type=int, default=500, help="Code HTTP des erreurs injectées")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="Proportion de flux coupés")
+    parser.add_argument('--seed', type=int, default=None, help="Graine aléatoire")
+
+
+def config_from_args(args):
+    """Construit la configuration du serveur à partir des options argparse"""
+    return FakeOpenAIConfig(
+        tokens_per_second=args.tokens_per_second,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API Chat Completions d'OpenAI")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = FakeOpenAIServer(args.host, args.port, config_from_args(args))
+    logger.info(f"Fake OpenAI server listening on {server.base_url} ({server.config.to_dict()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Served: {server.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""
+Benchmark de charge des fonctionnalités LLM contre un serveur OpenAI simulé
+
+Scénarios disponibles :
+    chat                 POST /api/chat en streaming (session authentifiée requise)
+    chat_json            POST /api/chat sans streaming
+    complete             POST /api/openai/complete
+    complete_stream      POST /api/openai/complete en streaming
+    analyze              POST /api/openai/analyze (analyze_text)
+    editorial_calendar   openai_marketing.generate_editorial_calendar (en processus)
+    financial_analysis   finance_blueprint.generate_financial_analysis (en processus)
+
+Les scénarios HTTP visent une application déjà démarrée avec OPENAI_BASE_URL
+pointant vers le serveur simulé (python -m benchmarks.fake_openai_server). Les
+scénarios en processus démarrent leur propre serveur simulé, sauf si
+--openai-base-url est fourni. Le résultat est un JSON stable (clés triées) que
+l'on peut comparer d'une version à l'autre avec --compare :
+
+    python -m benchmarks.llm_benchmark --scenarios editorial_calendar,financial_analysis \\
+        --concurrency 16 --requests 200 --output bench.json --compare bench-previous.json
+
+Les requêtes vers /api/chat sont enregistrées dans l'historique de l'utilisateur
+de la session : utiliser un compte dédié au benchmark.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+
+from benchmarks.fake_openai_server import FakeOpenAIServer, add_config_arguments, config_from_args
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCENARIOS = ['editorial_calendar', 'financial_analysis']
+
+
+class Sample:
+    """Mesure d'une requête du benchmark"""
+
+    __slots__ = ('latency', 'ttft', 'tokens', 'status', 'error')
+
+    def __init__(self, latency=0.0, ttft=None, tokens=0, status='ok', error=None):
+        self.latency = latency
+        self.ttft = ttft
+        self.tokens = tokens
+        self.status = status
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BenchmarkContext:
+    """Paramètres partagés par les scénarios"""
+
+    def __init__(self, app_url, cookie=None, timeout=120.0, concurrency=1):
+        self.app_url = app_url.rstrip('/')
+        headers = {'Cookie': cookie} if cookie else {}
+        self.http = httpx.Client(
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        )
+
+
+def _nonce():
+    """Identifiant unique inséré dans les prompts pour contourner les caches de réponses"""
+    return uuid.uuid4().hex[:12]
+
+
+def _sse_request(ctx, path, payload):
+    """Envoie une requête SSE et mesure la latence totale et le time-to-first-token"""
+    started = time.perf_counter()
+    ttft = None
+    tokens = 0
+    with ctx.http.stream('POST', ctx.app_url + path, json=payload) as response:
+        if response.status_code != 200:
+            response.read()
+            return Sample(time.perf_counter() - started, status=str(response.status_code),
+                          error=response.text[:200])
+        for line in response.iter_lines():
+            if not line.startswith('data:'):
+                continue
+            event = json.loads(line[5:].strip())
+            if event.get('error'):
+                return Sample(time.perf_counter() - started, ttft, tokens, 'stream_error', str(event['error']))
+            if event.get('done'):
+                break
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            tokens += 1
+    return Sample(time.perf_counter() - started, ttft, tokens, '200')
+
+
+def _json_request(ctx, path, payload):
+    """Envoie une requête JSON et mesure sa latence"""
+    started = time.perf_counter()
+    response = ctx.http.post(ctx.app_url + path, json=payload)
+    latency = time.perf_counter() - started
+    if response.status_code != 200:
+        return Sample(latency, status=str(response.status_code), error=response.text[:200])
+    data = response.json()
+    if data.get('error'):
+        return Sample(latency, status='200', error=str(data['error']))
+    usage = data.get('usage') or {}
+    return Sample(latency, tokens=usage.get('completion_tokens', 0), status='200')
+
+
+def scenario_chat(ctx, index):
+    return _sse_request(ctx, '/api/chat', {
+        'message': f"[bench {_nonce()}] Donne-moi trois conseils pour améliorer ma trésorerie.",
+        'stream': True
+    })
+
+
+def scenario_chat_json(ctx, index):
+    return _json_request(ctx, '/api/chat', {
+        'message': f"[bench {_nonce()}] Résume les avantages d'un budget prévisionnel.",
+        'stream': False
+    })
+
+
+def scenario_complete(ctx, index):
+    return _json_request(ctx, '/api/openai/complete', {
+        'prompt': f"[bench {_nonce()}] Rédige une accroche pour une agence comptable.",
+        'max_tokens': 300
+    })
+
+
+def scenario_complete_stream(ctx, index):
+    return _sse_request(ctx, '/api/openai/complete', {
+        'prompt': f"[bench {_nonce()}] Rédige une accroche pour une agence comptable.",
+        'max_tokens': 300,
+        'stream': True
+    })
+
+
+def scenario_analyze(ctx, index):
+    return _json_request(ctx, '/api/openai/analyze', {
+        'text': f"[bench {_nonce()}] Les ventes du trimestre ont progressé de 12% malgré la hausse des coûts.",
+        'analysis_type': 'summary',
+        'format': 'json'
+    })
+
+
+def scenario_editorial_calendar(ctx, index):
+    import openai_marketing
+    started = time.perf_counter()
+    try:
+        calendar = openai_marketing.generate_editorial_calendar(
+            business_sector=f"conseil {_nonce()}",
+            platforms=['linkedin', 'facebook'],
+            topics=['trésorerie', 'fiscalité'],
+            start_date='2025-01-01',
+            end_date='2025-01-31'
+        )
+    except Exception as e:
+        return Sample(time.perf_counter() - started, status='exception', error=str(e))
+    latency = time.perf_counter() - started
+    if not calendar:
+        return Sample(latency, status='empty', error="Calendrier vide")
+    return Sample(latency, status='ok')
+
+
+def scenario_financial_analysis(ctx, index):
+    import finance_blueprint
+    started = time.perf_counter()
+    html = finance_blueprint.generate_financial_analysis({
+        'start_date': '2025-01-01',
+        'end_date': '2025-03-31',
+        'total_income': 48250.0 + index,
+        'total_expenses': 31720.0,
+        'total_tax': 9650.0,
+        'profit': 16530.0 + index,
+        'expenses_by_category': {'Loyer': 7200.0, 'Salaires': 18400.0, 'Marketing': 6120.0},
+        'income_by_category': {'Prestations': 41000.0, 'Formations': 7250.0}
+    }, use_cache=False)
+    latency = time.perf_counter() - started
+    # La fonction capture ses erreurs et renvoie une alerte HTML
+    if not html or 'alert-danger' in html or 'alert-warning' in html:
+        return Sample(latency, status='error_html', error=(html or '')[:200])
+    return Sample(latency, tokens=len(html) // 4, status='ok')
+
+
+SCENARIOS = {
+    'chat': (scenario_chat, True),
+    'chat_json': (scenario_chat_json, False),
+    'complete': (scenario_complete, False),
+    'complete_stream': (scenario_complete_stream, True),
+    'analyze': (scenario_analyze, False),
+    'editorial_calendar': (scenario_editorial_calendar, False),
+    'financial_analysis': (scenario_financial_analysis, False),
+}
+
+IN_PROCESS_SCENARIOS = {'editorial_calendar', 'financial_analysis'}
+
+
+def percentile(values, fraction):
+    """Percentile par interpolation linéaire (values doit être trié)"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _distribution_ms(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.50) * 1000, 2),
+        'p95': round(percentile(values, 0.95) * 1000, 2),
+        'p99': round(percentile(values, 0.99) * 1000, 2),
+        'mean': round(sum(values) / len(values) * 1000, 2),
+        'max': round(values[-1] * 1000, 2)
+    }
+
+
+def run_scenario(ctx, name, requests_count, concurrency, warmup=0):
+    """
+    Exécute un scénario avec un nombre fixe de requêtes à la concurrence donnée
+
+    Args:
+        ctx (BenchmarkContext): Contexte partagé
+        name (str): Nom du scénario
+        requests_count (int): Nombre de requêtes mesurées
+        concurrency (int): Nombre de requêtes simultanées
+        warmup (int): Requêtes préalables non mesurées
+
+    Returns:
+        dict: Résultats agrégés du scénario
+    """
+    fn, streaming = SCENARIOS[name]
+
+    def call(index):
+        try:
+            return fn(ctx, index)
+        except Exception as e:
+            return Sample(status='exception', error=f"{type(e).__name__}: {e}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(warmup)))
+        started = time.perf_counter()
+        samples = list(pool.map(call, range(requests_count)))
+        elapsed = time.perf_counter() - started
+
+    succeeded = [s for s in samples if s.ok]
+    statuses = {}
+    for sample in samples:
+        statuses[sample.status] = statuses.get(sample.status, 0) + 1
+    errors = [s.error for s in samples if not s.ok]
+    if errors:
+        logger.warning(f"{name}: {len(errors)} error(s), first: {errors[0]}")
+
+    tokens = sum(s.tokens for s in succeeded)
+    return {
+        'requests': requests_count,
+        'concurrency': concurrency,
+        'streaming': streaming,
+        'errors': len(errors),
+        'error_rate': round(len(errors) / requests_count, 4) if requests_count else 0,
+        'statuses': statuses,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(succeeded) / elapsed, 2) if elapsed > 0 else None,
+        'tokens_per_second': round(tokens / elapsed, 2) if elapsed > 0 and tokens else None,
+        'latency_ms': _distribution_ms([s.latency for s in succeeded]),
+        'ttft_ms': _distribution_ms([s.ttft for s in succeeded if s.ttft is not None]) if streaming else None
+    }
+
+
+def compare(current, previous):
+    """
+    Calcule l'évolution des indicateurs principaux par rapport à un résultat précédent
+
+    Returns:
+        dict: {scénario: {indicateur: {'before', 'after', 'change_pct'}}}
+    """
+    def change(before, after):
+        if before in (None, 0) or after is None:
+            return None
+        return round((after - before) / before * 100, 1)
+
+    report = {}
+    for name, result in current['scenarios'].items():
+        old = previous.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        metrics = {}
+        for group in ('latency_ms', 'ttft_ms'):
+            for key in ('p50', 'p95', 'p99'):
+                before = (old.get(group) or {}).get(key)
+                after = (result.get(group) or {}).get(key)
+                if before is not None or after is not None:
+                    metrics[f"{group}.{key}"] = {'before': before, 'after': after, 'change_pct': change(before, after)}
+        for key in ('throughput_rps', 'tokens_per_second', 'error_rate'):
+            metrics[key] = {'before': old.get(key), 'after': result.get(key),
+                            'change_pct': change(old.get(key), result.get(key))}
+        report[name] = metrics
+    return report
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark des fonctionnalités LLM contre un OpenAI simulé")
+    parser.add_argument('--scenarios', default=','.join(DEFAULT_SCENARIOS),
+                        help=f"Scénarios séparés par des virgules parmi : {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help="Requêtes mesurées par scénario")
+    parser.add_argument('--warmup', type=int, default=5, help="Requêtes de chauffe par scénario")
+    parser.add_argument('--app-url', default=os.environ.get('BENCHMARK_APP_URL', 'http://localhost:5000'))
+    parser.add_argument('--cookie', default=os.environ.get('BENCHMARK_COOKIE'),
+                        help="En-tête Cookie d'une session connectée (scénarios chat)")
+    parser.add_argument('--openai-base-url', default=None,
+                        help="Serveur OpenAI (simulé) existant pour les scénarios en processus")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output', default=None, help="Fichier JSON de résultats (stdout par défaut)")
+    parser.add_argument('--compare', default=None, help="Résultats précédents à comparer")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Scénarios inconnus : {', '.join(unknown)}")
+
+    fake_server = None
+    if IN_PROCESS_SCENARIOS.intersection(names):
+        base_url = args.openai_base_url
+        if not base_url:
+            fake_server = FakeOpenAIServer(config=config_from_args(args)).start()
+            base_url = fake_server.base_url
+        # Lus par le SDK OpenAI à la création des clients, donc avant l'import des modules testés
+        os.environ['OPENAI_BASE_URL'] = base_url
+        os.environ.setdefault('OPENAI_API_KEY', 'sk-benchmark')
+
+    ctx = BenchmarkContext(args.app_url, args.cookie, args.timeout, args.concurrency)
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'app_url': ctx.app_url,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'fake_openai': config_from_args(args).to_dict() if fake_server else None
+        },
+        'scenarios': {}
+    }
+
+    try:
+        for name in names:
+            logger.info(f"Running {name} ({args.requests} requests, concurrency {args.concurrency})")
+            results['scenarios'][name] = run_scenario(ctx, name, args.requests, args.concurrency, args.warmup)
+    finally:
+        ctx.http.close()
+        if fake_server:
+            results['meta']['fake_openai_stats'] = fake_server.stats()
+            fake_server.stop()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            results['comparison'] = compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
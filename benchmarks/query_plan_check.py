@@ -0,0 +1,275 @@
+"""
+Vérification des plans d'exécution des requêtes fréquentes (régressions d'index)
+
+Crée les tables des modèles dans un schéma PostgreSQL dédié, les remplit de
+données synthétiques (--users utilisateurs, --rows lignes par utilisateur dans
+les tables filtrées par utilisateur), exécute ANALYZE puis EXPLAIN sur les
+requêtes des routes les plus sollicitées. Le script échoue si l'une d'elles
+parcourt séquentiellement la table qu'elle interroge : un index composite des
+modèles (__table_args__, créés en production par update_index_schema.py) a
+disparu ou ne correspond plus à la requête.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.query_plan_check
+    python -m benchmarks.query_plan_check --database-url postgresql://... --verbose
+
+Le schéma (query_plan_check par défaut) est supprimé à la fin sauf avec --keep.
+Les modèles sont importés depuis l'application (models_marketing importe main) :
+lancer le script avec l'environnement de l'application.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from sqlalchemy import create_engine, select, func, desc, text, event
+from sqlalchemy import types as sqltypes
+from sqlalchemy.dialects import postgresql
+
+from models import db, Subscription, Conversation, Message, ExtractedText, Category, FinancialTransaction, \
+    TransactionMonthlyRollup, Vendor, TaxReport, Customer, Invoice, InvoiceItem, Quote, QuoteItem
+from models_business import BusinessReport
+from models_marketing import MarketingCampaign, EmailContent, EditorialCalendarEntry
+from models_marketplace import ExtensionInstallation
+from models_modules import UserModuleInstallation
+from models_predictive import SalesPrediction, PredictiveAlert, MarketTrend
+from models_training import Lesson, Enrollment, ProgressRecord
+from dashboard_models import Transaction, CashflowPrediction
+import models_payment  # noqa: F401 (toutes les tables du schéma)
+import models_process  # noqa: F401
+
+DEFAULT_SCHEMA = 'query_plan_check'
+
+# Lignes des tables sans lien direct avec un utilisateur (catalogues, parents partagés)
+SHARED_ROWS = 200
+
+USER_ID = 42
+
+
+def _checks():
+    """Requêtes vérifiées : (nom, requête, table devant être lue par index)"""
+    day = func.current_date()
+    return [
+        ("transactions d'une période", select(FinancialTransaction).where(
+            FinancialTransaction.user_id == USER_ID,
+            FinancialTransaction.transaction_date.between(day - 90, day)), 'financial_transaction'),
+        ("transactions récentes", select(FinancialTransaction).where(
+            FinancialTransaction.user_id == USER_ID).order_by(FinancialTransaction.transaction_date.desc()).limit(5),
+         'financial_transaction'),
+        ("totaux mensuels d'une période", select(TransactionMonthlyRollup).where(
+            TransactionMonthlyRollup.user_id == USER_ID,
+            TransactionMonthlyRollup.month >= day - 365), 'transaction_monthly_rollup'),
+        ("transactions d'une catégorie", select(func.count()).select_from(FinancialTransaction).where(
+            FinancialTransaction.category_id == USER_ID), 'financial_transaction'),
+        ("messages d'une conversation", select(Message.id, Message.role, Message.timestamp).where(
+            Message.conversation_id == USER_ID).order_by(Message.timestamp), 'message'),
+        ("conversations d'un utilisateur", select(Conversation).where(
+            Conversation.user_id == USER_ID).order_by(Conversation.last_updated.desc()), 'conversation'),
+        ("textes extraits d'un utilisateur", select(ExtractedText.id, ExtractedText.title).where(
+            ExtractedText.user_id == USER_ID).order_by(ExtractedText.created_at.desc()), 'extracted_text'),
+        ("textes non traités", select(ExtractedText.id, ExtractedText.title).where(
+            ExtractedText.user_id == USER_ID, ExtractedText.is_processed == False).order_by(  # noqa: E712
+            ExtractedText.created_at.desc()), 'extracted_text'),
+        ("catégories d'un utilisateur", select(Category).where(Category.user_id == USER_ID), 'category'),
+        ("fournisseur par nom", select(Vendor).where(Vendor.user_id == USER_ID, Vendor.name == 'v1'), 'vendor'),
+        ("rapports fiscaux", select(TaxReport.id).where(TaxReport.user_id == USER_ID).order_by(
+            TaxReport.created_at.desc()), 'tax_report'),
+        ("clients d'un utilisateur", select(Customer).where(Customer.user_id == USER_ID).order_by(Customer.name),
+         'customer'),
+        ("factures par statut", select(func.count()).select_from(Invoice).where(
+            Invoice.user_id == USER_ID, Invoice.status == 'paid'), 'invoice'),
+        ("dernières factures", select(Invoice).where(Invoice.user_id == USER_ID).order_by(
+            desc(Invoice.created_at)).limit(5), 'invoice'),
+        ("factures d'un client", select(Invoice).where(Invoice.customer_id == USER_ID).order_by(
+            desc(Invoice.issue_date)), 'invoice'),
+        ("lignes d'une facture", select(InvoiceItem).where(InvoiceItem.invoice_id == USER_ID), 'invoice_item'),
+        ("devis par statut", select(func.count()).select_from(Quote).where(
+            Quote.user_id == USER_ID, Quote.status == 'sent'), 'quote'),
+        ("derniers devis", select(Quote).where(Quote.user_id == USER_ID).order_by(Quote.created_at.desc()).limit(5),
+         'quote'),
+        ("lignes d'un devis", select(QuoteItem).where(QuoteItem.quote_id == USER_ID), 'quote_item'),
+        ("abonnement courant", select(Subscription).where(Subscription.user_id == USER_ID).order_by(
+            Subscription.start_date.desc()).limit(1), 'subscription'),
+        ("analyses business", select(BusinessReport.id).where(BusinessReport.user_id == USER_ID).order_by(
+            BusinessReport.created_at.desc()), 'business_report'),
+        ("campagnes récentes", select(MarketingCampaign).where(MarketingCampaign.user_id == USER_ID).order_by(
+            MarketingCampaign.created_at.desc()).limit(5), 'marketing_campaign'),
+        ("emails d'une campagne", select(EmailContent).where(EmailContent.campaign_id == USER_ID), 'email_content'),
+        ("calendrier éditorial par type", select(EditorialCalendarEntry).where(
+            EditorialCalendarEntry.user_id == USER_ID, EditorialCalendarEntry.content_type == 'social'),
+         'editorial_calendar_entry'),
+        ("extension installée", select(ExtensionInstallation).where(
+            ExtensionInstallation.user_id == USER_ID, ExtensionInstallation.extension_id == 1,
+            ExtensionInstallation.is_active == True), 'marketplace_extension_installation'),  # noqa: E712
+        ("modules actifs", select(UserModuleInstallation).where(
+            UserModuleInstallation.user_id == USER_ID, UserModuleInstallation.status == 'active'),
+         'user_module_installation'),
+        ("prévisions de ventes", select(SalesPrediction.id).where(SalesPrediction.user_id == USER_ID).order_by(
+            SalesPrediction.date_created.desc()).limit(5), 'sales_prediction'),
+        ("alertes non lues", select(PredictiveAlert).where(
+            PredictiveAlert.user_id == USER_ID, PredictiveAlert.status == 'unread').order_by(
+            PredictiveAlert.date_created.desc()).limit(5), 'predictive_alert'),
+        ("tendances du marché", select(MarketTrend.id).where(MarketTrend.user_id == USER_ID).order_by(
+            MarketTrend.date_created.desc()).limit(5), 'market_trend'),
+        ("leçons d'un cours", select(Lesson.id, Lesson.title).where(Lesson.course_id == USER_ID).order_by(
+            Lesson.order_index), 'training_lesson'),
+        ("inscription à un cours", select(Enrollment).where(
+            Enrollment.user_id == USER_ID, Enrollment.course_id == 1), 'training_enrollment'),
+        ("progression d'une inscription", select(ProgressRecord).where(ProgressRecord.enrollment_id == USER_ID),
+         'training_progress_record'),
+        ("transactions du tableau de bord", select(Transaction).where(
+            Transaction.user_id == USER_ID, Transaction.date >= func.now() - text("interval '30 days'")),
+         'transaction'),
+        ("prévisions de trésorerie", select(CashflowPrediction).where(
+            CashflowPrediction.user_id == USER_ID, CashflowPrediction.prediction_date >= day), 'cashflow_prediction'),
+    ]
+
+
+def _value_sql(column, parent_rows, users):
+    """Expression SQL d'une valeur synthétique pour la ligne g de generate_series"""
+    foreign_keys = list(column.foreign_keys)
+    if foreign_keys:
+        parent = foreign_keys[0].column.table.name
+        return f"(g % {users if parent == 'user' else parent_rows[parent]}) + 1"
+    if column.name == 'user_id':
+        return f"(g % {users}) + 1"
+
+    column_type = column.type
+    if isinstance(column_type, sqltypes.Boolean):
+        return "(g % 3 = 0)"
+    if isinstance(column_type, (sqltypes.Integer, sqltypes.Numeric, sqltypes.Float)):
+        return "(g % 1000)"
+    if isinstance(column_type, sqltypes.DateTime):
+        return "(now() - (g % 1000) * interval '1 hour')"
+    if isinstance(column_type, sqltypes.Date):
+        return "(current_date - (g % 730))"
+    if isinstance(column_type, (sqltypes.JSON, postgresql.JSONB)):
+        return "'{}'"
+    if isinstance(column_type, postgresql.ARRAY):
+        return "'{}'"
+    if isinstance(column_type, sqltypes.String):
+        length = getattr(column_type, 'length', None) or 255
+        # Statuts, types et noms : quelques valeurs distinctes par table, uniques si nécessaire
+        value = "'v' || g" if column.unique or column.primary_key else "'v' || (g % 7)"
+        return f"left({value}, {length})"
+    return "NULL"
+
+
+def _row_count(table, users, rows):
+    columns = table.columns
+    if 'user_id' in columns and table.name != 'user':
+        return users * rows
+    if any(column.foreign_keys for column in columns):
+        return users * rows
+    return users if table.name == 'user' else SHARED_ROWS
+
+
+def seed(connection, metadata, users, rows):
+    """Remplit toutes les tables du schéma de données synthétiques avec generate_series"""
+    parent_rows = {}
+    for table in metadata.sorted_tables:
+        count = _row_count(table, users, rows)
+        parent_rows[table.name] = count
+        columns, values = [], []
+        for column in table.columns:
+            if column.computed is not None:
+                continue
+            if column.primary_key and isinstance(column.type, sqltypes.Integer) and not column.foreign_keys \
+                    and len(table.primary_key.columns) == 1:
+                columns.append(column.name)
+                values.append("g")
+                continue
+            columns.append(column.name)
+            values.append(_value_sql(column, parent_rows, users))
+        quoted = ", ".join(f'"{name}"' for name in columns)
+        connection.execute(text(
+            f'INSERT INTO "{table.name}" ({quoted}) SELECT {", ".join(values)} '
+            f'FROM generate_series(1, {count}) AS g ON CONFLICT DO NOTHING'
+        ))
+    connection.execute(text("ANALYZE"))
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def explain(connection, statement):
+    """Plan JSON d'une requête SQLAlchemy"""
+    compiled = statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    return connection.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()[0]['Plan']
+
+
+def run_checks(connection, verbose=False):
+    """
+    Exécute EXPLAIN sur chaque requête vérifiée
+
+    Returns:
+        list: Noms des requêtes qui parcourent séquentiellement leur table
+    """
+    failures = []
+    for name, statement, table in _checks():
+        plan = explain(connection, statement)
+        scans = [(node['Node Type'], node.get('Index Name')) for node in _plan_nodes(plan)
+                 if node.get('Relation Name') == table]
+        sequential = any(node_type == 'Seq Scan' for node_type, _ in scans)
+        status = 'SEQ SCAN' if sequential else 'ok'
+        print(f"{status:8} {name} ({table}): " + ", ".join(
+            f"{node_type}{' ' + index if index else ''}" for node_type, index in scans))
+        if verbose:
+            print(json.dumps(plan, indent=2))
+        if sequential:
+            failures.append(name)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérification des plans d'exécution des requêtes fréquentes")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'), help="Base PostgreSQL de test")
+    parser.add_argument('--schema', default=DEFAULT_SCHEMA, help="Schéma créé pour la vérification")
+    parser.add_argument('--users', type=int, default=200, help="Utilisateurs générés")
+    parser.add_argument('--rows', type=int, default=50, help="Lignes par utilisateur dans chaque table")
+    parser.add_argument('--keep', action='store_true', help="Conserver le schéma après la vérification")
+    parser.add_argument('--verbose', action='store_true', help="Afficher les plans complets")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        print("DATABASE_URL ou --database-url requis", file=sys.stderr)
+        return 2
+
+    engine = create_engine(args.database_url)
+
+    @event.listens_for(engine, 'connect')
+    def set_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'SET search_path TO "{args.schema}"')
+        cursor.close()
+
+    metadata = db.Model.metadata
+    started = time.monotonic()
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA "{args.schema}"'))
+        connection.execute(text(f'SET search_path TO "{args.schema}"'))
+        metadata.create_all(connection)
+        seed(connection, metadata, args.users, args.rows)
+    print(f"Schéma {args.schema} créé et rempli en {time.monotonic() - started:.1f}s")
+
+    try:
+        with engine.connect() as connection:
+            failures = run_checks(connection, args.verbose)
+    finally:
+        if not args.keep:
+            with engine.begin() as connection:
+                connection.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+
+    if failures:
+        print(f"{len(failures)} requête(s) en parcours séquentiel : {', '.join(failures)}", file=sys.stderr)
+        return 1
+    print("Aucune requête vérifiée ne parcourt séquentiellement sa table")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Vérification et micro-benchmark de l'extraction des champs des reçus (receipt_extractor)
+
+Deux modes :
+- --check compare le résultat de receipt_extractor.extract_fields sur chaque texte
+  de benchmarks/fixtures/receipts (*.txt) au résultat attendu (*.expected.json) ;
+  --update réécrit les résultats attendus après une modification volontaire.
+- par défaut, mesure le temps d'analyse de --texts textes (le corpus répété) par
+  extract_many et par l'implémentation d'origine (analyze_document_text_legacy de
+  finance_blueprint), qui parcourait le texte une fois par expression essayée, et
+  compte les montants, dates et fournisseurs du corpus trouvés par chacune.
+
+    python -m benchmarks.receipt_extractor_benchmark --check
+    python -m benchmarks.receipt_extractor_benchmark --texts 5000 --repeat 5
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import statistics
+
+import receipt_extractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'receipts')
+
+
+def load_fixtures():
+    fixtures = {}
+    for filename in sorted(os.listdir(FIXTURES_DIR)):
+        if filename.endswith('.txt'):
+            with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+                fixtures[filename[:-len('.txt')]] = f.read()
+    return fixtures
+
+
+def check_fixtures(update=False):
+    """Compare (ou réécrit) les résultats attendus ; retourne le nombre d'écarts"""
+    failures = 0
+    for name, text in load_fixtures().items():
+        result = receipt_extractor.extract_fields(text)
+        expected_path = os.path.join(FIXTURES_DIR, f"{name}.expected.json")
+        if update:
+            with open(expected_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+                f.write("\n")
+            print(f"updated  {name}")
+            continue
+        with open(expected_path, encoding='utf-8') as f:
+            expected = json.load(f)
+        if result == expected:
+            print(f"ok       {name}")
+        else:
+            failures += 1
+            print(f"MISMATCH {name}")
+            print(f"  expected: {json.dumps(expected, ensure_ascii=False, sort_keys=True)}")
+            print(f"  actual:   {json.dumps(result, ensure_ascii=False, sort_keys=True)}")
+    return failures
+
+
+def legacy_analyze_document_text(text):
+    """Implémentation d'origine de finance_blueprint.analyze_document_text_legacy (référence)"""
+    result = {}
+    amount_patterns = [
+        r'(\d+[,.]\d+)\s*€',
+        r'(\d+[,.]\d+)€',
+        r'€\s*(\d+[,.]\d+)',
+        r'TOTAL\s*:?\s*(\d+[,.]\d+)',
+        r'MONTANT\s*:?\s*(\d+[,.]\d+)'
+    ]
+    for pattern in amount_patterns:
+        match = re.search(pattern, text)
+        if match:
+            result['amount'] = match.group(1).replace(',', '.')
+            break
+    date_patterns = [
+        r'(\d{2}/\d{2}/\d{4})',
+        r'(\d{2}-\d{2}-\d{4})',
+        r'(\d{4}-\d{2}-\d{2})',
+        r'Date\s*:?\s*(\d{2}[/-]\d{2}[/-]\d{4})',
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text)
+        if match:
+            date_str = match.group(1)
+            if '/' in date_str:
+                parts = date_str.split('/')
+                if len(parts[2]) == 4:
+                    result['date'] = f"{parts[2]}-{parts[1]}-{parts[0]}"
+                else:
+                    result['date'] = datetime.datetime.now().strftime('%Y-%m-%d')
+            elif '-' in date_str:
+                parts = date_str.split('-')
+                if len(parts[0]) == 4:
+                    result['date'] = date_str
+                else:
+                    result['date'] = f"{parts[2]}-{parts[1]}-{parts[0]}"
+            break
+    if 'date' not in result:
+        result['date'] = datetime.datetime.now().strftime('%Y-%m-%d')
+    vendor_patterns = [
+        r'VENDEUR\s*:?\s*([A-Za-z0-9\s]+)',
+        r'FOURNISSEUR\s*:?\s*([A-Za-z0-9\s]+)',
+        r'MAGASIN\s*:?\s*([A-Za-z0-9\s]+)',
+        r'BOUTIQUE\s*:?\s*([A-Za-z0-9\s]+)',
+    ]
+    for pattern in vendor_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            result['vendor'] = match.group(1).strip()
+            break
+    tax_patterns = [
+        r'TVA\s+(\d+[,.]\d+)%',
+        r'TVA\s*:?\s*(\d+[,.]\d+)%',
+        r'T\.V\.A\.\s*(\d+[,.]\d+)%',
+    ]
+    for pattern in tax_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            result['tax_rate'] = match.group(1).replace(',', '.')
+            break
+    if 'FACTURE' in text.upper():
+        result['document_type'] = 'invoice'
+    elif 'REÇU' in text.upper() or 'RECU' in text.upper():
+        result['document_type'] = 'receipt'
+    elif 'TICKET' in text.upper():
+        result['document_type'] = 'receipt'
+    else:
+        result['document_type'] = 'unknown'
+    return result
+
+
+def time_function(function, texts, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(texts)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3)}
+
+
+def field_accuracy(function):
+    """Montants, dates et fournisseurs du corpus égaux aux résultats attendus"""
+    matching = total = 0
+    for name, text in load_fixtures().items():
+        with open(os.path.join(FIXTURES_DIR, f"{name}.expected.json"), encoding='utf-8') as f:
+            expected = json.load(f)
+        result = function(text)
+        for field in ('amount', 'date', 'vendor'):
+            total += 1
+            matching += result.get(field) == expected[field]
+    return f"{matching}/{total}"
+
+
+def run_benchmark(count, repeat):
+    corpus = list(load_fixtures().values())
+    texts = [corpus[i % len(corpus)] for i in range(count)]
+    legacy_timing = time_function(lambda batch: [legacy_analyze_document_text(t) for t in batch], texts, repeat)
+    current_timing = time_function(receipt_extractor.extract_many, texts, repeat)
+    return {
+        'texts': count,
+        'legacy': legacy_timing,
+        'current': current_timing,
+        'current_texts_per_second': round(count / (current_timing['median_ms'] / 1000)),
+        'speedup': round(legacy_timing['median_ms'] / current_timing['median_ms'], 1),
+        'legacy_fields_matching': field_accuracy(legacy_analyze_document_text),
+        'current_fields_matching': field_accuracy(receipt_extractor.extract_fields)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérification et benchmark de l'extraction des champs des reçus")
+    parser.add_argument('--check', action='store_true', help="Comparer aux résultats attendus des fixtures")
+    parser.add_argument('--update', action='store_true', help="Réécrire les résultats attendus des fixtures")
+    parser.add_argument('--texts', type=int, default=5000, help="Textes analysés par mesure")
+    parser.add_argument('--repeat', type=int, default=5, help="Mesures par implémentation")
+    args = parser.parse_args(argv)
+
+    if args.check or args.update:
+        failures = check_fixtures(update=args.update)
+        return 1 if failures else 0
+
+    print(json.dumps(run_benchmark(args.texts, args.repeat), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Vérification et micro-benchmark de l'analyse des réponses AWS Textract
+
+Deux modes :
+- --check compare le résultat de aws_textract sur chaque réponse enregistrée de
+  benchmarks/fixtures/textract (*.json) au résultat attendu (*.expected.json) ;
+  --update réécrit les résultats attendus après une modification volontaire.
+- par défaut, mesure le temps d'analyse d'une réponse de --pages pages (construite
+  en dupliquant les pages des fixtures) par l'implémentation actuelle et par
+  l'implémentation d'origine, qui recherchait chaque bloc référencé dans la liste
+  complète des blocs et sérialisait les documents de dépense pour détecter les reçus.
+
+    python -m benchmarks.textract_parser_benchmark --check
+    python -m benchmarks.textract_parser_benchmark --pages 50 --repeat 20
+"""
+import os
+import re
+import sys
+import copy
+import json
+import time
+import uuid
+import argparse
+import statistics
+
+import aws_textract
+import textract_parser
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'textract')
+
+
+def analyze_fixture(name, response):
+    """Résultat de aws_textract pour une réponse enregistrée (selon l'opération du nom de fichier)"""
+    if name.startswith('analyze_expense'):
+        return aws_textract.expense_analysis_from_parsed(textract_parser.parse_expense(response))
+    parsed = textract_parser.parse_analysis(response)
+    return {
+        "text": "\n".join(parsed.lines).strip(),
+        "extracted_info": aws_textract.financial_info_from_parsed(parsed),
+        "tables": parsed.tables
+    }
+
+
+def load_fixtures():
+    fixtures = {}
+    for filename in sorted(os.listdir(FIXTURES_DIR)):
+        if filename.endswith('.json') and not filename.endswith('.expected.json'):
+            with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+                fixtures[filename[:-len('.json')]] = json.load(f)
+    return fixtures
+
+
+def check_fixtures(update=False):
+    """Compare (ou réécrit) les résultats attendus ; retourne le nombre d'écarts"""
+    failures = 0
+    for name, response in load_fixtures().items():
+        result = analyze_fixture(name, response)
+        expected_path = os.path.join(FIXTURES_DIR, f"{name}.expected.json")
+        if update:
+            with open(expected_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+                f.write("\n")
+            print(f"updated  {name}")
+            continue
+        with open(expected_path, encoding='utf-8') as f:
+            expected = json.load(f)
+        if result == expected:
+            print(f"ok       {name}")
+        else:
+            failures += 1
+            print(f"MISMATCH {name}")
+            print(f"  expected: {json.dumps(expected, ensure_ascii=False, sort_keys=True)}")
+            print(f"  actual:   {json.dumps(result, ensure_ascii=False, sort_keys=True)}")
+    return failures
+
+
+def multiply_pages(response, pages):
+    """Construit une réponse de `pages` pages en dupliquant les blocs avec de nouveaux identifiants"""
+    if 'ExpenseDocuments' in response:
+        documents = []
+        for i in range(pages):
+            document = copy.deepcopy(response['ExpenseDocuments'][i % len(response['ExpenseDocuments'])])
+            document['ExpenseIndex'] = i + 1
+            documents.append(document)
+        return {**response, 'ExpenseDocuments': documents, 'DocumentMetadata': {'Pages': pages}}
+
+    blocks = []
+    for page in range(1, pages + 1):
+        ids = {block['Id']: str(uuid.uuid4()) for block in response['Blocks']}
+        for block in response['Blocks']:
+            block = copy.deepcopy(block)
+            block['Id'] = ids[block['Id']]
+            block['Page'] = page
+            for relationship in block.get('Relationships', []):
+                relationship['Ids'] = [ids[i] for i in relationship['Ids']]
+            blocks.append(block)
+    return {**response, 'Blocks': blocks, 'DocumentMetadata': {'Pages': pages}}
+
+
+def legacy_extract_financial_info(analysis_response):
+    """Implémentation d'origine de aws_textract.extract_financial_info (référence)"""
+    result = {}
+    full_text = ""
+    form_data = {}
+    for block in analysis_response["Blocks"]:
+        if block["BlockType"] == "LINE":
+            full_text += block["Text"] + "\n"
+        if block["BlockType"] == "KEY_VALUE_SET":
+            if "KEY" in block.get("EntityTypes", []):
+                key = ""
+                for relationship in block.get("Relationships", []):
+                    if relationship["Type"] == "CHILD":
+                        for child_id in relationship["Ids"]:
+                            child_block = next((b for b in analysis_response["Blocks"] if b["Id"] == child_id), None)
+                            if child_block and child_block["BlockType"] == "WORD":
+                                key += child_block["Text"] + " "
+                value = ""
+                for relationship in block.get("Relationships", []):
+                    if relationship["Type"] == "VALUE":
+                        for value_id in relationship["Ids"]:
+                            value_block = next((b for b in analysis_response["Blocks"] if b["Id"] == value_id), None)
+                            if value_block:
+                                for child_relationship in value_block.get("Relationships", []):
+                                    if child_relationship["Type"] == "CHILD":
+                                        for child_id in child_relationship["Ids"]:
+                                            child_block = next(
+                                                (b for b in analysis_response["Blocks"] if b["Id"] == child_id), None)
+                                            if child_block and child_block["BlockType"] == "WORD":
+                                                value += child_block["Text"] + " "
+                key = key.strip().lower()
+                value = value.strip()
+                if key and value:
+                    form_data[key] = value
+
+    for key in ["total", "montant", "amount", "somme"]:
+        if key in form_data:
+            result["amount"] = aws_textract.clean_amount(form_data[key])
+            break
+    for key in ["date", "date de facturation", "date d'émission"]:
+        if key in form_data:
+            result["date"] = form_data[key]
+            break
+    for key in ["fournisseur", "vendeur", "société", "magasin", "émetteur", "de"]:
+        if key in form_data:
+            result["vendor"] = form_data[key]
+            break
+    for key in ["tva", "taxe", "tax"]:
+        if key in form_data:
+            result["tax_amount"] = aws_textract.clean_amount(form_data[key])
+            break
+    if "amount" not in result:
+        amount_match = re.search(r'(?:TOTAL|MONTANT)\s*:?\s*(\d+[,.]\d+)', full_text, re.IGNORECASE)
+        if amount_match:
+            result["amount"] = aws_textract.clean_amount(amount_match.group(1))
+    if "date" not in result:
+        date_match = re.search(r'(?:DATE)\s*:?\s*(\d{2}[/.-]\d{2}[/.-]\d{4})', full_text, re.IGNORECASE)
+        if date_match:
+            result["date"] = date_match.group(1)
+    if "vendor" not in result:
+        vendor_match = re.search(r'(?:FOURNISSEUR|VENDEUR|MAGASIN)\s*:?\s*([A-Za-z0-9\s]{3,30})', full_text, re.IGNORECASE)
+        if vendor_match:
+            result["vendor"] = vendor_match.group(1).strip()
+    if re.search(r'\b(?:FACTURE|INVOICE)\b', full_text, re.IGNORECASE):
+        result["document_type"] = "invoice"
+    elif re.search(r'\b(?:REÇU|TICKET|RECEIPT)\b', full_text, re.IGNORECASE):
+        result["document_type"] = "receipt"
+    else:
+        result["document_type"] = "unknown"
+    return result
+
+
+def legacy_expense_fields(response):
+    """Analyse d'origine des réponses AnalyzeExpense (référence, sans repli sur le texte)"""
+    result = {}
+    for doc in response['ExpenseDocuments']:
+        result['document_type'] = "receipt" if 'Receipt' in str(doc) else "invoice"
+        for field in doc.get('SummaryFields', []):
+            if 'Type' in field and 'ValueDetection' in field:
+                field_type = field['Type']['Text']
+                field_value = field['ValueDetection'].get('Text', '')
+                if field_type == 'TOTAL':
+                    result['amount'] = aws_textract.clean_amount(field_value)
+                elif field_type == 'INVOICE_RECEIPT_DATE':
+                    result['date'] = field_value
+                elif field_type == 'VENDOR_NAME':
+                    result['vendor'] = field_value
+                elif field_type == 'TAX':
+                    result['tax_amount'] = aws_textract.clean_amount(field_value)
+                elif field_type == 'SUBTOTAL':
+                    result['subtotal'] = aws_textract.clean_amount(field_value)
+    full_text = ""
+    blocks = list(response.get('Blocks', []))
+    for doc in response.get('ExpenseDocuments', []):
+        blocks.extend(doc.get('Blocks', []))
+    for block in blocks:
+        if block.get('BlockType') == 'LINE':
+            full_text += block.get('Text', '') + "\n"
+    result['full_text'] = full_text.strip()
+    return result
+
+
+def current_document(response):
+    parsed = textract_parser.parse_analysis(response)
+    return aws_textract.financial_info_from_parsed(parsed)
+
+
+def current_expense(response):
+    return aws_textract.expense_analysis_from_parsed(textract_parser.parse_expense(response))
+
+
+def time_function(function, response, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(response)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3)}
+
+
+def run_benchmark(pages, repeat):
+    results = {}
+    for name, response in load_fixtures().items():
+        large = multiply_pages(response, pages)
+        if name.startswith('analyze_expense'):
+            legacy, current = legacy_expense_fields, current_expense
+            blocks = sum(len(doc.get('Blocks', [])) for doc in large['ExpenseDocuments'])
+        else:
+            legacy, current = legacy_extract_financial_info, current_document
+            blocks = len(large['Blocks'])
+        legacy_timing = time_function(legacy, large, max(1, repeat // 5))
+        current_timing = time_function(current, large, repeat)
+        results[name] = {
+            'pages': pages,
+            'blocks': blocks,
+            'legacy': legacy_timing,
+            'current': current_timing,
+            'speedup': round(legacy_timing['median_ms'] / current_timing['median_ms'], 1)
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérification et benchmark de l'analyse des réponses Textract")
+    parser.add_argument('--check', action='store_true', help="Comparer aux résultats attendus des fixtures")
+    parser.add_argument('--update', action='store_true', help="Réécrire les résultats attendus des fixtures")
+    parser.add_argument('--pages', type=int, default=50, help="Pages de la réponse mesurée")
+    parser.add_argument('--repeat', type=int, default=20, help="Mesures par implémentation")
+    args = parser.parse_args(argv)
+
+    if args.check or args.update:
+        failures = check_fixtures(update=args.update)
+        return 1 if failures else 0
+
+    print(json.dumps(run_benchmark(args.pages, args.repeat), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
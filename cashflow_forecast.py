@@ -0,0 +1,372 @@
+"""
+Prévisions de trésorerie précalculées (table cashflow_prediction)
+
+Pour chaque utilisateur ayant des transactions (tableau de bord) dans les
+CASHFLOW_FORECAST_HISTORY_MONTHS derniers mois complets, les revenus et dépenses
+mensuels sont prolongés par un lissage exponentiel double amorti (Holt), dont
+les coefficients sont choisis par utilisateur sur une petite grille en
+minimisant l'erreur de prévision à un mois. Les calculs sont vectorisés avec
+NumPy sur des paquets de CASHFLOW_FORECAST_BATCH_SIZE utilisateurs, répartis
+entre CASHFLOW_FORECAST_WORKERS processus.
+
+Les prévisions du mois en cours et des CASHFLOW_FORECAST_MONTHS mois suivants
+sont réécrites avec un score de confiance (erreur passée du modèle rapportée au
+niveau des montants, dégradée avec l'horizon et pour les historiques courts)
+au démarrage puis toutes les CASHFLOW_FORECAST_INTERVAL secondes, ou via
+forecast_cashflow.py. Les tableaux de bord lisent ces lignes par l'index
+(user_id, prediction_date) ; un utilisateur sans prévision enregistrée est
+calculé à la demande, sans écriture.
+"""
+import os
+import time
+import logging
+import datetime
+import threading
+import multiprocessing
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import delete, func, insert, text
+
+from models import db
+from dashboard_models import TransactionCategory, Transaction, CashflowPrediction
+
+logger = logging.getLogger(__name__)
+
+# Intervalle entre deux calculs des prévisions (secondes, 0 pour désactiver)
+CASHFLOW_FORECAST_INTERVAL = int(os.environ.get('CASHFLOW_FORECAST_INTERVAL', 86400))
+
+# Mois complets d'historique utilisés par le modèle
+CASHFLOW_FORECAST_HISTORY_MONTHS = int(os.environ.get('CASHFLOW_FORECAST_HISTORY_MONTHS', 24))
+
+# Mois prévus après le mois en cours
+CASHFLOW_FORECAST_MONTHS = int(os.environ.get('CASHFLOW_FORECAST_MONTHS', 12))
+
+# Utilisateurs calculés ensemble (une requête et un calcul vectorisé par paquet)
+CASHFLOW_FORECAST_BATCH_SIZE = int(os.environ.get('CASHFLOW_FORECAST_BATCH_SIZE', 500))
+
+# Processus de calcul (1 = calcul dans le processus appelant)
+CASHFLOW_FORECAST_WORKERS = int(os.environ.get('CASHFLOW_FORECAST_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Clé du verrou consultatif PostgreSQL garantissant un seul calcul à la fois
+FORECAST_LOCK_KEY = 720053
+
+# Grille des coefficients de lissage du niveau (alpha), de la tendance (beta) et d'amortissement de la tendance (phi)
+ALPHAS = (0.2, 0.4, 0.6, 0.8)
+BETAS = (0.05, 0.2)
+DAMPINGS = (0.9, 1.0)
+
+# Historique (mois observés) à partir duquel la confiance n'est plus réduite
+FULL_CONFIDENCE_MONTHS = 12
+
+MAX_AMOUNT = 99999999.99
+
+_forecast_thread = None
+
+
+def init_app(app):
+    """Initialiser le calcul périodique des prévisions de trésorerie pour l'application Flask"""
+    global _forecast_thread
+
+    if CASHFLOW_FORECAST_INTERVAL > 0 and _forecast_thread is None:
+        _forecast_thread = threading.Thread(
+            target=_forecast_loop, args=(app,), name='cashflow-forecast', daemon=True
+        )
+        _forecast_thread.start()
+
+
+def fit_forecast(history, starts, horizon):
+    """
+    Prolonge des séries mensuelles par lissage exponentiel double amorti
+
+    Toutes les séries et tous les coefficients de la grille sont calculés
+    ensemble ; seule la boucle sur les mois reste en Python.
+
+    Args:
+        history (np.ndarray): Montants mensuels (utilisateurs x mois), du plus ancien au plus récent
+        starts (np.ndarray): Indice du premier mois observé de chaque utilisateur
+        horizon (int): Nombre de mois à prévoir
+
+    Returns:
+        tuple: (prévisions, confiance), deux tableaux utilisateurs x horizon
+    """
+    users, months = history.shape
+    rows = np.arange(users)
+    alpha, beta, phi = (grid.ravel()[:, None] for grid in np.meshgrid(ALPHAS, BETAS, DAMPINGS, indexing='ij'))
+
+    # Niveau initial : premier mois observé ; tendance initiale : écart avec le mois suivant
+    level = np.repeat(history[rows, starts][None, :], len(alpha), axis=0)
+    following = history[rows, np.minimum(starts + 1, months - 1)]
+    initial_trend = np.where(starts + 1 < months, following - history[rows, starts], 0.0)
+    trend = np.repeat(initial_trend[None, :], len(alpha), axis=0)
+    sse = np.zeros_like(level)
+    for month in range(1, months):
+        active = month > starts
+        if not active.any():
+            continue
+        error = history[:, month] - (level + phi * trend)
+        level = np.where(active, level + phi * trend + alpha * error, level)
+        trend = np.where(active, phi * trend + alpha * beta * error, trend)
+        sse += np.where(active, error ** 2, 0.0)
+
+    best = sse.argmin(axis=0)
+    level, trend, sse, phi = level[best, rows], trend[best, rows], sse[best, rows], phi[best, 0]
+
+    steps = np.arange(1, horizon + 1)
+    damping = np.cumsum(phi[:, None] ** steps[None, :], axis=1)
+    forecast = np.clip(level[:, None] + trend[:, None] * damping, 0.0, MAX_AMOUNT)
+
+    # Confiance : erreur quadratique moyenne à un mois, rapportée au montant moyen et croissant avec l'horizon
+    observed = months - starts
+    rmse = np.sqrt(sse / np.maximum(observed - 1, 1))
+    observed_mask = np.arange(months)[None, :] >= starts[:, None]
+    scale = np.abs(history * observed_mask).sum(axis=1) / observed
+    spread = rmse[:, None] * np.sqrt(steps)[None, :]
+    ratio = np.divide(spread, scale[:, None], out=np.zeros_like(spread), where=scale[:, None] > 0)
+    confidence = np.minimum(observed / FULL_CONFIDENCE_MONTHS, 1.0)[:, None] / (1.0 + ratio)
+    return forecast, confidence
+
+
+def forecast_batch(income, expense, starts, horizon):
+    """
+    Prévoit revenus et dépenses d'un paquet d'utilisateurs (exécuté dans le pool de processus)
+
+    Returns:
+        tuple: (revenus prévus, dépenses prévues, confiance), tableaux utilisateurs x horizon
+    """
+    income_forecast, income_confidence = fit_forecast(income, starts, horizon)
+    expense_forecast, expense_confidence = fit_forecast(expense, starts, horizon)
+    return income_forecast, expense_forecast, np.minimum(income_confidence, expense_confidence)
+
+
+def _history_start(month_start):
+    return month_start - relativedelta(months=CASHFLOW_FORECAST_HISTORY_MONTHS)
+
+
+def load_history(user_ids, month_start):
+    """
+    Lit les revenus et dépenses mensuels d'un paquet d'utilisateurs en une requête groupée
+
+    Args:
+        user_ids (list): IDs des utilisateurs
+        month_start (datetime): Début du mois en cours (exclu de l'historique)
+
+    Returns:
+        tuple: (IDs des utilisateurs ayant un historique, revenus, dépenses, indices du premier mois observé)
+    """
+    first_month = _history_start(month_start)
+    month = func.date_trunc('month', Transaction.date)
+    rows = db.session.query(
+        Transaction.user_id, month, TransactionCategory.type, func.sum(Transaction.amount)
+    ).join(
+        TransactionCategory, Transaction.category_id == TransactionCategory.id
+    ).filter(
+        Transaction.user_id.in_(user_ids),
+        Transaction.date >= first_month,
+        Transaction.date < month_start
+    ).group_by(Transaction.user_id, month, TransactionCategory.type).all()
+
+    positions = {user_id: i for i, user_id in enumerate(user_ids)}
+    series = {
+        'income': np.zeros((len(user_ids), CASHFLOW_FORECAST_HISTORY_MONTHS)),
+        'expense': np.zeros((len(user_ids), CASHFLOW_FORECAST_HISTORY_MONTHS))
+    }
+    for user_id, month_value, transaction_type, total in rows:
+        if transaction_type not in series:
+            continue
+        delta = relativedelta(month_value, first_month)
+        series[transaction_type][positions[user_id], delta.years * 12 + delta.months] = float(total or 0)
+
+    observed = (series['income'] != 0) | (series['expense'] != 0)
+    keep = observed.any(axis=1)
+    starts = observed.argmax(axis=1)
+    return [user_id for user_id, kept in zip(user_ids, keep) if kept], \
+        series['income'][keep], series['expense'][keep], starts[keep]
+
+
+def _prediction_rows(user_ids, month_start, income, expense, confidence, created_at):
+    rows = []
+    for position, user_id in enumerate(user_ids):
+        for step in range(income.shape[1]):
+            rows.append({
+                'user_id': user_id,
+                'prediction_date': (month_start + relativedelta(months=step)).date(),
+                'predicted_income': Decimal(f"{income[position, step]:.2f}"),
+                'predicted_expense': Decimal(f"{expense[position, step]:.2f}"),
+                'confidence_score': round(float(confidence[position, step]), 4),
+                'created_at': created_at
+            })
+    return rows
+
+
+def _write_batch(user_ids, month_start, results, created_at):
+    """Remplace les prévisions du mois en cours et des suivants d'un paquet d'utilisateurs"""
+    rows = _prediction_rows(user_ids, month_start, *results, created_at)
+    db.session.execute(delete(CashflowPrediction).where(
+        CashflowPrediction.user_id.in_(user_ids),
+        CashflowPrediction.prediction_date >= month_start.date()
+    ))
+    if rows:
+        db.session.execute(insert(CashflowPrediction), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def _get_pool():
+    if CASHFLOW_FORECAST_WORKERS <= 1:
+        return None
+    # 'spawn' : les processus n'héritent pas des threads, verrous et connexions du serveur
+    return ProcessPoolExecutor(max_workers=CASHFLOW_FORECAST_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+
+def run_forecasts(now=None):
+    """
+    Recalcule et enregistre les prévisions de tous les utilisateurs
+
+    Args:
+        now (datetime, optional): Date de référence (maintenant par défaut)
+
+    Returns:
+        dict: Utilisateurs et prévisions écrits, durée ; None si un autre processus calcule déjà
+    """
+    now = now or datetime.datetime.now()
+    month_start = datetime.datetime(now.year, now.month, 1)
+    horizon = CASHFLOW_FORECAST_MONTHS + 1
+    created_at = datetime.datetime.utcnow()
+    started = time.monotonic()
+
+    # Verrou de session sur une connexion dédiée : chaque paquet est validé séparément
+    lock_connection = db.engine.connect()
+    locked = False
+    try:
+        locked = lock_connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {'key': FORECAST_LOCK_KEY}).scalar()
+        if not locked:
+            return None
+
+        user_ids = [user_id for (user_id,) in db.session.query(Transaction.user_id).filter(
+            Transaction.date >= _history_start(month_start),
+            Transaction.date < month_start
+        ).distinct().order_by(Transaction.user_id)]
+        db.session.rollback()
+
+        users = predictions = 0
+        pool = _get_pool()
+        try:
+            pending = {}
+            for offset in range(0, len(user_ids), CASHFLOW_FORECAST_BATCH_SIZE):
+                batch_ids, income, expense, starts = load_history(
+                    user_ids[offset:offset + CASHFLOW_FORECAST_BATCH_SIZE], month_start)
+                db.session.rollback()
+                if not batch_ids:
+                    continue
+                if pool is None:
+                    predictions += _write_batch(
+                        batch_ids, month_start, forecast_batch(income, expense, starts, horizon), created_at)
+                    users += len(batch_ids)
+                    continue
+
+                pending[pool.submit(forecast_batch, income, expense, starts, horizon)] = batch_ids
+                # Lire le paquet suivant pendant les calculs, sans accumuler plus d'un paquet d'avance par processus
+                while len(pending) >= CASHFLOW_FORECAST_WORKERS * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_ids = pending.pop(future)
+                        predictions += _write_batch(batch_ids, month_start, future.result(), created_at)
+                        users += len(batch_ids)
+
+            for future, batch_ids in pending.items():
+                predictions += _write_batch(batch_ids, month_start, future.result(), created_at)
+                users += len(batch_ids)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        # Prévisions des utilisateurs sans historique récent : elles ne seraient plus mises à jour
+        db.session.execute(delete(CashflowPrediction).where(
+            CashflowPrediction.prediction_date >= month_start.date(),
+            CashflowPrediction.created_at < created_at
+        ))
+        db.session.commit()
+
+        stats = {'users': users, 'predictions': predictions, 'seconds': round(time.monotonic() - started, 2)}
+        logger.info(f"Cash-flow forecasts computed: {stats}")
+        return stats
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # La connexion retourne au pool sans fermer la session PostgreSQL : libérer explicitement le verrou
+        if locked:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': FORECAST_LOCK_KEY})
+        lock_connection.close()
+
+
+def _forecast_loop(app):
+    """Calcule les prévisions au démarrage si elles sont absentes ou anciennes, puis périodiquement"""
+    delay = 0
+    while True:
+        time.sleep(delay)
+        delay = CASHFLOW_FORECAST_INTERVAL
+        try:
+            with app.app_context():
+                last_run = db.session.query(func.max(CashflowPrediction.created_at)).scalar()
+                db.session.rollback()
+                if last_run is None or \
+                        last_run <= datetime.datetime.utcnow() - datetime.timedelta(seconds=CASHFLOW_FORECAST_INTERVAL):
+                    run_forecasts()
+        except Exception as e:
+            logger.error(f"Error computing cash-flow forecasts: {str(e)}")
+
+
+def _forecast_user(user_id, month_start, horizon):
+    """Calcule les prévisions d'un utilisateur sans les enregistrer"""
+    user_ids, income, expense, starts = load_history([user_id], month_start)
+    if not user_ids:
+        return [], [], []
+    income_forecast, expense_forecast, confidence = forecast_batch(income, expense, starts, horizon)
+    return income_forecast[0].tolist(), expense_forecast[0].tolist(), confidence[0].tolist()
+
+
+def get_predictions(user_id, months=6):
+    """
+    Retourne les prévisions de trésorerie des prochains mois
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        months (int): Nombre de mois à prévoir après le mois en cours
+
+    Returns:
+        dict: Libellés, revenus, dépenses, soldes prévus et score de confiance de chaque mois
+    """
+    months = max(1, min(months, CASHFLOW_FORECAST_MONTHS))
+    now = datetime.datetime.now()
+    month_start = datetime.datetime(now.year, now.month, 1)
+    first_month = month_start + relativedelta(months=1)
+
+    rows = CashflowPrediction.query.filter(
+        CashflowPrediction.user_id == user_id,
+        CashflowPrediction.prediction_date >= first_month.date()
+    ).order_by(CashflowPrediction.prediction_date).limit(months).all()
+
+    if len(rows) == months:
+        income = [float(row.predicted_income) for row in rows]
+        expense = [float(row.predicted_expense) for row in rows]
+        confidence = [row.confidence_score for row in rows]
+    else:
+        # Pas encore de prévision enregistrée (nouvel utilisateur ou premier calcul en cours)
+        income, expense, confidence = _forecast_user(user_id, month_start, months + 1)
+        income, expense, confidence = income[1:], expense[1:], confidence[1:]
+        if not income:
+            income = expense = [0.0] * months
+            confidence = [0.0] * months
+
+    return {
+        'labels': [(first_month + relativedelta(months=i)).strftime('%b %Y') for i in range(months)],
+        'income': income,
+        'expense': expense,
+        'balance': [i - e for i, e in zip(income, expense)],
+        'confidence': confidence
+    }
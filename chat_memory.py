@@ -0,0 +1,294 @@
+"""
+Module de gestion du contexte des conversations du chat
+
+Le contexte envoyé au modèle est composé d'une fenêtre glissante des messages
+récents, limitée par un budget de tokens, et d'un résumé glissant stocké sur la
+Conversation pour les messages sortis de cette fenêtre. Le résumé est rafraîchi
+de manière incrémentale, en arrière-plan, lorsque la fenêtre déborde ; en
+attendant, les messages sortis de la fenêtre et pas encore résumés sont joints
+au contexte sous forme d'extraits tronqués. Si le modèle ne peut pas produire
+le résumé, les échanges y sont ajoutés tels quels (tronqués).
+"""
+import os
+import logging
+import threading
+
+from flask import current_app
+from models import db, Conversation, Message
+import message_cache
+
+logger = logging.getLogger(__name__)
+
+# Budget de tokens alloué à l'historique (hors prompt système et réponse)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CHAT_CONTEXT_TOKEN_BUDGET', 3000))
+
+# Nombre maximum de messages lus par tour (borne la requête SQL)
+CONTEXT_MAX_MESSAGES = int(os.environ.get('CHAT_CONTEXT_MAX_MESSAGES', 100))
+
+# Nombre de messages hors fenêtre à partir duquel le résumé est rafraîchi
+SUMMARY_REFRESH_THRESHOLD = int(os.environ.get('CHAT_SUMMARY_REFRESH_THRESHOLD', 6))
+
+# Nombre maximum de messages intégrés au résumé par rafraîchissement
+SUMMARY_BATCH_SIZE = 50
+
+# Budget de tokens des extraits de messages hors fenêtre pas encore résumés
+OVERFLOW_TOKEN_BUDGET = int(os.environ.get('CHAT_OVERFLOW_TOKEN_BUDGET', 500))
+
+# Longueur maximale d'un message dans les extraits et dans le résumé de repli (caractères)
+EXCERPT_MAX_CHARS = 300
+
+SUMMARY_MODEL = os.environ.get('CHAT_SUMMARY_MODEL', 'gpt-4')  # gpt-4 car notre compte n'a pas accès à gpt-4o
+SUMMARY_MAX_TOKENS = 400
+
+# Longueur maximale du résumé de repli, construit sans le modèle (caractères)
+FALLBACK_SUMMARY_MAX_CHARS = SUMMARY_MAX_TOKENS * 4
+
+# Conversations dont le résumé est en cours de rafraîchissement
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """
+    Estime le nombre de tokens d'un texte (environ 4 caractères par token)
+
+    Args:
+        text (str): Texte à évaluer
+
+    Returns:
+        int: Nombre de tokens estimé
+    """
+    # +4 pour la surcharge de formatage de chaque message de l'API Chat Completions
+    return len(text or "") // 4 + 4
+
+
+def _transcript_line(role, content):
+    """Ligne de transcription d'un message, tronquée à EXCERPT_MAX_CHARS si nécessaire"""
+    content = content or ""
+    if len(content) > EXCERPT_MAX_CHARS:
+        content = content[:EXCERPT_MAX_CHARS].rstrip() + "…"
+    return f"{'Utilisateur' if role == 'user' else 'Assistant'}: {content}"
+
+
+def get_recent_messages(conversation_id, last_message_id):
+    """
+    Retourne les derniers messages d'une conversation, depuis le cache si possible
+
+    Args:
+        conversation_id (int): ID de la conversation
+        last_message_id (int): ID du dernier message en base, pour valider le cache
+
+    Returns:
+        list: Messages {'id', 'role', 'content'} en ordre chronologique
+    """
+    messages = message_cache.get(conversation_id, last_message_id)
+    if messages is None:
+        rows = db.session.query(Message.id, Message.role, Message.content).filter(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.id.desc()).limit(CONTEXT_MAX_MESSAGES).all()
+
+        messages = [{'id': row.id, 'role': row.role, 'content': row.content} for row in reversed(rows)]
+        message_cache.put(conversation_id, messages)
+
+    return messages
+
+
+def build_context(conversation, last_message_id, token_budget=None):
+    """
+    Construit le contexte à envoyer au modèle pour une conversation
+
+    Seules les colonnes id/role/content des messages les plus récents sont lues,
+    avec une limite (ou depuis le cache), de sorte que le coût d'un tour reste
+    constant quelle que soit la longueur de la conversation.
+
+    Args:
+        conversation (Conversation): Conversation active
+        last_message_id (int): ID du dernier message de la conversation
+        token_budget (int, optional): Budget de tokens pour l'historique
+
+    Returns:
+        tuple: (liste de messages {'role', 'content'}, nombre de messages hors fenêtre)
+    """
+    if token_budget is None:
+        token_budget = CONTEXT_TOKEN_BUDGET
+
+    rows = get_recent_messages(conversation.id, last_message_id)
+    if conversation.summary_message_id:
+        rows = [row for row in rows if row['id'] > conversation.summary_message_id]
+
+    # Remplir la fenêtre du message le plus récent au plus ancien
+    summary_tokens = estimate_tokens(conversation.summary) if conversation.summary else 0
+    remaining = token_budget - summary_tokens
+    window = []
+    for row in reversed(rows):
+        cost = estimate_tokens(row['content'])
+        if window and cost > remaining:
+            break
+        window.append(row)
+        remaining -= cost
+
+    overflow = len(rows) - len(window)
+
+    # Messages hors fenêtre pas encore intégrés au résumé : extraits, du plus récent au plus ancien
+    excerpts = []
+    remaining = OVERFLOW_TOKEN_BUDGET
+    for row in reversed(rows[:overflow]):
+        line = _transcript_line(row['role'], row['content'])
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        excerpts.append(line)
+        remaining -= cost
+
+    messages = []
+    if conversation.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Résumé de la conversation précédente avec l'utilisateur : {conversation.summary}"
+        })
+    if excerpts:
+        messages.append({
+            "role": "system",
+            "content": "Échanges précédents pas encore résumés (extraits) :\n" + "\n".join(reversed(excerpts))
+        })
+    messages.extend({"role": row['role'], "content": row['content']} for row in reversed(window))
+
+    if overflow >= SUMMARY_REFRESH_THRESHOLD:
+        schedule_summary_refresh(conversation.id, window[-1]['id'] if window else None)
+
+    return messages, overflow
+
+
+def schedule_summary_refresh(conversation_id, window_start_id):
+    """
+    Lance le rafraîchissement du résumé en arrière-plan (un seul à la fois par conversation)
+
+    Args:
+        conversation_id (int): ID de la conversation
+        window_start_id (int): ID du plus ancien message conservé dans la fenêtre
+    """
+    if window_start_id is None:
+        return
+
+    with _refreshing_lock:
+        if conversation_id in _refreshing:
+            return
+        _refreshing.add(conversation_id)
+
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.app_context():
+                refresh_summary(conversation_id, window_start_id)
+        except Exception as e:
+            logger.error(f"Error refreshing summary for conversation {conversation_id}: {str(e)}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(conversation_id)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def refresh_summary(conversation_id, window_start_id):
+    """
+    Intègre au résumé les messages sortis de la fenêtre de contexte
+
+    Args:
+        conversation_id (int): ID de la conversation
+        window_start_id (int): ID du plus ancien message conservé dans la fenêtre
+
+    Returns:
+        bool: True si le résumé a été mis à jour
+    """
+    conversation = Conversation.query.get(conversation_id)
+    if not conversation:
+        return False
+
+    query = db.session.query(Message.id, Message.role, Message.content).filter(
+        Message.conversation_id == conversation_id,
+        Message.id < window_start_id
+    )
+    if conversation.summary_message_id:
+        query = query.filter(Message.id > conversation.summary_message_id)
+
+    rows = query.order_by(Message.id).limit(SUMMARY_BATCH_SIZE).all()
+    if not rows:
+        return False
+
+    transcript = "\n".join(
+        f"{'Utilisateur' if row.role == 'user' else 'Assistant'}: {row.content}" for row in rows
+    )
+
+    summary = summarize(conversation.summary, transcript)
+    if not summary:
+        # Sans résumé du modèle, ces messages sortiraient du contexte : les ajouter tronqués
+        logger.warning(f"Summary generation failed for conversation {conversation_id}, using fallback summary")
+        summary = fallback_summary(conversation.summary, rows)
+
+    conversation.summary = summary
+    conversation.summary_message_id = rows[-1].id
+    db.session.commit()
+
+    logger.debug(f"Updated summary of conversation {conversation_id} up to message {rows[-1].id}")
+    return True
+
+
+def fallback_summary(previous_summary, rows):
+    """
+    Résumé de repli, sans appel au modèle : résumé précédent suivi des messages tronqués
+
+    Args:
+        previous_summary (str): Résumé existant (peut être vide)
+        rows (list): Messages à intégrer (attributs role et content)
+
+    Returns:
+        str: Résumé limité à FALLBACK_SUMMARY_MAX_CHARS, les éléments les plus anciens étant retirés en premier
+    """
+    lines = [previous_summary] if previous_summary else []
+    lines.extend(_transcript_line(row.role, row.content) for row in rows)
+    summary = "\n".join(lines)
+    if len(summary) > FALLBACK_SUMMARY_MAX_CHARS:
+        summary = "…" + summary[-FALLBACK_SUMMARY_MAX_CHARS:]
+    return summary
+
+
+def summarize(previous_summary, transcript):
+    """
+    Produit un nouveau résumé à partir du résumé précédent et d'un extrait de conversation
+
+    Args:
+        previous_summary (str): Résumé existant (peut être vide)
+        transcript (str): Nouveaux échanges à intégrer
+
+    Returns:
+        str: Nouveau résumé ou None en cas d'erreur
+    """
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        return None
+
+    prompt = f"""Résumé actuel de la conversation :
+{previous_summary or "(aucun)"}
+
+Nouveaux échanges à intégrer :
+{transcript}
+
+Mets à jour le résumé en français, en moins de 250 mots. Conserve les faits, préférences, décisions et questions en suspens utiles pour la suite de la conversation."""
+
+    try:
+        from openai import OpenAI
+        client = OpenAI(api_key=api_key)
+        response = client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": "Tu résumes des conversations de manière fidèle et concise."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0.3
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error generating conversation summary: {str(e)}")
+        return None
@@ -0,0 +1,318 @@
+"""
+Données des graphiques des tableaux de bord (dashboard.py et unified_dashboard.py)
+
+Les séries mensuelles des DASHBOARD_HISTORY_MONTHS derniers mois, la répartition
+par catégorie et les compteurs d'un utilisateur sont calculés ensemble (une
+requête groupée par mois et type, une par catégorie, une pour les compteurs)
+puis mis en cache DASHBOARD_DATA_CACHE_TTL secondes, en mémoire du processus ou
+dans Redis si DASHBOARD_DATA_CACHE_BACKEND=redis. Les résumés mensuels, les
+tendances et la répartition servis par les deux blueprints sont dérivés de ce
+même contenu (les prévisions de trésorerie sont précalculées par
+cashflow_forecast).
+
+Chaque utilisateur a une version (table dashboard_data_version), incrémentée
+dans la transaction même qui écrit ses Transaction ou TransactionCategory : le
+contenu en cache est indexé par cette version, de sorte qu'un contenu calculé
+avant l'écriture n'est plus jamais relu, quel que soit le processus. La version
+sert aussi d'ETag au point d'accès groupé du tableau de bord unifié.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import desc, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import db
+from dashboard_models import TransactionCategory, Transaction, CashflowPrediction, DashboardDataVersion
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie du contenu en cache (secondes, 0 pour désactiver le cache)
+DASHBOARD_DATA_CACHE_TTL = int(os.environ.get('DASHBOARD_DATA_CACHE_TTL', 300))
+
+# Nombre d'utilisateurs conservés dans le cache en mémoire
+DASHBOARD_DATA_CACHE_SIZE = int(os.environ.get('DASHBOARD_DATA_CACHE_SIZE', 1000))
+
+# Mois d'historique des séries (résumé mensuel et tendance annuelle)
+DASHBOARD_HISTORY_MONTHS = 12
+
+_listener_registered = False
+
+
+def init_app(app):
+    """Initialiser l'invalidation du cache des tableaux de bord pour l'application Flask"""
+    global _listener_registered
+
+    if not _listener_registered:
+        event.listen(db.session, 'after_flush', _after_flush)
+        _listener_registered = True
+
+
+class MemoryPayloadBackend:
+    """Backend en mémoire du processus, borné en nombre d'utilisateurs"""
+
+    def __init__(self, ttl=DASHBOARD_DATA_CACHE_TTL, max_users=DASHBOARD_DATA_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[2]
+
+    def set(self, user_id, version, payload):
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.ttl, payload)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+
+class RedisPayloadBackend:
+    """Backend Redis partagé entre les workers (une clé JSON par utilisateur et version)"""
+
+    def __init__(self, client, ttl=DASHBOARD_DATA_CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, user_id, version):
+        data = self.client.get(f"dashboard:data:{user_id}:{version}")
+        return json.loads(data) if data else None
+
+    def set(self, user_id, version, payload):
+        self.client.setex(f"dashboard:data:{user_id}:{version}", self.ttl, json.dumps(payload))
+
+
+def _create_backend():
+    """Crée le backend configuré (Redis si demandé et disponible, mémoire sinon, aucun si TTL nul)"""
+    if DASHBOARD_DATA_CACHE_TTL <= 0:
+        return None
+    if os.environ.get('DASHBOARD_DATA_CACHE_BACKEND', 'memory').lower() == 'redis':
+        try:
+            import redis
+            client = redis.Redis(
+                host=os.environ.get('REDIS_HOST', 'localhost'),
+                port=int(os.environ.get('REDIS_PORT', 6379)),
+                password=os.environ.get('REDIS_PASSWORD') or None,
+                db=int(os.environ.get('REDIS_DB', 0)),
+                socket_timeout=1
+            )
+            client.ping()
+            logger.info("Dashboard data cache: Redis backend")
+            return RedisPayloadBackend(client)
+        except Exception as e:
+            logger.warning(f"Redis unavailable for dashboard data cache, using in-memory cache: {str(e)}")
+    return MemoryPayloadBackend()
+
+
+_backend = _create_backend()
+
+
+def _after_flush(session, flush_context):
+    """Incrémente la version des utilisateurs dont les transactions ou catégories du tableau de bord changent"""
+    users = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Transaction, TransactionCategory)):
+            users.add(obj.user_id)
+            # Objet rattaché à un autre utilisateur : l'ancien propriétaire change aussi
+            users.update(inspect(obj).attrs.user_id.history.deleted)
+    users.discard(None)
+    if users:
+        bump_versions(session.connection(), users)
+
+
+def bump_versions(connection, user_ids):
+    """
+    Incrémente la version des données du tableau de bord d'utilisateurs
+
+    Appelée dans la transaction qui écrit les données : à utiliser après une
+    écriture hors ORM des Transaction ou TransactionCategory.
+
+    Args:
+        connection: Connexion SQLAlchemy de la transaction en cours
+        user_ids (iterable): IDs des utilisateurs
+    """
+    now = datetime.utcnow()
+    # Ordre fixe : deux écritures concurrentes verrouillent les versions dans le même ordre
+    statement = pg_insert(DashboardDataVersion).values(
+        [{'user_id': user_id, 'version': 1, 'updated_at': now} for user_id in sorted(user_ids)]
+    )
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[DashboardDataVersion.user_id],
+        set_={'version': DashboardDataVersion.version + 1, 'updated_at': statement.excluded.updated_at}
+    ))
+
+
+def data_version(user_id):
+    """
+    Retourne la version des données du tableau de bord et la date du dernier calcul des prévisions
+
+    Une seule requête sur deux index : c'est la vérification faite avant de
+    répondre 304 au point d'accès groupé.
+
+    Args:
+        user_id (int): ID de l'utilisateur
+
+    Returns:
+        tuple: (version, date du dernier calcul des prévisions ou None)
+    """
+    version, forecast_at = db.session.execute(select(
+        select(DashboardDataVersion.version).where(DashboardDataVersion.user_id == user_id).scalar_subquery(),
+        select(func.max(CashflowPrediction.created_at)).where(
+            CashflowPrediction.user_id == user_id).scalar_subquery()
+    )).one()
+    return version or 0, forecast_at
+
+
+def build_payload(user_id, now=None):
+    """
+    Calcule les données des tableaux de bord d'un utilisateur
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        now (datetime, optional): Date de référence (maintenant par défaut)
+
+    Returns:
+        dict: Mois ('YYYY-MM'), libellés, séries de revenus et dépenses des
+            DASHBOARD_HISTORY_MONTHS derniers mois (le dernier étant le mois en cours),
+            répartition par catégorie, totaux et compteurs
+    """
+    now = now or datetime.now()
+    current_month_start = datetime(now.year, now.month, 1)
+    first_month = current_month_start - relativedelta(months=DASHBOARD_HISTORY_MONTHS - 1)
+    month_starts = [first_month + relativedelta(months=i) for i in range(DASHBOARD_HISTORY_MONTHS)]
+    months = [month.strftime('%Y-%m') for month in month_starts]
+
+    # Revenus et dépenses de chaque mois en une seule requête groupée
+    month = func.date_trunc('month', Transaction.date)
+    rows = db.session.query(
+        month, TransactionCategory.type, func.sum(Transaction.amount)
+    ).join(
+        TransactionCategory, Transaction.category_id == TransactionCategory.id
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= first_month,
+        Transaction.date < current_month_start + relativedelta(months=1)
+    ).group_by(month, TransactionCategory.type).all()
+
+    series = {'income': [0.0] * len(months), 'expense': [0.0] * len(months)}
+    index = {key: i for i, key in enumerate(months)}
+    for month_start, transaction_type, total in rows:
+        position = index.get(month_start.strftime('%Y-%m'))
+        if position is not None and transaction_type in series:
+            series[transaction_type][position] = float(total or 0)
+
+    # Répartition par catégorie (tout l'historique), dont se déduisent les totaux
+    breakdown = {'income': {'labels': [], 'values': []}, 'expense': {'labels': [], 'values': []}}
+    total = func.sum(Transaction.amount).label('total')
+    for transaction_type, name, amount in db.session.query(
+        TransactionCategory.type, TransactionCategory.name, total
+    ).join(
+        Transaction, Transaction.category_id == TransactionCategory.id
+    ).filter(
+        Transaction.user_id == user_id
+    ).group_by(TransactionCategory.type, TransactionCategory.name).order_by(desc('total')):
+        if transaction_type in breakdown:
+            breakdown[transaction_type]['labels'].append(name)
+            breakdown[transaction_type]['values'].append(float(amount or 0))
+
+    transactions_count, categories_count = db.session.execute(select(
+        select(func.count()).select_from(Transaction).where(Transaction.user_id == user_id).scalar_subquery(),
+        select(func.count()).select_from(TransactionCategory).where(
+            TransactionCategory.user_id == user_id).scalar_subquery()
+    )).one()
+
+    return {
+        'generated_at': now.isoformat(),
+        'months': months,
+        'labels': [month.strftime('%b %Y') for month in month_starts],
+        'income': series['income'],
+        'expense': series['expense'],
+        'category_breakdown': breakdown,
+        'total_income': sum(breakdown['income']['values']),
+        'total_expense': sum(breakdown['expense']['values']),
+        'transactions_count': transactions_count,
+        'categories_count': categories_count
+    }
+
+
+def get_payload(user_id, version=None):
+    """
+    Retourne les données des tableaux de bord d'un utilisateur, depuis le cache si possible
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        version (int, optional): Version déjà lue avec data_version (relue sinon)
+
+    Returns:
+        dict: Contenu retourné par build_payload
+    """
+    if _backend is None:
+        return build_payload(user_id)
+
+    if version is None:
+        version = data_version(user_id)[0]
+    # Le mois fait partie de la clé : les séries se décalent au changement de mois
+    key = f"{version}:{datetime.now():%Y-%m}"
+    try:
+        payload = _backend.get(user_id, key)
+    except Exception as e:
+        logger.warning(f"Dashboard data cache read failed: {str(e)}")
+        return build_payload(user_id)
+    if payload is not None:
+        return payload
+
+    payload = build_payload(user_id)
+    try:
+        _backend.set(user_id, key, payload)
+    except Exception as e:
+        logger.warning(f"Dashboard data cache write failed: {str(e)}")
+    return payload
+
+
+def monthly_summary(payload, months=6):
+    """Revenus et dépenses des derniers mois (le dernier étant le mois en cours)"""
+    months = max(1, min(months, len(payload['months'])))
+    return {
+        'labels': payload['labels'][-months:],
+        'income': payload['income'][-months:],
+        'expense': payload['expense'][-months:]
+    }
+
+
+def income_vs_expense_trend(payload, months=DASHBOARD_HISTORY_MONTHS):
+    """Revenus, dépenses et solde des derniers mois"""
+    summary = monthly_summary(payload, months)
+    summary['balance'] = [income - expense for income, expense in zip(summary['income'], summary['expense'])]
+    return summary
+
+
+def month_totals(payload, months_ago=0):
+    """
+    Revenus et dépenses d'un mois de l'historique
+
+    Args:
+        payload (dict): Contenu retourné par get_payload
+        months_ago (int): 0 pour le mois en cours, 1 pour le mois précédent...
+
+    Returns:
+        tuple: (revenus, dépenses)
+    """
+    position = len(payload['months']) - 1 - months_ago
+    return payload['income'][position], payload['expense'][position]
+
+
+def category_breakdown(payload, transaction_type='expense'):
+    """Répartition par catégorie des dépenses (ou des revenus si transaction_type vaut 'income')"""
+    return payload['category_breakdown']['income' if transaction_type == 'income' else 'expense']
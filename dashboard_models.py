@@ -22,6 +22,10 @@ class TransactionCategory(db.Model):
     # Relation avec les transactions
     transactions = db.relationship('Transaction', backref='category', lazy='dynamic')
     
+    __table_args__ = (
+        db.Index('ix_transaction_category_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<TransactionCategory {self.name}: {self.type}>'
 
@@ -42,6 +46,10 @@ class Transaction(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('user_transactions', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_transaction_user_date', 'user_id', 'date'),
+    )
+    
     def __repr__(self):
         return f'<Transaction {self.id}: {self.amount}€ - {self.description or "Sans description"}>'
 
@@ -61,10 +69,26 @@ class CashflowPrediction(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('cashflow_predictions', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_cashflow_prediction_user_date', 'user_id', 'prediction_date'),
+    )
+    
     def __repr__(self):
         return f'<CashflowPrediction {self.prediction_date}: Income={self.predicted_income}, Expense={self.predicted_expense}>'
 
 
+class DashboardDataVersion(db.Model):
+    """Version des données du tableau de bord d'un utilisateur (voir dashboard_data.py)"""
+    __tablename__ = 'dashboard_data_version'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Incrémentée à chaque écriture
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Dernière écriture des transactions ou catégories
+    
+    def __repr__(self):
+        return f'<DashboardDataVersion user_id={self.user_id}: {self.version}>'
+
+
 class FinancialAlert(db.Model):
     """Modèle pour les alertes financières"""
     __tablename__ = 'financial_alert'
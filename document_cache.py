@@ -0,0 +1,120 @@
+"""
+Cache des extractions de documents (PDF/DOCX) indexé par le SHA-256 du fichier
+
+Un document déjà extrait n'est pas analysé à nouveau : le texte, les métadonnées
+et le type du document sont relus depuis le cache, quel que soit l'utilisateur
+qui l'envoie. Le stockage réutilise les backends de ocr_cache (répertoire local
+borné à DOCUMENT_CACHE_MAX_BYTES avec éviction LRU, ou Redis si
+DOCUMENT_CACHE_BACKEND=redis). Les lectures réussies et manquées sont comptées
+par processus (get_stats).
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+
+import ocr_cache
+from document_parser import DOCUMENT_MAX_PAGES
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie des extractions (secondes)
+DOCUMENT_CACHE_TTL = int(os.environ.get('DOCUMENT_CACHE_TTL', 30 * 24 * 3600))
+
+# Taille maximale du cache disque (octets)
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get('DOCUMENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+DOCUMENT_CACHE_DIR = os.environ.get('DOCUMENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'document-cache'))
+
+# Incrémenter pour invalider les extractions produites par une ancienne version de document_parser
+CACHE_VERSION = 1
+
+_backend = ocr_cache.create_backend(
+    os.environ.get('DOCUMENT_CACHE_BACKEND', 'disk'),
+    directory=DOCUMENT_CACHE_DIR,
+    ttl=DOCUMENT_CACHE_TTL,
+    max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+    prefix="document:extraction"
+)
+
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+
+def document_digest(data):
+    """Retourne le SHA-256 hexadécimal du contenu d'un document"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _cache_key(digest):
+    # La limite de pages fait partie de la clé : une extraction tronquée n'est réutilisée qu'à limite égale
+    return f"v{CACHE_VERSION}-p{DOCUMENT_MAX_PAGES}-{digest}"
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get(digest):
+    """
+    Retourne l'extraction en cache d'un document
+
+    Args:
+        digest (str): SHA-256 du document
+
+    Returns:
+        dict: Résultat de extract_text_from_document mis en cache, ou None
+    """
+    if _backend is None:
+        return None
+    try:
+        result = _backend.get(_cache_key(digest))
+    except Exception as e:
+        logger.warning(f"Document cache read failed: {str(e)}")
+        _count('errors')
+        return None
+    _count('hits' if result is not None else 'misses')
+    return result
+
+
+def put(digest, result):
+    """
+    Enregistre l'extraction complète d'un document
+
+    Args:
+        digest (str): SHA-256 du document
+        result (dict): Résultat de extract_text_from_document (success, text, metadata, document_type...)
+    """
+    if _backend is None:
+        return
+    entry = {key: result.get(key) for key in
+             ('text', 'metadata', 'document_type', 'page_count', 'pages_extracted', 'truncated')}
+    entry['success'] = True
+    try:
+        _backend.set(_cache_key(digest), entry)
+        _count('writes')
+    except Exception as e:
+        logger.warning(f"Document cache write failed: {str(e)}")
+        _count('errors')
+
+
+def get_stats():
+    """
+    Retourne les statistiques du cache pour le processus
+
+    Returns:
+        dict: Lectures réussies/manquées, écritures, erreurs, taux de succès et,
+            pour le backend disque, taille occupée et entrées évincées
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+    stats['backend'] = type(_backend).__name__ if _backend is not None else None
+    if isinstance(_backend, ocr_cache.DiskOCRCache):
+        stats['size_bytes'] = _backend.size
+        stats['max_bytes'] = _backend.max_bytes
+        stats['evictions'] = _backend.evictions
+    return stats
@@ -0,0 +1,265 @@
+"""
+Extraction progressive des documents PDF longs envoyés à /api/process-document
+
+L'endpoint extrait les premières pages (DOCUMENT_FIRST_PAGES), enregistre
+l'ExtractedText avec le statut 'partial' et rend la main. Un pool borné de
+threads extrait ensuite les pages restantes par plages, ajoute leur texte au
+contenu de l'enregistrement et met à jour sa progression, jusqu'au statut
+'complete' (ou 'failed'). La progression est consultable en base depuis
+n'importe quel worker (/api/extracted-texts/<id>/progress, ou en SSE via
+/api/extracted-texts/<id>/events).
+"""
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, jsonify, request, session, current_app, stream_with_context, url_for
+
+from models import db, User, ExtractedText
+from auth import login_required
+import document_parser
+import document_cache
+
+logger = logging.getLogger(__name__)
+
+# Pages extraites pendant la requête avant de rendre la main
+DOCUMENT_FIRST_PAGES = int(os.environ.get('DOCUMENT_FIRST_PAGES', 5))
+
+# Threads terminant les extractions dans chaque processus, et extractions en attente au-delà
+DOCUMENT_JOB_WORKERS = int(os.environ.get('DOCUMENT_JOB_WORKERS', 2))
+DOCUMENT_JOB_QUEUE_SIZE = int(os.environ.get('DOCUMENT_JOB_QUEUE_SIZE', 20))
+
+# Durée maximale de l'extraction en arrière-plan d'un document (secondes)
+DOCUMENT_JOB_TIME_BUDGET = float(os.environ.get('DOCUMENT_JOB_TIME_BUDGET', 600))
+
+# Durée maximale d'un flux SSE de suivi et intervalle de consultation de la base
+DOCUMENT_JOB_EVENTS_TIMEOUT = int(os.environ.get('DOCUMENT_JOB_EVENTS_TIMEOUT', 300))
+DOCUMENT_JOB_EVENTS_INTERVAL = 0.5
+
+FINAL_STATUSES = ('complete', 'failed')
+
+document_jobs_bp = Blueprint('document_jobs', __name__, url_prefix='/api/extracted-texts')
+
+_executor = ThreadPoolExecutor(max_workers=DOCUMENT_JOB_WORKERS, thread_name_prefix='document-job')
+_queue_slots = threading.BoundedSemaphore(DOCUMENT_JOB_WORKERS + DOCUMENT_JOB_QUEUE_SIZE)
+
+
+class DocumentQueueFull(Exception):
+    """Levée lorsque la file des extractions en arrière-plan du processus est pleine"""
+
+
+def init_app(app):
+    """Initialiser les routes de suivi des extractions progressives pour l'application Flask"""
+    app.register_blueprint(document_jobs_bp)
+
+
+def has_remaining_pages(result):
+    """Indique si une extraction limitée aux premières pages doit être poursuivie"""
+    page_count = result.get('page_count') or 0
+    return result.get('pages_extracted', 0) < min(page_count, document_parser.DOCUMENT_MAX_PAGES)
+
+
+def progress_urls(extracted_text_id):
+    """URLs de suivi de l'extraction d'un texte (consultation et SSE)"""
+    return {
+        "progress_url": url_for('document_jobs.extraction_progress', text_id=extracted_text_id),
+        "events_url": url_for('document_jobs.extraction_events', text_id=extracted_text_id)
+    }
+
+
+def start_progressive_extraction(user_id, title, result, data, document_hash=None):
+    """
+    Enregistre les premières pages d'un PDF et confie les suivantes au pool
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        title (str): Titre du texte extrait
+        result (dict): Résultat de extract_text_from_document limité aux premières pages
+        data (bytes): Contenu du PDF
+        document_hash (str, optional): SHA-256 du PDF ; l'extraction complète est alors mise en cache
+
+    Returns:
+        ExtractedText: Enregistrement créé (statut 'partial')
+
+    Raises:
+        DocumentQueueFull: Si la file du processus est pleine (rien n'est enregistré)
+    """
+    if not _queue_slots.acquire(blocking=False):
+        raise DocumentQueueFull("Trop de documents en cours d'extraction")
+
+    try:
+        extracted_text = ExtractedText(
+            user_id=user_id,
+            title=title,
+            content=result.get('text', ''),
+            source=result.get('document_type', 'document'),
+            image_hash=document_hash,
+            status='partial',
+            page_count=result['page_count'],
+            pages_extracted=result['pages_extracted']
+        )
+        db.session.add(extracted_text)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        end = min(result['page_count'], document_parser.DOCUMENT_MAX_PAGES)
+        _executor.submit(_run_extraction, app, extracted_text.id, data, result['pages_extracted'], end,
+                         result, document_hash)
+    except Exception:
+        _queue_slots.release()
+        raise
+
+    logger.debug(f"Queued extraction of pages {result['pages_extracted'] + 1}-{end} "
+                 f"for extracted text {extracted_text.id}")
+    return extracted_text
+
+
+def _update_text(extracted_text_id, **values):
+    """Met à jour un texte extrait et rend la modification visible immédiatement"""
+    db.session.query(ExtractedText).filter(ExtractedText.id == extracted_text_id).update(
+        values, synchronize_session=False)
+    db.session.commit()
+
+
+def _run_extraction(app, extracted_text_id, data, start, end, first_result, document_hash):
+    """Extrait les pages [start, end) d'un PDF dans un thread du pool, plage par plage"""
+    try:
+        with app.app_context():
+            try:
+                texts = [first_result['text']] if first_result.get('text') else []
+                deadline = time.time() + DOCUMENT_JOB_TIME_BUDGET
+                # Une plage par processus d'extraction, pour que chaque étape profite du pool
+                step = document_parser.DOCUMENT_PAGES_PER_TASK * max(1, document_parser.DOCUMENT_PARSER_WORKERS)
+                pages_extracted = start
+                for first in range(start, end, step):
+                    page_texts = document_parser.extract_pdf_pages(data, first, min(first + step, end), deadline)
+                    # Seules les pages extraites sans interruption prolongent le contenu
+                    extracted = page_texts.index(None) if None in page_texts else len(page_texts)
+                    text = document_parser.join_page_texts(page_texts[:extracted])
+                    values = {'pages_extracted': pages_extracted + extracted}
+                    if text:
+                        # Ajout côté base, sans relire le contenu déjà enregistré
+                        values['content'] = ExtractedText.content + (f"\n\n{text}" if texts else text)
+                        texts.append(text)
+                    _update_text(extracted_text_id, **values)
+                    pages_extracted += extracted
+                    if extracted < len(page_texts):
+                        logger.warning(f"Extraction of extracted text {extracted_text_id} stopped after "
+                                       f"{pages_extracted} pages (time budget {DOCUMENT_JOB_TIME_BUDGET}s)")
+                        break
+
+                _update_text(extracted_text_id, status='complete')
+                if document_hash and pages_extracted == end:
+                    document_cache.put(document_hash, {
+                        **first_result,
+                        'text': "\n\n".join(texts),
+                        'pages_extracted': pages_extracted,
+                        'truncated': pages_extracted < first_result['page_count']
+                    })
+                logger.debug(f"Extraction of extracted text {extracted_text_id} completed ({pages_extracted} pages)")
+            except Exception as e:
+                logger.error(f"Extraction of extracted text {extracted_text_id} failed: {str(e)}")
+                db.session.rollback()
+                _update_text(extracted_text_id, status='failed')
+    except Exception as e:
+        logger.error(f"Unable to record failure of extracted text {extracted_text_id}: {str(e)}")
+    finally:
+        _queue_slots.release()
+
+
+def _progress_dict(extracted_text_id, offset):
+    """
+    État d'une extraction et texte ajouté depuis une position donnée
+
+    Args:
+        extracted_text_id (int): ID du texte extrait
+        offset (int): Nombre de caractères déjà reçus par le client
+
+    Returns:
+        dict: Progression, ou None si le texte n'existe plus
+    """
+    row = db.session.query(
+        ExtractedText.status,
+        ExtractedText.page_count,
+        ExtractedText.pages_extracted,
+        db.func.length(ExtractedText.content),
+        db.func.substr(ExtractedText.content, offset + 1)
+    ).filter(ExtractedText.id == extracted_text_id).first()
+    # Ne pas garder de transaction ouverte entre deux consultations
+    db.session.rollback()
+    if row is None:
+        return None
+
+    status, page_count, pages_extracted, length, text = row
+    return {
+        "id": extracted_text_id,
+        "status": status,
+        "page_count": page_count,
+        "pages_extracted": pages_extracted,
+        "truncated": status in FINAL_STATUSES and page_count is not None and (pages_extracted or 0) < page_count,
+        "offset": offset,
+        "length": length,
+        "text": text or ""
+    }
+
+
+def _get_user_text_id(text_id):
+    """Retourne l'ID du texte extrait s'il appartient à l'utilisateur connecté"""
+    user = User.query.filter_by(username=session.get('username')).first()
+    if not user:
+        return None
+    row = db.session.query(ExtractedText.id).filter_by(id=text_id, user_id=user.id).first()
+    return row[0] if row else None
+
+
+@document_jobs_bp.route("/<int:text_id>/progress", methods=["GET"])
+@login_required
+def extraction_progress(text_id):
+    """Progression d'une extraction et texte ajouté depuis ?offset= (caractères déjà reçus)"""
+    if not _get_user_text_id(text_id):
+        return jsonify({"success": False, "error": "Texte introuvable"}), 404
+    offset = max(0, request.args.get('offset', 0, type=int))
+    return jsonify({"success": True, **_progress_dict(text_id, offset)})
+
+
+@document_jobs_bp.route("/<int:text_id>/events", methods=["GET"])
+@login_required
+def extraction_events(text_id):
+    """Flux SSE de la progression d'une extraction, avec le texte ajouté à chaque étape"""
+    if not _get_user_text_id(text_id):
+        return jsonify({"success": False, "error": "Texte introuvable"}), 404
+    offset = max(0, request.args.get('offset', 0, type=int))
+    db.session.rollback()
+
+    def generate():
+        nonlocal offset
+        deadline = time.monotonic() + DOCUMENT_JOB_EVENTS_TIMEOUT
+        last_state = None
+        while True:
+            progress = _progress_dict(text_id, offset)
+            if progress is None:
+                break
+
+            state = (progress["status"], progress["pages_extracted"], progress["length"])
+            if state != last_state:
+                last_state = state
+                yield f"data: {json.dumps(progress, ensure_ascii=False)}\n\n"
+                offset = progress["length"]
+            if progress["status"] in FINAL_STATUSES:
+                break
+            if time.monotonic() > deadline:
+                yield f"data: {json.dumps({'id': text_id, 'timeout': True})}\n\n"
+                break
+            time.sleep(DOCUMENT_JOB_EVENTS_INTERVAL)
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -1,15 +1,38 @@
 """
 Module pour extraire et analyser le texte des fichiers PDF et Word (DOCX)
+
+Les documents sont lus directement depuis le flux reçu (mémoire ou fichier
+temporaire de Werkzeug), sans copie dans un fichier intermédiaire. Les PDF
+volumineux sont découpés en plages de pages extraites en parallèle par un pool
+de processus, puis réassemblées dans l'ordre. Le nombre de pages
+(DOCUMENT_MAX_PAGES) et la durée d'extraction (DOCUMENT_TIME_BUDGET) sont
+bornés : au-delà, le résultat est tronqué et signalé par "truncated".
+
+Les relevés bancaires (CSV, XLSX, OFX) sont lus opération par opération
+(iter_statement_rows), sans charger le fichier en mémoire.
 """
+import io
 import os
-import tempfile
+import re
+import csv
+import html
+import time
 import logging
-from datetime import datetime
+import threading
+import unicodedata
+import multiprocessing
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
 # Configure le logger
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Les traces DEBUG de pdfminer (une par objet analysé) multiplient la durée d'extraction
+logging.getLogger('pdfminer').setLevel(logging.WARNING)
+
 # Importer les bibliothèques de traitement de documents
 try:
     from docx import Document
@@ -21,12 +44,169 @@ except ImportError as e:
     logger.error(f"Erreur d'importation des bibliothèques de traitement de documents: {e}")
     LIBRARIES_LOADED = False
 
-def extract_text_from_pdf(file_storage):
+# Nombre maximum de pages extraites d'un PDF
+DOCUMENT_MAX_PAGES = int(os.environ.get('DOCUMENT_MAX_PAGES', 300))
+
+# Durée maximale d'extraction d'un document (secondes)
+DOCUMENT_TIME_BUDGET = float(os.environ.get('DOCUMENT_TIME_BUDGET', 20))
+
+# Processus d'extraction PDF (1 = extraction dans le processus de la requête)
+DOCUMENT_PARSER_WORKERS = int(os.environ.get('DOCUMENT_PARSER_WORKERS', min(4, os.cpu_count() or 1)))
+
+# En dessous de ce nombre de pages, l'extraction reste dans le processus de la requête
+DOCUMENT_PARALLEL_MIN_PAGES = int(os.environ.get('DOCUMENT_PARALLEL_MIN_PAGES', 20))
+
+# Pages par tâche confiée au pool
+DOCUMENT_PAGES_PER_TASK = int(os.environ.get('DOCUMENT_PAGES_PER_TASK', 25))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Pool de processus d'extraction PDF, créé à la première utilisation"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' : les processus n'héritent pas des threads, verrous et connexions du serveur
+            _pool = ProcessPoolExecutor(
+                max_workers=DOCUMENT_PARSER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+
+def _reset_pool():
+    """Abandonne un pool devenu inutilisable (processus tué) ; il sera recréé à la demande"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _document_stream(source):
+    """
+    Retourne un flux binaire lisible depuis le début
+
+    Args:
+        source: Flask FileStorage, objet fichier ou bytes
+
+    Returns:
+        Flux binaire positionné au début du document
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    stream = getattr(source, 'stream', source)
+    stream.seek(0)
+    return stream
+
+
+def _extract_pages(pdf, start, end, deadline):
+    """
+    Extrait le texte des pages [start, end) d'un PDF ouvert
+
+    Args:
+        pdf: Document pdfplumber
+        start (int): Première page (à partir de 0)
+        end (int): Page de fin (exclue)
+        deadline (float): Échéance (time.time()) au-delà de laquelle l'extraction s'arrête
+
+    Returns:
+        list: Texte des pages extraites, dans l'ordre (peut être plus courte que la plage)
+    """
+    texts = []
+    for number in range(start, end):
+        if time.time() >= deadline:
+            break
+        page = pdf.pages[number]
+        texts.append(page.extract_text(x_tolerance=3) or "")
+        # Libérer les objets de mise en page de la page traitée
+        page.close()
+    return texts
+
+
+def _extract_page_range(data, start, end, deadline):
+    """Extrait une plage de pages d'un PDF (exécuté dans un processus du pool)"""
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return _extract_pages(pdf, start, end, deadline)
+
+
+def _extract_pages_parallel(data, start, end, deadline):
+    """
+    Répartit l'extraction des pages [start, end) entre les processus du pool
+
+    Args:
+        data (bytes): Contenu du PDF
+        start (int): Première page (à partir de 0)
+        end (int): Page de fin (exclue)
+        deadline (float): Échéance de l'extraction (time.time())
+
+    Returns:
+        list: Texte de chaque page dans l'ordre, None pour les pages non extraites
+    """
+    ranges = [
+        (first, min(first + DOCUMENT_PAGES_PER_TASK, end))
+        for first in range(start, end, DOCUMENT_PAGES_PER_TASK)
+    ]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_page_range, data, first, last, deadline) for first, last in ranges]
+
+    # Les processus s'arrêtent d'eux-mêmes à l'échéance ; courte marge pour le retour des résultats
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.time()) + 1)
+    for future in not_done:
+        future.cancel()
+
+    page_texts = []
+    for future, (first, last) in zip(futures, ranges):
+        texts = future.result() if future in done else []
+        page_texts.extend(texts)
+        page_texts.extend([None] * (last - first - len(texts)))
+    return page_texts
+
+
+def extract_pdf_pages(data, start, end, deadline, pdf=None, parallel=True):
+    """
+    Extrait le texte des pages [start, end) d'un PDF, en parallèle si la plage est longue
+
+    Args:
+        data (bytes): Contenu du PDF
+        start (int): Première page (à partir de 0)
+        end (int): Page de fin (exclue)
+        deadline (float): Échéance (time.time()) au-delà de laquelle l'extraction s'arrête
+        pdf: Document pdfplumber déjà ouvert sur data (optionnel)
+        parallel (bool): Autoriser l'utilisation du pool de processus
+
+    Returns:
+        list: Texte de chaque page dans l'ordre, None pour les pages non extraites
+    """
+    if parallel and DOCUMENT_PARSER_WORKERS > 1 and end - start >= DOCUMENT_PARALLEL_MIN_PAGES:
+        try:
+            return _extract_pages_parallel(data, start, end, deadline)
+        except BrokenProcessPool as e:
+            logger.error(f"Pool d'extraction PDF inutilisable, extraction séquentielle: {e}")
+            _reset_pool()
+
+    if pdf is None:
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            texts = _extract_pages(pdf, start, end, deadline)
+    else:
+        texts = _extract_pages(pdf, start, end, deadline)
+    return texts + [None] * (end - start - len(texts))
+
+
+def join_page_texts(page_texts):
+    """Joint le texte des pages extraites, sans les pages vides"""
+    return "\n\n".join([t.strip() for t in page_texts if t and t.strip()])
+
+
+def extract_text_from_pdf(file_storage, max_pages=None):
     """
     Extrait le texte d'un fichier PDF
     
     Args:
-        file_storage: Flask FileStorage object
+        file_storage: Flask FileStorage object (ou objet fichier, ou bytes)
+        max_pages (int, optional): N'extraire que les premières pages (extraction progressive) ;
+            elles sont alors extraites dans l'ordre, sans le pool de processus
     
     Returns:
         dict: Résultat de l'extraction avec texte, métadonnées et statut
@@ -38,45 +218,39 @@ def extract_text_from_pdf(file_storage):
         }
     
     try:
-        # Créer un fichier temporaire
-        temp_fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        deadline = time.time() + DOCUMENT_TIME_BUDGET
+        data = _document_stream(file_storage).read()
+        metadata = {}
         
-        try:
-            # Sauvegarde le fichier temporairement
-            file_storage.save(temp_path)
-            
-            # Extrait le texte
-            all_text = []
-            metadata = {}
-            
-            with pdfplumber.open(temp_path) as pdf:
-                # Extraire les métadonnées
-                if hasattr(pdf, 'metadata') and pdf.metadata:
-                    metadata = {k.lower(): v for k, v in pdf.metadata.items() if v}
-                
-                # Extraire le texte de chaque page
-                for page in pdf.pages:
-                    text = page.extract_text(x_tolerance=3) or ""
-                    all_text.append(text)
-            
-            # Nettoyer et joindre le texte
-            full_text = "\n\n".join([t.strip() for t in all_text if t.strip()])
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            # Extraire les métadonnées
+            if hasattr(pdf, 'metadata') and pdf.metadata:
+                metadata = {k.lower(): v for k, v in pdf.metadata.items() if v}
             
-            return {
-                "success": True,
-                "text": full_text,
-                "metadata": metadata,
-                "document_type": "pdf"
-            }
+            page_count = len(pdf.pages)
+            pages_to_extract = min(page_count, DOCUMENT_MAX_PAGES)
+            if max_pages is not None:
+                pages_to_extract = min(pages_to_extract, max_pages)
             
-        finally:
-            # Fermer et supprimer le fichier temporaire
-            try:
-                os.close(temp_fd)
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-            except Exception as e:
-                logger.error(f"Erreur lors de la suppression du fichier temporaire: {e}")
+            # Documents volumineux : extraction des plages de pages en parallèle
+            page_texts = extract_pdf_pages(data, 0, pages_to_extract, deadline, pdf=pdf,
+                                           parallel=max_pages is None)
+        
+        pages_extracted = sum(1 for text in page_texts if text is not None)
+        truncated = pages_extracted < page_count
+        if truncated and max_pages is None:
+            logger.warning(f"Extraction PDF tronquée: {pages_extracted}/{page_count} pages "
+                           f"(limite {DOCUMENT_MAX_PAGES} pages, {DOCUMENT_TIME_BUDGET}s)")
+        
+        return {
+            "success": True,
+            "text": join_page_texts(page_texts),
+            "metadata": metadata,
+            "document_type": "pdf",
+            "page_count": page_count,
+            "pages_extracted": pages_extracted,
+            "truncated": truncated
+        }
     
     except Exception as e:
         logger.error(f"Erreur lors de l'extraction du texte PDF: {e}")
@@ -93,7 +267,7 @@ def extract_text_from_docx(file_storage):
     Extrait le texte d'un fichier Word (DOCX)
     
     Args:
-        file_storage: Flask FileStorage object
+        file_storage: Flask FileStorage object (ou objet fichier, ou bytes)
     
     Returns:
         dict: Résultat de l'extraction avec texte, métadonnées et statut
@@ -105,60 +279,44 @@ def extract_text_from_docx(file_storage):
         }
     
     try:
-        # Créer un fichier temporaire
-        temp_fd, temp_path = tempfile.mkstemp(suffix='.docx')
+        # Ouvrir le document directement depuis le flux reçu
+        doc = Document(_document_stream(file_storage))
         
-        try:
-            # Sauvegarde le fichier temporairement
-            file_storage.save(temp_path)
-            
-            # Ouvrir le document
-            doc = Document(temp_path)
-            
-            # Extraire les paragraphes
-            paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
-            
-            # Extraire le texte des tableaux
-            tables_text = []
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
-                    if row_text:
-                        tables_text.append(" | ".join(row_text))
-            
-            # Joindre tous les textes
-            all_text = paragraphs + tables_text
-            full_text = "\n\n".join(all_text)
-            
-            # Extraire les métadonnées de base
-            metadata = {}
-            
-            # Métadonnées des propriétés de documents (seulement certaines sont accessibles facilement)
-            if hasattr(doc, 'core_properties'):
-                if doc.core_properties.title:
-                    metadata['title'] = doc.core_properties.title
-                if doc.core_properties.author:
-                    metadata['author'] = doc.core_properties.author
-                if doc.core_properties.created:
-                    metadata['created'] = doc.core_properties.created.isoformat()
-                if doc.core_properties.modified:
-                    metadata['modified'] = doc.core_properties.modified.isoformat()
-            
-            return {
-                "success": True,
-                "text": full_text,
-                "metadata": metadata,
-                "document_type": "docx"
-            }
-            
-        finally:
-            # Fermer et supprimer le fichier temporaire
-            try:
-                os.close(temp_fd)
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-            except Exception as e:
-                logger.error(f"Erreur lors de la suppression du fichier temporaire: {e}")
+        # Extraire les paragraphes
+        paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
+        
+        # Extraire le texte des tableaux
+        tables_text = []
+        for table in doc.tables:
+            for row in table.rows:
+                row_text = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+                if row_text:
+                    tables_text.append(" | ".join(row_text))
+        
+        # Joindre tous les textes
+        all_text = paragraphs + tables_text
+        full_text = "\n\n".join(all_text)
+        
+        # Extraire les métadonnées de base
+        metadata = {}
+        
+        # Métadonnées des propriétés de documents (seulement certaines sont accessibles facilement)
+        if hasattr(doc, 'core_properties'):
+            if doc.core_properties.title:
+                metadata['title'] = doc.core_properties.title
+            if doc.core_properties.author:
+                metadata['author'] = doc.core_properties.author
+            if doc.core_properties.created:
+                metadata['created'] = doc.core_properties.created.isoformat()
+            if doc.core_properties.modified:
+                metadata['modified'] = doc.core_properties.modified.isoformat()
+        
+        return {
+            "success": True,
+            "text": full_text,
+            "metadata": metadata,
+            "document_type": "docx"
+        }
     
     except Exception as e:
         logger.error(f"Erreur lors de l'extraction du texte DOCX: {e}")
@@ -193,13 +351,14 @@ def is_allowed_file(filename, allowed_extensions=None):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in [ext.lstrip('.').lower() for ext in allowed_extensions]
 
-def extract_text_from_document(file_storage, filename=None):
+def extract_text_from_document(file_storage, filename=None, max_pages=None):
     """
     Extrait le texte d'un document (PDF ou DOCX) en fonction de son extension
     
     Args:
-        file_storage: Flask FileStorage object
+        file_storage: Flask FileStorage object (ou objet fichier, ou bytes)
         filename: Nom du fichier (optionnel, utilisera file_storage.filename si non fourni)
+        max_pages: Nombre de premières pages d'un PDF à extraire (optionnel, toutes par défaut)
     
     Returns:
         dict: Résultat de l'extraction avec texte, métadonnées et statut
@@ -221,11 +380,311 @@ def extract_text_from_document(file_storage, filename=None):
     
     # Vérifier l'extension
     if filename.lower().endswith('.pdf'):
-        return extract_text_from_pdf(file_storage)
+        return extract_text_from_pdf(file_storage, max_pages=max_pages)
     elif filename.lower().endswith('.docx'):
         return extract_text_from_docx(file_storage)
     else:
         return {
             "success": False,
             "error": f"Format de fichier non pris en charge: {filename}"
-        }
\ No newline at end of file
+        }
+
+# Relevés bancaires (CSV, XLSX, OFX), lus ligne à ligne en mémoire constante
+
+STATEMENT_EXTENSIONS = ['.csv', '.xlsx', '.ofx', '.qfx']
+
+# Intitulés de colonnes reconnus (en minuscules, sans accents ni ponctuation)
+STATEMENT_COLUMNS = {
+    'date': ('date', 'date operation', 'date de l operation', 'date comptable', 'date de comptabilisation',
+             'date valeur', 'date de valeur', 'booking date', 'transaction date'),
+    'description': ('libelle', 'libelle operation', 'libelle de l operation', 'description', 'label', 'detail',
+                    'details', 'intitule', 'operation', 'nature de l operation', 'memo', 'payee'),
+    'amount': ('montant', 'montant eur', 'montant en euros', 'amount', 'somme'),
+    'debit': ('debit', 'debit eur', 'debit euros', 'withdrawal'),
+    'credit': ('credit', 'credit eur', 'credit euros', 'deposit'),
+}
+
+# Lignes examinées pour trouver l'en-tête (les banques ajoutent souvent un préambule)
+STATEMENT_HEADER_SCAN_ROWS = 20
+
+# Échantillon lu pour détecter l'encodage et le séparateur des CSV
+STATEMENT_SNIFF_BYTES = 64 * 1024
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+class _SemicolonDialect(csv.excel):
+    """CSV des banques françaises (séparateur point-virgule)"""
+    delimiter = ';'
+
+
+def _normalize_header(value):
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+def _statement_columns(row):
+    """Associe les champs du relevé aux indices de colonnes d'une ligne d'en-tête, ou None"""
+    columns = {}
+    for index, value in enumerate(row):
+        name = _normalize_header(value)
+        for field, aliases in STATEMENT_COLUMNS.items():
+            if field not in columns and name in aliases:
+                columns[field] = index
+                break
+    if 'date' in columns and 'description' in columns and ('amount' in columns or 'debit' in columns):
+        return columns
+    return None
+
+
+def _sniff_encoding(sample):
+    """UTF-8 si l'échantillon est décodable (à un caractère coupé près), sinon Windows-1252"""
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            return 'cp1252'
+    return 'utf-8-sig'
+
+
+def parse_statement_amount(value):
+    """
+    Convertit un montant de relevé en Decimal
+
+    Accepte les nombres et les textes "1 234,56", "1.234,56", "-12.50", "12,50 €",
+    "(12,50)" ou "12,50-".
+
+    Args:
+        value: Montant (texte ou nombre)
+
+    Returns:
+        Decimal: Montant signé, ou None si la valeur est vide
+
+    Raises:
+        ValueError: Si la valeur n'est pas un montant
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        amount = Decimal(str(value))
+    else:
+        text = str(value).strip().replace(' ', '').replace('\u00a0', '').replace('\u202f', '')
+        text = text.replace('€', '').replace('EUR', '').replace('eur', '')
+        if not text:
+            return None
+        negative = False
+        if text.startswith('(') and text.endswith(')'):
+            negative, text = True, text[1:-1]
+        if text.endswith('-'):
+            negative, text = True, text[:-1]
+        if ',' in text and '.' in text:
+            # Le dernier séparateur est le séparateur décimal
+            if text.rfind(',') > text.rfind('.'):
+                text = text.replace('.', '').replace(',', '.')
+            else:
+                text = text.replace(',', '')
+        else:
+            text = text.replace(',', '.')
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"montant invalide: {value}")
+        if negative:
+            amount = -amount
+    if not amount.is_finite():
+        raise ValueError(f"montant invalide: {value}")
+    return amount
+
+
+def _date_parser(formats):
+    """Retourne une fonction de conversion des dates, avec mémoïsation (peu de dates distinctes par relevé)"""
+    cache = {}
+    formats = tuple(formats)
+
+    def parse(value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        text = str(value or '').strip()
+        if text in cache:
+            return cache[text]
+        # Ordre de priorité fixe : une date ambiguë est lue de la même façon quelle que soit sa ligne
+        for fmt in formats:
+            try:
+                parsed = datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+            cache[text] = parsed
+            return parsed
+        raise ValueError(f"date invalide: {text or '(vide)'}")
+
+    return parse
+
+
+def _statement_row(parse_date, raw_date, description, amount=None, debit=None, credit=None, reference=None):
+    """
+    Valide et normalise une opération de relevé
+
+    Returns:
+        dict: date, description, amount (positif, 2 décimales), is_expense, reference
+
+    Raises:
+        ValueError: Si la date ou le montant sont invalides
+    """
+    transaction_date = parse_date(raw_date)
+    if amount is not None and amount != '':
+        signed = parse_statement_amount(amount)
+    else:
+        # Colonnes débit/crédit séparées : un débit est une dépense même s'il est écrit sans signe
+        debit_amount = parse_statement_amount(debit)
+        credit_amount = parse_statement_amount(credit)
+        if debit_amount:
+            signed = -abs(debit_amount)
+        elif credit_amount:
+            signed = abs(credit_amount)
+        else:
+            signed = None
+    if not signed:
+        raise ValueError("montant manquant ou nul")
+
+    description = ' '.join(str(description or '').split())
+    return {
+        'date': transaction_date,
+        'description': description[:255] or None,
+        'amount': abs(signed).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+        'is_expense': signed < 0,
+        'reference': reference
+    }
+
+
+def _iter_table_statement(rows, parse_date):
+    """Parcourt les lignes d'un tableau (CSV ou feuille Excel) à partir de l'en-tête reconnu"""
+    columns = None
+    for number, row in enumerate(rows, start=1):
+        if columns is None:
+            columns = _statement_columns(row)
+            if columns is None and number >= STATEMENT_HEADER_SCAN_ROWS:
+                raise ValueError("Colonnes date, libellé et montant introuvables dans le relevé")
+            continue
+        if not any(cell not in (None, '') for cell in row):
+            continue
+
+        def cell(field):
+            index = columns.get(field)
+            return row[index] if index is not None and index < len(row) else None
+
+        try:
+            yield number, _statement_row(parse_date, cell('date'), cell('description'),
+                                         amount=cell('amount'), debit=cell('debit'), credit=cell('credit')), None
+        except ValueError as e:
+            yield number, None, str(e)
+
+    if columns is None:
+        raise ValueError("Colonnes date, libellé et montant introuvables dans le relevé")
+
+
+def _iter_csv_rows(fileobj):
+    sample = fileobj.read(STATEMENT_SNIFF_BYTES)
+    fileobj.seek(0)
+    encoding = _sniff_encoding(sample)
+    sample_text = sample.decode(encoding, errors='ignore')
+    try:
+        dialect = csv.Sniffer().sniff(sample_text, delimiters=';,\t|')
+    except csv.Error:
+        dialect = _SemicolonDialect if sample_text.count(';') > sample_text.count(',') else csv.excel
+
+    text = io.TextIOWrapper(fileobj, encoding=encoding, errors='replace', newline='')
+    try:
+        yield from csv.reader(text, dialect)
+    finally:
+        # Ne pas fermer le fichier de l'appelant avec le TextIOWrapper
+        text.detach()
+
+
+def _iter_xlsx_rows(fileobj):
+    from openpyxl import load_workbook
+
+    # Mode lecture seule : les lignes sont lues au fil de l'eau depuis l'archive
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_ofx_transactions(fileobj):
+    """Parcourt les blocs STMTTRN d'un fichier OFX (SGML 1.x ou XML 2.x), par morceaux"""
+    sample = fileobj.read(STATEMENT_SNIFF_BYTES)
+    fileobj.seek(0)
+    text = io.TextIOWrapper(fileobj, encoding=_sniff_encoding(sample), errors='replace')
+    try:
+        buffer = ''
+        current = None
+        while True:
+            chunk = text.read(STATEMENT_SNIFF_BYTES)
+            buffer += chunk
+            # La dernière balise peut être coupée : elle est traitée avec le morceau suivant
+            end = buffer.rfind('<') if chunk else len(buffer)
+            for match in _OFX_TAG.finditer(buffer, 0, max(end, 0)):
+                closing, tag, value = match.groups()
+                tag = tag.upper()
+                if tag == 'STMTTRN' or (closing and tag == 'BANKTRANLIST'):
+                    # En SGML, les balises fermantes sont facultatives
+                    if current is not None:
+                        yield current
+                    current = {} if tag == 'STMTTRN' and not closing else None
+                elif current is not None and not closing and value.strip():
+                    current[tag] = html.unescape(value.strip())
+            buffer = buffer[max(end, 0):]
+            if not chunk:
+                break
+        if current is not None:
+            yield current
+    finally:
+        text.detach()
+
+
+def _iter_ofx_statement(fileobj):
+    parse_date = _date_parser(['%Y%m%d'])
+    for number, transaction in enumerate(_iter_ofx_transactions(fileobj), start=1):
+        name = transaction.get('NAME', '')
+        memo = transaction.get('MEMO', '')
+        description = name if not memo or memo in name else f"{name} {memo}".strip()
+        try:
+            # DTPOSTED : AAAAMMJJ[HHMMSS[.XXX][fuseau]]
+            yield number, _statement_row(parse_date, transaction.get('DTPOSTED', '')[:8], description,
+                                         amount=transaction.get('TRNAMT'),
+                                         reference=transaction.get('FITID')), None
+        except ValueError as e:
+            yield number, None, str(e)
+
+
+def iter_statement_rows(fileobj, filename):
+    """
+    Lit un relevé bancaire opération par opération, sans le charger en mémoire
+
+    Les dates des CSV/XLSX sont lues avec les formats de main.parse_date ; les
+    montants signés (colonne montant) ou les colonnes débit/crédit sont acceptés.
+
+    Args:
+        fileobj: Fichier binaire du relevé (positionnable)
+        filename (str): Nom du fichier, dont l'extension détermine le format (.csv, .xlsx, .ofx, .qfx)
+
+    Returns:
+        generator: Tuples (numéro de ligne ou d'opération, opération normalisée ou None, erreur ou None) ;
+            l'opération est un dict date, description, amount (positif), is_expense, reference
+
+    Raises:
+        ValueError: Si le format n'est pas pris en charge ou si l'en-tête est introuvable
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        from main import DATE_FORMATS
+        return _iter_table_statement(_iter_csv_rows(fileobj), _date_parser(DATE_FORMATS))
+    if extension == '.xlsx':
+        from main import DATE_FORMATS
+        return _iter_table_statement(_iter_xlsx_rows(fileobj), _date_parser(DATE_FORMATS))
+    if extension in ('.ofx', '.qfx'):
+        return _iter_ofx_statement(fileobj)
+    raise ValueError(f"Format de relevé non pris en charge: {filename}")
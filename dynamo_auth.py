@@ -13,7 +13,7 @@ import time
 from datetime import datetime, timedelta
 from functools import wraps
 
-import boto3
+import aws_clients
 from botocore.exceptions import ClientError
 from flask import request, redirect, url_for, session, flash, g
 
@@ -31,14 +31,8 @@ APP_CLIENT_SECRET = os.environ.get('AWS_COGNITO_APP_CLIENT_SECRET')
 AWS_REGION = os.environ.get('AWS_REGION', 'eu-west-3')
 
 def get_cognito_client():
-    """Create and return a boto3 Cognito client"""
-    client = boto3.client(
-        'cognito-idp',
-        region_name=AWS_REGION,
-        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
-    )
-    return client
+    """Return the shared boto3 Cognito client"""
+    return aws_clients.get_client('cognito-idp', region_name=AWS_REGION)
 
 def login_user(username, password):
     """Authenticate a user with AWS Cognito and return tokens"""
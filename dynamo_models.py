@@ -26,6 +26,11 @@ class BaseModel(Model):
         # La capacité provisionnée est requise si billing_mode n'est pas PAY_PER_REQUEST
         read_capacity_units = 5
         write_capacity_units = 5
+        # PynamoDB gère sa propre connexion : mêmes réglages que les clients de aws_clients.py
+        max_pool_connections = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50))
+        connect_timeout_seconds = float(os.environ.get('AWS_CONNECT_TIMEOUT', 5))
+        read_timeout_seconds = 10
+        max_retry_attempts = int(os.environ.get('AWS_MAX_ATTEMPTS', 5))
 
     # Attributs communs à tous les modèles
     id = UnicodeAttribute(hash_key=True)  # Clé primaire
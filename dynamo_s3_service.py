@@ -10,7 +10,7 @@ from io import BytesIO
 from datetime import datetime, timedelta
 from urllib.parse import unquote
 
-import boto3
+import aws_clients
 from botocore.exceptions import ClientError
 from werkzeug.utils import secure_filename
 
@@ -30,13 +30,8 @@ class S3Service:
         self.bucket_name = bucket_name or S3_BUCKET_NAME
         self.region = region or AWS_REGION
         
-        # Initialiser le client S3
-        self.s3 = boto3.client(
-            's3',
-            region_name=self.region,
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
-        )
+        # Client S3 partagé du processus
+        self.s3 = aws_clients.get_client('s3', region_name=self.region)
         
         logger.info("Connexion à S3 établie")
     
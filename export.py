@@ -17,6 +17,7 @@ import io
 from auth import login_required
 from models import db, User, Invoice, Quote, TaxReport
 from models_business import BusinessReport
+import finance_reports
 from flask import g
 import language
 
@@ -57,6 +58,48 @@ SUPPORTED_FORMATS = {
     }
 }
 
+class _TaxReportDocument:
+    """
+    Rapport fiscal complété des agrégats de sa période pour les exports
+
+    Les totaux, la TVA et les répartitions par catégorie sont recalculés par
+    finance_reports en une requête ; les autres attributs sont ceux du TaxReport.
+    """
+
+    def __init__(self, report):
+        self._report = report
+        summary = finance_reports.compute_report(report.user_id, report.start_date, report.end_date)
+        income = summary['total_income']
+        expenses = summary['total_expenses']
+        net_income = summary['net_profit']
+
+        self.period_start = report.start_date
+        self.period_end = report.end_date
+        self.total_income = self.revenue = income
+        self.total_expenses = self.expenses = expenses
+        self.net_income = self.profit = net_income
+        self.profit_margin = round(float(net_income / income * 100), 1) if income else 0.0
+        self.vat_collected = summary['tax_collected']
+        self.vat_deductible = summary['tax_deductible']
+        # Les frais généraux ne sont pas distingués des achats
+        self.vat_deductible_expenses = finance_reports.ZERO
+        self.vat_due = self.vat_collected - self.vat_deductible
+        taxable_income = income - self.vat_collected
+        self.avg_vat_rate = float(self.vat_collected / taxable_income * 100) if taxable_income > 0 else 0.0
+        self.income_categories = self._categories(finance_reports.category_totals(summary, False), income)
+        self.expense_categories = self._categories(finance_reports.category_totals(summary, True), expenses)
+
+    @staticmethod
+    def _categories(totals, total):
+        return [{
+            'name': name,
+            'amount': amount,
+            'percentage': float(amount / total * 100) if total else 0.0
+        } for name, amount in totals.items()]
+
+    def __getattr__(self, name):
+        return getattr(self._report, name)
+
 def init_app(app):
     """Initialiser les routes de l'exportation pour l'application Flask"""
     app.register_blueprint(export_bp, url_prefix='/export')
@@ -190,7 +233,7 @@ def preview_document(doc_type, doc_id):
         template_name = 'export/preview_quote.html'
     
     elif doc_type == 'tax_reports':
-        document = TaxReport.query.filter_by(id=doc_id, user_id=user.id).first_or_404()
+        document = _TaxReportDocument(TaxReport.query.filter_by(id=doc_id, user_id=user.id).first_or_404())
         template_name = 'export/preview_tax_report.html'
     
     elif doc_type == 'business_reports':
@@ -235,7 +278,7 @@ def generate_export(doc_type, doc_id, format_type):
         filename = f"devis_{document.quote_number}_{datetime.now().strftime('%Y%m%d')}"
     
     elif doc_type == 'tax_reports':
-        document = TaxReport.query.filter_by(id=doc_id, user_id=user.id).first_or_404()
+        document = _TaxReportDocument(TaxReport.query.filter_by(id=doc_id, user_id=user.id).first_or_404())
         filename = f"rapport_fiscal_{document.id}_{datetime.now().strftime('%Y%m%d')}"
     
     elif doc_type == 'business_reports':
@@ -388,13 +431,13 @@ def generate_excel(doc_type, document, filename):
         
         # Ajouter les catégories de revenus
         ws.append(["Revenus", "", ""])
-        for category, amount in document.income_categories.items():
-            ws.append([category, amount, "Revenu"])
+        for category in document.income_categories:
+            ws.append([category['name'], category['amount'], "Revenu"])
         
         # Ajouter les catégories de dépenses
         ws.append(["Dépenses", "", ""])
-        for category, amount in document.expense_categories.items():
-            ws.append([category, amount, "Dépense"])
+        for category in document.expense_categories:
+            ws.append([category['name'], category['amount'], "Dépense"])
         
         # Ajouter les totaux et statistiques
         ws.append(["", "", ""])
@@ -520,15 +563,15 @@ def generate_csv(doc_type, document, filename):
         # Catégories de revenus
         writer.writerow(["Revenus"])
         writer.writerow(["Catégorie", "Montant"])
-        for category, amount in document.income_categories.items():
-            writer.writerow([category, amount])
+        for category in document.income_categories:
+            writer.writerow([category['name'], category['amount']])
         
         # Catégories de dépenses
         writer.writerow([])
         writer.writerow(["Dépenses"])
         writer.writerow(["Catégorie", "Montant"])
-        for category, amount in document.expense_categories.items():
-            writer.writerow([category, amount])
+        for category in document.expense_categories:
+            writer.writerow([category['name'], category['amount']])
         
         # Totaux et statistiques
         writer.writerow([])
@@ -655,8 +698,8 @@ def generate_json(doc_type, document, filename):
                 'start_date': document.start_date.strftime('%Y-%m-%d'),
                 'end_date': document.end_date.strftime('%Y-%m-%d')
             },
-            'income_categories': document.income_categories,
-            'expense_categories': document.expense_categories,
+            'income_categories': {c['name']: float(c['amount']) for c in document.income_categories},
+            'expense_categories': {c['name']: float(c['amount']) for c in document.expense_categories},
             'statistics': {
                 'total_income': float(document.total_income),
                 'total_expenses': float(document.total_expenses),
@@ -1,12 +1,12 @@
 import datetime
 import logging
-import re
 from decimal import Decimal
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session
 from sqlalchemy import func, extract
 
 from models import db, User, ExtractedText, Category, FinancialTransaction, Vendor, TaxReport, vendor_transaction
 from auth import login_required, admin_required
+import receipt_extractor
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -618,98 +618,8 @@ def analyze_document_text(text):
             
         except Exception as e:
             logger.error(f"Erreur lors de l'analyse OpenAI: {e}")
-            # En cas d'erreur, on utilise l'ancienne méthode
-            return analyze_document_text_legacy(text)
+            # En cas d'erreur, on utilise l'extraction par expression compilée
+            return receipt_extractor.extract_fields(text)
     else:
-        # Si pas de clé API, utiliser l'ancienne méthode
-        return analyze_document_text_legacy(text)
-
-def analyze_document_text_legacy(text):
-    """Analyser le texte d'un document avec des expressions régulières (méthode traditionnelle)"""
-    # Initialiser les valeurs par défaut
-    suggested_data = {
-        'amount': None,
-        'date': None,
-        'vendor': None,
-        'document_type': None,
-        'confidence': 0.3,  # Confiance plus faible pour cette méthode
-        'analyzed_by': 'regex'
-    }
-    
-    try:
-        # Rechercher un montant (pattern: nombres avec virgule/point)
-        amount_patterns = [
-            r'montant\s*(?:total)?\s*:?\s*(\d+[.,]\d{2})',  # montant 123,45
-            r'total\s*:?\s*(\d+[.,]\d{2})',                # total: 123,45
-            r'(?:€|EUR)\s*(\d+[.,]\d{2})',                  # EUR 123,45
-            r'(\d+[.,]\d{2})\s*(?:€|EUR)',                  # 123,45 €
-            r'(?<!\d)(\d+[.,]\d{2})(?!\d)'                  # 123,45 isolé
-        ]
-        
-        for pattern in amount_patterns:
-            amount_match = re.search(pattern, text, re.IGNORECASE)
-            if amount_match:
-                suggested_data['amount'] = amount_match.group(1).replace(',', '.')
-                break
-        
-        # Rechercher une date (formats communs)
-        date_patterns = [
-            r'date\s*:?\s*(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})',  # date: 31/12/2023
-            r'(?<!\d)(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})(?!\d)',  # 31/12/2023 isolé
-            r'(\d{1,2}\s+(?:janvier|février|mars|avril|mai|juin|juillet|août|septembre|octobre|novembre|décembre)\s+\d{2,4})' # 31 décembre 2023
-        ]
-        
-        for pattern in date_patterns:
-            date_match = re.search(pattern, text, re.IGNORECASE)
-            if date_match:
-                date_str = date_match.group(1)
-                # On ne convertit pas encore, juste on suggère le format trouvé
-                suggested_data['date'] = date_str
-                break
-        
-        # Rechercher un nom de vendeur (souvent en haut des factures)
-        # C'est plus complexe et moins précis, on prend les premières lignes
-        lines = text.split('\n')
-        non_empty_lines = [line.strip() for line in lines if line.strip()]
-        
-        if non_empty_lines:
-            # Souvent, le nom du vendeur est dans les premières lignes non vides
-            potential_vendor = non_empty_lines[0]
-            # Ignorer les lignes trop courtes ou trop longues
-            if 3 < len(potential_vendor) < 50:
-                suggested_data['vendor'] = potential_vendor
-        
-        # Deviner le type de document
-        doc_type_keywords = {
-            'facture': ['facture', 'invoice', 'numéro de facture'],
-            'reçu': ['reçu', 'ticket', 'caisse', 'receipt'],
-            'devis': ['devis', 'estimation', 'quote'],
-            'relevé': ['relevé', 'bancaire', 'statement']
-        }
-        
-        for doc_type, keywords in doc_type_keywords.items():
-            for keyword in keywords:
-                if re.search(r'\b' + keyword + r'\b', text, re.IGNORECASE):
-                    suggested_data['document_type'] = doc_type
-                    break
-            if suggested_data['document_type']:
-                break
-        
-        # Si aucun type détecté, considérer comme inconnu
-        if not suggested_data['document_type']:
-            suggested_data['document_type'] = 'inconnu'
-        
-        # Si on a trouvé au moins deux informations, augmenter la confiance
-        if (suggested_data['amount'] and suggested_data['date']) or \
-           (suggested_data['amount'] and suggested_data['vendor']) or \
-           (suggested_data['date'] and suggested_data['vendor']):
-            suggested_data['confidence'] = 0.6
-        
-        # Si on a trouvé toutes les informations clés, confiance plus élevée
-        if suggested_data['amount'] and suggested_data['date'] and suggested_data['vendor']:
-            suggested_data['confidence'] = 0.8
-        
-    except Exception as e:
-        logger.error(f"Error analyzing document text with regex: {str(e)}")
-    
-    return suggested_data
\ No newline at end of file
+        # Si pas de clé API, utiliser l'extraction par expression compilée
+        return receipt_extractor.extract_fields(text)
@@ -1,17 +1,23 @@
 import datetime
 import logging
 import os
-import re
 from decimal import Decimal
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session
-from sqlalchemy import func, extract
+from sqlalchemy import extract
 
 from models import db, User, ExtractedText, Category, FinancialTransaction, Vendor, TaxReport, vendor_transaction
 from auth import login_required, admin_required
+import finance_reports
+import transaction_rollups
+import receipt_extractor
+import analysis_cache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Modèle OpenAI des analyses financières (fait partie de la clé du cache des analyses)
+FINANCIAL_ANALYSIS_MODEL = "gpt-4"  # Utiliser gpt-4 car notre compte n'a pas accès à gpt-4o
+
 # Blueprint pour les fonctionnalités financières
 finance_bp = Blueprint('finance', __name__, url_prefix='/finance')
 
@@ -35,16 +41,10 @@ def finance_dashboard():
     transactions = FinancialTransaction.query.filter_by(user_id=user.id).order_by(FinancialTransaction.transaction_date.desc()).limit(5).all()
     categories = Category.query.filter_by(user_id=user.id).all()
     
-    # Calcul des totaux
-    total_income = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == False
-    ).scalar() or Decimal('0.00')
-    
-    total_expenses = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == True
-    ).scalar() or Decimal('0.00')
+    # Calcul des totaux (totaux mensuels maintenus incrémentalement)
+    totals = transaction_rollups.user_totals(user.id)
+    total_income = totals['total_income']
+    total_expenses = totals['total_expenses']
     
     balance = total_income - total_expenses
     
@@ -372,105 +372,23 @@ def financial_reports():
         else:
             end_date = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
     
-    # Récupérer les dépenses par catégorie
-    expense_by_category = db.session.query(
-        Category.name,
-        Category.color,
-        func.sum(FinancialTransaction.amount).label('total')
-    ).join(
-        FinancialTransaction, 
-        FinancialTransaction.category_id == Category.id
-    ).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == True,
-        FinancialTransaction.transaction_date.between(start_date, end_date)
-    ).group_by(
-        Category.id
-    ).all()
-    
-    # Récupérer les revenus par catégorie
-    income_by_category = db.session.query(
-        Category.name,
-        Category.color,
-        func.sum(FinancialTransaction.amount).label('total')
-    ).join(
-        FinancialTransaction, 
-        FinancialTransaction.category_id == Category.id
-    ).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == False,
-        FinancialTransaction.transaction_date.between(start_date, end_date)
-    ).group_by(
-        Category.id
-    ).all()
+    # Agrégats de la période en une requête groupée
+    report = finance_reports.compute_report(user.id, start_date, end_date)
+    total_income = report['total_income']
+    total_expenses = report['total_expenses']
+    total_tax = report['total_tax']
+    balance = net_profit = report['net_profit']
     
-    # Récupérer les dépenses par mois (pour l'année en cours)
+    # Dépenses et revenus par mois (pour l'année)
     expenses_by_month = []
     incomes_by_month = []
-    
     if period == 'year':
-        for m in range(1, 13):
-            # Définir le début et la fin du mois
-            m_start = datetime.date(year, m, 1)
-            if m == 12:
-                m_end = datetime.date(year + 1, 1, 1) - datetime.timedelta(days=1)
-            else:
-                m_end = datetime.date(year, m + 1, 1) - datetime.timedelta(days=1)
-            
-            # Dépenses du mois
-            month_expense = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-                FinancialTransaction.user_id == user.id,
-                FinancialTransaction.is_expense == True,
-                FinancialTransaction.transaction_date.between(m_start, m_end)
-            ).scalar() or 0
-            
-            # Revenus du mois
-            month_income = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-                FinancialTransaction.user_id == user.id,
-                FinancialTransaction.is_expense == False,
-                FinancialTransaction.transaction_date.between(m_start, m_end)
-            ).scalar() or 0
-            
-            expenses_by_month.append(float(month_expense))
-            incomes_by_month.append(float(month_income))
-    
-    # Calculer les totaux pour la période
-    total_income = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == False,
-        FinancialTransaction.transaction_date.between(start_date, end_date)
-    ).scalar() or Decimal('0.00')
+        expenses_by_month = [float(m['expenses']) for m in report['months']]
+        incomes_by_month = [float(m['income']) for m in report['months']]
     
-    total_expenses = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == True,
-        FinancialTransaction.transaction_date.between(start_date, end_date)
-    ).scalar() or Decimal('0.00')
-    
-    balance = total_income - total_expenses
-    
-    # Préparer les données pour les graphiques
-    expense_data = {
-        'labels': [cat.name for cat in expense_by_category],
-        'values': [float(cat.total) for cat in expense_by_category],
-        'colors': [cat.color for cat in expense_by_category]
-    }
-    
-    income_data = {
-        'labels': [cat.name for cat in income_by_category],
-        'values': [float(cat.total) for cat in income_by_category],
-        'colors': [cat.color for cat in income_by_category]
-    }
-    
-    # Calculer le total de TVA (taxe)
-    total_tax = db.session.query(func.sum(FinancialTransaction.tax_amount)).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.tax_amount.isnot(None),
-        FinancialTransaction.transaction_date.between(start_date, end_date)
-    ).scalar() or Decimal('0.00')
-    
-    # Calculer le profit net (revenu - dépenses)
-    net_profit = total_income - total_expenses
+    # Répartitions par catégorie (nom, couleur, total) et données des graphiques
+    expense_by_category = [(c['name'], c['color'], c['total']) for c in report['expense_by_category']]
+    income_by_category = [(c['name'], c['color'], c['total']) for c in report['income_by_category']]
     
     return render_template("finance/reports.html",
                           period=period,
@@ -483,8 +401,14 @@ def financial_reports():
                           total_tax=total_tax,
                           balance=balance,
                           net_profit=net_profit,
-                          expense_data=expense_data,
-                          income_data=income_data,
+                          expense_by_category=expense_by_category,
+                          income_by_category=income_by_category,
+                          expense_labels=[name for name, _, _ in expense_by_category],
+                          expense_colors=[color for _, color, _ in expense_by_category],
+                          expense_data=[float(total) for _, _, total in expense_by_category],
+                          income_labels=[name for name, _, _ in income_by_category],
+                          income_colors=[color for _, color, _ in income_by_category],
+                          income_data=[float(total) for _, _, total in income_by_category],
                           expenses_by_month=expenses_by_month,
                           incomes_by_month=incomes_by_month)
 
@@ -509,25 +433,11 @@ def generate_tax_report():
             start_date = datetime.datetime.strptime(start_date_str, '%Y-%m-%d').date()
             end_date = datetime.datetime.strptime(end_date_str, '%Y-%m-%d').date()
             
-            # Calculer les totaux
-            total_income = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-                FinancialTransaction.user_id == user.id,
-                FinancialTransaction.is_expense == False,
-                FinancialTransaction.transaction_date.between(start_date, end_date)
-            ).scalar() or Decimal('0.00')
-            
-            total_expenses = db.session.query(func.sum(FinancialTransaction.amount)).filter(
-                FinancialTransaction.user_id == user.id,
-                FinancialTransaction.is_expense == True,
-                FinancialTransaction.transaction_date.between(start_date, end_date)
-            ).scalar() or Decimal('0.00')
-            
-            # Calculer le total de TVA (taxe)
-            total_tax = db.session.query(func.sum(FinancialTransaction.tax_amount)).filter(
-                FinancialTransaction.user_id == user.id,
-                FinancialTransaction.tax_amount.isnot(None),
-                FinancialTransaction.transaction_date.between(start_date, end_date)
-            ).scalar() or Decimal('0.00')
+            # Calculer les totaux et la TVA en une requête groupée
+            summary = finance_reports.compute_report(user.id, start_date, end_date)
+            total_income = summary['total_income']
+            total_expenses = summary['total_expenses']
+            total_tax = summary['total_tax']
             
             # Profit avant impôts
             profit = total_income - total_expenses
@@ -591,49 +501,22 @@ def view_tax_report(report_id):
     expenses = [t for t in transactions if t.is_expense]
     incomes = [t for t in transactions if not t.is_expense]
     
-    # Obtenir les catégories de dépenses avec les montants totaux
-    expense_by_category = db.session.query(
-        Category.name,
-        Category.color,
-        func.sum(FinancialTransaction.amount).label('total')
-    ).join(
-        FinancialTransaction, 
-        FinancialTransaction.category_id == Category.id
-    ).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == True,
-        FinancialTransaction.transaction_date.between(report.start_date, report.end_date)
-    ).group_by(
-        Category.id
-    ).all()
-    
-    # Obtenir les catégories de revenus avec les montants totaux
-    income_by_category = db.session.query(
-        Category.name,
-        Category.color,
-        func.sum(FinancialTransaction.amount).label('total')
-    ).join(
-        FinancialTransaction, 
-        FinancialTransaction.category_id == Category.id
-    ).filter(
-        FinancialTransaction.user_id == user.id,
-        FinancialTransaction.is_expense == False,
-        FinancialTransaction.transaction_date.between(report.start_date, report.end_date)
-    ).group_by(
-        Category.id
-    ).all()
+    # Obtenir les catégories de dépenses et de revenus avec les montants totaux
+    summary = finance_reports.compute_report(user.id, report.start_date, report.end_date)
+    expense_by_category = [(c['name'], c['color'], c['total']) for c in summary['expense_by_category']]
+    income_by_category = [(c['name'], c['color'], c['total']) for c in summary['income_by_category']]
     
     # Préparer les données pour les graphiques
     expense_data = {
-        'labels': [cat.name for cat in expense_by_category],
-        'data': [float(cat.total) for cat in expense_by_category],
-        'colors': [cat.color for cat in expense_by_category]
+        'labels': [name for name, _, _ in expense_by_category],
+        'data': [float(total) for _, _, total in expense_by_category],
+        'colors': [color for _, color, _ in expense_by_category]
     }
     
     income_data = {
-        'labels': [cat.name for cat in income_by_category],
-        'data': [float(cat.total) for cat in income_by_category],
-        'colors': [cat.color for cat in income_by_category]
+        'labels': [name for name, _, _ in income_by_category],
+        'data': [float(total) for _, _, total in income_by_category],
+        'colors': [color for _, color, _ in income_by_category]
     }
     
     return render_template("finance/view_tax_report.html", 
@@ -684,11 +567,8 @@ def generate_tax_report_ai_analysis(report_id):
     report = TaxReport.query.filter_by(id=report_id, user_id=user.id).first_or_404()
     
     try:
-        # Récupérer les transactions pour ce rapport
-        transactions = FinancialTransaction.query.filter(
-            FinancialTransaction.user_id == user.id,
-            FinancialTransaction.transaction_date.between(report.start_date, report.end_date)
-        ).order_by(FinancialTransaction.transaction_date).all()
+        # Répartitions par catégorie de la période
+        summary = finance_reports.compute_report(user.id, report.start_date, report.end_date)
         
         # Préparer les données pour l'analyse
         financial_data = {
@@ -698,32 +578,27 @@ def generate_tax_report_ai_analysis(report_id):
             "profit": float(report.profit),
             "start_date": report.start_date.strftime('%d/%m/%Y'),
             "end_date": report.end_date.strftime('%d/%m/%Y'),
-            "expenses_by_category": {},
-            "income_by_category": {}
+            # Opérations sans catégorie regroupées sous "Non classé"
+            "expenses_by_category": {
+                name: float(total) for name, total in finance_reports.category_totals(summary, True).items()},
+            "income_by_category": {
+                name: float(total) for name, total in finance_reports.category_totals(summary, False).items()}
         }
         
-        # Calculer les dépenses par catégorie
-        for t in [t for t in transactions if t.is_expense]:
-            category_name = t.category.name if t.category else "Non classé"
-            if category_name not in financial_data["expenses_by_category"]:
-                financial_data["expenses_by_category"][category_name] = 0.0
-            financial_data["expenses_by_category"][category_name] += float(t.amount)
-        
-        # Calculer les revenus par catégorie
-        for t in [t for t in transactions if not t.is_expense]:
-            category_name = t.category.name if t.category else "Non classé"
-            if category_name not in financial_data["income_by_category"]:
-                financial_data["income_by_category"][category_name] = 0.0
-            financial_data["income_by_category"][category_name] += float(t.amount)
+        # Analyse déjà produite pour ces chiffres : les transactions de la période n'ont pas changé
+        digest = analysis_cache.analysis_digest('financial', financial_data, FINANCIAL_ANALYSIS_MODEL)
+        if report.ai_analysis and report.ai_analysis_hash == digest:
+            return jsonify({"success": True, "cached": True})
         
-        # Appeler l'API OpenAI pour l'analyse
-        analysis_html = generate_financial_analysis(financial_data)
+        # Appeler l'API OpenAI pour l'analyse (ou relire le cache partagé)
+        analysis_html, cached = analyze_financial_data(financial_data, digest)
         
         if analysis_html:
-            # Mise à jour du rapport avec l'analyse
+            # Mise à jour du rapport avec l'analyse ; l'empreinte n'est conservée que si l'analyse a réussi
             report.ai_analysis = analysis_html
+            report.ai_analysis_hash = digest if cached is not None else None
             db.session.commit()
-            return jsonify({"success": True})
+            return jsonify({"success": True, "cached": bool(cached)})
         else:
             return jsonify({"success": False, "error": "Impossible de générer l'analyse IA"}), 500
             
@@ -746,29 +621,47 @@ def analyze_document_text(text):
         # Utiliser une IA pour extraire les informations
         # TODO: Intégrer avec le modèle OpenAI pour une analyse plus intelligente
         
-        # En attendant, utiliser des expressions régulières basiques
-        result = analyze_document_text_legacy(text)
-        
-        return result
+        # En attendant, extraction par expression compilée (montant, date, fournisseur, TVA, type)
+        return receipt_extractor.extract_fields(text)
     except Exception as e:
         logger.error(f"Error analyzing document text: {str(e)}")
         return {}
 
-def generate_financial_analysis(financial_data):
+def generate_financial_analysis(financial_data, use_cache=True):
     """
     Génère une analyse financière en utilisant l'API OpenAI
     
     Args:
         financial_data (dict): Données financières à analyser
+        use_cache (bool): Relire et enregistrer l'analyse dans le cache des analyses
         
     Returns:
         str: Analyse HTML formatée ou None en cas d'erreur
     """
+    digest = analysis_cache.analysis_digest('financial', financial_data, FINANCIAL_ANALYSIS_MODEL) if use_cache else None
+    return analyze_financial_data(financial_data, digest)[0]
+
+def analyze_financial_data(financial_data, digest=None):
+    """
+    Génère une analyse financière, relue depuis le cache des analyses si ces chiffres ont déjà été analysés
+    
+    Args:
+        financial_data (dict): Données financières à analyser
+        digest (str, optional): Clé de cache (analysis_cache.analysis_digest) ; None pour ne pas utiliser le cache
+        
+    Returns:
+        tuple: (analyse HTML, True si relue depuis le cache / False si générée / None si message d'erreur)
+    """
+    if digest:
+        cached_html = analysis_cache.get(digest)
+        if cached_html:
+            return cached_html, True
+    
     try:
         # Vérifier si la clé API OpenAI est disponible
         openai_api_key = os.environ.get('OPENAI_API_KEY')
         if not openai_api_key:
-            return "<div class='alert alert-warning'>Clé API OpenAI non configurée. Veuillez configurer une clé API pour obtenir une analyse détaillée.</div>"
+            return "<div class='alert alert-warning'>Clé API OpenAI non configurée. Veuillez configurer une clé API pour obtenir une analyse détaillée.</div>", None
         
         # Préparer le prompt pour OpenAI
         prompt = f"""
@@ -798,7 +691,7 @@ def generate_financial_analysis(financial_data):
         from openai import OpenAI
         client = OpenAI(api_key=openai_api_key)
         response = client.chat.completions.create(
-            model="gpt-4",  # Utiliser gpt-4 car notre compte n'a pas accès à gpt-4o
+            model=FINANCIAL_ANALYSIS_MODEL,
             messages=[
                 {"role": "system", "content": "Tu es un expert en analyse financière qui fournit des conseils précis et pratiques."},
                 {"role": "user", "content": prompt}
@@ -808,97 +701,12 @@ def generate_financial_analysis(financial_data):
         )
         
         analysis_html = response.choices[0].message.content
-        return analysis_html
+        if not analysis_html:
+            return None, None
+        if digest:
+            analysis_cache.put(digest, analysis_html)
+        return analysis_html, False
     
     except Exception as e:
         logger.error(f"Error generating financial analysis: {str(e)}")
-        return f"<div class='alert alert-danger'>Erreur lors de l'analyse: {str(e)}</div>"
-
-def analyze_document_text_legacy(text):
-    """Analyser le texte d'un document avec des expressions régulières (méthode traditionnelle)"""
-    result = {}
-    
-    # Détection de montants - recherche de patterns comme "123,45 €" ou "123.45€"
-    amount_patterns = [
-        r'(\d+[,.]\d+)\s*€',  # 123,45 €
-        r'(\d+[,.]\d+)€',    # 123,45€
-        r'€\s*(\d+[,.]\d+)',  # € 123,45
-        r'TOTAL\s*:?\s*(\d+[,.]\d+)',  # TOTAL: 123,45
-        r'MONTANT\s*:?\s*(\d+[,.]\d+)'  # MONTANT: 123,45
-    ]
-    
-    for pattern in amount_patterns:
-        match = re.search(pattern, text)
-        if match:
-            result['amount'] = match.group(1).replace(',', '.')
-            break
-    
-    # Détection de date - recherche de patterns comme "01/01/2025" ou "2025-01-01"
-    date_patterns = [
-        r'(\d{2}/\d{2}/\d{4})',  # 01/01/2025
-        r'(\d{2}-\d{2}-\d{4})',  # 01-01-2025
-        r'(\d{4}-\d{2}-\d{2})',  # 2025-01-01
-        r'Date\s*:?\s*(\d{2}[/-]\d{2}[/-]\d{4})',  # Date: 01/01/2025
-    ]
-    
-    for pattern in date_patterns:
-        match = re.search(pattern, text)
-        if match:
-            date_str = match.group(1)
-            # Convertir en format YYYY-MM-DD pour le formulaire
-            if '/' in date_str:
-                parts = date_str.split('/')
-                if len(parts[2]) == 4:  # Format DD/MM/YYYY
-                    result['date'] = f"{parts[2]}-{parts[1]}-{parts[0]}"
-                else:  # Format MM/DD/YYYY ou autre
-                    result['date'] = datetime.datetime.now().strftime('%Y-%m-%d')
-            elif '-' in date_str:
-                parts = date_str.split('-')
-                if len(parts[0]) == 4:  # Format YYYY-MM-DD
-                    result['date'] = date_str
-                else:  # Format DD-MM-YYYY
-                    result['date'] = f"{parts[2]}-{parts[1]}-{parts[0]}"
-            break
-    
-    # Si pas de date trouvée, utiliser la date du jour
-    if 'date' not in result:
-        result['date'] = datetime.datetime.now().strftime('%Y-%m-%d')
-    
-    # Détection de vendeur/fournisseur
-    vendor_patterns = [
-        r'VENDEUR\s*:?\s*([A-Za-z0-9\s]+)',
-        r'FOURNISSEUR\s*:?\s*([A-Za-z0-9\s]+)',
-        r'MAGASIN\s*:?\s*([A-Za-z0-9\s]+)',
-        r'BOUTIQUE\s*:?\s*([A-Za-z0-9\s]+)',
-    ]
-    
-    for pattern in vendor_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            result['vendor'] = match.group(1).strip()
-            break
-    
-    # Détection de taux de TVA
-    tax_patterns = [
-        r'TVA\s+(\d+[,.]\d+)%',  # TVA 20,00%
-        r'TVA\s*:?\s*(\d+[,.]\d+)%',  # TVA: 20,00%
-        r'T\.V\.A\.\s*(\d+[,.]\d+)%',  # T.V.A. 20,00%
-    ]
-    
-    for pattern in tax_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            result['tax_rate'] = match.group(1).replace(',', '.')
-            break
-    
-    # Type de document (facture, reçu, ticket)
-    if 'FACTURE' in text.upper():
-        result['document_type'] = 'invoice'
-    elif 'REÇU' in text.upper() or 'RECU' in text.upper():
-        result['document_type'] = 'receipt'
-    elif 'TICKET' in text.upper():
-        result['document_type'] = 'receipt'
-    else:
-        result['document_type'] = 'unknown'
-    
-    return result
\ No newline at end of file
+        return f"<div class='alert alert-danger'>Erreur lors de l'analyse: {str(e)}</div>", None
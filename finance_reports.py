@@ -0,0 +1,106 @@
+"""
+Agrégats financiers des rapports (page Rapports, rapports fiscaux et exports)
+
+Les totaux par mois, sens (dépense/revenu) et catégorie d'un utilisateur, lus
+dans les totaux mensuels de transaction_rollups, fournissent les totaux
+mensuels, les totaux de la période, la TVA et les répartitions par catégorie ;
+les vues en dérivent les formes qu'elles affichent.
+"""
+import datetime
+import logging
+from decimal import Decimal
+
+import transaction_rollups
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+
+# Libellé des opérations sans catégorie
+UNCATEGORIZED_LABEL = "Non classé"
+
+
+def month_starts(start_date, end_date):
+    """Premiers jours des mois couverts par une période, dans l'ordre"""
+    months = []
+    current = start_date.replace(day=1)
+    while current <= end_date:
+        months.append(current)
+        current = (current + datetime.timedelta(days=32)).replace(day=1)
+    return months
+
+
+def compute_report(user_id, start_date, end_date):
+    """
+    Calcule les agrégats financiers d'un utilisateur sur une période
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        start_date (date): Début de la période (inclus)
+        end_date (date): Fin de la période (incluse)
+
+    Returns:
+        dict: total_income, total_expenses, total_tax, tax_collected (TVA des revenus),
+            tax_deductible (TVA des dépenses), net_profit ; months (un dict month, income,
+            expenses, tax par mois de la période) ; expense_by_category et income_by_category
+            (dicts id, name, color, total, par montant décroissant) ; uncategorized_expenses et
+            uncategorized_income (montants sans catégorie)
+    """
+    rows = transaction_rollups.monthly_rows(user_id, start_date, end_date)
+
+    months = {m: {'month': m, 'income': ZERO, 'expenses': ZERO, 'tax': ZERO}
+              for m in month_starts(start_date, end_date)}
+    totals = {'total_income': ZERO, 'total_expenses': ZERO, 'total_tax': ZERO,
+              'tax_collected': ZERO, 'tax_deductible': ZERO,
+              'uncategorized_expenses': ZERO, 'uncategorized_income': ZERO}
+    categories = {True: {}, False: {}}
+
+    for month_start, is_expense, category_id, name, color, amount, tax, _ in rows:
+        amount = amount or ZERO
+        tax = tax or ZERO
+        entry = months.setdefault(month_start, {'month': month_start, 'income': ZERO, 'expenses': ZERO, 'tax': ZERO})
+        entry['tax'] += tax
+        totals['total_tax'] += tax
+        entry['expenses' if is_expense else 'income'] += amount
+        totals['total_expenses' if is_expense else 'total_income'] += amount
+        totals['tax_deductible' if is_expense else 'tax_collected'] += tax
+        if category_id is None:
+            totals['uncategorized_expenses' if is_expense else 'uncategorized_income'] += amount
+        else:
+            category = categories[is_expense].setdefault(
+                category_id, {'id': category_id, 'name': name, 'color': color, 'total': ZERO})
+            category['total'] += amount
+
+    def by_total(entries):
+        return sorted(entries.values(), key=lambda c: c['total'], reverse=True)
+
+    return {
+        **totals,
+        'net_profit': totals['total_income'] - totals['total_expenses'],
+        'months': [months[m] for m in sorted(months)],
+        'expense_by_category': by_total(categories[True]),
+        'income_by_category': by_total(categories[False])
+    }
+
+
+def category_totals(report, is_expense, include_uncategorized=True):
+    """
+    Montants par nom de catégorie d'un rapport calculé par compute_report
+
+    Args:
+        report (dict): Résultat de compute_report
+        is_expense (bool): Dépenses (True) ou revenus (False)
+        include_uncategorized (bool): Ajouter les opérations sans catégorie sous UNCATEGORIZED_LABEL
+
+    Returns:
+        dict: Nom de catégorie -> montant (Decimal)
+    """
+    key = 'expense' if is_expense else 'income'
+    totals = {}
+    for category in report[f'{key}_by_category']:
+        # Deux catégories homonymes sont cumulées
+        totals[category['name']] = totals.get(category['name'], ZERO) + category['total']
+    uncategorized = report['uncategorized_expenses' if is_expense else 'uncategorized_income']
+    if include_uncategorized and uncategorized:
+        totals[UNCATEGORIZED_LABEL] = totals.get(UNCATEGORIZED_LABEL, ZERO) + uncategorized
+    return totals
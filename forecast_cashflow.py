@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Script pour (re)calculer les prévisions de trésorerie de tous les utilisateurs
+Crée la table cashflow_prediction si nécessaire et remplace les prévisions du
+mois en cours et des mois suivants (à lancer par cron si le calcul périodique
+de l'application est désactivé avec CASHFLOW_FORECAST_INTERVAL=0)
+"""
+import sys
+import logging
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """Fonction principale pour recalculer les prévisions"""
+    try:
+        from main import app
+        from models import db
+        from dashboard_models import CashflowPrediction
+        import cashflow_forecast
+
+        with app.app_context():
+            CashflowPrediction.__table__.create(db.engine, checkfirst=True)
+            stats = cashflow_forecast.run_forecasts()
+            if stats is not None:
+                logger.info(f"Prévisions calculées pour {stats['users']} utilisateurs en {stats['seconds']} s")
+            else:
+                logger.warning("Un calcul des prévisions est déjà en cours dans un autre processus.")
+                sys.exit(1)
+
+    except Exception as e:
+        logger.error(f"Erreur lors du calcul des prévisions: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1882,6 +1882,18 @@ TRANSLATIONS = {
         'fr': 'Traiter',
         'en': 'Process'
     },
+    'finance.dashboard.process_all': {
+        'fr': 'Tout traiter',
+        'en': 'Process all'
+    },
+    'finance.dashboard.process_all_progress': {
+        'fr': 'Traitement en cours',
+        'en': 'Processing'
+    },
+    'finance.dashboard.process_all_done': {
+        'fr': 'transactions créées, documents à vérifier :',
+        'en': 'transactions created, documents to review:'
+    },
     'finance.dashboard.no_pending_documents': {
         'fr': 'Aucun document en attente de traitement',
         'en': 'No documents pending processing'
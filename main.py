@@ -3,11 +3,12 @@ import logging
 import requests
 import random
 import datetime
-import json
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, g, send_from_directory
+import io
+import base64
+import binascii
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, g, send_from_directory, stream_with_context
 from flask_login import LoginManager, current_user, login_user, logout_user, login_required
 from dotenv import load_dotenv
-from decimal import Decimal
 from sqlalchemy import func, extract
 import language
 
@@ -46,7 +47,7 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 
 # Import models (après configuration de l'app)
 from models import db
-from models import Conversation, Message, User, ExtractedText, Category, FinancialTransaction, Vendor, TaxReport
+from models import Conversation, Message, User, ExtractedText, Category, Vendor, TaxReport
 from models import SubscriptionPlan, Subscription
 from models_business import BusinessReport
 from models_payment import UniPesaPayment
@@ -70,7 +71,7 @@ def load_user(user_id):
 
 # Define constants
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_API_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/") + "/chat/completions"
 OPENAI_MODEL = "gpt-4"  # Utilisation de gpt-4 car notre compte n'a pas encore accès à gpt-4o
 
 # Import forms
@@ -97,6 +98,21 @@ import marketplace  # Import du module API marketplace
 import process_analysis  # Import du module d'analyse des processus
 import predictive_intelligence  # Import du module d'intelligence prédictive commerciale
 import modules  # Import du système de modules
+import chat_memory  # Import de la gestion du contexte des conversations
+import message_cache  # Import du cache de l'historique des conversations
+import message_search  # Import de la recherche plein texte des conversations (admin)
+import admin_stats  # Import des statistiques incrémentales de l'administration
+import ocr_cache  # Import du cache des résultats OCR
+import ocr_jobs  # Import du traitement asynchrone des images OCR
+import ocr_upload  # Import de la réception des images OCR en binaire/multipart
+import ocr_batch  # Import de l'import par lots des reçus et factures
+import document_jobs  # Import de l'extraction progressive des documents longs
+import document_cache  # Import du cache des extractions de documents
+import statement_import  # Import des relevés bancaires (CSV, XLSX, OFX)
+import transaction_rollups  # Import des totaux mensuels incrémentaux des transactions
+import text_processing_jobs  # Import du traitement par lot des textes extraits
+import dashboard_data  # Import des données mises en cache des tableaux de bord
+import cashflow_forecast  # Import des prévisions de trésorerie précalculées
 
 # Benji's personality phrases - Version améliorée sans répétitions
 GREETING_PHRASES = [
@@ -143,61 +159,109 @@ def init_db():
         db.create_all()
         logger.debug("Database tables created")
 
-# Get or create active conversation
+# Get or create active conversation (resolved once per request and memoized on g)
 def get_active_conversation():
-    with app.app_context():
-        # Check if user is logged in
-        username = session.get('username')
-        user = None
+    conversation = g.get('active_conversation')
+    if conversation is not None:
+        return conversation
+    
+    # Check if user is logged in
+    username = session.get('username')
+    
+    # ID of the last message, fetched in the same query to validate the history cache
+    last_message_id = db.session.query(func.max(Message.id)).filter(
+        Message.conversation_id == Conversation.id
+    ).correlate(Conversation).scalar_subquery()
+    
+    row = None
+    user = None
+    
+    if username:
+        # Get the most recent conversation for this user in a single query
+        row = db.session.query(Conversation, last_message_id).join(
+            User, Conversation.user_id == User.id
+        ).filter(User.username == username).order_by(Conversation.last_updated.desc()).first()
         
-        if username:
-            # Get user from database
+        if not row:
             user = User.query.filter_by(username=username).first()
-        
-        if user:
-            # Get the most recent conversation for this user or create a new one
-            conversation = Conversation.query.filter_by(user_id=user.id).order_by(Conversation.last_updated.desc()).first()
-            if not conversation:
-                conversation = Conversation(user_id=user.id)
-                db.session.add(conversation)
-                db.session.commit()
-                logger.debug(f"Created new conversation with ID: {conversation.id} for user {username}")
+    
+    if row:
+        conversation, g.active_conversation_last_message_id = row
+    elif user:
+        # No conversation yet for this user: create a new one
+        conversation = Conversation(user_id=user.id)
+        db.session.add(conversation)
+        db.session.commit()
+        g.active_conversation_last_message_id = None
+        logger.debug(f"Created new conversation with ID: {conversation.id} for user {username}")
+    else:
+        # Anonymous conversation (no user logged in)
+        # Either get the most recent anonymous conversation or create a new one
+        row = db.session.query(Conversation, last_message_id).filter(
+            Conversation.user_id.is_(None)
+        ).order_by(Conversation.last_updated.desc()).first()
+        if row:
+            conversation, g.active_conversation_last_message_id = row
         else:
-            # Anonymous conversation (no user logged in)
-            # Either get the most recent anonymous conversation or create a new one
-            conversation = Conversation.query.filter_by(user_id=None).order_by(Conversation.last_updated.desc()).first()
-            if not conversation:
-                conversation = Conversation(user_id=None)
-                db.session.add(conversation)
-                db.session.commit()
-                logger.debug(f"Created new anonymous conversation with ID: {conversation.id}")
-        
-        return conversation
+            conversation = Conversation(user_id=None)
+            db.session.add(conversation)
+            db.session.commit()
+            g.active_conversation_last_message_id = None
+            logger.debug(f"Created new anonymous conversation with ID: {conversation.id}")
+    
+    g.active_conversation = conversation
+    g.active_conversation_id = conversation.id
+    return conversation
 
 # Load conversation history
 def load_memory():
     try:
-        with app.app_context():
-            conversation = get_active_conversation()
-            # Use a session-bound query to avoid detached instance errors
-            messages = Message.query.filter_by(conversation_id=conversation.id).order_by(Message.timestamp).all()
-            return [message.to_dict() for message in messages]
+        get_active_conversation()
+        # Use a session-bound query to avoid detached instance errors
+        messages = Message.query.filter_by(conversation_id=g.active_conversation_id).order_by(Message.timestamp).all()
+        return [message.to_dict() for message in messages]
     except Exception as e:
         logger.error(f"Error loading conversation: {str(e)}")
         return []
 
-# Save message to database
-def save_message(role, content):
+# Load the token-budgeted context sent to the model (recent window + rolling summary)
+def load_context():
     try:
-        with app.app_context():
-            conversation = get_active_conversation()
-            message = Message(conversation_id=conversation.id, role=role, content=content)
-            db.session.add(message)
-            db.session.commit()
-            logger.debug(f"Saved {role} message to conversation {conversation.id}")
+        conversation = get_active_conversation()
+        messages, overflow = chat_memory.build_context(conversation, g.active_conversation_last_message_id)
+        if overflow:
+            logger.debug(f"Conversation {g.active_conversation_id}: {overflow} messages outside the context window")
+        return messages
     except Exception as e:
-        logger.error(f"Error saving message: {str(e)}")
+        logger.error(f"Error loading conversation context: {str(e)}")
+        return []
+
+# Save several messages to database in a single transaction
+def save_messages(messages):
+    conversation_id = None
+    try:
+        get_active_conversation()
+        conversation_id = g.active_conversation_id
+        
+        rows = [Message(conversation_id=conversation_id, role=role, content=content) for role, content in messages]
+        db.session.add_all(rows)
+        db.session.flush()  # Pour obtenir les IDs sans relire après le commit
+        saved = [{'id': message.id, 'role': message.role, 'content': message.content} for message in rows]
+        db.session.commit()
+        
+        # Keep the history cache in sync with the database
+        message_cache.append(conversation_id, saved, g.active_conversation_last_message_id)
+        g.active_conversation_last_message_id = saved[-1]['id']
+        logger.debug(f"Saved {len(saved)} messages to conversation {conversation_id}")
+    except Exception as e:
+        logger.error(f"Error saving messages: {str(e)}")
         db.session.rollback()
+        if conversation_id is not None:
+            message_cache.invalidate(conversation_id)
+
+# Save message to database
+def save_message(role, content):
+    save_messages([(role, content)])
 
 @app.route("/")
 def home():
@@ -255,8 +319,8 @@ def chat():
     if not user_message.strip():
         return jsonify({"error": "Empty message"}), 400
     
-    # Load conversation history
-    memory = load_memory()
+    # Load conversation context (token-budgeted window + rolling summary)
+    memory = load_context()
     
     # Add system message for personalization at the beginning of the conversation
     system_message = {"role": "system", "content": "Tu es Benji, un assistant IA professionnel et sympathique. Tu parles TOUJOURS en français avec un ton naturel et professionnel. IMPORTANT: Même si l'utilisateur te parle en anglais, tu DOIS répondre en français. Tu expliques clairement, tu donnes des conseils pratiques, et tu restes toujours constructif et positif. N'utilise jamais l'anglais, uniquement le français. IMPORTANT: Ne commence JAMAIS ta réponse par 'Benji:' ou par des salutations répétitives comme 'Bonjour', 'Salut', 'Hello' - va directement à l'information utile pour éviter les répétitions."}
@@ -264,10 +328,8 @@ def chat():
     # Create a new memory array with system message first
     memory_with_system = [system_message] + memory
     
-    # Save user message to database
-    save_message('user', user_message)
-    
     # Add user message to memory for API call
+    # (persisted before streaming, or with the assistant reply in a single transaction in non-streaming mode)
     memory_with_system.append({"role": "user", "content": user_message})
     
     # Prepare OpenAI API request
@@ -303,83 +365,80 @@ def chat():
             # Extract assistant's reply
             assistant_message = response_data["choices"][0]["message"]["content"]
             
-            # Save assistant message to database
-            save_message('assistant', assistant_message)
+            # Save user and assistant messages to database
+            save_messages([('user', user_message), ('assistant', assistant_message)])
             
             return jsonify({"response": assistant_message})
         
         except requests.exceptions.RequestException as e:
             logger.error(f"API request error: {str(e)}")
+            save_message('user', user_message)
             return jsonify({"error": f"API request failed: {str(e)}"}), 500
         except (KeyError, IndexError) as e:
             logger.error(f"Error parsing API response: {str(e)}")
+            save_message('user', user_message)
             return jsonify({"error": "Invalid response from API"}), 500
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
+            save_message('user', user_message)
             return jsonify({"error": "An unexpected error occurred"}), 500
     
-    # Streaming mode
+    # Streaming mode: relayé par le client OpenAI asynchrone partagé du processus
+    import openai
+    from services.openai_service.stream_relay import get_stream_relay, StreamRelayBusy, sse_event
+    
+    # Enregistrer la question avant le flux : elle est conservée même si le relais est saturé
+    # ou si le client se déconnecte avant la première itération du générateur
+    save_message('user', user_message)
+    
+    try:
+        stream = get_stream_relay().open(
+            messages=memory_with_system,
+            model=OPENAI_MODEL,
+            temperature=payload["temperature"],
+            max_tokens=payload["max_tokens"]
+        )
+    except StreamRelayBusy as e:
+        logger.warning(f"Chat stream rejected: {str(e)}")
+        return jsonify({"error": "Le service est momentanément saturé, veuillez réessayer dans quelques instants."}), 503
+    except Exception as e:
+        logger.error(f"Unable to open chat stream: {str(e)}")
+        return jsonify({"error": f"API request failed: {str(e)}"}), 500
+    
     def generate():
+        # Complete message that will be saved to the database
+        complete_message = ""
         try:
-            # Complete message that will be saved to the database
-            complete_message = ""
-            
-            # Call OpenAI API with streaming
-            response = requests.post(
-                OPENAI_API_URL,
-                headers=headers,
-                json=payload,
-                stream=True
-            )
-            
-            response.raise_for_status()
-            
-            # Process each chunk of the stream
-            for line in response.iter_lines():
-                if line:
-                    # Remove the "data: " prefix and parse JSON
-                    line_text = line.decode('utf-8')
-                    
-                    # Skip the [DONE] line
-                    if line_text == "data: [DONE]":
-                        continue
-                        
-                    if line_text.startswith("data: "):
-                        json_str = line_text[6:]  # Remove "data: " prefix
-                        try:
-                            chunk = json.loads(json_str)
-                            
-                            # Extract the delta content if present
-                            if "choices" in chunk and len(chunk["choices"]) > 0:
-                                delta = chunk["choices"][0].get("delta", {})
-                                content = delta.get("content", "")
-                                
-                                if content:
-                                    complete_message += content
-                                    
-                                    # Send the chunk to the client
-                                    yield f"data: {json.dumps({'chunk': content})}\n\n"
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Error parsing JSON chunk: {e}")
+            for content in stream:
+                complete_message += content
+                
+                # Send the chunk to the client
+                yield sse_event({'chunk': content})
             
-            # Save the complete message to the database
+            # Save the complete reply
             if complete_message:
-                with app.app_context():
-                    save_message('assistant', complete_message)
+                save_message('assistant', complete_message)
             
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            yield sse_event({'done': True, 'metrics': stream.metrics})
             
-        except requests.exceptions.RequestException as e:
+        except (openai.OpenAIError, TimeoutError) as e:
             logger.error(f"API streaming error: {str(e)}")
-            error_msg = {"error": f"API request failed: {str(e)}"}
-            yield f"data: {json.dumps(error_msg)}\n\n"
+            yield sse_event({"error": f"API request failed: {str(e)}"})
         except Exception as e:
             logger.error(f"Unexpected streaming error: {str(e)}")
-            error_msg = {"error": "An unexpected error occurred"}
-            yield f"data: {json.dumps(error_msg)}\n\n"
+            yield sse_event({"error": "An unexpected error occurred"})
+        finally:
+            # Annule la requête amont si le client s'est déconnecté
+            stream.close()
     
     # Return the streaming response
-    return Response(generate(), mimetype="text/event-stream")
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Pour Nginx
+    })
+    # Libérer le flux même si le client se déconnecte avant le premier chunk
+    response.call_on_close(stream.close)
+    return response
 
 @app.route("/history")
 @login_required
@@ -391,16 +450,19 @@ def history():
 @login_required
 def clear():
     try:
-        with app.app_context():
-            # Delete all messages from the active conversation
-            conversation = get_active_conversation()
-            Message.query.filter_by(conversation_id=conversation.id).delete()
-            db.session.commit()
-            logger.debug(f"Cleared all messages from conversation {conversation.id}")
-            
-            # Return a random reset message
-            reset_message = random.choice(RESET_PHRASES)
-            return jsonify({"status": "History cleared", "message": reset_message})
+        # Delete all messages from the active conversation
+        conversation = get_active_conversation()
+        conversation_id = g.active_conversation_id
+        admin_stats.delete_conversation_messages(conversation_id)
+        conversation.summary = None
+        conversation.summary_message_id = None
+        db.session.commit()
+        message_cache.invalidate(conversation_id)
+        logger.debug(f"Cleared all messages from conversation {conversation_id}")
+        
+        # Return a random reset message
+        reset_message = random.choice(RESET_PHRASES)
+        return jsonify({"status": "History cleared", "message": reset_message})
     except Exception as e:
         logger.error(f"Error clearing history: {str(e)}")
         db.session.rollback()
@@ -414,21 +476,18 @@ def admin():
     page = request.args.get('page', 1, type=int)
     per_page = 5  # Number of conversations per page
     
-    # Get all conversations with pagination
+    # Totals and last activity come from the incrementally maintained stats (no full-table count)
+    stats = admin_stats.get_stats(days=7)
+    total_messages = stats['total_messages']
+    total_conversations = stats['total_conversations']
+    last_activity = stats['last_activity'] or "Aucune activité"
+    
+    # Get all conversations with pagination (total taken from the stats instead of a COUNT query)
     pagination = Conversation.query.order_by(Conversation.last_updated.desc()).paginate(
-        page=page, per_page=per_page, error_out=False)
+        page=page, per_page=per_page, error_out=False, count=False)
+    pagination.total = total_conversations
     conversations = pagination.items
     
-    # Calculate total messages across all conversations
-    total_messages = Message.query.count()
-    
-    # Get the timestamp of the last activity
-    last_message = Message.query.order_by(Message.timestamp.desc()).first()
-    last_activity = last_message.timestamp if last_message else "Aucune activité"
-    
-    # Get total number of conversations
-    total_conversations = Conversation.query.count()
-    
     # Calculate pagination display values
     start_idx = (pagination.page - 1) * pagination.per_page + 1 if total_conversations > 0 else 0
     end_idx = min((pagination.page) * pagination.per_page, total_conversations)
@@ -442,6 +501,7 @@ def admin():
                           total_messages=total_messages, 
                           total_conversations=total_conversations,
                           last_activity=last_activity,
+                          stats=stats,
                           search_term=search_term,
                           start_idx=start_idx,
                           end_idx=end_idx,
@@ -457,6 +517,7 @@ def admin_delete_conversation(conversation_id):
         # Delete the conversation (cascade will delete its messages too)
         db.session.delete(conversation)
         db.session.commit()
+        message_cache.invalidate(conversation_id)
         
         logger.debug(f"Deleted conversation {conversation_id}")
         return redirect(url_for('admin'))
@@ -468,46 +529,48 @@ def admin_delete_conversation(conversation_id):
 @app.route("/admin/search", methods=["GET"])
 @admin_required
 def admin_search():
-    search_term = request.args.get('q', '')
-    page = request.args.get('page', 1, type=int)
-    per_page = 5
+    search_term = request.args.get('q', '').strip()
+    after = request.args.get('after')
+    before = request.args.get('before')
+    start_idx = max(request.args.get('start', 1, type=int), 1)
     
     if not search_term:
         return redirect(url_for('admin'))
     
-    # Search for conversations with messages containing the search term
-    # This is a basic search implementation that can be improved with more complex queries
-    matching_messages = Message.query.filter(Message.content.ilike(f'%{search_term}%')).all()
-    conversation_ids = set(message.conversation_id for message in matching_messages)
+    # Recherche plein texte classée (index GIN sur message.search_vector), paginée par curseur
+    try:
+        results = message_search.search_conversations(search_term, after=after, before=before)
+    except Exception as e:
+        logger.error(f"Error searching conversations: {str(e)}")
+        db.session.rollback()
+        flash("La recherche n'a pas pu être effectuée.", "danger")
+        return redirect(url_for('admin'))
     
-    if not conversation_ids:
+    if not results['total']:
         flash("Aucun résultat trouvé pour votre recherche.", "info")
         return redirect(url_for('admin'))
     
-    # Get the conversations with matching messages
-    conversations_query = Conversation.query.filter(Conversation.id.in_(conversation_ids))
-    
-    # Apply pagination to the query
-    pagination = conversations_query.paginate(page=page, per_page=per_page, error_out=False)
-    conversations = pagination.items
-    
-    total_conversations = conversations_query.count()
+    conversations = results['conversations']
+    end_idx = start_idx + len(conversations) - 1 if conversations else start_idx - 1
     
-    # Calculate pagination display values
-    start_idx = (pagination.page - 1) * pagination.per_page + 1 if total_conversations > 0 else 0
-    end_idx = min((pagination.page) * pagination.per_page, total_conversations)
+    stats = admin_stats.get_stats(days=7)
     
     return render_template("admin.html", 
                           conversations=conversations, 
-                          pagination=pagination,
-                          total_messages=Message.query.count(), 
-                          total_conversations=Conversation.query.count(),
-                          last_activity=Message.query.order_by(Message.timestamp.desc()).first().timestamp if Message.query.count() > 0 else "Aucune activité",
+                          pagination=None,
+                          total_messages=stats['total_messages'], 
+                          total_conversations=results['total'],
+                          last_activity=stats['last_activity'] or "Aucune activité",
+                          stats=stats,
                           search_term=search_term,
                           start_idx=start_idx,
                           end_idx=end_idx,
                           search_results=True,
-                          search_count=total_conversations,
+                          search_count=results['total'],
+                          snippets=results['snippets'],
+                          next_cursor=results['next_cursor'],
+                          prev_cursor=results['prev_cursor'],
+                          page_size=message_search.SEARCH_PAGE_SIZE,
                           Message=Message)
 
 @app.route("/login", methods=["GET", "POST"])
@@ -835,15 +898,6 @@ def process_document():
                 "error": "Type de fichier non pris en charge. Extensions autorisées: PDF, DOCX"
             }), 400
         
-        # Extraire le texte du document
-        result = extract_text_from_document(document_file)
-        
-        if not result.get('success', False):
-            return jsonify({
-                "success": False, 
-                "error": result.get('error', "Erreur inconnue lors du traitement du document")
-            }), 500
-        
         # Récupérer l'utilisateur courant
         username = session.get('username')
         user = User.query.filter_by(username=username).first()
@@ -851,6 +905,56 @@ def process_document():
         if not user:
             return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 403
         
+        # Lire le document une seule fois : il peut être poursuivi en arrière-plan
+        document_data = document_file.read()
+        document_hash = document_cache.document_digest(document_data)
+        
+        # Document déjà envoyé par l'utilisateur : renvoyer l'enregistrement existant (sauf link_existing=false)
+        if ocr_upload.get_flag(request.form, "link_existing", True):
+            existing = ExtractedText.query.filter(
+                ExtractedText.user_id == user.id,
+                ExtractedText.image_hash == document_hash,
+                ExtractedText.status != 'failed'
+            ).order_by(ExtractedText.id.desc()).first()
+            if existing:
+                logger.debug(f"Document already uploaded as extracted text {existing.id}")
+                response = {
+                    "success": True,
+                    "duplicate": True,
+                    "text": existing.content,
+                    "metadata": {},
+                    "id": existing.id,
+                    "document_type": existing.source,
+                    "title": existing.title,
+                    "status": existing.status,
+                    "page_count": existing.page_count,
+                    "pages_extracted": existing.pages_extracted
+                }
+                if existing.status == 'partial':
+                    response.update(document_jobs.progress_urls(existing.id), offset=len(existing.content))
+                return jsonify(response)
+        
+        # Mode progressif (par défaut) : les premières pages d'un PDF long sont renvoyées immédiatement
+        progressive = ocr_upload.get_flag(request.form, "progressive", True)
+        
+        # Document déjà extrait (quel que soit l'utilisateur) : pas de nouvelle analyse
+        result = document_cache.get(document_hash)
+        if result is None:
+            # Extraire le texte du document
+            result = extract_text_from_document(
+                document_data, document_file.filename,
+                max_pages=document_jobs.DOCUMENT_FIRST_PAGES if progressive else None
+            )
+            
+            if not result.get('success', False):
+                return jsonify({
+                    "success": False, 
+                    "error": result.get('error', "Erreur inconnue lors du traitement du document")
+                }), 500
+            
+            if not document_jobs.has_remaining_pages(result):
+                document_cache.put(document_hash, result)
+        
         # Créer un titre par défaut si nécessaire
         title = f"Document {result.get('document_type', '').upper()} - {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}"
         
@@ -862,12 +966,46 @@ def process_document():
         # Filtrer le texte pour éviter les caractères problématiques
         text_content = result.get('text', '')
         
+        # Pages restantes : enregistrement partiel, complété en arrière-plan
+        if progressive and document_jobs.has_remaining_pages(result):
+            try:
+                extracted_text = document_jobs.start_progressive_extraction(
+                    user.id, title, result, document_data, document_hash)
+                return jsonify({
+                    "success": True,
+                    "text": text_content,
+                    "metadata": metadata,
+                    "id": extracted_text.id,
+                    "document_type": result.get('document_type', 'document'),
+                    "title": title,
+                    "status": "partial",
+                    "page_count": result.get('page_count'),
+                    "pages_extracted": result.get('pages_extracted'),
+                    "offset": len(text_content),
+                    **document_jobs.progress_urls(extracted_text.id)
+                })
+            except document_jobs.DocumentQueueFull:
+                # File pleine : extraction complète pendant la requête
+                logger.warning("Document extraction queue full, extracting synchronously")
+                result = extract_text_from_document(document_data, document_file.filename)
+                if not result.get('success', False):
+                    return jsonify({
+                        "success": False,
+                        "error": result.get('error', "Erreur inconnue lors du traitement du document")
+                    }), 500
+                if not document_jobs.has_remaining_pages(result):
+                    document_cache.put(document_hash, result)
+                text_content = result.get('text', '')
+        
         # Créer un nouvel enregistrement ExtractedText
         extracted_text = ExtractedText(
             user_id=user.id,
             title=title,
             content=text_content,
-            source=result.get('document_type', 'document')
+            source=result.get('document_type', 'document'),
+            image_hash=document_hash,
+            page_count=result.get('page_count'),
+            pages_extracted=result.get('pages_extracted')
         )
         
         db.session.add(extracted_text)
@@ -880,7 +1018,11 @@ def process_document():
             "metadata": metadata,
             "id": extracted_text.id,
             "document_type": result.get('document_type', 'document'),
-            "title": title
+            "title": title,
+            "status": extracted_text.status,
+            "page_count": result.get('page_count'),
+            "pages_extracted": result.get('pages_extracted'),
+            "truncated": result.get('truncated', False)
         })
         
     except Exception as e:
@@ -892,91 +1034,130 @@ def process_document():
 @app.route("/api/save-extracted-text", methods=["POST"])
 @login_required
 def save_extracted_text():
-    """Save text extracted from an image to the database using AWS Textract"""
+    """Save text extracted from an image to the database using AWS Textract
+    
+    L'image peut être envoyée en multipart/form-data (champ "image") ou en corps binaire
+    (paramètres dans la chaîne de requête), ou encore en base64 dans un corps JSON.
+    """
+    upload = None
     try:
         logger.debug("Received request to save extracted text")
-        data = request.json
-        logger.debug(f"Request data keys: {list(data.keys())}")
-        
-        base64_image = data.get("image", "")
-        if base64_image is not None:
-            base64_image = base64_image.strip()
+        if ocr_upload.is_binary_upload(request):
+            data = ocr_upload.upload_fields(request)
+            try:
+                upload = ocr_upload.read_image_upload(request)
+            except ocr_upload.UploadTooLarge as e:
+                return jsonify({"success": False, "error": str(e)}), 413
         else:
-            base64_image = ""
-            
-        title = data.get("title", "")
-        if title is not None:
-            title = title.strip()
+            data = request.json
+        
+        title = (data.get("title") or "").strip()
         if not title:
             title = "Texte extrait"
             
-        use_textract = data.get("use_textract", True)  # Par défaut, utiliser Textract
+        use_textract = ocr_upload.get_flag(data, "use_textract", True)  # Par défaut, utiliser Textract
         
         # Mode standard ou analyse de facture/reçu
-        analyze_expense = data.get("analyze_expense", True)  # Par défaut, utiliser AnalyzeExpense
+        analyze_expense = ocr_upload.get_flag(data, "analyze_expense", True)  # Par défaut, utiliser AnalyzeExpense
+        
+        # Texte pré-extrait côté client, utilisé si Textract n'est pas disponible
+        fallback_text = (data.get("text") or "").strip()
         
         # Variables par défaut
         text_content = ""
         extracted_info = {}
+        image_hash = None
+        image_file = None
+        
+        # Get current user
+        username = session.get('username')
+        user = User.query.filter_by(username=username).first()
+        
+        if not user:
+            return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 403
+        
+        if upload:
+            image_file, image_hash, image_size = upload
+            logger.debug(f"Received binary image upload ({image_size} bytes)")
+        else:
+            base64_image = (data.get("image") or "").strip()
+            # Nettoyer les préfixes des données base64 si présents
+            if "base64," in base64_image:
+                base64_image = base64_image.split("base64,", 1)[1]
+            if base64_image:
+                try:
+                    image_bytes = base64.b64decode(base64_image)
+                    image_hash = ocr_cache.image_digest(image_bytes)
+                    image_file = io.BytesIO(image_bytes)
+                except (binascii.Error, ValueError):
+                    logger.warning("Invalid base64 image, using pre-extracted text")
         
         # Vérifier si nous avons une image à traiter
-        if not base64_image:
+        if image_file is None:
             # Fallback vers le texte pré-extrait si fourni
             logger.debug("No image provided, using pre-extracted text")
-            text_content = data.get("text", "").strip()
+            text_content = fallback_text
             if not text_content:
                 return jsonify({"success": False, "error": "Aucune image ou texte fourni"}), 400
         else:
-            logger.debug(f"Processing base64 image (length: {len(base64_image)})")
-            # Nettoyer les préfixes des données base64 si présents
-            if "base64," in base64_image:
-                base64_image = base64_image.split("base64,")[1]
-                logger.debug(f"Removed base64 prefix (new length: {len(base64_image)})")
+            # Image déjà enregistrée par cet utilisateur : renvoyer l'enregistrement existant
+            existing = ExtractedText.query.filter_by(user_id=user.id, image_hash=image_hash).order_by(
+                ExtractedText.id.desc()).first()
+            if existing:
+                # Résultat Textract mis en cache sous le SHA-256 du fichier reçu, sinon reconstitué
+                cached = ocr_cache.get('expense' if analyze_expense else 'document', image_hash)
+                extracted_info = cached.get("extracted_info") if cached else None
+                logger.debug(f"Duplicate image upload, returning extracted text {existing.id}")
+                return jsonify({
+                    "success": True,
+                    "message": "Ce document a déjà été enregistré",
+                    "id": existing.id,
+                    "extracted_info": extracted_info or ocr_jobs.extracted_info_from_record(existing),
+                    "duplicate": True
+                })
             
             # Utiliser AWS Textract pour l'extraction avancée si demandé
             if use_textract:
+                # Réduire les photos trop grandes à la résolution utile pour Textract
+                image_bytes = ocr_upload.prepare_image(image_file)
+                
+                # Mode asynchrone : confier l'analyse au pool de tâches OCR et rendre la main immédiatement
+                if ocr_upload.get_flag(data, "async") or ocr_upload.get_flag(request.args, "async"):
+                    try:
+                        job = ocr_jobs.submit_job(
+                            user.id, title, image_bytes,
+                            image_hash=image_hash,
+                            analyze_expense=analyze_expense,
+                            fallback_text=fallback_text
+                        )
+                    except ocr_jobs.OcrQueueFull as e:
+                        return jsonify({"success": False, "error": str(e)}), 503
+                    return jsonify({
+                        "success": True,
+                        "job_id": job.id,
+                        "status": job.status,
+                        "status_url": url_for('ocr_jobs.job_status', job_id=job.id),
+                        "events_url": url_for('ocr_jobs.job_events', job_id=job.id)
+                    }), 202
+                
                 try:
                     logger.debug(f"Using AWS Textract with analyze_expense={analyze_expense}")
-                    # Import Textract modules
-                    import sys
-                    logger.debug(f"Python path: {sys.path}")
-                    logger.debug(f"Trying to import aws_textract...")
-                    
-                    from aws_textract import extract_text_from_base64, analyze_expense_document
-                    logger.debug("Successfully imported aws_textract modules")
+                    from aws_textract import run_expense_analysis, run_document_analysis
                     
                     if analyze_expense:
                         # Utiliser l'analyse spécifique pour factures/reçus
-                        logger.debug("Calling analyze_expense_document...")
-                        result = analyze_expense_document(base64_image)
-                        logger.debug("AWS Textract analyze_expense completed")
+                        result = run_expense_analysis(image_bytes, digest=image_hash)
                     else:
                         # Utiliser l'extraction de texte standard
-                        logger.debug("Calling extract_text_from_base64...")
-                        result = extract_text_from_base64(base64_image)
-                        logger.debug("AWS Textract extract_text completed")
+                        result = run_document_analysis(image_bytes, digest=image_hash)
                     
-                    logger.debug(f"Textract result keys: {list(result.keys())}")
-                    
-                    if not result.get("success", False):
-                        logger.error(f"Textract extraction failed: {result.get('error')}")
-                        # Fallback vers Tesseract local en cas d'échec
-                        text_content = data.get("text", "").strip()
-                        logger.debug(f"Falling back to pre-extracted text: {text_content[:100]}...")
-                        
-                        if not text_content:
-                            logger.error("No fallback text available")
-                            return jsonify({"success": False, "error": f"Échec de l'extraction avec AWS Textract: {result.get('error')}"}), 500
-                    else:
-                        text_content = result["text"]
-                        extracted_info = result.get("extracted_info", {})
-                        logger.debug(f"Successfully extracted text with Textract (length: {len(text_content)})")
-                        if extracted_info:
-                            logger.debug(f"Extracted info keys: {list(extracted_info.keys())}")
+                    text_content = result["text"]
+                    extracted_info = result.get("extracted_info", {})
+                    logger.debug(f"Successfully extracted text with Textract (length: {len(text_content)})")
                 except ImportError as import_error:
                     logger.error(f"Error importing aws_textract: {str(import_error)}")
                     # Fallback vers le texte pré-extrait en cas d'erreur
-                    text_content = data.get("text", "").strip()
+                    text_content = fallback_text
                     logger.debug(f"Falling back to pre-extracted text due to import error")
                     if not text_content:
                         return jsonify({"success": False, "error": f"Module AWS Textract non disponible: {str(import_error)}"}), 500
@@ -987,71 +1168,20 @@ def save_extracted_text():
                     logger.error(f"Traceback: {traceback.format_exc()}")
                     
                     # Fallback vers le texte pré-extrait en cas d'erreur
-                    text_content = data.get("text", "").strip()
+                    text_content = fallback_text
                     logger.debug(f"Falling back to pre-extracted text due to error")
                     if not text_content:
                         return jsonify({"success": False, "error": f"Erreur lors de l'utilisation d'AWS Textract: {str(textract_error)}"}), 500
             else:
                 # Utiliser le texte fourni directement
                 logger.debug("Using pre-extracted text (Textract disabled)")
-                text_content = data.get("text", "").strip()
+                text_content = fallback_text
                 
                 if not text_content:
                     return jsonify({"success": False, "error": "Le texte extrait est vide"}), 400
         
-        # Get current user
-        username = session.get('username')
-        user = User.query.filter_by(username=username).first()
-        
-        if not user:
-            return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 403
-        
-        # Créer un nouvel enregistrement ExtractedText
-        extracted_text = ExtractedText(
-            user_id=user.id,
-            title=title,
-            content=text_content,
-            source="camera"
-        )
-        
-        # Ajouter les informations financières extraites si disponibles
-        if 'document_type' in extracted_info:
-            extracted_text.document_type = extracted_info['document_type']
-            extracted_text.is_processed = True
-        
-        db.session.add(extracted_text)
-        db.session.commit()
-        
-        # Si des informations financières ont été extraites, créer automatiquement une transaction
-        if 'amount' in extracted_info and extracted_info['amount'] != "0.00":
-            try:
-                # Déterminer si c'est une dépense (par défaut: oui)
-                is_expense = True
-                
-                # Créer la transaction
-                transaction = FinancialTransaction(
-                    user_id=user.id,
-                    amount=Decimal(extracted_info['amount']),
-                    description=title,
-                    transaction_date=parse_date(extracted_info.get('date')),
-                    is_expense=is_expense
-                )
-                
-                # Ajouter TVA si présente
-                if 'tax_amount' in extracted_info:
-                    transaction.tax_amount = Decimal(extracted_info['tax_amount'])
-                
-                db.session.add(transaction)
-                
-                # Lier la transaction au texte extrait
-                extracted_text.transaction_id = transaction.id
-                
-                db.session.commit()
-                
-                logger.debug(f"Created transaction from extracted text: {transaction.id}")
-            except Exception as transaction_error:
-                logger.error(f"Error creating transaction: {str(transaction_error)}")
-                # Ne pas échouer si la création de transaction échoue
+        # Créer le texte extrait et la transaction associée dans une seule transaction
+        extracted_text = ocr_jobs.save_extracted_result(user.id, title, text_content, extracted_info, image_hash)
         
         logger.debug(f"Saved extracted text with ID: {extracted_text.id}")
         return jsonify({
@@ -1065,21 +1195,25 @@ def save_extracted_text():
         logger.error(f"Error saving extracted text: {str(e)}")
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        if upload:
+            upload[0].close()
+
+# Formats de date acceptés (OCR, imports de relevés), par ordre de priorité
+DATE_FORMATS = [
+    '%d/%m/%Y',  # 31/12/2025
+    '%d-%m-%Y',  # 31-12-2025
+    '%Y-%m-%d',  # 2025-12-31
+    '%d.%m.%Y',  # 31.12.2025
+    '%m/%d/%Y',  # 12/31/2025
+]
 
 def parse_date(date_str):
     """Parse une date depuis différents formats vers datetime.date"""
     if not date_str:
         return datetime.datetime.now().date()
     
-    formats = [
-        '%d/%m/%Y',  # 31/12/2025
-        '%d-%m-%Y',  # 31-12-2025
-        '%Y-%m-%d',  # 2025-12-31
-        '%d.%m.%Y',  # 31.12.2025
-        '%m/%d/%Y',  # 12/31/2025
-    ]
-    
-    for fmt in formats:
+    for fmt in DATE_FORMATS:
         try:
             return datetime.datetime.strptime(date_str, fmt).date()
         except ValueError:
@@ -1224,6 +1358,15 @@ marketplace.init_app(app)  # Module API marketplace
 process_analysis.init_app(app)  # Module d'analyse des processus
 predictive_intelligence.init_app(app)  # Module d'intelligence prédictive commerciale
 modules.init_app(app)  # Système de modules métiers
+admin_stats.init_app(app)  # Statistiques de l'administration
+ocr_jobs.init_app(app)  # Suivi des tâches OCR asynchrones
+ocr_batch.init_app(app)  # Import par lots des reçus et factures
+document_jobs.init_app(app)  # Extraction progressive des documents longs
+statement_import.init_app(app)  # Import des relevés bancaires
+transaction_rollups.init_app(app)  # Totaux mensuels des transactions
+text_processing_jobs.init_app(app)  # Traitement par lot des textes extraits
+dashboard_data.init_app(app)  # Invalidation du cache des tableaux de bord
+cashflow_forecast.init_app(app)  # Calcul périodique des prévisions de trésorerie
 
 # Route de redirection pour la compatibilité avec l'ancien chemin /invoice
 @app.route('/invoice')
@@ -1238,6 +1381,3 @@ init_db()
 from init_modules_data import init_modules_data
 with app.app_context():
     init_modules_data()
-
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
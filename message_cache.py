@@ -0,0 +1,191 @@
+"""
+Cache de l'historique récent des conversations du chat
+
+Conserve, par conversation, les derniers messages ({'id', 'role', 'content'})
+dans un LRU en mémoire du processus ou, si CHAT_HISTORY_CACHE_BACKEND=redis,
+dans Redis pour partager le cache entre les workers. Les entrées sont validées
+par l'ID du dernier message de la conversation : un cache qui ne se termine pas
+par ce message est ignoré.
+"""
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Nombre de messages conservés par conversation
+MAX_MESSAGES_PER_CONVERSATION = int(os.environ.get('CHAT_CONTEXT_MAX_MESSAGES', 100))
+
+# Nombre de conversations conservées dans le LRU en mémoire
+LRU_MAX_CONVERSATIONS = int(os.environ.get('CHAT_HISTORY_CACHE_SIZE', 1000))
+
+# Durée de vie des entrées Redis (secondes)
+REDIS_TTL = int(os.environ.get('CHAT_HISTORY_CACHE_TTL', 3600))
+
+
+class LRUHistoryBackend:
+    """Backend en mémoire, borné en nombre de conversations"""
+
+    def __init__(self, max_conversations=LRU_MAX_CONVERSATIONS):
+        self.max_conversations = max_conversations
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id):
+        with self._lock:
+            messages = self._entries.get(conversation_id)
+            if messages is not None:
+                self._entries.move_to_end(conversation_id)
+                return list(messages)
+            return None
+
+    def set(self, conversation_id, messages):
+        with self._lock:
+            self._entries[conversation_id] = list(messages[-MAX_MESSAGES_PER_CONVERSATION:])
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+
+    def append(self, conversation_id, messages, expected_last_id):
+        with self._lock:
+            cached = self._entries.get(conversation_id)
+            if cached is None:
+                return
+            if _last_id(cached) != expected_last_id:
+                # Un autre écrivain est passé entre-temps : l'entrée n'est plus fiable
+                del self._entries[conversation_id]
+                return
+            cached.extend(messages)
+            del cached[:-MAX_MESSAGES_PER_CONVERSATION]
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+
+class RedisHistoryBackend:
+    """Backend Redis partagé entre les workers (une liste JSON par conversation)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _key(conversation_id):
+        return f"chat:history:{conversation_id}"
+
+    def get(self, conversation_id):
+        items = self.client.lrange(self._key(conversation_id), 0, -1)
+        if not items:
+            return None
+        return [json.loads(item) for item in items]
+
+    def set(self, conversation_id, messages):
+        key = self._key(conversation_id)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        if messages:
+            pipe.rpush(key, *[json.dumps(m) for m in messages[-MAX_MESSAGES_PER_CONVERSATION:]])
+            pipe.expire(key, REDIS_TTL)
+        pipe.execute()
+
+    def append(self, conversation_id, messages, expected_last_id):
+        key = self._key(conversation_id)
+        last = self.client.lindex(key, -1)
+        if last is None:
+            return
+        if json.loads(last).get('id') != expected_last_id:
+            self.client.delete(key)
+            return
+        pipe = self.client.pipeline()
+        pipe.rpushx(key, *[json.dumps(m) for m in messages])
+        pipe.ltrim(key, -MAX_MESSAGES_PER_CONVERSATION, -1)
+        pipe.expire(key, REDIS_TTL)
+        pipe.execute()
+
+    def invalidate(self, conversation_id):
+        self.client.delete(self._key(conversation_id))
+
+
+def _last_id(messages):
+    return messages[-1]['id'] if messages else None
+
+
+def _create_backend():
+    """Crée le backend configuré (Redis si demandé et disponible, LRU sinon)"""
+    if os.environ.get('CHAT_HISTORY_CACHE_BACKEND', 'memory').lower() == 'redis':
+        try:
+            import redis
+            client = redis.Redis(
+                host=os.environ.get('REDIS_HOST', 'localhost'),
+                port=int(os.environ.get('REDIS_PORT', 6379)),
+                password=os.environ.get('REDIS_PASSWORD') or None,
+                db=int(os.environ.get('REDIS_DB', 0)),
+                socket_timeout=1
+            )
+            client.ping()
+            logger.info("Message history cache: Redis backend")
+            return RedisHistoryBackend(client)
+        except Exception as e:
+            logger.warning(f"Redis unavailable for message history cache, using in-memory LRU: {str(e)}")
+    return LRUHistoryBackend()
+
+
+_backend = _create_backend()
+
+
+def get(conversation_id, last_message_id):
+    """
+    Retourne l'historique en cache s'il est à jour
+
+    Args:
+        conversation_id (int): ID de la conversation
+        last_message_id (int): ID du dernier message en base (None si aucun)
+
+    Returns:
+        list: Messages en ordre chronologique, ou None si absent ou périmé
+    """
+    try:
+        messages = _backend.get(conversation_id)
+    except Exception as e:
+        logger.warning(f"Message history cache read failed: {str(e)}")
+        return None
+
+    if messages is None:
+        return [] if last_message_id is None else None
+    if _last_id(messages) != last_message_id:
+        return None
+    return messages
+
+
+def put(conversation_id, messages):
+    """Remplace l'historique en cache d'une conversation"""
+    try:
+        _backend.set(conversation_id, messages)
+    except Exception as e:
+        logger.warning(f"Message history cache write failed: {str(e)}")
+
+
+def append(conversation_id, messages, expected_last_id):
+    """
+    Ajoute des messages à l'historique en cache s'il se termine par expected_last_id
+
+    Args:
+        conversation_id (int): ID de la conversation
+        messages (list): Nouveaux messages {'id', 'role', 'content'}
+        expected_last_id (int): ID du dernier message connu avant l'écriture
+    """
+    try:
+        _backend.append(conversation_id, messages, expected_last_id)
+    except Exception as e:
+        logger.warning(f"Message history cache append failed: {str(e)}")
+        invalidate(conversation_id)
+
+
+def invalidate(conversation_id):
+    """Supprime l'historique en cache d'une conversation"""
+    try:
+        _backend.invalidate(conversation_id)
+    except Exception as e:
+        logger.warning(f"Message history cache invalidation failed: {str(e)}")
@@ -0,0 +1,184 @@
+"""
+Recherche plein texte dans les conversations pour l'interface d'administration
+
+La recherche s'appuie sur la colonne Message.search_vector (tsvector calculé par
+PostgreSQL à l'insertion, indexé en GIN) et sur les métadonnées de la conversation
+(nom d'utilisateur et nom d'affichage de son propriétaire). Les conversations sont
+classées par pertinence (ts_rank du meilleur message) et paginées par curseur
+(rang, id) afin que le coût d'une page ne dépende pas de sa position.
+"""
+import os
+import logging
+
+from markupsafe import Markup, escape
+from sqlalchemy import func, literal, or_, select, tuple_, union_all, cast
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+from models import db, Conversation, Message, User, MESSAGE_SEARCH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Nombre de conversations par page de résultats
+SEARCH_PAGE_SIZE = int(os.environ.get('ADMIN_SEARCH_PAGE_SIZE', 5))
+
+# Rang attribué aux conversations trouvées par leurs métadonnées (ts_rank est généralement < 1)
+METADATA_RANK = 1.0
+
+# Délimiteurs des termes surlignés par ts_headline, remplacés par <mark> après échappement HTML
+_MARK_START = '\x02'
+_MARK_STOP = '\x03'
+HEADLINE_OPTIONS = f'StartSel="{_MARK_START}", StopSel="{_MARK_STOP}", MaxWords=35, MinWords=15, MaxFragments=2'
+
+
+def encode_cursor(rank, conversation_id):
+    """Encode la position (rang, id) d'un résultat sous forme de curseur d'URL"""
+    return f"{rank!r}:{conversation_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Décode un curseur produit par encode_cursor
+
+    Args:
+        cursor (str): Curseur reçu dans l'URL
+
+    Returns:
+        tuple: (rang, id de conversation) ou None si le curseur est absent ou invalide
+    """
+    if not cursor:
+        return None
+    try:
+        rank, conversation_id = cursor.split(':', 1)
+        return float(rank), int(conversation_id)
+    except ValueError:
+        logger.warning(f"Invalid admin search cursor: {cursor}")
+        return None
+
+
+def _ranked_conversations(term, tsquery):
+    """Construit la CTE (conversation_id, rank) des conversations correspondant à la recherche"""
+    message_hits = select(
+        Message.conversation_id.label('conversation_id'),
+        cast(func.ts_rank(Message.search_vector, tsquery), DOUBLE_PRECISION).label('rank')
+    ).where(Message.search_vector.bool_op('@@')(tsquery))
+
+    metadata_hits = select(
+        Conversation.id.label('conversation_id'),
+        cast(literal(METADATA_RANK), DOUBLE_PRECISION).label('rank')
+    ).join(User, Conversation.user_id == User.id).where(or_(
+        User.username.icontains(term, autoescape=True),
+        User.display_name.icontains(term, autoescape=True)
+    ))
+
+    hits = union_all(message_hits, metadata_hits).subquery()
+    return select(
+        hits.c.conversation_id,
+        func.max(hits.c.rank).label('rank')
+    ).group_by(hits.c.conversation_id).cte('ranked')
+
+
+def get_snippets(conversation_ids, tsquery):
+    """
+    Retourne un extrait surligné du message le plus pertinent de chaque conversation
+
+    Args:
+        conversation_ids (list): IDs des conversations de la page
+        tsquery: Requête tsquery de la recherche
+
+    Returns:
+        dict: {conversation_id: Markup} (absent si seule la métadonnée correspond)
+    """
+    if not conversation_ids:
+        return {}
+
+    best = select(
+        Message.id,
+        func.row_number().over(
+            partition_by=Message.conversation_id,
+            order_by=(func.ts_rank(Message.search_vector, tsquery).desc(), Message.id.desc())
+        ).label('position')
+    ).where(
+        Message.conversation_id.in_(conversation_ids),
+        Message.search_vector.bool_op('@@')(tsquery)
+    ).subquery()
+
+    rows = db.session.execute(
+        select(
+            Message.conversation_id,
+            func.ts_headline(MESSAGE_SEARCH_CONFIG, Message.content, tsquery, HEADLINE_OPTIONS)
+        ).join(best, best.c.id == Message.id).where(best.c.position == 1)
+    ).all()
+
+    snippets = {}
+    for conversation_id, headline in rows:
+        snippets[conversation_id] = (
+            escape(headline)
+            .replace(_MARK_START, Markup('<mark>'))
+            .replace(_MARK_STOP, Markup('</mark>'))
+        )
+    return snippets
+
+
+def search_conversations(term, after=None, before=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Recherche les conversations dont un message ou les métadonnées correspondent au terme
+
+    Les résultats sont triés par pertinence décroissante puis par ID décroissant.
+    La page et le nombre total de conversations correspondantes sont calculés en
+    une seule requête (la CTE de classement n'est évaluée qu'une fois).
+
+    Args:
+        term (str): Terme recherché (syntaxe websearch : "phrase exacte", -exclu, or)
+        after (str, optional): Curseur de la page suivante
+        before (str, optional): Curseur de la page précédente
+        limit (int): Nombre de conversations par page
+
+    Returns:
+        dict: conversations, snippets, total, next_cursor et prev_cursor
+    """
+    tsquery = func.websearch_to_tsquery(MESSAGE_SEARCH_CONFIG, term)
+    ranked = _ranked_conversations(term, tsquery)
+    total = select(func.count()).select_from(ranked).scalar_subquery()
+
+    query = select(ranked.c.conversation_id, ranked.c.rank, total.label('total'))
+    key = tuple_(ranked.c.rank, ranked.c.conversation_id)
+
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if after_key is None else None
+    if before_key is not None:
+        query = query.where(key > tuple_(cast(before_key[0], DOUBLE_PRECISION), before_key[1]))
+        query = query.order_by(ranked.c.rank.asc(), ranked.c.conversation_id.asc())
+    else:
+        if after_key is not None:
+            query = query.where(key < tuple_(cast(after_key[0], DOUBLE_PRECISION), after_key[1]))
+        query = query.order_by(ranked.c.rank.desc(), ranked.c.conversation_id.desc())
+
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before_key is not None:
+        rows.reverse()
+
+    if rows:
+        total_count = rows[0].total
+    else:
+        total_count = db.session.execute(select(func.count()).select_from(ranked)).scalar()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if before_key is not None or has_more:
+            next_cursor = encode_cursor(rows[-1].rank, rows[-1].conversation_id)
+        if after_key is not None or (before_key is not None and has_more):
+            prev_cursor = encode_cursor(rows[0].rank, rows[0].conversation_id)
+
+    conversation_ids = [row.conversation_id for row in rows]
+    by_id = {c.id: c for c in Conversation.query.filter(Conversation.id.in_(conversation_ids)).all()} \
+        if conversation_ids else {}
+
+    return {
+        'conversations': [by_id[cid] for cid in conversation_ids if cid in by_id],
+        'snippets': get_snippets(conversation_ids, tsquery),
+        'total': total_count,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    }
@@ -1,8 +1,13 @@
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 db = SQLAlchemy()
 
+# Configuration de recherche plein texte PostgreSQL utilisée pour l'index des messages
+MESSAGE_SEARCH_CONFIG = 'french'
+
 class SubscriptionPlan(db.Model):
     """Modèle pour les plans d'abonnement disponibles"""
     id = db.Column(db.Integer, primary_key=True)
@@ -40,6 +45,10 @@ class Subscription(db.Model):
     # Relation avec l'utilisateur
     user = db.relationship('User', backref=db.backref('subscriptions', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_subscription_user_start_date', 'user_id', 'start_date'),
+    )
+    
     def __repr__(self):
         return f'<Subscription {self.id}: {self.plan.name} - {self.end_date.strftime("%Y-%m-%d")}>'
     
@@ -161,9 +170,17 @@ class Conversation(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Résumé glissant des messages sortis de la fenêtre de contexte du chat
+    summary = db.Column(db.Text, nullable=True)
+    summary_message_id = db.Column(db.Integer, nullable=True)  # Dernier message intégré au résumé
+    
     # Relationship to messages
     messages = db.relationship('Message', backref='conversation', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_conversation_user_last_updated', 'user_id', 'last_updated'),
+    )
+    
     def __repr__(self):
         return f'<Conversation {self.id}>'
 
@@ -176,6 +193,17 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Vecteur de recherche plein texte, calculé par PostgreSQL à l'insertion (non chargé par défaut)
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{MESSAGE_SEARCH_CONFIG}'::regconfig, content)", persisted=True)
+    ))
+    
+    __table_args__ = (
+        db.Index('ix_message_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_message_conversation_timestamp', 'conversation_id', 'timestamp'),
+    )
+    
     def __repr__(self):
         return f'<Message {self.id}: {self.role}>'
     
@@ -187,6 +215,40 @@ class Message(db.Model):
         }
 
 
+class ChatStats(db.Model):
+    """Totaux du chat, répartis sur plusieurs lignes (id = numéro de ligne) pour les écritures concurrentes"""
+    __tablename__ = 'chat_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    total_messages = db.Column(db.BigInteger, nullable=False, default=0)
+    total_conversations = db.Column(db.BigInteger, nullable=False, default=0)
+    last_activity = db.Column(db.DateTime, nullable=True)
+    reconciled_at = db.Column(db.DateTime, nullable=True)  # Dernier recalcul complet (ligne 0)
+
+
+class ChatDailyStats(db.Model):
+    """Volume quotidien du chat (jour UTC), réparti sur plusieurs lignes par jour pour les écritures concurrentes"""
+    __tablename__ = 'chat_daily_stats'
+    day = db.Column(db.Date, primary_key=True)
+    shard = db.Column(db.SmallInteger, primary_key=True, default=0)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    conversation_count = db.Column(db.Integer, nullable=False, default=0)
+    active_users = db.Column(db.Integer, nullable=False, default=0)
+    last_active_users = db.Column(db.Integer, nullable=False, default=0)  # Utilisateurs dont c'est le dernier jour actif
+
+
+class ChatUserActivity(db.Model):
+    """Jours d'activité de chaque utilisateur dans le chat (une ligne par jour et par utilisateur)"""
+    __tablename__ = 'chat_user_activity'
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+
+class ChatUserLastActive(db.Model):
+    """Dernier jour d'activité de chaque utilisateur dans le chat"""
+    __tablename__ = 'chat_user_last_active'
+    user_id = db.Column(db.Integer, primary_key=True)
+    last_day = db.Column(db.Date, nullable=False)
+
 class ExtractedText(db.Model):
     """Model for storing text extracted from images"""
     id = db.Column(db.Integer, primary_key=True)
@@ -204,13 +266,69 @@ class ExtractedText(db.Model):
     # Relation avec une transaction (si identifiée)
     transaction_id = db.Column(db.Integer, db.ForeignKey('financial_transaction.id'), nullable=True)
     
+    # SHA-256 de l'image source, pour détecter les envois en double
+    image_hash = db.Column(db.String(64), nullable=True)
+    
+    # Extraction progressive des documents longs : 'partial' tant que des pages restent à extraire
+    status = db.Column(db.String(20), default="complete", nullable=False)  # 'partial', 'complete', 'failed'
+    page_count = db.Column(db.Integer, nullable=True)  # Nombre de pages du document source
+    pages_extracted = db.Column(db.Integer, nullable=True)  # Pages dont le texte figure dans content
+    
     # Relationship to user
     user = db.relationship('User', backref=db.backref('extracted_texts', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_extracted_text_user_image_hash', 'user_id', 'image_hash'),
+        db.Index('ix_extracted_text_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_extracted_text_user_unprocessed', 'user_id', 'created_at',
+                 postgresql_where=db.text('NOT is_processed')),
+    )
+    
     def __repr__(self):
         return f'<ExtractedText {self.id}: {self.title or "Untitled"}>'
 
 
+class OcrJob(db.Model):
+    """Traitement asynchrone d'une image OCR (voir ocr_jobs.py)"""
+    __tablename__ = 'ocr_job'
+    id = db.Column(db.String(36), primary_key=True)  # UUID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, processing, retrying, completed, failed
+    progress = db.Column(db.String(50), nullable=True)  # Étape en cours (ocr, saving)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # Informations extraites (JSON)
+    extracted_text_id = db.Column(db.Integer, db.ForeignKey('extracted_text.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OcrJob {self.id}: {self.status}>'
+
+
+class TextProcessingJob(db.Model):
+    """Traitement par lot des textes extraits non traités d'un utilisateur (voir text_processing_jobs.py)"""
+    __tablename__ = 'text_processing_job'
+    id = db.Column(db.String(36), primary_key=True)  # UUID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, processing, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)  # Textes non traités au lancement
+    processed = db.Column(db.Integer, nullable=False, default=0)  # Textes examinés
+    created = db.Column(db.Integer, nullable=False, default=0)  # Transactions créées
+    skipped = db.Column(db.Integer, nullable=False, default=0)  # Textes laissés au traitement manuel
+    last_text_id = db.Column(db.Integer, nullable=False, default=0)  # Reprise : dernier texte examiné
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_text_processing_job_user_status', 'user_id', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<TextProcessingJob {self.id}: {self.status} {self.processed}/{self.total}>'
+
 class Category(db.Model):
     """Catégories de dépenses et revenus"""
     id = db.Column(db.Integer, primary_key=True)
@@ -226,6 +344,10 @@ class Category(db.Model):
     # Relations avec les transactions
     transactions = db.relationship('FinancialTransaction', backref='category', lazy='dynamic')
     
+    __table_args__ = (
+        db.Index('ix_category_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<Category {self.name}: {self.type}>'
 
@@ -252,10 +374,34 @@ class FinancialTransaction(db.Model):
     # Relation avec l'utilisateur
     user = db.relationship('User', backref=db.backref('transactions', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_financial_transaction_user_date', 'user_id', 'transaction_date'),
+        db.Index('ix_financial_transaction_category', 'category_id'),
+    )
+    
     def __repr__(self):
         return f'<Transaction {self.id}: {self.amount}€ - {self.description or "Sans description"}>'
 
 
+class TransactionMonthlyRollup(db.Model):
+    """Totaux mensuels des transactions financières par utilisateur, catégorie et sens (voir transaction_rollups.py)"""
+    __tablename__ = 'transaction_monthly_rollup'
+    user_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # Premier jour du mois
+    category_id = db.Column(db.Integer, primary_key=True)  # 0 pour les transactions sans catégorie
+    is_expense = db.Column(db.Boolean, primary_key=True)  # is_expense NULL compté comme dépense (défaut de la colonne)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    tax_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TransactionRollupState(db.Model):
+    """État du recalcul des totaux mensuels des transactions (ligne unique id=1)"""
+    __tablename__ = 'transaction_rollup_state'
+    id = db.Column(db.Integer, primary_key=True)
+    reconciled_at = db.Column(db.DateTime, nullable=True)  # Dernier recalcul complet
+
+
 class Vendor(db.Model):
     """Fournisseurs/Commerçants"""
     id = db.Column(db.Integer, primary_key=True)
@@ -275,6 +421,10 @@ class Vendor(db.Model):
                                  secondary='vendor_transaction',
                                  backref=db.backref('vendors', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_vendor_user_name', 'user_id', 'name'),
+    )
+    
     def __repr__(self):
         return f'<Vendor {self.name}>'
 
@@ -303,6 +453,7 @@ class TaxReport(db.Model):
     # Contenu du rapport
     report_html = db.Column(db.Text, nullable=True)  # Contenu HTML généré par OpenAI
     ai_analysis = db.Column(db.Text, nullable=True)  # Analyse IA pour la nouvelle interface
+    ai_analysis_hash = db.Column(db.String(64), nullable=True)  # Empreinte des chiffres analysés (analysis_cache)
     notes = db.Column(db.Text, nullable=True)  # Notes personnelles ajoutées au rapport
     
     # Montants calculés
@@ -315,6 +466,10 @@ class TaxReport(db.Model):
     # Relation avec l'utilisateur
     user = db.relationship('User', backref=db.backref('tax_reports', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_tax_report_user_created_at', 'user_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<TaxReport {self.title or self.name}: {self.start_date} - {self.end_date}>'
 
@@ -342,6 +497,10 @@ class Customer(db.Model):
     invoices = db.relationship('Invoice', backref='customer', lazy='dynamic')
     quotes = db.relationship('Quote', backref='customer', lazy='dynamic')
     
+    __table_args__ = (
+        db.Index('ix_customer_user_name', 'user_id', 'name'),
+    )
+    
     def __repr__(self):
         return f'<Customer {self.name}>'
 
@@ -370,6 +529,12 @@ class Invoice(db.Model):
     user = db.relationship('User', backref=db.backref('invoices', lazy='dynamic'))
     items = db.relationship('InvoiceItem', backref='invoice', lazy='dynamic', cascade="all, delete-orphan")
     
+    __table_args__ = (
+        db.Index('ix_invoice_user_status', 'user_id', 'status'),
+        db.Index('ix_invoice_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_invoice_customer_issue_date', 'customer_id', 'issue_date'),
+    )
+    
     def __repr__(self):
         return f'<Invoice {self.invoice_number}: {self.total}€>'
     
@@ -404,6 +569,10 @@ class InvoiceItem(db.Model):
     tax_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     total = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     
+    __table_args__ = (
+        db.Index('ix_invoice_item_invoice', 'invoice_id'),
+    )
+    
     def __repr__(self):
         return f'<InvoiceItem {self.id}: {self.description[:20]}...>'
     
@@ -440,6 +609,12 @@ class Quote(db.Model):
     items = db.relationship('QuoteItem', backref='quote', lazy='dynamic', cascade="all, delete-orphan")
     invoice = db.relationship('Invoice', backref=db.backref('quote', uselist=False))
     
+    __table_args__ = (
+        db.Index('ix_quote_user_status', 'user_id', 'status'),
+        db.Index('ix_quote_user_created_at', 'user_id', 'created_at'),
+        db.Index('ix_quote_customer_issue_date', 'customer_id', 'issue_date'),
+    )
+    
     def __repr__(self):
         return f'<Quote {self.quote_number}: {self.total}€>'
     
@@ -516,6 +691,10 @@ class QuoteItem(db.Model):
     tax_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     total = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     
+    __table_args__ = (
+        db.Index('ix_quote_item_quote', 'quote_id'),
+    )
+    
     def __repr__(self):
         return f'<QuoteItem {self.id}: {self.description[:20]}...>'
     
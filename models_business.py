@@ -38,6 +38,10 @@ class BusinessReport(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('business_reports', lazy=True))
     
+    __table_args__ = (
+        db.Index('ix_business_report_user_created_at', 'user_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<BusinessReport {self.id}: {self.company_name}>'
     
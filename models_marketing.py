@@ -31,6 +31,10 @@ class MarketingCampaign(db.Model):
     social_posts = db.relationship('SocialMediaPost', backref='campaign', lazy='dynamic', cascade="all, delete-orphan")
     influencer_briefs = db.relationship('InfluencerBrief', backref='campaign', lazy='dynamic', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_marketing_campaign_user_created_at', 'user_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<MarketingCampaign {self.name}>'
 
@@ -55,6 +59,10 @@ class EmailContent(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_email_content_campaign', 'campaign_id'),
+    )
+
     def __repr__(self):
         return f'<EmailContent {self.subject}>'
 
@@ -78,6 +86,10 @@ class SocialMediaPost(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_social_media_post_campaign', 'campaign_id'),
+    )
+
     def __repr__(self):
         return f'<SocialMediaPost {self.platform} {self.id}>'
 
@@ -103,6 +115,10 @@ class InfluencerBrief(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_influencer_brief_campaign', 'campaign_id'),
+    )
+
     def __repr__(self):
         return f'<InfluencerBrief {self.influencer_name}>'
 
@@ -176,6 +192,10 @@ class EditorialCalendarEntry(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('calendar_entries', lazy='dynamic'))
     schedule = db.relationship('MarketingSchedule', backref=db.backref('entries', lazy='dynamic'))
+
+    __table_args__ = (
+        db.Index('ix_editorial_calendar_entry_user_content_type', 'user_id', 'content_type'),
+    )
     
     def __repr__(self):
         return f'<EditorialCalendarEntry {self.id} - {self.title}>'
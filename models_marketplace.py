@@ -118,6 +118,10 @@ class ExtensionInstallation(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('installed_extensions', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_extension_installation_user_extension', 'user_id', 'extension_id'),
+    )
+    
     def __repr__(self):
         return f'<ExtensionInstallation {self.user_id}-{self.extension_id}>'
     
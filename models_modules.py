@@ -148,5 +148,9 @@ class UserModuleInstallation(db.Model):
     # Relation avec la version (optionnelle)
     version = db.relationship('ModuleVersion', backref=db.backref('installations', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_user_module_installation_user_status', 'user_id', 'status'),
+    )
+    
     def __repr__(self):
         return f'<UserModuleInstallation {self.user.username}: {self.module.name}>'
\ No newline at end of file
@@ -46,6 +46,10 @@ class SalesPrediction(db.Model):
     user = db.relationship('User', backref=db.backref('sales_predictions', lazy='dynamic'))
     scenarios = db.relationship('PredictionScenario', backref='prediction', lazy='dynamic',
                               cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_sales_prediction_user_date_created', 'user_id', 'date_created'),
+    )
 
     def __repr__(self):
         return f'<SalesPrediction {self.name}>'
@@ -111,6 +115,10 @@ class CustomerInsight(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('customer_insights', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_customer_insight_user', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<CustomerInsight {self.customer_name}>'
 
@@ -147,6 +155,10 @@ class ProductCatalogInsight(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('product_catalog_insights', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_product_catalog_insight_user_date_created', 'user_id', 'date_created'),
+    )
+    
     def __repr__(self):
         return f'<ProductCatalogInsight {self.name}>'
 
@@ -183,6 +195,10 @@ class MarketTrend(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('market_trends', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_market_trend_user_date_created', 'user_id', 'date_created'),
+    )
+    
     def __repr__(self):
         return f'<MarketTrend {self.name}>'
 
@@ -219,5 +235,9 @@ class PredictiveAlert(db.Model):
     # Relations
     user = db.relationship('User', backref=db.backref('predictive_alerts', lazy='dynamic'))
     
+    __table_args__ = (
+        db.Index('ix_predictive_alert_user_status_date_created', 'user_id', 'status', 'date_created'),
+    )
+    
     def __repr__(self):
         return f'<PredictiveAlert {self.title}>'
\ No newline at end of file
@@ -85,6 +85,10 @@ class Lesson(db.Model):
     # Relations
     quizzes = db.relationship('Quiz', backref='lesson', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_training_lesson_course_order', 'course_id', 'order_index'),
+    )
+    
     def __repr__(self):
         return f'<Lesson {self.title}>'
     
@@ -166,6 +170,10 @@ class Enrollment(db.Model):
     progress_records = db.relationship('ProgressRecord', backref='enrollment', lazy='dynamic', cascade='all, delete-orphan')
     quiz_attempts = db.relationship('QuizAttempt', backref='enrollment', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_training_enrollment_user_course', 'user_id', 'course_id'),
+    )
+    
     def __repr__(self):
         return f'<Enrollment {self.id}>'
 
@@ -183,6 +191,10 @@ class ProgressRecord(db.Model):
     completion_date = db.Column(db.DateTime, nullable=True)
     notes = db.Column(db.Text, nullable=True)
     
+    __table_args__ = (
+        db.Index('ix_training_progress_record_enrollment_lesson', 'enrollment_id', 'lesson_id'),
+    )
+    
     def __repr__(self):
         return f'<ProgressRecord {self.id}>'
 
@@ -203,6 +215,10 @@ class QuizAttempt(db.Model):
     # Relations
     answers = db.relationship('QuizAnswer', backref='attempt', lazy='dynamic', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_training_quiz_attempt_enrollment_quiz', 'enrollment_id', 'quiz_id'),
+    )
+    
     def __repr__(self):
         return f'<QuizAttempt {self.id}>'
 
@@ -0,0 +1,178 @@
+"""
+Import par lots de reçus et factures
+
+POST /api/extracted-texts/batch reçoit plusieurs images ou PDF (champ multipart
+"files") et les analyse en parallèle avec AnalyzeExpense dans un pool de threads
+borné. Le résultat de chaque document est renvoyé dès qu'il est prêt (une ligne
+JSON par document, application/x-ndjson). Les ExtractedText et FinancialTransaction
+sont ensuite insérés en une seule transaction, et une dernière ligne donne les
+identifiants créés.
+"""
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Blueprint, jsonify, request, session, current_app, stream_with_context
+
+from models import db, User, ExtractedText
+from auth import login_required
+import ocr_jobs
+import ocr_upload
+
+logger = logging.getLogger(__name__)
+
+# Threads d'analyse partagés par tous les lots du processus
+OCR_BATCH_WORKERS = int(os.environ.get('OCR_BATCH_WORKERS', 4))
+
+# Nombre maximum de documents par lot
+OCR_BATCH_MAX_FILES = int(os.environ.get('OCR_BATCH_MAX_FILES', 50))
+
+ocr_batch_bp = Blueprint('ocr_batch', __name__, url_prefix='/api/extracted-texts')
+
+_executor = ThreadPoolExecutor(max_workers=OCR_BATCH_WORKERS, thread_name_prefix='ocr-batch')
+
+
+def init_app(app):
+    """Initialiser la route d'import par lots pour l'application Flask"""
+    app.register_blueprint(ocr_batch_bp)
+
+
+def _is_pdf(data):
+    return data[:5] == b'%PDF-'
+
+
+def _analyze_document(fileobj, digest):
+    """
+    Analyse un reçu ou une facture (exécuté dans un thread du pool)
+
+    Args:
+        fileobj: Fichier binaire reçu
+        digest (str): SHA-256 du fichier reçu (clé du cache Textract)
+
+    Returns:
+        dict: Résultat de run_expense_analysis
+    """
+    from aws_textract import run_expense_analysis
+
+    header = fileobj.read(5)
+    fileobj.seek(0)
+    # Les PDF sont transmis tels quels, les photos sont réduites si nécessaire
+    document_bytes = fileobj.read() if _is_pdf(header) else ocr_upload.prepare_image(fileobj)
+    with ocr_jobs.textract_slots:
+        return run_expense_analysis(document_bytes, digest=digest)
+
+
+def _ndjson(payload):
+    return json.dumps(payload, ensure_ascii=False) + "\n"
+
+
+@ocr_batch_bp.route("/batch", methods=["POST"])
+@login_required
+def ingest_batch():
+    """Analyse et enregistre un lot de reçus/factures, en diffusant les résultats au fil de l'eau"""
+    user = User.query.filter_by(username=session.get('username')).first()
+    if not user:
+        return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 403
+
+    uploads = [f for f in request.files.getlist('files') if f and f.filename]
+    if not uploads:
+        return jsonify({"success": False, "error": "Aucun document fourni"}), 400
+    if len(uploads) > OCR_BATCH_MAX_FILES:
+        return jsonify({"success": False, "error": f"{OCR_BATCH_MAX_FILES} documents maximum par lot"}), 400
+
+    items = []
+    for index, upload in enumerate(uploads):
+        item = {"index": index, "filename": upload.filename,
+                "title": os.path.splitext(os.path.basename(upload.filename))[0] or f"Document {index + 1}"}
+        try:
+            # Les fichiers de la requête sont fermés dès le retour de la vue : copier chaque
+            # document dans un tampon propre au lot (mémoire puis disque)
+            item["file"], item["hash"], _ = ocr_upload.spool_stream(upload.stream)
+        except ocr_upload.UploadTooLarge as e:
+            item["error"] = str(e)
+        items.append(item)
+
+    # Documents déjà enregistrés par l'utilisateur (une seule requête pour tout le lot)
+    hashes = {item["hash"] for item in items if "hash" in item}
+    existing = dict(
+        db.session.query(ExtractedText.image_hash, db.func.max(ExtractedText.id))
+        .filter(ExtractedText.user_id == user.id, ExtractedText.image_hash.in_(hashes))
+        .group_by(ExtractedText.image_hash)
+        .all()
+    ) if hashes else {}
+    user_id = user.id
+
+    def generate():
+        futures = {}
+        seen = {}
+        records = []
+        try:
+            for item in items:
+                line = {"index": item["index"], "filename": item["filename"]}
+                if "error" in item:
+                    yield _ndjson({**line, "status": "error", "error": item["error"]})
+                elif item["hash"] in existing:
+                    yield _ndjson({**line, "status": "duplicate", "id": existing[item["hash"]]})
+                elif item["hash"] in seen:
+                    yield _ndjson({**line, "status": "duplicate", "duplicate_of": seen[item["hash"]]})
+                else:
+                    seen[item["hash"]] = item["index"]
+                    futures[_executor.submit(_analyze_document, item["file"], item["hash"])] = item
+
+            for future in as_completed(futures):
+                item = futures[future]
+                line = {"index": item["index"], "filename": item["filename"]}
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Batch OCR failed for {item['filename']}: {str(e)}")
+                    yield _ndjson({**line, "status": "error", "error": str(e)})
+                    continue
+
+                extracted_info = result.get("extracted_info", {})
+                extracted_text, transaction = ocr_jobs.build_extracted_records(
+                    user_id, item["title"], result["text"], extracted_info, item["hash"], source="upload")
+                records.append((item, extracted_text, transaction))
+                yield _ndjson({**line, "status": "analyzed", "extracted_info": extracted_info})
+
+            # Insertion groupée de tous les documents analysés, en une seule transaction
+            try:
+                db.session.add_all([extracted_text for _, extracted_text, _ in records])
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Batch insert failed: {str(e)}")
+                db.session.rollback()
+                yield _ndjson({"done": True, "success": False, "error": str(e)})
+                return
+
+            logger.debug(f"Batch OCR saved {len(records)} documents for user {user_id}")
+            yield _ndjson({
+                "done": True,
+                "success": True,
+                "saved": len(records),
+                "items": [{
+                    "index": item["index"],
+                    "id": extracted_text.id,
+                    "transaction_id": transaction.id if transaction is not None else None
+                } for item, extracted_text, transaction in records]
+            })
+        finally:
+            # Client déconnecté : ne pas analyser les documents restants
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+            for item in items:
+                if "file" in item:
+                    item["file"].close()
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,219 @@
+"""
+Cache des résultats OCR (AWS Textract) indexé par le SHA-256 des images
+
+Une image déjà analysée n'est pas renvoyée à Textract : le résultat est relu
+depuis un répertoire local (par défaut) ou depuis Redis si OCR_CACHE_BACKEND=redis.
+Les entrées expirent après OCR_CACHE_TTL secondes ; le cache disque est borné à
+OCR_CACHE_MAX_BYTES (les entrées les moins récemment lues sont évincées).
+OCR_CACHE_BACKEND=none désactive le cache.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie des résultats (secondes)
+CACHE_TTL = int(os.environ.get('OCR_CACHE_TTL', 30 * 24 * 3600))
+
+# Taille maximale du cache disque (octets)
+CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+CACHE_DIR = os.environ.get('OCR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ocr-cache'))
+
+# Incrémenter pour invalider les résultats produits par une ancienne version du parseur
+CACHE_VERSION = 2
+
+
+def image_digest(image_bytes):
+    """Retourne le SHA-256 hexadécimal des octets d'une image"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class DiskOCRCache:
+    """Backend fichier : un JSON par résultat, éviction LRU au-delà de la taille maximale"""
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.json'))
+
+    @property
+    def size(self):
+        """Taille occupée par les entrées (octets)"""
+        return self._size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('created', 0) + self.ttl < time.time():
+            self._remove(path)
+            return None
+
+        # La date de modification sert d'horodatage de dernier accès pour l'éviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get('result')
+
+    def set(self, key, result):
+        data = json.dumps({'created': time.time(), 'result': result}, ensure_ascii=False).encode('utf-8')
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        with self._lock:
+            # Une entrée remplacée libère la place de l'ancien fichier
+            try:
+                previous = os.path.getsize(path)
+            except OSError:
+                previous = 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment utilisées jusqu'à 90 % de la taille maximale"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.evictions += 1
+            except OSError:
+                pass
+        self._size = total
+        logger.debug(f"OCR cache evicted down to {total} bytes")
+
+
+class RedisOCRCache:
+    """Backend Redis partagé entre les workers (taille bornée par la politique maxmemory de Redis)"""
+
+    def __init__(self, client, ttl=CACHE_TTL, prefix="ocr:result"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        data = self.client.get(self._key(key))
+        return json.loads(data) if data else None
+
+    def set(self, key, result):
+        self.client.setex(self._key(key), self.ttl, json.dumps(result, ensure_ascii=False))
+
+
+def create_backend(backend, directory=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, prefix="ocr:result"):
+    """
+    Crée un backend de cache (disque par défaut, Redis si demandé, aucun si désactivé)
+
+    Args:
+        backend (str): 'disk', 'redis' ou 'none'
+        directory (str): Répertoire du cache disque
+        ttl (int): Durée de vie des entrées (secondes)
+        max_bytes (int): Taille maximale du cache disque (octets)
+        prefix (str): Préfixe des clés Redis
+
+    Returns:
+        DiskOCRCache, RedisOCRCache ou None
+    """
+    backend = backend.lower()
+    if backend == 'none':
+        return None
+    if backend == 'redis':
+        try:
+            import redis
+            client = redis.Redis(
+                host=os.environ.get('REDIS_HOST', 'localhost'),
+                port=int(os.environ.get('REDIS_PORT', 6379)),
+                password=os.environ.get('REDIS_PASSWORD') or None,
+                db=int(os.environ.get('REDIS_DB', 0)),
+                socket_timeout=1
+            )
+            client.ping()
+            logger.info(f"Result cache {prefix}: Redis backend")
+            return RedisOCRCache(client, ttl, prefix)
+        except Exception as e:
+            logger.warning(f"Redis unavailable for result cache {prefix}, using disk cache: {str(e)}")
+    try:
+        return DiskOCRCache(directory, ttl, max_bytes)
+    except OSError as e:
+        logger.warning(f"Result cache {prefix} disabled, cannot use {directory}: {str(e)}")
+        return None
+
+
+_backend = create_backend(os.environ.get('OCR_CACHE_BACKEND', 'disk'))
+
+
+def _cache_key(operation, digest):
+    return f"v{CACHE_VERSION}-{operation}-{digest}"
+
+
+def get(operation, digest):
+    """
+    Retourne le résultat OCR en cache pour une image
+
+    Args:
+        operation (str): Type d'analyse ('expense' ou 'document')
+        digest (str): SHA-256 de l'image
+
+    Returns:
+        dict: Résultat mis en cache, ou None
+    """
+    if _backend is None:
+        return None
+    try:
+        return _backend.get(_cache_key(operation, digest))
+    except Exception as e:
+        logger.warning(f"OCR cache read failed: {str(e)}")
+        return None
+
+
+def put(operation, digest, result):
+    """Enregistre le résultat OCR d'une image"""
+    if _backend is None:
+        return
+    try:
+        _backend.set(_cache_key(operation, digest), result)
+    except Exception as e:
+        logger.warning(f"OCR cache write failed: {str(e)}")
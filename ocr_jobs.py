@@ -0,0 +1,356 @@
+"""
+Traitement asynchrone des images OCR envoyées à /api/save-extracted-text
+
+En mode asynchrone, l'endpoint enregistre une tâche OcrJob et rend la main
+immédiatement avec son identifiant. Un pool borné de threads exécute ensuite
+Textract, l'extraction des informations financières et la création de
+l'ExtractedText et de la FinancialTransaction. L'état est stocké en base pour
+être consultable depuis n'importe quel worker (/api/ocr-jobs/<id>, ou en SSE
+via /api/ocr-jobs/<id>/events).
+"""
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import Blueprint, jsonify, session, current_app, stream_with_context
+
+from models import db, User, ExtractedText, FinancialTransaction, OcrJob
+from auth import login_required
+
+logger = logging.getLogger(__name__)
+
+# Nombre de threads traitant les tâches OCR dans chaque processus
+OCR_JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', 4))
+
+# Nombre maximum de tâches en attente par processus au-delà des tâches en cours
+OCR_JOB_QUEUE_SIZE = int(os.environ.get('OCR_JOB_QUEUE_SIZE', 100))
+
+# Nombre maximum d'appels Textract simultanés par processus
+OCR_MAX_INFLIGHT_TEXTRACT = int(os.environ.get('OCR_MAX_INFLIGHT_TEXTRACT', 4))
+
+# Tentatives Textract (erreurs transitoires) et délai de base de l'attente exponentielle
+OCR_JOB_MAX_ATTEMPTS = int(os.environ.get('OCR_JOB_MAX_ATTEMPTS', 4))
+OCR_JOB_BACKOFF_SECONDS = float(os.environ.get('OCR_JOB_BACKOFF_SECONDS', 1.0))
+
+# Durée maximale d'un flux SSE de suivi et intervalle de consultation de la base
+OCR_JOB_EVENTS_TIMEOUT = int(os.environ.get('OCR_JOB_EVENTS_TIMEOUT', 120))
+OCR_JOB_EVENTS_INTERVAL = 0.5
+
+FINAL_STATUSES = ('completed', 'failed')
+
+# Plus grand montant accepté par les colonnes Numeric(10, 2)
+MAX_AMOUNT = Decimal('99999999.99')
+
+ocr_jobs_bp = Blueprint('ocr_jobs', __name__, url_prefix='/api/ocr-jobs')
+
+_executor = ThreadPoolExecutor(max_workers=OCR_JOB_WORKERS, thread_name_prefix='ocr-job')
+_queue_slots = threading.BoundedSemaphore(OCR_JOB_WORKERS + OCR_JOB_QUEUE_SIZE)
+# Plafond partagé par toutes les analyses Textract du processus (tâches et lots)
+textract_slots = threading.BoundedSemaphore(OCR_MAX_INFLIGHT_TEXTRACT)
+
+
+class OcrQueueFull(Exception):
+    """Levée lorsque la file des tâches OCR du processus est pleine"""
+
+
+def init_app(app):
+    """Initialiser les routes de suivi des tâches OCR pour l'application Flask"""
+    app.register_blueprint(ocr_jobs_bp)
+
+
+def build_extracted_records(user_id, title, text_content, extracted_info, image_hash=None, source="camera"):
+    """
+    Construit, sans les ajouter à la session, le texte extrait et la transaction détectée
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        title (str): Titre du texte extrait
+        text_content (str): Texte extrait
+        extracted_info (dict): Informations financières extraites
+        image_hash (str, optional): SHA-256 de l'image source
+        source (str): Origine du texte ('camera', 'upload'...)
+
+    Returns:
+        tuple: (ExtractedText, FinancialTransaction ou None), liés par la relation transaction
+    """
+    from main import parse_date
+
+    extracted_text = ExtractedText(
+        user_id=user_id,
+        title=title,
+        content=text_content,
+        source=source,
+        image_hash=image_hash
+    )
+
+    # Ajouter les informations financières extraites si disponibles
+    if 'document_type' in extracted_info:
+        extracted_text.document_type = extracted_info['document_type']
+        extracted_text.is_processed = True
+
+    # Si des informations financières ont été extraites, créer automatiquement une transaction
+    transaction = None
+    if 'amount' in extracted_info and extracted_info['amount'] != "0.00":
+        try:
+            amount = Decimal(extracted_info['amount'])
+            tax_amount = Decimal(extracted_info['tax_amount']) if 'tax_amount' in extracted_info else None
+            # Les colonnes Numeric(10, 2) refuseraient un montant mal lu
+            if abs(amount) > MAX_AMOUNT or (tax_amount is not None and abs(tax_amount) > MAX_AMOUNT):
+                raise ValueError(f"montant hors limites: {amount}")
+
+            transaction = FinancialTransaction(
+                user_id=user_id,
+                amount=amount,
+                description=title,
+                transaction_date=parse_date(extracted_info.get('date')),
+                is_expense=True,
+                tax_amount=tax_amount
+            )
+            # Lier la transaction au texte extrait
+            extracted_text.transaction = transaction
+        except (InvalidOperation, ValueError) as transaction_error:
+            # Ne pas échouer si la création de transaction échoue
+            logger.error(f"Error creating transaction: {str(transaction_error)}")
+            transaction = None
+
+    return extracted_text, transaction
+
+
+def extracted_info_from_record(extracted_text):
+    """
+    Reconstitue les informations extraites d'un texte déjà enregistré
+
+    Utilisé pour un envoi en double dont le résultat Textract n'est plus en cache
+    (ou n'a jamais existé lorsque le texte pré-extrait a servi de repli).
+
+    Args:
+        extracted_text (ExtractedText): Enregistrement existant
+
+    Returns:
+        dict: Type de document et, si une transaction est liée, montant, TVA et date
+    """
+    extracted_info = {}
+    if extracted_text.document_type:
+        extracted_info['document_type'] = extracted_text.document_type
+    transaction = extracted_text.transaction
+    if transaction is not None:
+        extracted_info['amount'] = f"{transaction.amount:.2f}"
+        if transaction.tax_amount is not None:
+            extracted_info['tax_amount'] = f"{transaction.tax_amount:.2f}"
+        if transaction.transaction_date:
+            extracted_info['date'] = transaction.transaction_date.isoformat()
+    return extracted_info
+
+
+def save_extracted_result(user_id, title, text_content, extracted_info, image_hash=None, source="camera"):
+    """
+    Enregistre un texte extrait et, si un montant a été détecté, la transaction associée
+
+    Les deux enregistrements sont créés dans une seule transaction.
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        title (str): Titre du texte extrait
+        text_content (str): Texte extrait
+        extracted_info (dict): Informations financières extraites
+        image_hash (str, optional): SHA-256 de l'image source
+        source (str): Origine du texte ('camera', 'upload'...)
+
+    Returns:
+        ExtractedText: Enregistrement créé
+    """
+    extracted_text, transaction = build_extracted_records(
+        user_id, title, text_content, extracted_info, image_hash, source)
+
+    # La transaction est insérée avant le texte extrait qui la référence
+    db.session.add(extracted_text)
+    db.session.commit()
+    if transaction is not None:
+        logger.debug(f"Created transaction from extracted text: {transaction.id}")
+    return extracted_text
+
+
+def submit_job(user_id, title, image_bytes, image_hash=None, analyze_expense=True, fallback_text=""):
+    """
+    Crée une tâche OCR et la confie au pool de traitement
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        title (str): Titre du texte extrait
+        image_bytes (bytes): Contenu de l'image
+        image_hash (str, optional): SHA-256 de l'image
+        analyze_expense (bool): Utiliser AnalyzeExpense plutôt qu'AnalyzeDocument
+        fallback_text (str): Texte pré-extrait côté client, utilisé si Textract échoue
+
+    Returns:
+        OcrJob: Tâche créée (statut 'queued')
+
+    Raises:
+        OcrQueueFull: Si la file du processus est pleine
+    """
+    if not _queue_slots.acquire(blocking=False):
+        raise OcrQueueFull("Trop de documents en cours de traitement, réessayez dans quelques instants")
+
+    try:
+        job = OcrJob(id=str(uuid.uuid4()), user_id=user_id, title=title, status='queued')
+        db.session.add(job)
+        db.session.commit()
+
+        app = current_app._get_current_object()
+        _executor.submit(_run_job, app, job.id, user_id, title, image_bytes, image_hash,
+                         analyze_expense, fallback_text)
+    except Exception:
+        _queue_slots.release()
+        raise
+
+    logger.debug(f"Queued OCR job {job.id}")
+    return job
+
+
+def _update_job(job_id, **values):
+    """Met à jour l'état d'une tâche et le rend visible immédiatement"""
+    values['updated_at'] = datetime.utcnow()
+    db.session.query(OcrJob).filter(OcrJob.id == job_id).update(values)
+    db.session.commit()
+
+
+def _analyze_with_retries(job_id, image_bytes, image_hash, analyze_expense):
+    """Appelle Textract en respectant le plafond d'appels simultanés, avec nouvelles tentatives"""
+    from aws_textract import run_expense_analysis, run_document_analysis, is_retryable_error, get_textract_client
+
+    analyze = run_expense_analysis if analyze_expense else run_document_analysis
+    # Seule cette boucle réessaie : botocore ne fait qu'une tentative par appel, et
+    # l'emplacement Textract est rendu pendant l'attente entre deux tentatives
+    textract_client = get_textract_client(max_attempts=1)
+    for attempt in range(1, OCR_JOB_MAX_ATTEMPTS + 1):
+        try:
+            with textract_slots:
+                return analyze(image_bytes, textract_client=textract_client, digest=image_hash)
+        except Exception as e:
+            if attempt == OCR_JOB_MAX_ATTEMPTS or not is_retryable_error(e):
+                raise
+            delay = OCR_JOB_BACKOFF_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            logger.warning(f"OCR job {job_id}: Textract attempt {attempt} failed ({str(e)}), retrying in {delay:.1f}s")
+            _update_job(job_id, status='retrying', attempts=attempt, error=str(e))
+            time.sleep(delay)
+            _update_job(job_id, status='processing')
+
+
+def _run_job(app, job_id, user_id, title, image_bytes, image_hash, analyze_expense, fallback_text):
+    """Exécute une tâche OCR dans un thread du pool"""
+    try:
+        with app.app_context():
+            try:
+                _update_job(job_id, status='processing', progress='ocr')
+
+                try:
+                    result = _analyze_with_retries(job_id, image_bytes, image_hash, analyze_expense)
+                    text_content = result["text"]
+                    extracted_info = result.get("extracted_info", {})
+                except Exception as textract_error:
+                    logger.error(f"OCR job {job_id}: Textract failed: {str(textract_error)}")
+                    # Fallback vers le texte pré-extrait en cas d'échec
+                    if not fallback_text:
+                        _update_job(job_id, status='failed', progress=None,
+                                    error=f"Échec de l'extraction avec AWS Textract: {str(textract_error)}")
+                        return
+                    text_content = fallback_text
+                    extracted_info = {}
+
+                _update_job(job_id, progress='saving')
+                extracted_text = save_extracted_result(user_id, title, text_content, extracted_info, image_hash)
+
+                _update_job(job_id, status='completed', progress=None, error=None,
+                            extracted_text_id=extracted_text.id,
+                            result=json.dumps(extracted_info, ensure_ascii=False))
+                logger.debug(f"OCR job {job_id} completed (extracted text {extracted_text.id})")
+            except Exception as e:
+                logger.error(f"OCR job {job_id} failed: {str(e)}")
+                db.session.rollback()
+                _update_job(job_id, status='failed', progress=None, error=str(e))
+    except Exception as e:
+        logger.error(f"Unable to record failure of OCR job {job_id}: {str(e)}")
+    finally:
+        _queue_slots.release()
+
+
+def job_to_dict(job):
+    """Convertit une tâche en dictionnaire pour l'API de suivi"""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "progress": job.progress,
+        "attempts": job.attempts,
+        "error": job.error,
+        "id": job.extracted_text_id,
+        "extracted_info": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+
+def _get_user_job(job_id):
+    """Retourne la tâche si elle appartient à l'utilisateur connecté"""
+    user = User.query.filter_by(username=session.get('username')).first()
+    if not user:
+        return None
+    return OcrJob.query.filter_by(id=job_id, user_id=user.id).first()
+
+
+@ocr_jobs_bp.route("/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    """État et résultat d'une tâche OCR"""
+    job = _get_user_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Tâche introuvable"}), 404
+    return jsonify({"success": True, **job_to_dict(job)})
+
+
+@ocr_jobs_bp.route("/<job_id>/events", methods=["GET"])
+@login_required
+def job_events(job_id):
+    """Flux SSE des changements d'état d'une tâche OCR, jusqu'à sa fin"""
+    job = _get_user_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Tâche introuvable"}), 404
+    db.session.rollback()
+
+    def generate():
+        deadline = time.monotonic() + OCR_JOB_EVENTS_TIMEOUT
+        last_state = None
+        while True:
+            job = db.session.get(OcrJob, job_id, populate_existing=True)
+            # Copie de l'état avant de libérer la session : relire le job après le
+            # rollback rouvrirait une transaction gardée pendant l'attente
+            snapshot = job_to_dict(job) if job is not None else None
+            db.session.rollback()
+            if snapshot is None:
+                break
+
+            state = (snapshot['status'], snapshot['progress'], snapshot['attempts'])
+            if state != last_state:
+                last_state = state
+                yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if snapshot['status'] in FINAL_STATUSES:
+                break
+            if time.monotonic() > deadline:
+                yield f"data: {json.dumps({'job_id': job_id, 'timeout': True})}\n\n"
+                break
+            time.sleep(OCR_JOB_EVENTS_INTERVAL)
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,213 @@
+"""
+Réception des images OCR envoyées en binaire ou en multipart
+
+Plutôt qu'une chaîne base64 dans un corps JSON (33 % plus volumineuse et copiée
+plusieurs fois en mémoire), /api/save-extracted-text accepte l'image brute :
+- multipart/form-data avec un champ fichier "image" (et les autres champs en formulaire)
+- corps binaire (image/jpeg, image/png, application/octet-stream) avec les
+  paramètres dans la chaîne de requête
+
+Le corps est lu par blocs dans un tampon borné (mémoire puis disque) tout en
+calculant son SHA-256. Les photos trop grandes sont réduites et réencodées en JPEG
+avant l'appel à Textract.
+"""
+import io
+import os
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale d'une image envoyée (octets)
+OCR_UPLOAD_MAX_BYTES = int(os.environ.get('OCR_UPLOAD_MAX_BYTES', 15 * 1024 * 1024))
+
+# Au-delà de cette taille, le tampon de réception est déplacé sur disque
+OCR_UPLOAD_SPOOL_BYTES = int(os.environ.get('OCR_UPLOAD_SPOOL_BYTES', 1024 * 1024))
+
+# Plus grand côté des images transmises à Textract (environ 300 DPI pour un A4)
+OCR_IMAGE_MAX_SIDE = int(os.environ.get('OCR_IMAGE_MAX_SIDE', 2400))
+OCR_IMAGE_JPEG_QUALITY = int(os.environ.get('OCR_IMAGE_JPEG_QUALITY', 85))
+
+# Taille maximale d'un document pour les opérations synchrones de Textract
+TEXTRACT_MAX_BYTES = 10 * 1024 * 1024
+
+# Formats acceptés tels quels par Textract
+TEXTRACT_FORMATS = ('JPEG', 'PNG')
+
+CHUNK_SIZE = 64 * 1024
+
+BINARY_MIMETYPES = ('application/octet-stream', 'image/jpeg', 'image/png', 'image/webp', 'image/heic')
+
+
+class UploadTooLarge(Exception):
+    """Levée lorsque l'image dépasse OCR_UPLOAD_MAX_BYTES"""
+
+
+def is_binary_upload(req):
+    """Indique si la requête transporte l'image en multipart ou en binaire plutôt qu'en JSON"""
+    return req.mimetype == 'multipart/form-data' or req.mimetype in BINARY_MIMETYPES
+
+
+def upload_fields(req):
+    """Retourne les paramètres de la requête (champs du formulaire ou chaîne de requête)"""
+    if req.mimetype == 'multipart/form-data':
+        return req.form
+    return req.args
+
+
+def get_flag(data, name, default=False):
+    """
+    Lit un booléen dans des données JSON ou de formulaire
+
+    Args:
+        data (dict): Corps JSON ou champs du formulaire
+        name (str): Nom du paramètre
+        default (bool): Valeur si le paramètre est absent
+
+    Returns:
+        bool: Valeur du paramètre
+    """
+    value = data.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def spool_stream(stream, max_bytes=OCR_UPLOAD_MAX_BYTES):
+    """
+    Copie un flux par blocs dans un tampon borné en calculant son SHA-256
+
+    Args:
+        stream: Flux binaire à lire
+        max_bytes (int): Taille maximale acceptée
+
+    Returns:
+        tuple: (tampon positionné au début, SHA-256 hexadécimal, taille en octets)
+
+    Raises:
+        UploadTooLarge: Si le flux dépasse max_bytes
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=OCR_UPLOAD_SPOOL_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Image trop volumineuse (maximum {max_bytes // (1024 * 1024)} Mo)")
+            digest.update(chunk)
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def hash_file(fileobj, max_bytes=OCR_UPLOAD_MAX_BYTES):
+    """
+    Calcule le SHA-256 et la taille d'un fichier déjà reçu, sans le recopier
+
+    Args:
+        fileobj: Fichier binaire (tampon d'un champ multipart)
+        max_bytes (int): Taille maximale acceptée
+
+    Returns:
+        tuple: (fichier repositionné au début, SHA-256 hexadécimal, taille en octets)
+
+    Raises:
+        UploadTooLarge: Si le fichier dépasse max_bytes
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Image trop volumineuse (maximum {max_bytes // (1024 * 1024)} Mo)")
+        digest.update(chunk)
+    fileobj.seek(0)
+    return fileobj, digest.hexdigest(), size
+
+
+def read_image_upload(req):
+    """
+    Lit l'image d'une requête multipart ou binaire
+
+    Args:
+        req: Requête Flask
+
+    Returns:
+        tuple: (fichier positionné au début, SHA-256 hexadécimal, taille), ou None si aucune image
+
+    Raises:
+        UploadTooLarge: Si l'image dépasse OCR_UPLOAD_MAX_BYTES
+    """
+    if req.content_length and req.content_length > OCR_UPLOAD_MAX_BYTES + CHUNK_SIZE:
+        raise UploadTooLarge(f"Image trop volumineuse (maximum {OCR_UPLOAD_MAX_BYTES // (1024 * 1024)} Mo)")
+
+    if req.mimetype == 'multipart/form-data':
+        upload = req.files.get('image')
+        if not upload:
+            return None
+        # Werkzeug a déjà placé le fichier dans un tampon temporaire : le parcourir sans le recopier
+        result = hash_file(upload.stream)
+    else:
+        result = spool_stream(req.stream)
+
+    return result if result[2] else None
+
+
+def prepare_image(fileobj):
+    """
+    Retourne les octets à transmettre à Textract, en réduisant les photos trop grandes
+
+    Les images JPEG/PNG dont le plus grand côté ne dépasse pas OCR_IMAGE_MAX_SIDE sont
+    transmises telles quelles. Les autres sont réduites (décodage JPEG à échelle réduite
+    quand c'est possible), réorientées selon EXIF et réencodées en JPEG.
+
+    Args:
+        fileobj: Fichier binaire contenant l'image
+
+    Returns:
+        bytes: Image à analyser
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        fileobj.seek(0)
+        return fileobj.read()
+
+    fileobj.seek(0, io.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as img:
+            original_size = img.size
+            if (img.format in TEXTRACT_FORMATS and max(img.size) <= OCR_IMAGE_MAX_SIDE
+                    and size <= TEXTRACT_MAX_BYTES):
+                fileobj.seek(0)
+                return fileobj.read()
+
+            # Pour un JPEG, ne décoder qu'à l'échelle utile (1/2, 1/4, 1/8)
+            img.draft('RGB', (OCR_IMAGE_MAX_SIDE, OCR_IMAGE_MAX_SIDE))
+            image = ImageOps.exif_transpose(img)
+            image.thumbnail((OCR_IMAGE_MAX_SIDE, OCR_IMAGE_MAX_SIDE), Image.LANCZOS)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, 'JPEG', quality=OCR_IMAGE_JPEG_QUALITY, optimize=True)
+            data = output.getvalue()
+            logger.debug(f"Image resized for OCR: {original_size} -> {image.size}, {size} -> {len(data)} bytes")
+            return data
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Format non reconnu par Pillow : laisser Textract décider
+        logger.warning(f"Unable to resize OCR image: {str(e)}")
+        fileobj.seek(0)
+        return fileobj.read()
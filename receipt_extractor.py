@@ -0,0 +1,284 @@
+"""
+Extraction des champs d'un reçu ou d'une facture à partir de son texte OCR
+
+Le texte est parcouru une seule fois par une expression compilée dont chaque
+alternative reconnaît un jeton : libellé de montant (TOTAL TTC, NET À PAYER,
+SOUS-TOTAL...), taux de TVA, libellé de fournisseur, date (numérique ou en
+toutes lettres), montant (séparateurs français ou anglais, symbole € ou EUR) et
+mot-clé du type de document. Les candidats sont notés selon leur contexte (un
+montant qui suit "TOTAL TTC" l'emporte sur un montant isolé) et chaque champ
+retenu est accompagné de sa note de confiance.
+
+extract_fields analyse un texte ; extract_many et iter_unprocessed_fields
+traitent des lots (les textes extraits non traités d'un utilisateur sont lus
+par paquets de RECEIPT_EXTRACT_BATCH_SIZE).
+"""
+import os
+import re
+import logging
+from datetime import date
+from decimal import Decimal
+
+from document_parser import parse_statement_amount
+
+logger = logging.getLogger(__name__)
+
+# Textes extraits lus par requête dans iter_unprocessed_fields
+RECEIPT_EXTRACT_BATCH_SIZE = int(os.environ.get('RECEIPT_EXTRACT_BATCH_SIZE', 500))
+
+# Distance maximale (caractères) entre un libellé et le montant ou la date qu'il qualifie
+LABEL_REACH = 40
+
+MONTHS = {
+    'janvier': 1, 'janv': 1, 'février': 2, 'fevrier': 2, 'févr': 2, 'fevr': 2, 'mars': 3, 'avril': 4, 'avr': 4,
+    'mai': 5, 'juin': 6, 'juillet': 7, 'juil': 7, 'août': 8, 'aout': 8, 'septembre': 9, 'sept': 9,
+    'octobre': 10, 'oct': 10, 'novembre': 11, 'nov': 11, 'décembre': 12, 'decembre': 12, 'déc': 12, 'dec': 12
+}
+
+# Confiance d'un montant selon le libellé qui le précède
+AMOUNT_LABEL_SCORES = {
+    'net': 0.95, 'ttc': 0.95, 'due': 0.95,
+    'total': 0.85,
+    'ht': 0.5,
+}
+CURRENCY_AMOUNT_SCORE = 0.55
+BARE_AMOUNT_SCORE = 0.3
+
+# Type de document par mot-clé, dans l'ordre de priorité des types
+DOCUMENT_TYPES = [
+    ('facture', ('facture', 'invoice')),
+    ('reçu', ('reçu', 'recu', 'ticket', 'caisse', 'receipt')),
+    ('devis', ('devis', 'estimation', 'quote')),
+    ('relevé', ('relevé', 'releve', 'statement')),
+]
+_DOCUMENT_TYPE_BY_KEYWORD = {keyword: doc_type for doc_type, keywords in DOCUMENT_TYPES for keyword in keywords}
+_DOCUMENT_TYPE_RANK = {doc_type: rank for rank, (doc_type, _) in enumerate(DOCUMENT_TYPES)}
+
+_MONTH_NAMES = '|'.join(sorted(MONTHS, key=len, reverse=True))
+_KEYWORDS = '|'.join(sorted(_DOCUMENT_TYPE_BY_KEYWORD, key=len, reverse=True))
+# Initiales des libellés et des mots-clés reconnus par _TOKEN
+_INITIALS = 'bcdefimnqrstv'
+
+# Le texte est mis en minuscules avant l'analyse : l'expression n'a pas besoin de
+# re.IGNORECASE. Le préfixe (aucun caractère de mot avant, caractère de mot ou €
+# ensuite) écarte sans essayer les alternatives les positions internes aux mots, et
+# les dates et montants ne sont essayés qu'avant un chiffre, € ou EUR, les libellés
+# qu'avant l'une de leurs initiales
+_TOKEN = re.compile(rf"""
+    (?<!\w)(?=[\w€])(?:
+    (?=[\d€]|eur\b)(?:
+    (?P<date>(?<![\d.,])(?:
+        (?P<d_day>\d{{1,2}})[/.-](?P<d_month>\d{{1,2}})[/.-](?P<d_year>\d{{4}}|\d{{2}})
+      | (?P<i_year>\d{{4}})-(?P<i_month>\d{{2}})-(?P<i_day>\d{{2}})
+      | (?P<t_day>\d{{1,2}})(?:er)?\s+(?P<t_month>{_MONTH_NAMES})\.?\s+(?P<t_year>\d{{4}})
+    )(?![\d,]))
+  | (?P<amount>(?:(?P<pre_currency>€|eur\b)[ \t]*)?
+        (?P<number>(?<![\d.,])\d{{1,3}}(?:[ \u00a0\u202f.,]\d{{3}})*[.,]\d{{2}}|(?<![\d.,])\d+[.,]\d{{2}})(?!\d)
+        (?P<post_currency>[ \t]*(?:€|eur\b))?)
+    )
+  | (?=[{_INITIALS}])(?:
+    (?P<vat>(?:tva|t\.v\.a\.?|vat)[^\d\n%]{{0,15}}?(?P<vat_rate>\d{{1,2}}(?:[.,]\d{{1,2}})?)\s*%)
+  | (?P<net>(?:net|reste)\s+[àa]\s+payer\b)
+  | (?P<ttc>(?:(?:total|montant)(?:\s+g[ée]n[ée]ral)?\s+t\.?t\.?c\.?|montant\s+total)\b)
+  | (?P<due>total\s+(?:[àa]\s+payer|d[ûu])\b)
+  | (?P<ht>(?:sous[-\s]?total|(?:total|montant)\s+h\.?t\.?)\b)
+  | (?P<tax>(?:tva|t\.v\.a\.?|taxes?)\b)
+  | (?P<total>(?:total|montant|somme)\b)
+  | (?P<vendor_label>(?:vendeur|fournisseur|magasin|boutique|enseigne)\b[ \t]*:?[ \t]*
+        (?P<vendor>[^\W\d_][^\n:]{{1,47}})?)
+  | (?P<date_label>date(?:\s+(?:de\s+)?(?:facture|facturation|d'[ée]mission|achat|vente))?\b)
+  | (?P<keyword>(?:{_KEYWORDS})\b)
+    )
+    )
+""", re.VERBOSE)
+
+# Lignes d'en-tête qui ne sont pas un nom de fournisseur (sans lettres, avec un montant ou un mot-clé)
+_HEADER_NOISE = re.compile(
+    rf"^(?:[\W\d_]+|.*\d[.,]\d{{2}}.*|.*\b(?:{_KEYWORDS}|date|total|tva|n°|tél|tel|siret)\b.*)$", re.IGNORECASE)
+
+
+def _parse_date(match):
+    """Date d'un jeton date (jour en premier pour les dates numériques), ou None si elle est invalide"""
+    try:
+        if match.group('d_day'):
+            year = int(match.group('d_year'))
+            if year < 100:
+                year += 2000
+            return date(year, int(match.group('d_month')), int(match.group('d_day')))
+        if match.group('i_year'):
+            return date(int(match.group('i_year')), int(match.group('i_month')), int(match.group('i_day')))
+        return date(int(match.group('t_year')), MONTHS[match.group('t_month')], int(match.group('t_day')))
+    except ValueError:
+        return None
+
+
+def _parse_amount(number):
+    """Montant d'un jeton montant ; "1 234,56", "1.234,56" et "1,234.56" sont acceptés"""
+    try:
+        amount = parse_statement_amount(number)
+    except ValueError:
+        return None
+    return abs(amount).quantize(Decimal('0.01')) if amount is not None else None
+
+
+def _header_vendor(text):
+    """Première ligne d'en-tête plausible comme nom de fournisseur"""
+    for line in text.split('\n', 6)[:6]:
+        line = line.strip()
+        if 3 < len(line) < 50 and not _HEADER_NOISE.match(line):
+            return line
+    return None
+
+
+def _next_line(text, position):
+    """Première ligne non vide après une position (valeur d'un libellé seul sur sa ligne)"""
+    end = text.find('\n', position)
+    while end != -1:
+        start, end = end + 1, text.find('\n', end + 1)
+        line = text[start:end if end != -1 else len(text)].strip()
+        if line:
+            return line
+    return None
+
+
+def extract_fields(text):
+    """
+    Extrait le montant, la date, le fournisseur, le taux de TVA et le type d'un document
+
+    Args:
+        text (str): Texte du reçu ou de la facture
+
+    Returns:
+        dict: amount (str "123.45"), date (str "AAAA-MM-JJ"), vendor, tax_rate (str "20" ou "5.5"),
+            document_type (facture, reçu, devis, relevé) ; None pour les champs non trouvés.
+            field_confidence donne la confiance de chaque champ trouvé (0 à 1) et confidence
+            la confiance globale (moyenne sur le montant, la date et le fournisseur)
+    """
+    text = text or ''
+    lowered = text.lower()
+    # Les noms de fournisseur sont relus dans le texte d'origine (même longueur sauf rares caractères)
+    source = text if len(lowered) == len(text) else lowered
+    amount_score, amount_numbers = None, []  # meilleure confiance et montants qui l'atteignent
+    best_date = None  # (score, date)
+    vendor = None  # (score, nom)
+    tax_rate = None
+    document_type = None
+    label, label_end = None, -1
+    date_label_end = -1
+
+    for match in _TOKEN.finditer(lowered):
+        kind = match.lastgroup
+        if kind == 'amount':
+            if label is not None and match.start() - label_end <= LABEL_REACH:
+                score = AMOUNT_LABEL_SCORES.get(label)
+                label = None
+                if score is None:
+                    continue
+            elif match.group('pre_currency') or match.group('post_currency'):
+                score = CURRENCY_AMOUNT_SCORE
+            else:
+                score = BARE_AMOUNT_SCORE
+            if amount_score is None or score > amount_score:
+                amount_score, amount_numbers = score, [match.group('number')]
+            elif score == amount_score:
+                amount_numbers.append(match.group('number'))
+        elif kind == 'date':
+            if best_date is None or best_date[0] < 0.9:
+                score = 0.9 if 0 <= match.start() - date_label_end <= LABEL_REACH else 0.7
+                if best_date is None or score > best_date[0]:
+                    parsed = _parse_date(match)
+                    if parsed is not None:
+                        best_date = (score, parsed)
+        elif kind == 'vat':
+            if tax_rate is None:
+                tax_rate = match.group('vat_rate').replace(',', '.')
+            # Le montant qui suit un taux de TVA est celui de la taxe
+            label, label_end = 'tax', match.end()
+        elif kind in AMOUNT_LABEL_SCORES or kind == 'tax':
+            label, label_end = kind, match.end()
+        elif kind == 'vendor_label':
+            if vendor is None:
+                name = source[match.start('vendor'):match.end('vendor')].strip() if match.group('vendor') else ''
+                name = name or _next_line(source, match.end())
+                if name and 1 < len(name) < 50:
+                    vendor = (0.9, name)
+        elif kind == 'date_label':
+            date_label_end = match.end()
+        elif kind == 'keyword':
+            doc_type = _DOCUMENT_TYPE_BY_KEYWORD[match.group('keyword')]
+            if document_type is None or _DOCUMENT_TYPE_RANK[doc_type] < _DOCUMENT_TYPE_RANK[document_type]:
+                document_type = doc_type
+
+    # À confiance égale, le plus grand montant est le total (les lignes d'articles le précèdent)
+    amounts = [amount for amount in map(_parse_amount, amount_numbers) if amount is not None]
+    best_amount = (amount_score, max(amounts)) if amounts else None
+
+    if vendor is None:
+        header = _header_vendor(text)
+        if header:
+            vendor = (0.5, header)
+
+    field_confidence = {}
+    if best_amount:
+        field_confidence['amount'] = best_amount[0]
+    if best_date:
+        field_confidence['date'] = best_date[0]
+    if vendor:
+        field_confidence['vendor'] = vendor[0]
+    if tax_rate is not None:
+        field_confidence['tax_rate'] = 0.9
+    if document_type:
+        field_confidence['document_type'] = 0.8
+
+    if tax_rate is not None:
+        tax_rate = format(Decimal(tax_rate).normalize(), 'f')
+
+    return {
+        'amount': str(best_amount[1]) if best_amount else None,
+        'date': best_date[1].isoformat() if best_date else None,
+        'vendor': vendor[1] if vendor else None,
+        'tax_rate': tax_rate,
+        'document_type': document_type,
+        'confidence': round(sum(field_confidence.get(f, 0) for f in ('amount', 'date', 'vendor')) / 3, 2),
+        'field_confidence': field_confidence,
+        'analyzed_by': 'regex'
+    }
+
+
+def extract_many(texts):
+    """
+    Extrait les champs d'une série de textes
+
+    Args:
+        texts (iterable): Textes à analyser
+
+    Returns:
+        list: Résultats de extract_fields, dans l'ordre des textes
+    """
+    return [extract_fields(text) for text in texts]
+
+
+def iter_unprocessed_fields(user_id, batch_size=None):
+    """
+    Extrait les champs des textes extraits non traités d'un utilisateur
+
+    Seuls l'ID et le contenu des textes sont chargés, par paquets de batch_size.
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        batch_size (int): Textes lus par requête (RECEIPT_EXTRACT_BATCH_SIZE par défaut)
+
+    Yields:
+        tuple: (ID du texte extrait, résultat de extract_fields)
+    """
+    from models import db, ExtractedText
+
+    query = db.session.query(ExtractedText.id, ExtractedText.content).filter(
+        ExtractedText.user_id == user_id,
+        ExtractedText.is_processed == False  # noqa: E712
+    ).order_by(
+        ExtractedText.created_at.desc(), ExtractedText.id.desc()
+    ).yield_per(batch_size or RECEIPT_EXTRACT_BATCH_SIZE)
+
+    for text_id, content in query:
+        yield text_id, extract_fields(content)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Script pour (re)calculer les totaux mensuels des transactions financières
+Crée la table transaction_monthly_rollup si nécessaire et la remplit à partir de
+financial_transaction, pour tous les utilisateurs ou un seul (--user-id)
+"""
+import sys
+import logging
+import argparse
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """Fonction principale pour recalculer les totaux mensuels"""
+    parser = argparse.ArgumentParser(description="Recalcul des totaux mensuels des transactions")
+    parser.add_argument('--user-id', type=int, default=None, help="Limiter le recalcul à un utilisateur")
+    args = parser.parse_args()
+
+    try:
+        from main import app
+        from models import db, TransactionMonthlyRollup, TransactionRollupState
+        import transaction_rollups
+
+        with app.app_context():
+            for model in (TransactionMonthlyRollup, TransactionRollupState):
+                model.__table__.create(db.engine, checkfirst=True)
+            if transaction_rollups.reconcile(user_id=args.user_id):
+                logger.info("Recalcul des totaux mensuels réussi!")
+            else:
+                logger.warning("Un recalcul est déjà en cours dans un autre processus.")
+                sys.exit(1)
+
+    except Exception as e:
+        logger.error(f"Erreur lors du recalcul des totaux mensuels: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+Lancement direct du serveur de développement : python run.py
+
+L'application est importée depuis le module « main », celui qu'importent aussi les blueprints.
+L'import reste sous la garde : les processus 'spawn' (document_parser, cashflow_forecast)
+ré-exécutent ce script comme module principal et ne doivent pas recréer l'application,
+ses connexions ni ses tâches de fond.
+"""
+
+if __name__ == "__main__":
+    from main import app
+    app.run(host="0.0.0.0", port=5000, debug=True)
@@ -1,6 +1,6 @@
 import os
 import logging
-import boto3
+import aws_clients
 from botocore.exceptions import ClientError
 from io import BytesIO
 
@@ -22,12 +22,8 @@ class S3Storage:
                 logging.warning("Identifiants AWS manquants. Le stockage S3 ne sera pas disponible.")
                 return
                 
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-                region_name=os.environ.get('AWS_REGION', 'eu-west-3')
-            )
+            # Client partagé par toutes les instances (pool de connexions commun)
+            self.s3_client = aws_clients.get_client('s3', region_name=os.environ.get('AWS_REGION', 'eu-west-3'))
             logging.info("Connexion à S3 établie")
         except Exception as e:
             logging.error(f"Erreur lors de la connexion à S3: {e}")
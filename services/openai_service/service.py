@@ -16,6 +16,7 @@ from openai import OpenAI
 from flask import Blueprint, request, jsonify, current_app
 
 from cache.flask_integration import openai_cached, rate_limited
+from services.openai_service.stream_relay import get_stream_relay, StreamRelayBusy, sse_event
 
 # Configuration du logging
 logging.basicConfig(
@@ -154,6 +155,10 @@ def stream_completion(prompt, model, temperature, max_tokens):
     """
     Effectue une complétion en streaming et renvoie les résultats au fur et à mesure.
     
+    Le flux est relayé par le client asynchrone partagé du processus : le worker
+    n'est pas bloqué sur la connexion OpenAI et la requête amont est annulée si
+    le client se déconnecte.
+    
     Args:
         prompt (str): Prompt pour la complétion
         model (str): Modèle à utiliser
@@ -163,31 +168,36 @@ def stream_completion(prompt, model, temperature, max_tokens):
     Returns:
         flask.Response: Réponse en streaming
     """
+    try:
+        stream = get_stream_relay().open(
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    except StreamRelayBusy as e:
+        logger.warning(f"Streaming refusé: {e}")
+        return jsonify({
+            'error': 'Service saturé',
+            'message': str(e)
+        }), 503
+    
     def generate():
         try:
-            # Appel à l'API OpenAI avec streaming
-            response = openai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True
-            )
-            
-            # Envoyer les chunks de réponse au fur et à mesure
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    yield f"data: {json.dumps({'text': content})}\n\n"
+            # Relayer les chunks de réponse au fur et à mesure
+            for content in stream:
+                yield sse_event({'text': content})
             
-            # Indiquer la fin du streaming
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            # Indiquer la fin du streaming avec les métriques du flux
+            yield sse_event({'done': True, 'metrics': stream.metrics})
             
         except Exception as e:
             logger.error(f"Erreur lors du streaming: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield sse_event({'error': str(e)})
+        finally:
+            stream.close()
     
-    return current_app.response_class(
+    response = current_app.response_class(
         generate(),
         mimetype='text/event-stream',
         headers={
@@ -196,7 +206,15 @@ def stream_completion(prompt, model, temperature, max_tokens):
             'X-Accel-Buffering': 'no'  # Pour Nginx
         }
     )
+    # Annuler la requête amont si le client se déconnecte avant le premier chunk
+    response.call_on_close(stream.close)
+    return response
+
 
+@openai_service.route('/stream/stats', methods=['GET'])
+def stream_stats():
+    """Endpoint exposant l'état du relais de streaming partagé."""
+    return jsonify(get_stream_relay().stats())
 
 @openai_service.route('/analyze', methods=['POST'])
 @rate_limited(limit=30, period=60)  # Limiter à 30 requêtes par minute
@@ -0,0 +1,272 @@
+"""
+Relais de streaming OpenAI partagé par processus.
+
+Ce module maintient une boucle asyncio unique dans un thread dédié ainsi qu'un
+client AsyncOpenAI dont le pool de connexions HTTP est partagé par tous les flux.
+Chaque flux SSE est relayé vers le thread WSGI au travers d'une file bornée
+(contre-pression sur la requête amont) et la fermeture du générateur côté client
+annule immédiatement la requête OpenAI correspondante.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Paramètres par défaut (surchargeables par variables d'environnement)
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get('OPENAI_STREAM_MAX_CONCURRENCY', 256))
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get('OPENAI_STREAM_MAX_CONNECTIONS', 100))
+DEFAULT_BUFFER_SIZE = int(os.environ.get('OPENAI_STREAM_BUFFER_SIZE', 64))
+DEFAULT_READ_TIMEOUT = float(os.environ.get('OPENAI_STREAM_READ_TIMEOUT', 60))
+
+
+class StreamRelayBusy(Exception):
+    """Levée lorsque le plafond de flux simultanés du processus est atteint."""
+
+
+def sse_event(payload):
+    """Formate un dictionnaire en événement Server-Sent Events."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class RelayedStream:
+    """
+    Flux relayé consommé depuis un thread WSGI.
+
+    L'itération renvoie les fragments de texte au fur et à mesure. La méthode
+    close() (appelée automatiquement en fin d'itération ou lorsque le client se
+    déconnecte) annule la requête amont et libère la place dans le relais.
+    """
+
+    def __init__(self, relay, buffer, task, read_timeout):
+        self._relay = relay
+        self._buffer = buffer
+        self._task = task
+        self._read_timeout = read_timeout
+        self._closed = False
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.finished_at = None
+        self.tokens = 0  # Un chunk de contenu OpenAI correspond à un token
+
+    def __iter__(self):
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(self._buffer.get(), self._relay.loop)
+                try:
+                    kind, value = future.result(timeout=self._read_timeout)
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    raise TimeoutError(f"Aucune donnée reçue d'OpenAI depuis {self._read_timeout}s")
+
+                if kind == 'chunk':
+                    if self.first_token_at is None:
+                        self.first_token_at = time.monotonic()
+                    self.tokens += 1
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    break
+        finally:
+            self.close()
+
+    @property
+    def metrics(self):
+        """Métriques du flux : time-to-first-token et débit en tokens/s."""
+        end = self.finished_at or time.monotonic()
+        ttft = (self.first_token_at - self.started_at) if self.first_token_at else None
+        generation_time = (end - self.first_token_at) if self.first_token_at else 0
+        return {
+            'ttft_ms': round(ttft * 1000, 1) if ttft is not None else None,
+            'tokens': self.tokens,
+            'duration_ms': round((end - self.started_at) * 1000, 1),
+            'tokens_per_second': round(self.tokens / generation_time, 2) if generation_time > 0 else None
+        }
+
+    def close(self):
+        """Annule la requête amont si elle est encore active et libère la place."""
+        if self._closed:
+            return
+        self._closed = True
+        self.finished_at = time.monotonic()
+
+        if not self._task.done():
+            self._relay.loop.call_soon_threadsafe(self._task.cancel)
+            logger.debug("Flux OpenAI annulé (client déconnecté ou flux interrompu)")
+
+        self._relay._release(self)
+
+
+class StreamRelay:
+    """
+    Relais de streaming partagé : une boucle asyncio, un client HTTP poolé,
+    un plafond de flux simultanés.
+    """
+
+    def __init__(self, api_key=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, buffer_size=DEFAULT_BUFFER_SIZE,
+                 read_timeout=DEFAULT_READ_TIMEOUT):
+        """
+        Initialise le relais (la boucle n'est démarrée qu'au premier flux).
+
+        Args:
+            api_key (str, optional): Clé API OpenAI. Par défaut OPENAI_API_KEY.
+            max_concurrency (int): Nombre maximum de flux simultanés dans le processus.
+            max_connections (int): Taille du pool de connexions HTTP vers OpenAI.
+            buffer_size (int): Nombre de fragments tamponnés par flux avant contre-pression.
+            read_timeout (float): Délai maximum sans donnée avant abandon du flux.
+        """
+        self.api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.buffer_size = buffer_size
+        self.read_timeout = read_timeout
+
+        self.loop = None
+        self._client = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _ensure_started(self):
+        """Démarre la boucle asyncio et le client partagé si nécessaire."""
+        if self.loop is not None:
+            return
+
+        with self._lock:
+            if self.loop is not None:
+                return
+
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='openai-stream-relay', daemon=True)
+            thread.start()
+
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                http_client=http_client,
+                timeout=httpx.Timeout(self.read_timeout, connect=10.0)
+            )
+            self.loop = loop
+
+            logger.info(f"Relais de streaming OpenAI démarré (flux max: {self.max_concurrency}, "
+                        f"connexions: {self.max_connections})")
+
+    def open(self, messages, model, temperature=0.7, max_tokens=1000):
+        """
+        Ouvre un flux de complétion relayé.
+
+        Args:
+            messages (list): Messages de la conversation au format Chat Completions
+            model (str): Modèle à utiliser
+            temperature (float): Température pour la génération
+            max_tokens (int): Nombre maximum de tokens
+
+        Returns:
+            RelayedStream: Flux itérable de fragments de texte
+
+        Raises:
+            StreamRelayBusy: Si le plafond de flux simultanés est atteint
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise StreamRelayBusy(f"Nombre maximum de flux simultanés atteint ({self.max_concurrency})")
+
+        try:
+            self._ensure_started()
+            params = {
+                'model': model,
+                'messages': messages,
+                'temperature': temperature,
+                'max_tokens': max_tokens
+            }
+            buffer, task = asyncio.run_coroutine_threadsafe(self._start(params), self.loop).result()
+        except Exception:
+            self._slots.release()
+            raise
+
+        stream = RelayedStream(self, buffer, task, self.read_timeout)
+        with self._lock:
+            self._active += 1
+        return stream
+
+    async def _start(self, params):
+        """Crée la file bornée et la tâche amont dans la boucle du relais."""
+        buffer = asyncio.Queue(maxsize=self.buffer_size)
+        task = asyncio.ensure_future(self._pump(params, buffer))
+        return buffer, task
+
+    async def _pump(self, params, buffer):
+        """Lit le flux OpenAI et alimente la file (bloque si le client est lent)."""
+        response = None
+        try:
+            response = await self._client.chat.completions.create(stream=True, **params)
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    await buffer.put(('chunk', content))
+            await buffer.put(('done', None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erreur lors du streaming OpenAI: {e}")
+            await buffer.put(('error', e))
+        finally:
+            if response is not None:
+                await response.close()
+
+    def _release(self, stream):
+        """Libère la place d'un flux terminé et journalise ses métriques."""
+        metrics = stream.metrics
+        with self._lock:
+            self._active -= 1
+            self._completed += 1
+        self._slots.release()
+        logger.info(f"Flux OpenAI terminé: ttft={metrics['ttft_ms']}ms, tokens={metrics['tokens']}, "
+                    f"tokens/s={metrics['tokens_per_second']}")
+
+    def stats(self):
+        """Retourne l'état courant du relais."""
+        with self._lock:
+            return {
+                'active_streams': self._active,
+                'completed_streams': self._completed,
+                'rejected_streams': self._rejected,
+                'max_concurrency': self.max_concurrency,
+                'max_connections': self.max_connections
+            }
+
+
+# Instance partagée par le processus
+_relay = None
+_relay_lock = threading.Lock()
+
+
+def get_stream_relay():
+    """Retourne le relais de streaming partagé du processus."""
+    global _relay
+    if _relay is None:
+        with _relay_lock:
+            if _relay is None:
+                _relay = StreamRelay()
+    return _relay
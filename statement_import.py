@@ -0,0 +1,214 @@
+"""
+Import des relevés bancaires (CSV, XLSX, OFX) dans les transactions financières
+
+POST /api/transactions/import reçoit un relevé (champ multipart "statement"),
+le lit opération par opération avec document_parser.iter_statement_rows et
+insère les FinancialTransaction par lots (COPY sous PostgreSQL, INSERT groupés
+sinon), dans une seule transaction. Les opérations déjà présentes en base (même date, montant, sens et
+libellé) sont ignorées : réimporter un relevé ne crée pas de doublons, tandis
+que deux opérations identiques d'un même relevé sont toutes deux conservées.
+"""
+import io
+import os
+import csv
+import logging
+from collections import Counter
+from datetime import datetime
+
+from flask import Blueprint, jsonify, request, session
+from sqlalchemy import insert
+
+from models import db, User, FinancialTransaction
+from auth import login_required
+from document_parser import iter_statement_rows, STATEMENT_EXTENSIONS
+from ocr_jobs import MAX_AMOUNT
+import transaction_rollups
+
+logger = logging.getLogger(__name__)
+
+# Opérations insérées par requête COPY/INSERT
+STATEMENT_IMPORT_BATCH_SIZE = int(os.environ.get('STATEMENT_IMPORT_BATCH_SIZE', 1000))
+
+# Lignes en erreur détaillées dans la réponse (toutes sont comptées)
+STATEMENT_IMPORT_MAX_ERRORS = 50
+
+statement_import_bp = Blueprint('statement_import', __name__, url_prefix='/api/transactions')
+
+
+def init_app(app):
+    """Initialiser la route d'import des relevés bancaires pour l'application Flask"""
+    app.register_blueprint(statement_import_bp)
+
+
+def _transaction_key(transaction_date, amount, is_expense, description):
+    return transaction_date, amount, is_expense, description
+
+
+class _StatementWriter:
+    """Insère les opérations par lots en écartant celles déjà enregistrées"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.imported = 0
+        self.duplicates = 0
+        # Opérations existantes par clé, chargées date par date au fil du relevé
+        self._existing = Counter()
+        self._loaded_dates = set()
+        self._batch = []
+
+    def add(self, row):
+        self._batch.append(row)
+        if len(self._batch) >= STATEMENT_IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def _load_existing(self, dates):
+        dates = dates - self._loaded_dates
+        if not dates:
+            return
+        rows = db.session.query(
+            FinancialTransaction.transaction_date,
+            FinancialTransaction.amount,
+            FinancialTransaction.is_expense,
+            FinancialTransaction.description
+        ).filter(
+            FinancialTransaction.user_id == self.user_id,
+            FinancialTransaction.transaction_date.in_(dates)
+        )
+        for row in rows:
+            self._existing[_transaction_key(*row)] += 1
+        # Les dates déjà chargées ne sont plus relues : les opérations insérées par
+        # cet import ne sont donc pas prises pour des doublons
+        self._loaded_dates |= dates
+
+    def flush(self):
+        if not self._batch:
+            return
+        self._load_existing({row['date'] for row in self._batch})
+
+        values = []
+        for row in self._batch:
+            key = _transaction_key(row['date'], row['amount'], row['is_expense'], row['description'])
+            if self._existing[key] > 0:
+                self._existing[key] -= 1
+                self.duplicates += 1
+                continue
+            values.append({
+                'user_id': self.user_id,
+                'amount': row['amount'],
+                'description': row['description'],
+                'transaction_date': row['date'],
+                'is_expense': row['is_expense']
+            })
+        self._batch = []
+
+        if values:
+            if db.engine.dialect.name == 'postgresql':
+                self._copy(values)
+            else:
+                db.session.execute(insert(FinancialTransaction.__table__), values)
+            # Les insertions hors ORM ne passent pas par les écouteurs de la session
+            delta = transaction_rollups.RollupDelta()
+            for value in values:
+                delta.add_transaction(value)
+            transaction_rollups.apply_delta(db.session.connection(), delta)
+            self.imported += len(values)
+
+    def _copy(self, values):
+        """Insère un lot avec COPY, dans la transaction de la session"""
+        created_at = datetime.utcnow()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for value in values:
+            # Un champ vide non entouré de guillemets est lu comme NULL par COPY
+            writer.writerow([value['user_id'], value['amount'], value['description'], value['transaction_date'],
+                             't' if value['is_expense'] else 'f', created_at])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {FinancialTransaction.__tablename__} "
+                "(user_id, amount, description, transaction_date, is_expense, created_at) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+        finally:
+            cursor.close()
+
+
+def import_statement(user_id, fileobj, filename):
+    """
+    Importe les opérations d'un relevé bancaire pour un utilisateur
+
+    Les opérations sont validées une par une ; les lignes invalides sont ignorées
+    et signalées. Toutes les insertions sont validées ensemble à la fin.
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        fileobj: Fichier binaire du relevé (positionnable)
+        filename (str): Nom du fichier (.csv, .xlsx, .ofx, .qfx)
+
+    Returns:
+        dict: Nombre d'opérations lues, importées, en double et en erreur, détail des premières erreurs
+
+    Raises:
+        ValueError: Si le format n'est pas reconnu
+    """
+    writer = _StatementWriter(user_id)
+    rows = 0
+    error_count = 0
+    errors = []
+
+    try:
+        for number, row, error in iter_statement_rows(fileobj, filename):
+            if row is not None and row['amount'] > MAX_AMOUNT:
+                row, error = None, f"montant hors limites: {row['amount']}"
+            if error:
+                error_count += 1
+                if len(errors) < STATEMENT_IMPORT_MAX_ERRORS:
+                    errors.append({"line": number, "error": error})
+                continue
+            rows += 1
+            writer.add(row)
+        writer.flush()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.debug(f"Statement {filename} imported for user {user_id}: {writer.imported} transactions, "
+                 f"{writer.duplicates} duplicates, {error_count} errors")
+    return {
+        "rows": rows,
+        "imported": writer.imported,
+        "duplicates": writer.duplicates,
+        "error_count": error_count,
+        "errors": errors
+    }
+
+
+@statement_import_bp.route("/import", methods=["POST"])
+@login_required
+def import_statement_api():
+    """Importe un relevé bancaire (CSV, XLSX ou OFX) dans les transactions de l'utilisateur"""
+    user = User.query.filter_by(username=session.get('username')).first()
+    if not user:
+        return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 403
+
+    statement = request.files.get('statement')
+    if not statement or not statement.filename:
+        return jsonify({"success": False, "error": "Aucun relevé fourni"}), 400
+    if os.path.splitext(statement.filename)[1].lower() not in STATEMENT_EXTENSIONS:
+        return jsonify({
+            "success": False,
+            "error": "Type de fichier non pris en charge. Extensions autorisées: CSV, XLSX, OFX"
+        }), 400
+
+    try:
+        result = import_statement(user.id, statement.stream, statement.filename)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error importing statement: {str(e)}")
+        return jsonify({"success": False, "error": "Erreur lors de l'import du relevé"}), 500
+
+    return jsonify({"success": True, **result})
@@ -0,0 +1,492 @@
+"""
+Traitement par lot des textes extraits non traités ("Tout traiter")
+
+POST /api/text-processing-jobs crée une tâche TextProcessingJob pour l'utilisateur
+et rend la main. Un pool borné de threads lit ensuite ses textes non traités par
+paquets de TEXT_PROCESSING_BATCH_SIZE, en extrait les champs avec
+receipt_extractor, rapproche fournisseurs et catégories de ceux de l'utilisateur
+et insère les FinancialTransaction du paquet en une seule requête. Chaque paquet
+(transactions, textes marqués traités et progression de la tâche) est validé en
+une seule transaction : après l'arrêt d'un processus, la tâche dont la
+progression n'avance plus depuis TEXT_PROCESSING_JOB_STALE_SECONDS est reprise
+au paquet suivant par n'importe quel worker.
+
+Les textes dont le montant est incertain, ainsi que les devis et relevés, restent
+à traiter manuellement (/finance/process_text/<id>).
+"""
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import datetime
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from flask import Blueprint, jsonify, session, current_app, stream_with_context, url_for
+from sqlalchemy import func, insert, update
+
+from models import db, User, ExtractedText, Category, FinancialTransaction, Vendor, TextProcessingJob, \
+    vendor_transaction
+from auth import login_required
+from ocr_jobs import MAX_AMOUNT
+import receipt_extractor
+import transaction_rollups
+
+logger = logging.getLogger(__name__)
+
+# Tâches traitées simultanément dans chaque processus
+TEXT_PROCESSING_JOB_WORKERS = int(os.environ.get('TEXT_PROCESSING_JOB_WORKERS', 2))
+
+# Textes lus, analysés et enregistrés par transaction
+TEXT_PROCESSING_BATCH_SIZE = int(os.environ.get('TEXT_PROCESSING_BATCH_SIZE', 200))
+
+# Confiance minimale du montant extrait pour créer la transaction sans intervention
+TEXT_PROCESSING_MIN_CONFIDENCE = float(os.environ.get('TEXT_PROCESSING_MIN_CONFIDENCE', 0.5))
+
+# Délai sans progression au-delà duquel une tâche en cours est reprise (secondes)
+TEXT_PROCESSING_JOB_STALE_SECONDS = int(os.environ.get('TEXT_PROCESSING_JOB_STALE_SECONDS', 300))
+
+# Durée maximale d'un flux SSE de suivi et intervalle de consultation de la base
+TEXT_PROCESSING_JOB_EVENTS_TIMEOUT = int(os.environ.get('TEXT_PROCESSING_JOB_EVENTS_TIMEOUT', 600))
+TEXT_PROCESSING_JOB_EVENTS_INTERVAL = 1.0
+
+# Précision de FinancialTransaction.tax_amount
+CENT = Decimal('0.01')
+
+ACTIVE_STATUSES = ('queued', 'processing')
+FINAL_STATUSES = ('completed', 'failed')
+
+# Types de document convertis automatiquement en dépense (None : type non reconnu)
+AUTO_DOCUMENT_TYPES = (None, 'facture', 'reçu')
+
+text_processing_bp = Blueprint('text_processing_jobs', __name__, url_prefix='/api/text-processing-jobs')
+
+_executor = ThreadPoolExecutor(max_workers=TEXT_PROCESSING_JOB_WORKERS, thread_name_prefix='text-processing')
+_resume_thread = None
+
+
+def init_app(app):
+    """Initialiser le traitement par lot des textes extraits pour l'application Flask"""
+    global _resume_thread
+
+    app.register_blueprint(text_processing_bp)
+
+    if TEXT_PROCESSING_JOB_STALE_SECONDS > 0 and _resume_thread is None:
+        _resume_thread = threading.Thread(
+            target=_resume_loop, args=(app,), name='text-processing-resume', daemon=True
+        )
+        _resume_thread.start()
+
+
+def normalize_name(name):
+    """Nom de fournisseur ou de catégorie comparable (casse, ponctuation et espaces ignorés)"""
+    return ' '.join(re.sub(r'[\W_]+', ' ', name.casefold()).split())
+
+
+class _UserMatcher:
+    """Fournisseurs et catégories d'un utilisateur, chargés une fois par tâche"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.vendors = {}
+        for vendor_id, name in db.session.query(Vendor.id, Vendor.name).filter(
+                Vendor.user_id == user_id).order_by(Vendor.id):
+            self.vendors.setdefault(normalize_name(name), vendor_id)
+
+        # Catégorie la plus utilisée par les transactions déjà liées à chaque fournisseur
+        usage = defaultdict(Counter)
+        rows = db.session.query(
+            vendor_transaction.c.vendor_id, FinancialTransaction.category_id, func.count()
+        ).join(
+            FinancialTransaction, FinancialTransaction.id == vendor_transaction.c.transaction_id
+        ).filter(
+            FinancialTransaction.user_id == user_id,
+            FinancialTransaction.category_id.isnot(None)
+        ).group_by(vendor_transaction.c.vendor_id, FinancialTransaction.category_id)
+        for vendor_id, category_id, count in rows:
+            usage[vendor_id][category_id] = count
+        self.vendor_categories = {vendor_id: counts.most_common(1)[0][0] for vendor_id, counts in usage.items()}
+
+        # Sinon, la première catégorie de dépense dont le nom figure dans le texte
+        categories = {}
+        for category_id, name in db.session.query(Category.id, Category.name).filter(
+                Category.user_id == user_id, Category.type == 'expense').order_by(Category.id):
+            key = normalize_name(name)
+            if key:
+                categories.setdefault(key, category_id)
+        self.categories = categories
+        self._category_pattern = re.compile(
+            r'\b(' + '|'.join(re.escape(key) for key in sorted(categories, key=len, reverse=True)) + r')\b'
+        ) if categories else None
+
+    def category_for(self, vendor_id, content):
+        if vendor_id in self.vendor_categories:
+            return self.vendor_categories[vendor_id]
+        if self._category_pattern is not None:
+            match = self._category_pattern.search(normalize_name(content))
+            if match:
+                return self.categories[match.group(1)]
+        return None
+
+
+def _transaction_values(row, fields):
+    """
+    Valeurs de la transaction à créer pour un texte, ou None s'il doit être traité manuellement
+
+    Args:
+        row: (id, title, content, created_at) du texte extrait
+        fields (dict): Résultat de receipt_extractor.extract_fields
+
+    Returns:
+        dict: Valeurs de la transaction (et nom du fournisseur sous 'vendor'), ou None
+    """
+    text_id, title, content, created_at = row
+    if fields['document_type'] not in AUTO_DOCUMENT_TYPES or not fields['amount']:
+        return None
+    if fields['field_confidence'].get('amount', 0) < TEXT_PROCESSING_MIN_CONFIDENCE:
+        return None
+    try:
+        amount = Decimal(fields['amount'])
+        tax_rate = Decimal(fields['tax_rate']) if fields['tax_rate'] else None
+    except InvalidOperation:
+        return None
+    if amount <= 0 or amount > MAX_AMOUNT:
+        return None
+    if tax_rate is not None and tax_rate >= 100:
+        tax_rate = None
+
+    if fields['date']:
+        transaction_date = datetime.date.fromisoformat(fields['date'])
+    else:
+        transaction_date = (created_at or datetime.datetime.utcnow()).date()
+
+    # Même calcul que la saisie manuelle, arrondi comme la colonne pour que le cumul suive la base
+    tax_amount = (amount * tax_rate / 100).quantize(CENT, ROUND_HALF_UP) if tax_rate else None
+
+    vendor = (fields['vendor'] or '').strip()[:100] or None
+    return {
+        'amount': amount,
+        'description': (title or vendor or f"Document {text_id}")[:255],
+        'transaction_date': transaction_date,
+        'is_expense': True,
+        'tax_rate': tax_rate,
+        'tax_amount': tax_amount,
+        'vendor': vendor
+    }
+
+
+def process_batch(job_id, user_id, matcher, rows):
+    """
+    Crée les transactions d'un paquet de textes et met à jour la progression de la tâche
+
+    Tout est écrit dans la transaction en cours de la session ; l'appelant valide.
+
+    Args:
+        job_id (str): ID de la tâche
+        user_id (int): ID de l'utilisateur
+        matcher (_UserMatcher): Fournisseurs et catégories de l'utilisateur
+        rows (list): (id, title, content, created_at) des textes du paquet, par ID croissant
+
+    Returns:
+        tuple: (transactions créées, textes laissés au traitement manuel)
+    """
+    results = receipt_extractor.extract_many(row[2] for row in rows)
+
+    pending = []
+    for row, fields in zip(rows, results):
+        values = _transaction_values(row, fields)
+        if values is not None:
+            pending.append((row, fields, values))
+
+    # Fournisseurs absents du carnet de l'utilisateur, créés une seule fois par nom
+    new_vendors = {}
+    for _, _, values in pending:
+        if values['vendor']:
+            key = normalize_name(values['vendor'])
+            if key and key not in matcher.vendors:
+                new_vendors.setdefault(key, values['vendor'])
+    if new_vendors:
+        keys = list(new_vendors)
+        created = db.session.execute(
+            insert(Vendor).returning(Vendor.id, sort_by_parameter_order=True),
+            [{'user_id': user_id, 'name': new_vendors[key]} for key in keys]
+        ).scalars().all()
+        matcher.vendors.update(zip(keys, created))
+
+    transaction_rows = []
+    vendor_ids = []
+    for row, fields, values in pending:
+        vendor_id = matcher.vendors.get(normalize_name(values['vendor'])) if values['vendor'] else None
+        vendor_ids.append(vendor_id)
+        transaction_rows.append({
+            'user_id': user_id,
+            'category_id': matcher.category_for(vendor_id, row[2]),
+            'amount': values['amount'],
+            'description': values['description'],
+            'transaction_date': values['transaction_date'],
+            'is_expense': values['is_expense'],
+            'tax_rate': values['tax_rate'],
+            'tax_amount': values['tax_amount']
+        })
+
+    if transaction_rows:
+        transaction_ids = db.session.execute(
+            insert(FinancialTransaction).returning(FinancialTransaction.id, sort_by_parameter_order=True),
+            transaction_rows
+        ).scalars().all()
+
+        links = [{'vendor_id': vendor_id, 'transaction_id': transaction_id}
+                 for vendor_id, transaction_id in zip(vendor_ids, transaction_ids) if vendor_id]
+        if links:
+            db.session.execute(vendor_transaction.insert(), links)
+
+        db.session.execute(update(ExtractedText), [
+            {'id': row[0], 'is_processed': True, 'document_type': fields['document_type'] or 'autre',
+             'transaction_id': transaction_id}
+            for (row, fields, _), transaction_id in zip(pending, transaction_ids)
+        ])
+
+        # Les insertions groupées ne passent pas par les écouteurs de la session
+        delta = transaction_rollups.RollupDelta()
+        for values in transaction_rows:
+            delta.add_transaction(values)
+        transaction_rollups.apply_delta(db.session.connection(), delta)
+
+    db.session.execute(update(TextProcessingJob).where(TextProcessingJob.id == job_id).values(
+        processed=TextProcessingJob.processed + len(rows),
+        created=TextProcessingJob.created + len(transaction_rows),
+        skipped=TextProcessingJob.skipped + len(rows) - len(transaction_rows),
+        last_text_id=func.greatest(TextProcessingJob.last_text_id, rows[-1][0]),
+        updated_at=datetime.datetime.utcnow()
+    ))
+    return len(transaction_rows), len(rows) - len(transaction_rows)
+
+
+def _update_job(job_id, **values):
+    """Met à jour l'état d'une tâche et le rend visible immédiatement"""
+    values['updated_at'] = datetime.datetime.utcnow()
+    db.session.query(TextProcessingJob).filter(TextProcessingJob.id == job_id).update(values)
+    db.session.commit()
+
+
+def _run_job(app, job_id):
+    """Traite les textes d'une tâche paquet par paquet dans un thread du pool"""
+    try:
+        with app.app_context():
+            try:
+                job = db.session.get(TextProcessingJob, job_id)
+                user_id, last_text_id = job.user_id, job.last_text_id
+                _update_job(job_id, status='processing', error=None)
+                matcher = _UserMatcher(user_id)
+
+                while True:
+                    # Les textes verrouillés par une autre reprise de la tâche sont laissés de côté
+                    rows = db.session.query(
+                        ExtractedText.id, ExtractedText.title, ExtractedText.content, ExtractedText.created_at
+                    ).filter(
+                        ExtractedText.user_id == user_id,
+                        ExtractedText.is_processed == False,  # noqa: E712
+                        ExtractedText.id > last_text_id
+                    ).order_by(ExtractedText.id).limit(TEXT_PROCESSING_BATCH_SIZE).with_for_update(
+                        of=ExtractedText, skip_locked=True).all()
+                    if not rows:
+                        break
+                    process_batch(job_id, user_id, matcher, rows)
+                    db.session.commit()
+                    last_text_id = rows[-1][0]
+
+                _update_job(job_id, status='completed')
+                logger.debug(f"Text processing job {job_id} completed")
+            except Exception as e:
+                logger.error(f"Text processing job {job_id} failed: {str(e)}")
+                db.session.rollback()
+                _update_job(job_id, status='failed', error=str(e))
+    except Exception as e:
+        logger.error(f"Unable to record failure of text processing job {job_id}: {str(e)}")
+
+
+def _claim(job_id=None):
+    """
+    Réserve les tâches actives dont la progression n'avance plus (processus arrêté)
+
+    Args:
+        job_id (str, optional): Limiter à une tâche
+
+    Returns:
+        list: IDs des tâches réservées, à confier au pool
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=TEXT_PROCESSING_JOB_STALE_SECONDS)
+    query = update(TextProcessingJob).where(
+        TextProcessingJob.status.in_(ACTIVE_STATUSES),
+        TextProcessingJob.updated_at < cutoff
+    )
+    if job_id is not None:
+        query = query.where(TextProcessingJob.id == job_id)
+    claimed = db.session.execute(
+        query.values(updated_at=datetime.datetime.utcnow()).returning(TextProcessingJob.id)
+    ).scalars().all()
+    db.session.commit()
+    return claimed
+
+
+def _resume_loop(app):
+    """Reprend périodiquement les tâches interrompues par l'arrêt d'un processus"""
+    while True:
+        try:
+            with app.app_context():
+                for job_id in _claim():
+                    logger.info(f"Resuming text processing job {job_id}")
+                    _executor.submit(_run_job, app, job_id)
+        except Exception as e:
+            logger.error(f"Error resuming text processing jobs: {str(e)}")
+        time.sleep(TEXT_PROCESSING_JOB_STALE_SECONDS)
+
+
+def start_job(user_id):
+    """
+    Lance le traitement des textes non traités d'un utilisateur
+
+    Une seule tâche est active par utilisateur : si elle existe déjà, elle est
+    renvoyée (et reprise si sa progression n'avance plus).
+
+    Args:
+        user_id (int): ID de l'utilisateur
+
+    Returns:
+        TextProcessingJob: Tâche lancée ou en cours, ou None s'il n'y a rien à traiter
+    """
+    app = current_app._get_current_object()
+
+    job = TextProcessingJob.query.filter(
+        TextProcessingJob.user_id == user_id,
+        TextProcessingJob.status.in_(ACTIVE_STATUSES)
+    ).order_by(TextProcessingJob.created_at.desc()).first()
+    if job is not None:
+        if _claim(job.id):
+            _executor.submit(_run_job, app, job.id)
+        return job
+
+    total = db.session.query(func.count(ExtractedText.id)).filter(
+        ExtractedText.user_id == user_id,
+        ExtractedText.is_processed == False  # noqa: E712
+    ).scalar()
+    if not total:
+        return None
+
+    job = TextProcessingJob(id=str(uuid.uuid4()), user_id=user_id, status='queued', total=total)
+    db.session.add(job)
+    db.session.commit()
+    _executor.submit(_run_job, app, job.id)
+
+    logger.debug(f"Queued text processing job {job.id} ({total} texts)")
+    return job
+
+
+def job_to_dict(job):
+    """Convertit une tâche en dictionnaire pour l'API de suivi"""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "created": job.created,
+        "skipped": job.skipped,
+        "percent": min(100, round(100 * job.processed / job.total)) if job.total else 100,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+
+def _current_user():
+    return User.query.filter_by(username=session.get('username')).first()
+
+
+def _get_user_job(job_id):
+    """Retourne la tâche si elle appartient à l'utilisateur connecté"""
+    user = _current_user()
+    if not user:
+        return None
+    return TextProcessingJob.query.filter_by(id=job_id, user_id=user.id).first()
+
+
+@text_processing_bp.route("", methods=["POST"])
+@login_required
+def start_processing():
+    """Lance (ou renvoie) le traitement par lot des textes non traités de l'utilisateur"""
+    user = _current_user()
+    if not user:
+        return jsonify({"success": False, "error": "Utilisateur non trouvé"}), 403
+
+    try:
+        job = start_job(user.id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error starting text processing job: {str(e)}")
+        return jsonify({"success": False, "error": "Impossible de lancer le traitement"}), 500
+
+    if job is None:
+        return jsonify({"success": False, "error": "Aucun document en attente de traitement"}), 400
+
+    return jsonify({
+        "success": True,
+        **job_to_dict(job),
+        "status_url": url_for('text_processing_jobs.job_status', job_id=job.id),
+        "events_url": url_for('text_processing_jobs.job_events', job_id=job.id)
+    }), 202
+
+
+@text_processing_bp.route("/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    """État et progression d'une tâche de traitement"""
+    job = _get_user_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Tâche introuvable"}), 404
+    return jsonify({"success": True, **job_to_dict(job)})
+
+
+@text_processing_bp.route("/<job_id>/events", methods=["GET"])
+@login_required
+def job_events(job_id):
+    """Flux SSE de la progression d'une tâche de traitement, jusqu'à sa fin"""
+    job = _get_user_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Tâche introuvable"}), 404
+    db.session.rollback()
+
+    def generate():
+        deadline = time.monotonic() + TEXT_PROCESSING_JOB_EVENTS_TIMEOUT
+        last_state = None
+        while True:
+            job = db.session.get(TextProcessingJob, job_id, populate_existing=True)
+            # Copie de l'état avant de libérer la session : relire le job après le
+            # rollback rouvrirait une transaction gardée pendant l'attente
+            snapshot = job_to_dict(job) if job is not None else None
+            db.session.rollback()
+            if snapshot is None:
+                break
+
+            state = (snapshot['status'], snapshot['processed'])
+            if state != last_state:
+                last_state = state
+                yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if snapshot['status'] in FINAL_STATUSES:
+                break
+            if time.monotonic() > deadline:
+                yield f"data: {json.dumps({'job_id': job_id, 'timeout': True})}\n\n"
+                break
+            time.sleep(TEXT_PROCESSING_JOB_EVENTS_INTERVAL)
+
+    return current_app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,142 @@
+"""
+Analyse des réponses AWS Textract en un seul parcours
+
+Les blocs d'une réponse AnalyzeDocument se référencent par identifiant
+(KEY_VALUE_SET -> WORD, TABLE -> CELL -> WORD). Un index identifiant -> bloc est
+construit une fois, puis chaque relation est résolue par accès direct au lieu de
+rechercher le bloc dans la liste complète à chaque référence.
+"""
+from collections import namedtuple
+
+ParsedDocument = namedtuple('ParsedDocument', ['lines', 'form_data', 'tables', 'pages'])
+ParsedExpense = namedtuple('ParsedExpense', ['lines', 'summary', 'is_receipt', 'documents'])
+
+
+def _child_ids(block, relationship_type='CHILD'):
+    for relationship in block.get('Relationships', ()):
+        if relationship['Type'] == relationship_type:
+            yield from relationship['Ids']
+
+
+def _words(block, index):
+    """Texte des mots (WORD) enfants d'un bloc"""
+    words = []
+    for child_id in _child_ids(block):
+        child = index.get(child_id)
+        if child is not None and child['BlockType'] == 'WORD':
+            words.append(child['Text'])
+    return ' '.join(words)
+
+
+def parse_analysis(response):
+    """
+    Analyse une réponse AnalyzeDocument ou DetectDocumentText
+
+    Args:
+        response (dict): Réponse de l'API Textract
+
+    Returns:
+        ParsedDocument: lignes de texte, paires clé-valeur (clé en minuscules, la
+            dernière occurrence l'emporte), tableaux (liste de lignes de cellules)
+            et nombre de pages
+    """
+    blocks = response.get('Blocks', ())
+    index = {}
+    lines = []
+    keys = []
+    tables = []
+    pages = 0
+
+    for block in blocks:
+        index[block['Id']] = block
+        block_type = block['BlockType']
+        if block_type == 'LINE':
+            lines.append(block['Text'])
+        elif block_type == 'KEY_VALUE_SET':
+            if 'KEY' in block.get('EntityTypes', ()):
+                keys.append(block)
+        elif block_type == 'TABLE':
+            tables.append(block)
+        elif block_type == 'PAGE':
+            pages += 1
+
+    form_data = {}
+    for key_block in keys:
+        key = _words(key_block, index).strip().lower()
+        value = ' '.join(
+            text for text in (
+                _words(index[value_id], index) for value_id in _child_ids(key_block, 'VALUE') if value_id in index
+            ) if text
+        ).strip()
+        if key and value:
+            form_data[key] = value
+
+    parsed_tables = []
+    for table in tables:
+        cells = {}
+        row_count = column_count = 0
+        for cell_id in _child_ids(table):
+            cell = index.get(cell_id)
+            if cell is None or cell['BlockType'] != 'CELL':
+                continue
+            row, column = cell['RowIndex'], cell['ColumnIndex']
+            cells[(row, column)] = _words(cell, index)
+            row_count = max(row_count, row)
+            column_count = max(column_count, column)
+        parsed_tables.append([
+            [cells.get((row, column), '') for column in range(1, column_count + 1)]
+            for row in range(1, row_count + 1)
+        ])
+
+    return ParsedDocument(lines, form_data, parsed_tables, pages or (1 if blocks else 0))
+
+
+def parse_expense(response):
+    """
+    Analyse une réponse AnalyzeExpense
+
+    Args:
+        response (dict): Réponse de l'API Textract
+
+    Returns:
+        ParsedExpense: lignes de texte (tous documents), champs de synthèse
+            (type -> texte, la dernière occurrence l'emporte), indicateur « reçu »
+            (le mot Receipt apparaît dans un des textes du document) et nombre de documents
+    """
+    lines = []
+    summary = {}
+    is_receipt = False
+    documents = response.get('ExpenseDocuments', ())
+
+    for block in response.get('Blocks', ()):
+        if block.get('BlockType') == 'LINE':
+            lines.append(block.get('Text', ''))
+
+    for document in documents:
+        for field in document.get('SummaryFields', ()):
+            if 'Type' in field and 'ValueDetection' in field:
+                summary[field['Type']['Text']] = field['ValueDetection'].get('Text', '')
+            if not is_receipt:
+                is_receipt = _field_mentions_receipt(field)
+
+        for group in document.get('LineItemGroups', ()):
+            for item in group.get('LineItems', ()):
+                for field in item.get('LineItemExpenseFields', ()):
+                    if not is_receipt:
+                        is_receipt = _field_mentions_receipt(field)
+
+        for block in document.get('Blocks', ()):
+            if block.get('BlockType') == 'LINE':
+                text = block.get('Text', '')
+                lines.append(text)
+                if not is_receipt and 'Receipt' in text:
+                    is_receipt = True
+
+    return ParsedExpense(lines, summary, is_receipt, len(documents))
+
+
+def _field_mentions_receipt(field):
+    for part in ('Type', 'LabelDetection', 'ValueDetection'):
+        if 'Receipt' in (field.get(part) or {}).get('Text', ''):
+            return True
+    return False
@@ -0,0 +1,379 @@
+"""
+Totaux mensuels des transactions financières maintenus incrémentalement
+
+La table transaction_monthly_rollup contient, par utilisateur, mois, catégorie
+et sens (dépense/revenu), le montant, la TVA et le nombre de transactions. Elle
+est mise à jour dans la transaction qui insère, modifie ou supprime les
+FinancialTransaction (écouteurs before_flush/after_flush de la session) ; les
+écritures hors ORM (import des relevés) appliquent leurs variations avec
+apply_delta. Un recalcul complet à partir de financial_transaction corrige toute
+dérive au démarrage puis périodiquement (ou via reconcile_transaction_rollups.py).
+
+Les rapports et tableaux de bord lisent ces totaux (quelques dizaines de lignes
+par période) au lieu de réagréger tout l'historique.
+"""
+import os
+import time
+import logging
+import datetime
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import and_, delete, event, func, inspect, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import db, Category, FinancialTransaction, TransactionMonthlyRollup, TransactionRollupState
+
+logger = logging.getLogger(__name__)
+
+# Intervalle entre deux recalculs complets (secondes, 0 pour désactiver)
+RECONCILE_INTERVAL = int(os.environ.get('TRANSACTION_ROLLUP_RECONCILE_INTERVAL', 86400))
+
+# Clé du verrou consultatif PostgreSQL garantissant un seul recalcul à la fois
+RECONCILE_LOCK_KEY = 720052
+
+# Verrou consultatif (clé, user_id) partagé par les écritures d'un utilisateur, pris en exclusif par son recalcul
+WRITE_LOCK_KEY = 720055
+
+STATE_ID = 1
+
+# Colonnes dont la modification déplace une transaction d'un total à un autre
+ROLLUP_COLUMNS = ('user_id', 'transaction_date', 'category_id', 'is_expense', 'amount', 'tax_amount')
+
+ZERO = Decimal('0.00')
+
+_listener_registered = False
+_reconcile_thread = None
+
+
+def init_app(app):
+    """Initialiser la maintenance des totaux mensuels pour l'application Flask"""
+    global _listener_registered, _reconcile_thread
+
+    if not _listener_registered:
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_flush', _after_flush)
+        _listener_registered = True
+
+    if RECONCILE_INTERVAL > 0 and _reconcile_thread is None:
+        _reconcile_thread = threading.Thread(
+            target=_reconcile_loop, args=(app,), name='transaction-rollup-reconcile', daemon=True
+        )
+        _reconcile_thread.start()
+
+
+def _decimal(value):
+    if value is None:
+        return ZERO
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class RollupDelta:
+    """Variations des totaux mensuels produites par une écriture"""
+
+    def __init__(self):
+        # (user_id, mois, category_id, is_expense) -> [montant, TVA, nombre]
+        self.rows = defaultdict(lambda: [ZERO, ZERO, 0])
+
+    def __bool__(self):
+        return any(amount or tax or count for amount, tax, count in self.rows.values())
+
+    def add(self, user_id, transaction_date, category_id, is_expense, amount, tax_amount, count=1):
+        """Ajoute (count=1) ou retire (count=-1) une transaction des totaux"""
+        if user_id is None or transaction_date is None:
+            return
+        key = (int(user_id), transaction_date.replace(day=1),
+               int(category_id) if category_id else 0, is_expense is not False)
+        entry = self.rows[key]
+        entry[0] += _decimal(amount) * count
+        entry[1] += _decimal(tax_amount) * count
+        entry[2] += count
+
+    def add_transaction(self, values, count=1):
+        """Ajoute ou retire une transaction décrite par ses colonnes (dict ou objet)"""
+        get = values.get if isinstance(values, dict) else lambda name: getattr(values, name)
+        self.add(get('user_id'), get('transaction_date'), get('category_id'), get('is_expense'),
+                 get('amount'), get('tax_amount'), count)
+
+
+def apply_delta(connection, delta):
+    """
+    Applique des variations aux totaux mensuels dans la transaction courante
+
+    Les lignes sont mises à jour dans l'ordre des clés pour éviter les
+    interblocages entre écritures concurrentes ; les totaux vidés de toute
+    transaction sont supprimés. Le verrou WRITE_LOCK_KEY de chaque utilisateur
+    concerné est pris en mode partagé : les écritures ne s'attendent pas entre
+    elles, mais attendent le recalcul en cours de cet utilisateur.
+
+    Args:
+        connection: Connexion SQLAlchemy de la transaction d'écriture
+        delta (RollupDelta): Variations à appliquer
+    """
+    keys = sorted(key for key, (amount, tax, count) in delta.rows.items() if amount or tax or count)
+    if not keys:
+        return
+
+    for user_id in sorted({key[0] for key in keys}):
+        connection.execute(text("SELECT pg_advisory_xact_lock_shared(:key, :user_id)"),
+                           {'key': WRITE_LOCK_KEY, 'user_id': user_id})
+
+    stmt = pg_insert(TransactionMonthlyRollup).values([{
+        'user_id': key[0],
+        'month': key[1],
+        'category_id': key[2],
+        'is_expense': key[3],
+        'amount': delta.rows[key][0],
+        'tax_amount': delta.rows[key][1],
+        'transaction_count': delta.rows[key][2]
+    } for key in keys])
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[TransactionMonthlyRollup.user_id, TransactionMonthlyRollup.month,
+                        TransactionMonthlyRollup.category_id, TransactionMonthlyRollup.is_expense],
+        set_={
+            'amount': TransactionMonthlyRollup.amount + stmt.excluded.amount,
+            'tax_amount': TransactionMonthlyRollup.tax_amount + stmt.excluded.tax_amount,
+            'transaction_count': TransactionMonthlyRollup.transaction_count + stmt.excluded.transaction_count
+        }
+    ))
+
+    removed = [key for key in keys if delta.rows[key][2] < 0]
+    if removed:
+        connection.execute(delete(TransactionMonthlyRollup).where(
+            or_(*[and_(
+                TransactionMonthlyRollup.user_id == user_id,
+                TransactionMonthlyRollup.month == month,
+                TransactionMonthlyRollup.category_id == category_id,
+                TransactionMonthlyRollup.is_expense == is_expense
+            ) for user_id, month, category_id, is_expense in removed]),
+            TransactionMonthlyRollup.transaction_count <= 0
+        ))
+
+
+def _changed(obj):
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in ROLLUP_COLUMNS)
+
+
+def _before_flush(session, flush_context, instances):
+    """Relit en base les valeurs d'origine des transactions modifiées ou supprimées par le flush"""
+    changed = [obj for obj in session.dirty if isinstance(obj, FinancialTransaction) and _changed(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, FinancialTransaction)]
+    ids = {obj.id for obj in changed + deleted if obj.id is not None}
+    # Ne pas réutiliser les valeurs relues pour un flush précédent qui aurait échoué
+    session.info.pop('transaction_rollup_previous', None)
+    if not ids:
+        return
+
+    columns = [getattr(FinancialTransaction, name) for name in ROLLUP_COLUMNS]
+    rows = session.connection().execute(
+        select(FinancialTransaction.id, *columns).where(FinancialTransaction.id.in_(ids))
+    ).all()
+    session.info['transaction_rollup_previous'] = {row[0]: dict(zip(ROLLUP_COLUMNS, row[1:])) for row in rows}
+
+
+def _after_flush(session, flush_context):
+    """Répercute les transactions insérées, modifiées ou supprimées par le flush"""
+    previous = session.info.pop('transaction_rollup_previous', {})
+    created = [obj for obj in session.new if isinstance(obj, FinancialTransaction)]
+    if not (created or previous):
+        return
+
+    delta = RollupDelta()
+    for obj in created:
+        delta.add_transaction(obj)
+    for obj in session.deleted:
+        if isinstance(obj, FinancialTransaction) and obj.id in previous:
+            delta.add_transaction(previous[obj.id], -1)
+    for obj in session.dirty:
+        if isinstance(obj, FinancialTransaction) and obj.id in previous:
+            delta.add_transaction(previous[obj.id], -1)
+            delta.add_transaction(obj)
+
+    apply_delta(session.connection(), delta)
+
+
+def _reconcile_user(user_id):
+    """
+    Recalcule et valide les totaux mensuels d'un utilisateur
+
+    Le verrou WRITE_LOCK_KEY de l'utilisateur est pris en exclusif : ses
+    écritures en cours se terminent avant le recalcul, les suivantes attendent
+    sa validation puis appliquent leurs variations sur les totaux recalculés.
+    Les autres utilisateurs ne sont pas bloqués.
+
+    Args:
+        user_id (int): ID de l'utilisateur
+    """
+    connection = db.session.connection()
+    params = {'key': WRITE_LOCK_KEY, 'user_id': user_id}
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key, :user_id)"), params)
+    connection.execute(text("DELETE FROM transaction_monthly_rollup WHERE user_id = :user_id"), params)
+    connection.execute(text("""
+        INSERT INTO transaction_monthly_rollup
+            (user_id, month, category_id, is_expense, amount, tax_amount, transaction_count)
+        SELECT user_id, CAST(date_trunc('month', transaction_date) AS date), COALESCE(category_id, 0),
+               COALESCE(is_expense, TRUE), SUM(amount), COALESCE(SUM(tax_amount), 0), COUNT(*)
+        FROM financial_transaction
+        WHERE user_id = :user_id
+        GROUP BY 1, 2, 3, 4
+    """), params)
+    db.session.commit()
+
+
+def reconcile(user_id=None):
+    """
+    Recalcule les totaux mensuels à partir de la table financial_transaction
+
+    Le recalcul est fait utilisateur par utilisateur, chacun dans une courte
+    transaction (voir _reconcile_user) : une écriture n'attend au plus que le
+    recalcul de son propre utilisateur.
+
+    Args:
+        user_id (int, optional): Limiter le recalcul à un utilisateur
+
+    Returns:
+        bool: True si le recalcul a eu lieu (False si un autre processus s'en charge)
+    """
+    # Verrou de session sur une connexion dédiée : il reste pris entre les transactions par utilisateur
+    with db.engine.connect() as guard:
+        if not guard.execute(text("SELECT pg_try_advisory_lock(:key)"), {'key': RECONCILE_LOCK_KEY}).scalar():
+            return False
+        guard.commit()
+        try:
+            started = time.monotonic()
+            if user_id is not None:
+                user_ids = [user_id]
+            else:
+                user_ids = db.session.execute(text("""
+                    SELECT user_id FROM financial_transaction
+                    UNION
+                    SELECT user_id FROM transaction_monthly_rollup
+                    ORDER BY 1
+                """)).scalars().all()
+                db.session.commit()
+
+            for current_user_id in user_ids:
+                _reconcile_user(current_user_id)
+
+            if user_id is None:
+                db.session.execute(pg_insert(TransactionRollupState).values(
+                    id=STATE_ID, reconciled_at=datetime.datetime.utcnow()
+                ).on_conflict_do_update(
+                    index_elements=[TransactionRollupState.id],
+                    set_={'reconciled_at': datetime.datetime.utcnow()}
+                ))
+                db.session.commit()
+        finally:
+            guard.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': RECONCILE_LOCK_KEY})
+            guard.commit()
+
+    logger.info(f"Transaction rollups reconciled in {time.monotonic() - started:.2f}s"
+                + (f" for user {user_id}" if user_id is not None else f" ({len(user_ids)} users)"))
+    return True
+
+
+def _reconcile_loop(app):
+    """Recalcule les totaux au démarrage s'ils n'ont jamais été calculés ou sont anciens, puis périodiquement"""
+    delay = 0
+    while True:
+        time.sleep(delay)
+        delay = RECONCILE_INTERVAL
+        try:
+            with app.app_context():
+                state = db.session.get(TransactionRollupState, STATE_ID)
+                due = state is None or state.reconciled_at is None or \
+                    state.reconciled_at <= datetime.datetime.utcnow() - datetime.timedelta(seconds=RECONCILE_INTERVAL)
+                if due:
+                    reconcile()
+                else:
+                    db.session.rollback()
+        except Exception as e:
+            logger.error(f"Error reconciling transaction rollups: {str(e)}")
+
+
+def _month_after(day):
+    return (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def monthly_rows(user_id, start_date, end_date):
+    """
+    Totaux par mois, sens et catégorie d'un utilisateur sur une période
+
+    Les mois entièrement couverts sont lus dans les totaux mensuels ; les mois
+    partiels en début et fin de période sont agrégés depuis les transactions.
+
+    Args:
+        user_id (int): ID de l'utilisateur
+        start_date (date): Début de la période (inclus)
+        end_date (date): Fin de la période (incluse)
+
+    Returns:
+        list: Tuples (mois, is_expense, category_id ou None, nom, couleur, montant, TVA, nombre)
+    """
+    # Mois entièrement couverts : [full_start, full_end)
+    full_start = start_date if start_date.day == 1 else _month_after(start_date)
+    full_end = _month_after(end_date)
+    if full_end - datetime.timedelta(days=1) != end_date:
+        full_end = end_date.replace(day=1)
+
+    rows = []
+    partial_ranges = []
+    if full_start < full_end:
+        R = TransactionMonthlyRollup
+        rows.extend(db.session.query(
+            R.month, R.is_expense, Category.id, Category.name, Category.color,
+            R.amount, R.tax_amount, R.transaction_count
+        ).outerjoin(
+            Category, and_(R.category_id == Category.id, R.category_id != 0)
+        ).filter(
+            R.user_id == user_id,
+            R.month >= full_start,
+            R.month < full_end
+        ).all())
+        if start_date < full_start:
+            partial_ranges.append((start_date, full_start - datetime.timedelta(days=1)))
+        if end_date >= full_end:
+            partial_ranges.append((full_end, end_date))
+    else:
+        partial_ranges.append((start_date, end_date))
+
+    if partial_ranges:
+        month = func.date_trunc('month', FinancialTransaction.transaction_date)
+        is_expense = func.coalesce(FinancialTransaction.is_expense, True)
+        for row in db.session.query(
+            month, is_expense, Category.id, Category.name, Category.color,
+            func.sum(FinancialTransaction.amount), func.coalesce(func.sum(FinancialTransaction.tax_amount), 0),
+            func.count()
+        ).outerjoin(
+            Category, FinancialTransaction.category_id == Category.id
+        ).filter(
+            FinancialTransaction.user_id == user_id,
+            or_(*[FinancialTransaction.transaction_date.between(first, last) for first, last in partial_ranges])
+        ).group_by(month, is_expense, Category.id):
+            rows.append((row[0].date(), *row[1:]))
+    return rows
+
+
+def user_totals(user_id):
+    """
+    Totaux de toutes les transactions d'un utilisateur
+
+    Args:
+        user_id (int): ID de l'utilisateur
+
+    Returns:
+        dict: total_income, total_expenses et transactions_count
+    """
+    totals = {'total_income': ZERO, 'total_expenses': ZERO, 'transactions_count': 0}
+    for is_expense, amount, count in db.session.query(
+        TransactionMonthlyRollup.is_expense,
+        func.sum(TransactionMonthlyRollup.amount),
+        func.sum(TransactionMonthlyRollup.transaction_count)
+    ).filter(
+        TransactionMonthlyRollup.user_id == user_id
+    ).group_by(TransactionMonthlyRollup.is_expense):
+        totals['total_expenses' if is_expense else 'total_income'] += amount or ZERO
+        totals['transactions_count'] += int(count or 0)
+    return totals
@@ -1,16 +1,19 @@
 import logging
 import json
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
 import calendar
 from enum import Enum
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash
-from sqlalchemy import func, extract, desc
-from models import User, db, ExtractedText, FinancialTransaction as Transaction, Category 
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, current_app
+from sqlalchemy import func, extract
+from models import User, db, ExtractedText, Category 
 from models import Invoice, Quote, Customer
+from models import TransactionMonthlyRollup
 from models_business import BusinessReport
-from dashboard_models import TransactionCategory, Transaction as DashboardTransaction, CashflowPrediction, FinancialAlert, DashboardSettings
+from dashboard_models import Transaction as DashboardTransaction, CashflowPrediction, FinancialAlert, DashboardSettings
 from auth import login_required
+import transaction_rollups
+import dashboard_data
+import cashflow_forecast
 
 # États des factures
 class InvoiceStatus(Enum):
@@ -54,12 +57,8 @@ def dashboard_home():
     # Collecter les données de la facturation
     invoicing_data = get_invoicing_dashboard_data(user.id)
     
-    # Collecter les données des graphiques du tableau de bord avancé
-    chart_data = get_dashboard_chart_data(user.id)
-    
-    # Fusionner toutes les données
+    # Fusionner toutes les données (les graphiques sont chargés par la page via /unified-dashboard/data)
     dashboard_data = {**finance_data, **invoicing_data}
-    dashboard_data['chart_data'] = chart_data
     
     # Utiliser le template le plus simple avec des URL codées en dur
     # Change to simplified.html which uses direct URLs instead of url_for
@@ -70,16 +69,17 @@ def dashboard_home():
 
 def get_finance_dashboard_data(user_id):
     """Récupérer les données pour le tableau de bord financier"""
-    # Récupérer les totaux financiers
-    total_income = Transaction.query.join(Category).filter(
-        Transaction.user_id == user_id,
-        Category.type == 'income'
-    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
-    
-    total_expenses = Transaction.query.join(Category).filter(
-        Transaction.user_id == user_id,
-        Category.type == 'expense'
-    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
+    # Récupérer les totaux financiers par type de catégorie (totaux mensuels maintenus incrémentalement)
+    totals_by_type = dict(db.session.query(
+        Category.type,
+        func.sum(TransactionMonthlyRollup.amount)
+    ).join(
+        Category, TransactionMonthlyRollup.category_id == Category.id
+    ).filter(
+        TransactionMonthlyRollup.user_id == user_id
+    ).group_by(Category.type).all())
+    total_income = totals_by_type.get('income') or 0
+    total_expenses = totals_by_type.get('expense') or 0
     
     balance = total_income - total_expenses
     
@@ -92,23 +92,10 @@ def get_finance_dashboard_data(user_id):
     # Récupérer les transactions récentes
     recent_transactions = get_recent_transactions(user_id)
     
-    # Date actuelle pour les calculs de période
-    current_date = datetime.now()
-    
-    # Calculer le début et la fin du mois en cours
-    current_month_start = datetime(current_date.year, current_date.month, 1)
-    next_month_start = current_month_start + relativedelta(months=1)
-    current_month_end = next_month_start - timedelta(days=1)
-    
-    # Calculer le début et la fin du mois précédent
-    last_month_start = current_month_start - relativedelta(months=1)
-    last_month_end = current_month_start - timedelta(days=1)
-    
-    # Récupérer les données mensuelles
-    current_month_income = get_total_income_by_period(user_id, current_month_start, current_month_end)
-    current_month_expense = get_total_expense_by_period(user_id, current_month_start, current_month_end)
-    last_month_income = get_total_income_by_period(user_id, last_month_start, last_month_end)
-    last_month_expense = get_total_expense_by_period(user_id, last_month_start, last_month_end)
+    # Récupérer les données mensuelles (séries du tableau de bord mises en cache)
+    payload = dashboard_data.get_payload(user_id)
+    current_month_income, current_month_expense = dashboard_data.month_totals(payload, 0)
+    last_month_income, last_month_expense = dashboard_data.month_totals(payload, 1)
     
     # Calcul de la tendance
     current_month_balance = current_month_income - current_month_expense
@@ -125,7 +112,7 @@ def get_finance_dashboard_data(user_id):
         'last_month_income': last_month_income,
         'last_month_expense': last_month_expense,
         'trend': trend,
-        'transactions_count': Transaction.query.filter_by(user_id=user_id).count(),
+        'transactions_count': transaction_rollups.user_totals(user_id)['transactions_count'],
         'categories_count': Category.query.filter_by(user_id=user_id).count()
     }
     
@@ -187,22 +174,48 @@ def get_invoicing_dashboard_data(user_id):
         'latest_quotes': latest_quotes
     }
 
-def get_dashboard_chart_data(user_id):
-    """Récupérer les données pour les graphiques du tableau de bord avancé"""
-    # Récupérer les données mensuelles pour les 6 derniers mois
-    monthly_summary = get_monthly_summary(user_id)
+@unified_dashboard_bp.route("/data", methods=["GET"])
+@login_required
+def dashboard_data_all():
+    """
+    API endpoint regroupant toutes les séries du tableau de bord
+
+    L'ETag dépend de la version des transactions de l'utilisateur, du dernier
+    calcul de ses prévisions, du mois en cours et des paramètres : un tableau de
+    bord inchangé coûte une requête de version et une réponse 304.
+    """
+    from models import User
+    
+    # Récupérer l'utilisateur actuel
+    username = session.get('username')
+    user = User.query.filter_by(username=username).first()
     
-    # Récupérer la répartition des dépenses par catégorie
-    category_breakdown = get_category_breakdown(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
     
-    # Récupérer les données pour les prévisions de trésorerie
-    cashflow_prediction = generate_cashflow_prediction(user_id)
+    # Nombre de mois à prédire (valeur invalide : défaut, puis borné comme les prévisions)
+    months = max(1, min(request.args.get('months', 6, type=int), cashflow_forecast.CASHFLOW_FORECAST_MONTHS))
+    
+    version, forecast_at = dashboard_data.data_version(user.id)
+    etag = f"{user.id}-{version}-{forecast_at.timestamp() if forecast_at else 0:.0f}-{datetime.now():%Y%m}-{months}"
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        payload = dashboard_data.get_payload(user.id, version)
+        response = jsonify({
+            'monthly_summary': dashboard_data.monthly_summary(payload),
+            'income_vs_expense': dashboard_data.income_vs_expense_trend(payload),
+            'category_breakdown': {
+                'expense': dashboard_data.category_breakdown(payload, 'expense'),
+                'income': dashboard_data.category_breakdown(payload, 'income')
+            },
+            'cashflow_prediction': cashflow_forecast.get_predictions(user.id, months)
+        })
     
-    return {
-        'monthly_summary': monthly_summary,
-        'category_breakdown': category_breakdown,
-        'cashflow_prediction': cashflow_prediction
-    }
+    # Le navigateur revalide à chaque chargement (réponse propre à l'utilisateur)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @unified_dashboard_bp.route("/data/monthly-summary", methods=["GET"])
 @login_required
@@ -304,40 +317,6 @@ def update_settings():
     
     return jsonify({"success": True})
 
-def get_total_income_by_period(user_id, start_date=None, end_date=None):
-    """Récupérer le total des revenus pour une période donnée"""
-    query = DashboardTransaction.query.join(TransactionCategory).filter(
-        DashboardTransaction.user_id == user_id,
-        TransactionCategory.type == 'income'
-    )
-    
-    if start_date:
-        query = query.filter(DashboardTransaction.date >= start_date)
-    
-    if end_date:
-        query = query.filter(DashboardTransaction.date <= end_date)
-    
-    result = query.with_entities(func.sum(DashboardTransaction.amount)).scalar()
-    
-    return float(result) if result else 0.0
-
-def get_total_expense_by_period(user_id, start_date=None, end_date=None):
-    """Récupérer le total des dépenses pour une période donnée"""
-    query = DashboardTransaction.query.join(TransactionCategory).filter(
-        DashboardTransaction.user_id == user_id,
-        TransactionCategory.type == 'expense'
-    )
-    
-    if start_date:
-        query = query.filter(DashboardTransaction.date >= start_date)
-    
-    if end_date:
-        query = query.filter(DashboardTransaction.date <= end_date)
-    
-    result = query.with_entities(func.sum(DashboardTransaction.amount)).scalar()
-    
-    return float(result) if result else 0.0
-
 def get_recent_transactions(user_id, limit=5):
     """Récupérer les transactions récentes"""
     transactions = DashboardTransaction.query.filter_by(user_id=user_id).order_by(
@@ -359,137 +338,12 @@ def get_recent_transactions(user_id, limit=5):
 
 def get_monthly_summary(user_id, months=6):
     """Récupérer les revenus et dépenses mensuels des derniers mois"""
-    # Date actuelle
-    current_date = datetime.now()
-    
-    # Initialiser les données vides pour les X derniers mois
-    labels = []
-    income_data = []
-    expense_data = []
-    
-    # Calculer les données pour chaque mois
-    for i in range(months - 1, -1, -1):
-        # Calculer le mois
-        target_date = current_date - relativedelta(months=i)
-        month_start = datetime(target_date.year, target_date.month, 1)
-        
-        # Si c'est le mois actuel, utiliser la date actuelle comme fin
-        if i == 0:
-            month_end = current_date
-        else:
-            month_end = (month_start + relativedelta(months=1)) - timedelta(days=1)
-        
-        # Formatage de l'étiquette du mois
-        month_label = month_start.strftime('%b %Y')
-        labels.append(month_label)
-        
-        # Récupérer les revenus et dépenses
-        income = get_total_income_by_period(user_id, month_start, month_end)
-        expense = get_total_expense_by_period(user_id, month_start, month_end)
-        
-        income_data.append(income)
-        expense_data.append(expense)
-    
-    return {
-        'labels': labels,
-        'income': income_data,
-        'expense': expense_data
-    }
+    return dashboard_data.monthly_summary(dashboard_data.get_payload(user_id), months)
 
 def get_category_breakdown(user_id, transaction_type='expense'):
     """Récupérer la répartition des dépenses par catégorie"""
-    # Déterminer le type de transaction en fonction du paramètre
-    type_name = 'expense' if transaction_type == 'expense' else 'income'
-    
-    # Récupérer les transactions par catégorie
-    query = db.session.query(
-        TransactionCategory.name,
-        func.sum(DashboardTransaction.amount).label('total')
-    ).join(
-        DashboardTransaction, DashboardTransaction.category_id == TransactionCategory.id
-    ).filter(
-        DashboardTransaction.user_id == user_id,
-        TransactionCategory.type == type_name
-    ).group_by(
-        TransactionCategory.name
-    ).order_by(
-        desc('total')
-    )
-    
-    results = query.all()
-    
-    # Formater les données pour un graphique circulaire
-    labels = [result[0] for result in results]
-    values = [float(result[1]) for result in results]
-    
-    return {
-        'labels': labels,
-        'values': values
-    }
+    return dashboard_data.category_breakdown(dashboard_data.get_payload(user_id), transaction_type)
 
 def generate_cashflow_prediction(user_id, months=6):
-    """Générer des prédictions de flux de trésorerie basées sur les données historiques"""
-    # Date actuelle
-    current_date = datetime.now()
-    
-    # Récupérer les données historiques des 12 derniers mois pour l'analyse
-    historical_summary = get_monthly_summary(user_id, 12)
-    
-    # Calculer les tendances moyennes pour les revenus et dépenses
-    income_trend = calculate_trend(historical_summary['income'])
-    expense_trend = calculate_trend(historical_summary['expense'])
-    
-    # Initialiser les données de prédiction
-    labels = []
-    income_prediction = []
-    expense_prediction = []
-    balance_prediction = []
-    
-    # Dernières valeurs connues (du mois actuel)
-    last_income = historical_summary['income'][-1] if historical_summary['income'] else 0
-    last_expense = historical_summary['expense'][-1] if historical_summary['expense'] else 0
-    
-    # Générer les prédictions pour les mois à venir
-    for i in range(1, months + 1):
-        # Calculer le mois de prédiction
-        target_date = current_date + relativedelta(months=i)
-        month_label = target_date.strftime('%b %Y')
-        labels.append(month_label)
-        
-        # Appliquer les tendances pour prédire les valeurs
-        predicted_income = max(0, last_income * (1 + income_trend * i))
-        predicted_expense = max(0, last_expense * (1 + expense_trend * i))
-        predicted_balance = predicted_income - predicted_expense
-        
-        income_prediction.append(predicted_income)
-        expense_prediction.append(predicted_expense)
-        balance_prediction.append(predicted_balance)
-    
-    return {
-        'labels': labels,
-        'income': income_prediction,
-        'expense': expense_prediction,
-        'balance': balance_prediction
-    }
-
-def calculate_trend(data):
-    """Calculer la tendance à partir d'une série de données"""
-    if not data or len(data) < 2:
-        return 0
-    
-    # Éviter la division par zéro
-    if data[0] == 0:
-        return 0
-    
-    # Calculer le taux de croissance moyen
-    total_growth_rate = 0
-    count = 0
-    
-    for i in range(1, len(data)):
-        if data[i-1] > 0:  # Éviter la division par zéro
-            growth_rate = (data[i] - data[i-1]) / data[i-1]
-            total_growth_rate += growth_rate
-            count += 1
-    
-    # Retourner le taux de croissance moyen
-    return total_growth_rate / count if count > 0 else 0
\ No newline at end of file
+    """Prévisions de flux de trésorerie précalculées (voir cashflow_forecast.py)"""
+    return cashflow_forecast.get_predictions(user_id, months)
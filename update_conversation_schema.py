@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Script pour mettre à jour le schéma de la table conversation
+Ajoute les colonnes du résumé glissant utilisé par le contexte du chat
+"""
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Récupérer l'URL de la base de données
+database_url = os.environ.get('DATABASE_URL')
+if not database_url:
+    logger.error("Variable d'environnement DATABASE_URL non définie")
+    sys.exit(1)
+
+def add_column_if_not_exists(engine, table_name, column_name, column_definition):
+    """Ajoute une colonne à une table si elle n'existe pas déjà"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column_name} {column_definition}"
+            ))
+            conn.commit()
+            logger.info(f"Colonne {column_name} présente dans {table_name}")
+            return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erreur lors de l'ajout de la colonne {column_name}: {str(e)}")
+        return False
+
+def main():
+    """Fonction principale pour mettre à jour le schéma"""
+    try:
+        logger.info("Connexion à la base de données...")
+        engine = create_engine(database_url)
+        
+        # Colonnes à ajouter avec leurs définitions
+        columns_to_add = [
+            ("summary", "TEXT"),
+            ("summary_message_id", "INTEGER")
+        ]
+        
+        success = True
+        for column_name, column_definition in columns_to_add:
+            if not add_column_if_not_exists(engine, "conversation", column_name, column_definition):
+                success = False
+        
+        if success:
+            logger.info("Mise à jour du schéma réussie!")
+        else:
+            logger.warning("Certaines colonnes n'ont pas pu être ajoutées.")
+            
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour du schéma: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Script pour mettre à jour le schéma de la table extracted_text
+Ajoute l'empreinte SHA-256 des images (détection des envois en double) et son index,
+ainsi que l'état de l'extraction progressive des documents longs
+"""
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Récupérer l'URL de la base de données
+database_url = os.environ.get('DATABASE_URL')
+if not database_url:
+    logger.error("Variable d'environnement DATABASE_URL non définie")
+    sys.exit(1)
+
+def add_column_if_not_exists(engine, table_name, column_name, column_definition):
+    """Ajoute une colonne à une table si elle n'existe pas déjà"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column_name} {column_definition}"
+            ))
+            conn.commit()
+            logger.info(f"Colonne {column_name} présente dans {table_name}")
+            return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erreur lors de l'ajout de la colonne {column_name}: {str(e)}")
+        return False
+
+def create_index_if_not_exists(engine, index_name, table_name, columns):
+    """Crée un index sans bloquer les écritures s'il n'existe pas déjà"""
+    try:
+        # CREATE INDEX CONCURRENTLY ne peut pas s'exécuter dans une transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} ({columns})"
+            ))
+            logger.info(f"Index {index_name} présent sur {table_name}")
+            return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erreur lors de la création de l'index {index_name}: {str(e)}")
+        return False
+
+def main():
+    """Fonction principale pour mettre à jour le schéma"""
+    try:
+        logger.info("Connexion à la base de données...")
+        engine = create_engine(database_url)
+
+        success = add_column_if_not_exists(engine, "extracted_text", "image_hash", "VARCHAR(64)")
+        if success:
+            success = create_index_if_not_exists(
+                engine, "ix_extracted_text_user_image_hash", "extracted_text", "user_id, image_hash"
+            )
+
+        for column_name, column_definition in [
+            ("status", "VARCHAR(20) NOT NULL DEFAULT 'complete'"),
+            ("page_count", "INTEGER"),
+            ("pages_extracted", "INTEGER"),
+        ]:
+            if success:
+                success = add_column_if_not_exists(engine, "extracted_text", column_name, column_definition)
+
+        if success:
+            logger.info("Mise à jour du schéma réussie!")
+        else:
+            logger.warning("La mise à jour du schéma n'a pas pu être terminée.")
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour du schéma: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
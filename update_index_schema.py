@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Script pour créer les index composites des requêtes fréquentes
+Chaque index correspond à un filtre par utilisateur (ou parent) suivi d'un
+statut, d'une date ou d'une colonne de tri ; voir les __table_args__ des modèles
+et benchmarks/query_plan_check.py qui vérifie leur utilisation
+"""
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Récupérer l'URL de la base de données
+database_url = os.environ.get('DATABASE_URL')
+if not database_url:
+    logger.error("Variable d'environnement DATABASE_URL non définie")
+    sys.exit(1)
+
+# (nom de l'index, table, colonnes, condition d'index partiel)
+INDEXES = [
+    ("ix_subscription_user_start_date", "subscription", "user_id, start_date", None),
+    ("ix_conversation_user_last_updated", "conversation", "user_id, last_updated", None),
+    ("ix_message_conversation_timestamp", "message", "conversation_id, \"timestamp\"", None),
+    ("ix_extracted_text_user_created_at", "extracted_text", "user_id, created_at", None),
+    ("ix_extracted_text_user_unprocessed", "extracted_text", "user_id, created_at", "NOT is_processed"),
+    ("ix_category_user", "category", "user_id", None),
+    ("ix_financial_transaction_user_date", "financial_transaction", "user_id, transaction_date", None),
+    ("ix_financial_transaction_category", "financial_transaction", "category_id", None),
+    ("ix_vendor_user_name", "vendor", "user_id, name", None),
+    ("ix_tax_report_user_created_at", "tax_report", "user_id, created_at", None),
+    ("ix_customer_user_name", "customer", "user_id, name", None),
+    ("ix_invoice_user_status", "invoice", "user_id, status", None),
+    ("ix_invoice_user_created_at", "invoice", "user_id, created_at", None),
+    ("ix_invoice_customer_issue_date", "invoice", "customer_id, issue_date", None),
+    ("ix_invoice_item_invoice", "invoice_item", "invoice_id", None),
+    ("ix_quote_user_status", "quote", "user_id, status", None),
+    ("ix_quote_user_created_at", "quote", "user_id, created_at", None),
+    ("ix_quote_customer_issue_date", "quote", "customer_id, issue_date", None),
+    ("ix_quote_item_quote", "quote_item", "quote_id", None),
+    ("ix_business_report_user_created_at", "business_report", "user_id, created_at", None),
+    ("ix_marketing_campaign_user_created_at", "marketing_campaign", "user_id, created_at", None),
+    ("ix_email_content_campaign", "email_content", "campaign_id", None),
+    ("ix_social_media_post_campaign", "social_media_post", "campaign_id", None),
+    ("ix_influencer_brief_campaign", "influencer_brief", "campaign_id", None),
+    ("ix_editorial_calendar_entry_user_content_type", "editorial_calendar_entry", "user_id, content_type", None),
+    ("ix_extension_installation_user_extension", "marketplace_extension_installation", "user_id, extension_id", None),
+    ("ix_user_module_installation_user_status", "user_module_installation", "user_id, status", None),
+    ("ix_sales_prediction_user_date_created", "sales_prediction", "user_id, date_created", None),
+    ("ix_customer_insight_user", "customer_insight", "user_id", None),
+    ("ix_product_catalog_insight_user_date_created", "product_catalog_insight", "user_id, date_created", None),
+    ("ix_market_trend_user_date_created", "market_trend", "user_id, date_created", None),
+    ("ix_predictive_alert_user_status_date_created", "predictive_alert", "user_id, status, date_created", None),
+    ("ix_training_lesson_course_order", "training_lesson", "course_id, order_index", None),
+    ("ix_training_enrollment_user_course", "training_enrollment", "user_id, course_id", None),
+    ("ix_training_progress_record_enrollment_lesson", "training_progress_record", "enrollment_id, lesson_id", None),
+    ("ix_training_quiz_attempt_enrollment_quiz", "training_quiz_attempt", "enrollment_id, quiz_id", None),
+    ("ix_transaction_category_user", "transaction_category", "user_id", None),
+    ("ix_transaction_user_date", "transaction", "user_id, date", None),
+    ("ix_cashflow_prediction_user_date", "cashflow_prediction", "user_id, prediction_date", None),
+]
+
+def table_exists(engine, table_name):
+    """Vérifie qu'une table existe (certains modules optionnels ne créent pas les leurs)"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f'"{table_name}"'}).scalar()
+
+def create_index_if_not_exists(engine, index_name, table_name, columns, where=None):
+    """Crée un index sans bloquer les écritures s'il n'existe pas déjà"""
+    try:
+        # CREATE INDEX CONCURRENTLY ne peut pas s'exécuter dans une transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON \"{table_name}\" ({columns})"
+                + (f" WHERE {where}" if where else "")
+            ))
+            logger.info(f"Index {index_name} présent sur {table_name}")
+            return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erreur lors de la création de l'index {index_name}: {str(e)}")
+        return False
+
+def main():
+    """Fonction principale pour mettre à jour le schéma"""
+    try:
+        logger.info("Connexion à la base de données...")
+        engine = create_engine(database_url)
+
+        success = True
+        for index_name, table_name, columns, where in INDEXES:
+            if not table_exists(engine, table_name):
+                logger.info(f"Table {table_name} absente, index {index_name} ignoré")
+                continue
+            success = create_index_if_not_exists(engine, index_name, table_name, columns, where) and success
+
+        if success:
+            logger.info("Mise à jour du schéma réussie!")
+        else:
+            logger.warning("La mise à jour du schéma n'a pas pu être terminée.")
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour du schéma: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
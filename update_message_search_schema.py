@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Script pour mettre à jour le schéma de la table message
+Ajoute la colonne tsvector calculée et l'index GIN utilisés par la recherche
+plein texte de l'administration (message_search.py)
+
+Attention : l'ajout d'une colonne générée STORED réécrit la table message.
+Sur une grosse base, exécuter le script pendant une fenêtre de maintenance.
+L'index est ensuite créé avec CREATE INDEX CONCURRENTLY pour ne pas bloquer les écritures.
+"""
+import os
+import sys
+import logging
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Doit correspondre à models.MESSAGE_SEARCH_CONFIG
+SEARCH_CONFIG = 'french'
+
+# Récupérer l'URL de la base de données
+database_url = os.environ.get('DATABASE_URL')
+if not database_url:
+    logger.error("Variable d'environnement DATABASE_URL non définie")
+    sys.exit(1)
+
+def add_search_vector_column(engine):
+    """Ajoute la colonne search_vector calculée par PostgreSQL si elle n'existe pas déjà"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                "ALTER TABLE message ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}'::regconfig, content)) STORED"
+            ))
+            conn.commit()
+            logger.info("Colonne search_vector présente dans message")
+            return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erreur lors de l'ajout de la colonne search_vector: {str(e)}")
+        return False
+
+def create_search_index(engine):
+    """Crée l'index GIN sur search_vector sans bloquer les écritures"""
+    try:
+        # CREATE INDEX CONCURRENTLY ne peut pas s'exécuter dans une transaction
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_message_search_vector "
+                "ON message USING gin (search_vector)"
+            ))
+            logger.info("Index ix_message_search_vector présent sur message")
+            return True
+    except SQLAlchemyError as e:
+        logger.error(f"Erreur lors de la création de l'index ix_message_search_vector: {str(e)}")
+        return False
+
+def main():
+    """Fonction principale pour mettre à jour le schéma"""
+    try:
+        logger.info("Connexion à la base de données...")
+        engine = create_engine(database_url)
+
+        if add_search_vector_column(engine) and create_search_index(engine):
+            logger.info("Mise à jour du schéma réussie!")
+        else:
+            logger.warning("La mise à jour du schéma n'a pas pu être terminée.")
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la mise à jour du schéma: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
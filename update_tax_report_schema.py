@@ -58,6 +58,7 @@ def main():
             ("name", "VARCHAR(100)"),
             ("updated_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
             ("ai_analysis", "TEXT"),
+            ("ai_analysis_hash", "VARCHAR(64)"),
             ("notes", "TEXT"),
             ("profit", "NUMERIC(12, 2)")
         ]